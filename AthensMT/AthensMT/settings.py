@@ -25,6 +25,11 @@ MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 # image_connections.csv is empty. "local" = this server running on localhost.
 SD_SERVER_DEFAULT = {'host': 'localhost', 'port': '7860'}
 
+# Co-located SD server: a directory both processes can see (the server's
+# SD_SHARED_OUTPUT_DIR). When set, generated images are handed over as files
+# in it instead of travelling in the HTTP response.
+SD_SHARED_OUTPUT_DIR = os.environ.get('ODT_SD_SHARED_OUTPUT_DIR', '')
+
 
 # Quick-start development settings - unsuitable for production
 # See https://docs.djangoproject.com/en/5.0/howto/deployment/checklist/
@@ -0,0 +1,656 @@
+"""
+Throughput benchmarking for text-mode tagging, with no GPU box required.
+
+A stand-in Ollama server (OpenAI-compatible /v1/chat/completions, native
+/api/chat and /api/embed, plus /api/tags and /api/ps so status panels don't
+error) answers with configurable latency, a fixed number of parallel slots
+(like OLLAMA_NUM_PARALLEL — requests beyond it queue) and an injected error
+rate. The harness points a throwaway connection registry at it, drives the
+real row_by_row_tagger over synthetic CSVs of varying length and width, and
+reads per-row latency back out of the run's trace file (see utils' run
+tracing). Results are written as JSON so runs can be compared over time.
+
+The server runs in its own process by default, so the CPU time and RSS
+reported are the tagger's own and not the stand-in's. Entry point:
+
+  python manage.py bench_throughput --rows 200,2000 --widths 5,40 --latency lognormal:150:0.4
+
+The image path (call_image_generation → _save_generated_images) has its own
+harness further down, run against sd_server in fake-pipeline mode or a small
+built-in stand-in:
+
+  python manage.py bench_image_path --sizes 512x512,1024x1024 --formats png,jpg
+"""
+import base64
+import contextlib
+import hashlib
+import io
+import json
+import math
+import multiprocessing
+import os
+import platform
+import random
+import resource
+import shutil
+import struct
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+MOCK_EMBED_DIMS = 64
+MOCK_ANSWERS = ('YES', 'NO')
+_WORDS = ('apple', 'river', 'stone', 'quick', 'amber', 'signal', 'forest', 'copper',
+          'lantern', 'harbor', 'meadow', 'vector', 'saddle', 'orbit', 'pepper', 'glacier')
+
+
+# ─── Mock Ollama server ──────────────────────────────────────────────────────
+
+def parse_latency_spec(spec):
+    """'fixed:MS', 'uniform:LO:HI', 'normal:MEAN:SD' or 'lognormal:MEDIAN:SIGMA'
+    (all milliseconds) -> a function rng -> seconds. Raises ValueError on
+    anything else so a typo fails the command instead of benchmarking 0ms."""
+    kind, _, rest = (spec or 'fixed:0').partition(':')
+    try:
+        args = [float(a) for a in rest.split(':')] if rest else []
+    except ValueError:
+        raise ValueError(f"Bad latency spec '{spec}'.")
+    if kind == 'fixed' and len(args) == 1:
+        return lambda rng: args[0] / 1000
+    if kind == 'uniform' and len(args) == 2:
+        return lambda rng: rng.uniform(args[0], args[1]) / 1000
+    if kind == 'normal' and len(args) == 2:
+        return lambda rng: max(0.0, rng.gauss(args[0], args[1])) / 1000
+    if kind == 'lognormal' and len(args) == 2:
+        return lambda rng: rng.lognormvariate(math.log(max(args[0], 1e-3)), args[1]) / 1000
+    raise ValueError(f"Bad latency spec '{spec}' — use fixed:MS, uniform:LO:HI, "
+                     f"normal:MEAN:SD or lognormal:MEDIAN:SIGMA.")
+
+
+def _approx_tokens(text):
+    return max(1, len(text) // 4)
+
+
+def _mock_embedding(text):
+    """Deterministic unit vector per text, so the same chunk always embeds
+    the same way and retrieval results are stable across runs."""
+    rnd = random.Random(hashlib.sha256(text.encode('utf-8')).digest())
+    vec = [rnd.gauss(0, 1) for _ in range(MOCK_EMBED_DIMS)]
+    norm = math.sqrt(sum(v * v for v in vec)) or 1.0
+    return [v / norm for v in vec]
+
+
+class _MockOllamaHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, fmt, *args):
+        pass
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_json(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        try:
+            return json.loads(self.rfile.read(length) or b'{}')
+        except ValueError:
+            return {}
+
+    def _simulate(self, prompt_tokens):
+        """Hold one of the server's slots for a sampled latency (plus any
+        per-prompt-token prefill cost), rolling for an injected failure.
+        Returns (ok, simulated_seconds, answer)."""
+        srv = self.server
+        with srv.rng_lock:
+            delay = srv.latency(srv.rng) + prompt_tokens * srv.ms_per_prompt_token / 1000
+            fail = srv.rng.random() < srv.error_rate
+            answer = srv.rng.choice(MOCK_ANSWERS)
+        with srv.slots:
+            time.sleep(delay)
+        with srv.stats_lock:
+            srv.stats['requests'] += 1
+            srv.stats['errors'] += int(fail)
+        return (not fail), delay, answer
+
+    def do_GET(self):
+        if self.path.startswith('/api/tags'):
+            self._send_json(200, {'models': [{'name': self.server.model, 'size': 0}]})
+        elif self.path.startswith('/api/ps'):
+            self._send_json(200, {'models': [{'name': self.server.model, 'size_vram': 0}]})
+        elif self.path.startswith('/stats'):
+            with self.server.stats_lock:
+                self._send_json(200, dict(self.server.stats))
+        else:
+            self._send_json(404, {'error': 'not found'})
+
+    def do_POST(self):
+        payload = self._read_json()
+        if self.path.startswith('/v1/chat/completions'):
+            self._chat_completions(payload)
+        elif self.path.startswith('/api/chat'):
+            self._api_chat(payload)
+        elif self.path.startswith('/api/embed'):
+            self._api_embed(payload)
+        else:
+            self._send_json(404, {'error': 'not found'})
+
+    def _chat_completions(self, payload):
+        messages = payload.get('messages') or []
+        prompt_tokens = sum(_approx_tokens(str(m.get('content', ''))) for m in messages)
+        ok, _, answer = self._simulate(prompt_tokens)
+        if not ok:
+            self._send_json(500, {'error': {'message': 'mock server: injected failure', 'type': 'server_error'}})
+            return
+        content = f"Best Answer: {answer}\nExplanation: mock response."
+        completion_tokens = _approx_tokens(content)
+        self._send_json(200, {
+            'id': f"chatcmpl-{uuid.uuid4().hex[:12]}",
+            'object': 'chat.completion',
+            'created': int(time.time()),
+            'model': payload.get('model') or self.server.model,
+            'choices': [{'index': 0, 'finish_reason': 'stop',
+                         'message': {'role': 'assistant', 'content': content}}],
+            'usage': {'prompt_tokens': prompt_tokens, 'completion_tokens': completion_tokens,
+                      'total_tokens': prompt_tokens + completion_tokens},
+        })
+
+    def _api_chat(self, payload):
+        messages = payload.get('messages') or []
+        prompt_tokens = sum(_approx_tokens(str(m.get('content', ''))) for m in messages)
+        ok, delay, answer = self._simulate(prompt_tokens)
+        if not ok:
+            self._send_json(500, {'error': 'mock server: injected failure'})
+            return
+        content = f"Best Answer: {answer}\nExplanation: mock response."
+        self._send_json(200, {
+            'model': payload.get('model') or self.server.model,
+            'created_at': datetime.now(timezone.utc).isoformat(),
+            'message': {'role': 'assistant', 'content': content},
+            'done': True,
+            'done_reason': 'stop',
+            'total_duration': int(delay * 1e9),
+            'prompt_eval_count': prompt_tokens,
+            'eval_count': _approx_tokens(content),
+        })
+
+    def _api_embed(self, payload):
+        inputs = payload.get('input') or []
+        if isinstance(inputs, str):
+            inputs = [inputs]
+        ok, _, _ = self._simulate(sum(_approx_tokens(str(t)) for t in inputs))
+        if not ok:
+            self._send_json(500, {'error': 'mock server: injected failure'})
+            return
+        self._send_json(200, {'model': payload.get('model') or self.server.model,
+                              'embeddings': [_mock_embedding(str(t)) for t in inputs]})
+
+
+def make_mock_server(latency='fixed:0', slots=1, error_rate=0.0, ms_per_prompt_token=0.0,
+                     seed=0, host='127.0.0.1', port=0, model='mock-chat'):
+    """Build (but don't start) a stand-in Ollama server; port=0 picks a free
+    port (read it back from server.server_address)."""
+    server = ThreadingHTTPServer((host, port), _MockOllamaHandler)
+    server.daemon_threads = True
+    server.latency = parse_latency_spec(latency)
+    server.slots = threading.BoundedSemaphore(max(1, int(slots)))
+    server.error_rate = float(error_rate)
+    server.ms_per_prompt_token = float(ms_per_prompt_token)
+    server.rng = random.Random(seed)
+    server.rng_lock = threading.Lock()
+    server.stats = {'requests': 0, 'errors': 0}
+    server.stats_lock = threading.Lock()
+    server.model = model
+    return server
+
+
+def _serve_mock_process(server_opts, port_conn):
+    server = make_mock_server(**server_opts)
+    port_conn.send(server.server_address[1])
+    port_conn.close()
+    server.serve_forever()
+
+
+@contextlib.contextmanager
+def running_mock_server(server_opts, in_process=False):
+    """Yield (host, port) of a running stand-in server, torn down on exit.
+    in_process=True serves from a thread instead of a child process —
+    cheaper to start (tests use it) but its CPU/RSS then count against the
+    tagger being measured."""
+    host = server_opts.get('host', '127.0.0.1')
+    if in_process:
+        server = make_mock_server(**server_opts)
+        t = threading.Thread(target=server.serve_forever, daemon=True)
+        t.start()
+        try:
+            yield host, server.server_address[1]
+        finally:
+            server.shutdown()
+            server.server_close()
+        return
+    parent_conn, child_conn = multiprocessing.Pipe(duplex=False)
+    proc = multiprocessing.Process(target=_serve_mock_process, args=(server_opts, child_conn), daemon=True)
+    proc.start()
+    try:
+        if not parent_conn.poll(15):
+            raise RuntimeError('Mock Ollama server did not start.')
+        yield host, parent_conn.recv()
+    finally:
+        proc.terminate()
+        proc.join(5)
+
+
+# ─── Harness ─────────────────────────────────────────────────────────────────
+
+def make_synthetic_csv(path, rows, width, cell_chars=60, seed=0):
+    """rows x width CSV: an id column plus width-1 text columns of roughly
+    cell_chars characters of filler words each."""
+    import pandas as pd
+    rnd = random.Random(seed)
+
+    def cell():
+        words, n = [], 0
+        while n < cell_chars:
+            w = rnd.choice(_WORDS)
+            words.append(w)
+            n += len(w) + 1
+        return ' '.join(words)
+
+    data = {'id': [f"item{i}" for i in range(rows)]}
+    for c in range(1, max(1, width)):
+        data[f"text_{c}"] = [cell() for _ in range(rows)]
+    pd.DataFrame(data).to_csv(path, index=False)
+
+
+def make_synthetic_tags(n_tags, retrieval=False, conditional=True):
+    """n_tags text tags over the synthetic CSV. With conditional=True the
+    last tag only fires when the first answered YES (~half the rows), so
+    condition evaluation and SendContext carry-over are exercised too."""
+    tags = []
+    for t in range(max(1, n_tags)):
+        d = {'OutputColumn': f"tag_{t}", 'PromptTemplate': f"Does {{id}} satisfy property {t}? Answer YES or NO."}
+        if retrieval and t == 0:
+            d['RetrievalConfig'] = json.dumps({'enabled': True, 'top_k': 3})
+        tags.append(d)
+    if conditional and len(tags) > 1:
+        tags[-1].update({'ConditionField': 'tag_0', 'ConditionOp': '==', 'ConditionValue': 'YES',
+                         'DefaultValue': 'N/A', 'SendContext': '1'})
+    return tags
+
+
+@contextlib.contextmanager
+def _isolated_app_state(tmp_dir):
+    """Point the app's registries and MEDIA_ROOT at tmp_dir for the
+    duration, so a benchmark never touches the real projects/connections/
+    stats files."""
+    from django.conf import settings
+    from . import utils
+    names = ('PROJECTS_CSV', 'CONNECTIONS_CSV', 'IMAGE_CONNECTIONS_CSV', 'STATS_CSV', 'RAG_PROJECTS_JSON')
+    saved = {n: getattr(utils, n) for n in names}
+    saved_media = settings.MEDIA_ROOT
+    try:
+        for n in names:
+            setattr(utils, n, os.path.join(tmp_dir, os.path.basename(saved[n])))
+        settings.MEDIA_ROOT = os.path.join(tmp_dir, 'media')
+        os.makedirs(settings.MEDIA_ROOT, exist_ok=True)
+        yield
+    finally:
+        for n, v in saved.items():
+            setattr(utils, n, v)
+        settings.MEDIA_ROOT = saved_media
+
+
+class _RssSampler:
+    """Peak resident set size over a window, sampled from /proc (Linux).
+    ru_maxrss is a whole-process high-water mark that can't be reset between
+    scenarios; elsewhere it's the fallback and is flagged as such."""
+
+    def __init__(self, interval=0.05):
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+        self._page = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+        self.source = 'proc' if os.path.exists('/proc/self/statm') else 'ru_maxrss'
+
+    def _read(self):
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * self._page
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.peak = max(self.peak, self._read())
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        if self.source == 'proc':
+            self.peak = self._read()
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        if self.source == 'proc':
+            self._stop.set()
+            self._thread.join()
+        else:
+            ru = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            self.peak = ru if sys.platform == 'darwin' else ru * 1024
+        return False
+
+
+def _percentile(values, q):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    k = (len(ordered) - 1) * q / 100
+    lo, hi = int(math.floor(k)), int(math.ceil(k))
+    return ordered[lo] + (ordered[hi] - ordered[lo]) * (k - lo)
+
+
+def _row_latencies_ms(trace_path):
+    try:
+        with open(trace_path) as f:
+            events = json.load(f)
+    except (OSError, ValueError):
+        return []
+    return [e['dur'] / 1000 for e in events if e.get('ph') == 'X' and e.get('name') == 'row']
+
+
+def run_scenario(host, port, rows, width, n_tags=3, cell_chars=60, retrieval=False, seed=0):
+    """Tag one synthetic CSV end to end against the server at host:port and
+    return its measurements. Must be called inside _isolated_app_state."""
+    from django.conf import settings
+    from . import utils
+
+    utils.save_connection(host, port, 'mock-chat', 'mock-embed')
+    work_dir = os.path.join(settings.MEDIA_ROOT, f"bench_{rows}x{width}_{uuid.uuid4().hex[:6]}")
+    os.makedirs(work_dir)
+    csv_path = os.path.join(work_dir, 'data.csv')
+    make_synthetic_csv(csv_path, rows, width, cell_chars, seed)
+    tags = make_synthetic_tags(n_tags, retrieval=retrieval)
+
+    project_id = None
+    if retrieval:
+        project_id = f"bench-{uuid.uuid4().hex[:8]}"
+        utils.save_project(project_id, f"bench {rows}x{width}", csv_path)
+        ref_path = os.path.join(work_dir, 'reference.csv')
+        make_synthetic_csv(ref_path, 200, 3, cell_chars, seed + 1)
+        utils.add_reference_file(project_id, 'reference.csv', ref_path, 'csv', os.path.getsize(ref_path))
+        if not utils.build_reference_index(project_id):
+            raise RuntimeError(utils.REFERENCE_INDEX_STATUS[project_id].get('message', 'index build failed'))
+
+    session_key = f"bench-{uuid.uuid4()}"
+    ru0 = resource.getrusage(resource.RUSAGE_SELF)
+    with _RssSampler() as rss:
+        t0 = time.perf_counter()
+        utils.row_by_row_tagger(session_key, csv_path, '', [], tags, project_id=project_id)
+        wall = time.perf_counter() - t0
+    ru1 = resource.getrusage(resource.RUSAGE_SELF)
+    status = utils.PROGRESS_STATUS.pop(session_key, {})
+
+    tagged_path = os.path.splitext(csv_path)[0] + '_tagged.csv'
+    latencies = _row_latencies_ms(utils.get_run_trace_path(tagged_path))
+    df = utils.read_csv_safe(tagged_path)
+    out_cols = [t['OutputColumn'] for t in tags]
+    errors = int(sum((df[c].astype(str) == 'ERROR').sum() for c in out_cols))
+    cpu = (ru1.ru_utime - ru0.ru_utime) + (ru1.ru_stime - ru0.ru_stime)
+    return {
+        'rows':              rows,
+        'width':             width,
+        'tags':              len(tags),
+        'cell_chars':        cell_chars,
+        'retrieval':         retrieval,
+        'status':            status.get('status', ''),
+        'wall_sec':          round(wall, 3),
+        'rows_per_sec':      round(rows / wall, 2) if wall else 0.0,
+        'row_latency_ms':    {
+            'p50':  round(_percentile(latencies, 50), 2),
+            'p95':  round(_percentile(latencies, 95), 2),
+            'max':  round(max(latencies), 2) if latencies else 0.0,
+            'mean': round(sum(latencies) / len(latencies), 2) if latencies else 0.0,
+        },
+        'cpu_sec':           round(cpu, 3),
+        'cpu_ms_per_row':    round(cpu / rows * 1000, 3) if rows else 0.0,
+        'peak_rss_mb':       round(rss.peak / 2**20, 1),
+        'rss_source':        rss.source,
+        'prompt_tokens':     status.get('prompt_tokens', 0),
+        'completion_tokens': status.get('completion_tokens', 0),
+        'llm_time_sec':      round(status.get('llm_time_sec', 0.0), 3),
+        'error_cells':       errors,
+    }
+
+
+def _git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, timeout=5, cwd=os.path.dirname(__file__)).stdout.strip()
+    except Exception:
+        return ''
+
+
+def run_throughput_benchmark(row_counts, widths, server_opts, n_tags=3, cell_chars=60,
+                             retrieval=False, in_process=False, progress=None):
+    """Every (rows, width) combination, smallest first, against one mock
+    server. Returns the full results document (see write_results)."""
+    scenarios = []
+    tmp_dir = tempfile.mkdtemp(prefix='odt_bench_')
+    try:
+        with running_mock_server(server_opts, in_process=in_process) as (host, port), \
+                _isolated_app_state(tmp_dir):
+            for rows in sorted(row_counts):
+                for width in sorted(widths):
+                    result = run_scenario(host, port, rows, width, n_tags, cell_chars,
+                                          retrieval, seed=server_opts.get('seed', 0))
+                    scenarios.append(result)
+                    if progress:
+                        progress(result)
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+    return {
+        'benchmark':   'throughput',
+        'created_at':  datetime.now().isoformat(),
+        'git_rev':     _git_revision(),
+        'python':      platform.python_version(),
+        'platform':    platform.platform(),
+        'server':      {k: v for k, v in server_opts.items() if k not in ('host', 'port')},
+        'scenarios':   scenarios,
+    }
+
+
+def write_results(results, path):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump(results, f, indent=2)
+    return path
+
+
+# ─── Image path (call_image_generation → _save_generated_images) ────────────
+# What ODT itself spends per generated image: the HTTP round trip, decoding
+# the binary (or, from older servers, base64 JSON) response, any format
+# conversion, the file write and the image-store insert. Run it against sd_server started with SD_FAKE_PIPELINE=1 (see
+# sd_server/fake_pipeline.py) for the real server's encode path, or against
+# the stand-in below when only ODT's side is of interest.
+
+
+def _synthetic_png(width, height, image_format='png'):
+    from PIL import Image
+    w, h = int(width), int(height)
+    # Gradients for structure, noise so PNG compression isn't trivially cheap.
+    img = Image.merge('RGB', [Image.linear_gradient('L').resize((w, h)),
+                              Image.radial_gradient('L').resize((w, h)),
+                              Image.effect_noise((w, h), 24)])
+    buf = io.BytesIO()
+    if image_format == 'jpeg':
+        img.save(buf, format='JPEG', quality=92)
+    else:
+        img.save(buf, format='PNG')
+    return buf.getvalue()
+
+
+class _MockSdHandler(BaseHTTPRequestHandler):
+    """Just /health and /generate, answering with a pre-encoded image per
+    size and format after a fixed delay — so the numbers are ODT's cost, not
+    PIL's. Speaks the binary response format when asked, like sd_server."""
+    protocol_version = 'HTTP/1.1'
+    log_message = _MockOllamaHandler.log_message
+    _send_json = _MockOllamaHandler._send_json
+    _read_json = _MockOllamaHandler._read_json
+
+    def do_GET(self):
+        if self.path.startswith('/health'):
+            self._send_json(200, {'status': 'ok', 'loaded_model': self.server.model})
+        else:
+            self._send_json(404, {'detail': 'not found'})
+
+    def do_POST(self):
+        if not self.path.startswith('/generate'):
+            self._send_json(404, {'detail': 'not found'})
+            return
+        payload = self._read_json()
+        fmt = 'jpeg' if payload.get('image_format') == 'jpeg' else 'png'
+        key = (int(payload.get('width', 512)), int(payload.get('height', 512)), fmt)
+        with self.server.cache_lock:
+            if key not in self.server.png_cache:
+                self.server.png_cache[key] = _synthetic_png(*key)
+            blob = self.server.png_cache[key]
+        time.sleep(self.server.delay)
+        blobs = [blob] * max(1, int(payload.get('num_images', 1)))
+        header = {'seed_used': payload.get('seed', 0), 'elapsed_sec': self.server.delay,
+                  'format': 'jpg' if fmt == 'jpeg' else fmt}
+        if payload.get('response_format') != 'binary':
+            self._send_json(200, {**header, 'images': [base64.b64encode(b).decode('ascii') for b in blobs]})
+            return
+        head = json.dumps({**header, 'sizes': [len(b) for b in blobs]}).encode('utf-8')
+        body = struct.pack('>I', len(head)) + head + b''.join(blobs)
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/x-odt-images')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+@contextlib.contextmanager
+def running_mock_sd_server(delay_ms=0.0, model='mock-sd'):
+    """Yield (host, port) of a stand-in SD server on a thread."""
+    server = ThreadingHTTPServer(('127.0.0.1', 0), _MockSdHandler)
+    server.daemon_threads = True
+    server.delay = float(delay_ms) / 1000
+    server.model = model
+    server.png_cache = {}
+    server.cache_lock = threading.Lock()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        yield '127.0.0.1', server.server_address[1]
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def _ms_stats(values):
+    return {
+        'p50':  round(_percentile(values, 50), 2),
+        'p95':  round(_percentile(values, 95), 2),
+        'max':  round(max(values), 2) if values else 0.0,
+        'mean': round(sum(values) / len(values), 2) if values else 0.0,
+    }
+
+
+def run_image_path_scenario(rows, width, height, ext, params):
+    """Generate and save `rows` images through the real ODT functions
+    against the active image connection. Must be called inside
+    _isolated_app_state."""
+    from django.conf import settings
+    from . import utils
+
+    work_dir = os.path.join(settings.MEDIA_ROOT, f"imgbench_{width}x{height}_{ext}_{uuid.uuid4().hex[:6]}")
+    images_dir = os.path.join(work_dir, 'images')
+    os.makedirs(images_dir)
+    tagged_path = os.path.join(work_dir, 'data_tagged.csv')
+    images_rel = os.path.relpath(images_dir, settings.MEDIA_ROOT).replace(os.sep, '/')
+    params = {**params, 'width': width, 'height': height}
+
+    generate_ms, server_ms, save_ms, file_bytes, errors = [], [], [], [], 0
+    t_start = time.perf_counter()
+    for i in range(rows):
+        t0 = time.perf_counter()
+        images, meta, _ = utils.call_image_generation(f"synthetic prompt {i}", params, ext)
+        t1 = time.perf_counter()
+        if not images:
+            errors += 1
+            continue
+        saved = utils._save_generated_images(images_dir, images_rel, tagged_path, i, 'Image',
+                                             0, images, f"row{i}", ext)
+        t2 = time.perf_counter()
+        generate_ms.append((t1 - t0) * 1000)
+        server_ms.append((meta.get('server_elapsed') or 0) * 1000)
+        save_ms.append((t2 - t1) * 1000 / len(images))
+        file_bytes.extend(os.path.getsize(os.path.join(settings.MEDIA_ROOT, r)) for r in saved)
+    wall = time.perf_counter() - t_start
+
+    # Compare the first and last quarter: per-image save cost should stay
+    # flat as the image store grows with row count.
+    quarter = max(1, len(save_ms) // 4)
+    return {
+        'rows':              rows,
+        'width':             width,
+        'height':            height,
+        'format':            ext,
+        'num_images':        params.get('num_images', 1),
+        'wall_sec':          round(wall, 3),
+        'images_per_sec':    round(len(file_bytes) / wall, 2) if wall else 0.0,
+        'generate_ms':       _ms_stats(generate_ms),
+        'server_ms':         _ms_stats(server_ms),
+        'transport_ms':      _ms_stats([g - s for g, s in zip(generate_ms, server_ms)]),
+        'save_ms_per_image': _ms_stats(save_ms),
+        'save_ms_first_quarter': round(sum(save_ms[:quarter]) / quarter, 2) if save_ms else 0.0,
+        'save_ms_last_quarter':  round(sum(save_ms[-quarter:]) / quarter, 2) if save_ms else 0.0,
+        'mean_file_kb':      round(sum(file_bytes) / len(file_bytes) / 1024, 1) if file_bytes else 0.0,
+        'errors':            errors,
+    }
+
+
+def run_image_path_benchmark(sizes, formats, rows=20, host=None, port=None, model='',
+                             mock_delay_ms=0.0, steps=4, num_images=1, progress=None):
+    """Every (size, format) combination against the SD server at host:port,
+    or against running_mock_sd_server when host is None. Returns the full
+    results document (see write_results)."""
+    scenarios = []
+    tmp_dir = tempfile.mkdtemp(prefix='odt_imgbench_')
+    params = {'model': model or 'mock-sd', 'steps': steps, 'num_images': num_images, 'seed': 42}
+    try:
+        with contextlib.ExitStack() as stack:
+            if host is None:
+                host, port = stack.enter_context(running_mock_sd_server(mock_delay_ms))
+                target = 'mock'
+            else:
+                target = f"{host}:{port}"
+            stack.enter_context(_isolated_app_state(tmp_dir))
+            from . import utils
+            utils.save_image_connection(host, port, params['model'])
+            for width, height in sizes:
+                for ext in formats:
+                    result = run_image_path_scenario(rows, width, height, ext, params)
+                    scenarios.append(result)
+                    if progress:
+                        progress(result)
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+    return {
+        'benchmark':   'image_path',
+        'created_at':  datetime.now().isoformat(),
+        'git_rev':     _git_revision(),
+        'python':      platform.python_version(),
+        'platform':    platform.platform(),
+        'target':      target,
+        'params':      params,
+        'scenarios':   scenarios,
+    }
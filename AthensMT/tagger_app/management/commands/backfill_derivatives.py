@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand
+
+from tagger_app.utils import (
+    load_projects,
+    missing_image_derivatives,
+    render_image_derivatives,
+    tagged_path_for_project,
+)
+
+
+class Command(BaseCommand):
+    help = ('Render missing thumbnail/preview derivatives for generated images, for image projects '
+            'created before derivatives existed (the app also backfills lazily, per page visit)')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--project', default='', help='Only this project_id (default: every image project)')
+
+    def handle(self, *args, **options):
+        projects = [p for p in load_projects() if p.get('mode') == 'image'
+                    and (not options['project'] or str(p['project_id']) == options['project'])]
+        total = 0
+        for project in projects:
+            tagged_path = tagged_path_for_project(project)
+            if not tagged_path:
+                continue
+            missing = missing_image_derivatives(tagged_path)
+            for n, rel_path in enumerate(missing, 1):
+                try:
+                    render_image_derivatives(tagged_path, rel_path)
+                except Exception as e:
+                    self.stderr.write(f"  {rel_path}: {e}")
+                if n % 100 == 0:
+                    self.stdout.write(f"  {project.get('name', project['project_id'])}: {n}/{len(missing)}")
+            self.stdout.write(f"{project.get('name', project['project_id'])}: {len(missing)} image(s) processed")
+            total += len(missing)
+        self.stdout.write(self.style.SUCCESS(f"Done — {total} image(s) across {len(projects)} project(s)."))
@@ -0,0 +1,61 @@
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from tagger_app.bench import run_image_path_benchmark, write_results
+
+
+def _sizes(value):
+    try:
+        return [tuple(int(x) for x in s.lower().split('x')) for s in value.split(',') if s.strip()]
+    except ValueError:
+        raise CommandError(f"Expected sizes like 512x512,1024x768, got '{value}'.")
+
+
+class Command(BaseCommand):
+    help = ('Benchmark the image-generation path (SD request, decode, convert, save, image store) '
+            'against an SD server or a built-in stand-in, and write the results to JSON')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='',
+                            help='SD server host — e.g. one started with SD_FAKE_PIPELINE=1. '
+                                 'Omit to use the built-in stand-in')
+        parser.add_argument('--port', type=int, default=7860)
+        parser.add_argument('--model', default='', help='model_id to request (default: mock-sd)')
+        parser.add_argument('--rows', type=int, default=20, help='Images per scenario (default: 20)')
+        parser.add_argument('--sizes', default='512x512,1024x1024',
+                            help='Comma-separated WIDTHxHEIGHT sizes (default: 512x512,1024x1024)')
+        parser.add_argument('--formats', default='png,jpg', help='Output formats to save as (default: png,jpg)')
+        parser.add_argument('--steps', type=int, default=4)
+        parser.add_argument('--num-images', type=int, default=1)
+        parser.add_argument('--mock-delay', type=float, default=0.0,
+                            help='Stand-in server latency per request, in ms (default: 0)')
+        parser.add_argument('--output', default='',
+                            help='Results JSON path (default: bench_results/image_path_<timestamp>.json)')
+
+    def handle(self, *args, **options):
+        formats = [f.strip().lower() for f in options['formats'].split(',') if f.strip()]
+        bad = [f for f in formats if f not in ('png', 'jpg', 'jpeg')]
+        if bad:
+            raise CommandError(f"Unsupported format(s): {', '.join(bad)}")
+
+        def progress(r):
+            self.stdout.write(
+                f"  {r['width']}x{r['height']} {r['format']:<4}: {r['images_per_sec']:>7.2f} img/s  "
+                f"transport p50 {r['transport_ms']['p50']:.1f}ms  save p50 {r['save_ms_per_image']['p50']:.1f}ms "
+                f"(first/last quarter {r['save_ms_first_quarter']:.1f}/{r['save_ms_last_quarter']:.1f}ms)  "
+                f"{r['mean_file_kb']:.0f}KB  errors {r['errors']}"
+            )
+
+        host = options['host'] or None
+        self.stdout.write(f"SD server: {host}:{options['port']}" if host else "SD server: built-in stand-in")
+        results = run_image_path_benchmark(
+            _sizes(options['sizes']), formats, rows=options['rows'], host=host, port=options['port'],
+            model=options['model'], mock_delay_ms=options['mock_delay'], steps=options['steps'],
+            num_images=options['num_images'], progress=progress,
+        )
+        output = options['output'] or os.path.join(
+            'bench_results', f"image_path_{time.strftime('%Y%m%d_%H%M%S')}.json")
+        write_results(results, output)
+        self.stdout.write(self.style.SUCCESS(f"Results written to {output}"))
@@ -0,0 +1,80 @@
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from tagger_app.bench import parse_latency_spec, run_throughput_benchmark, write_results
+
+
+def _int_list(value):
+    try:
+        return [int(v) for v in value.split(',') if v.strip()]
+    except ValueError:
+        raise CommandError(f"Expected a comma-separated list of integers, got '{value}'.")
+
+
+class Command(BaseCommand):
+    help = ('Benchmark text-mode tagging throughput against a local mock Ollama server '
+            '(no GPU needed) and write the results to JSON')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', default='100,1000',
+                            help='Comma-separated row counts to benchmark (default: 100,1000)')
+        parser.add_argument('--widths', default='5,40',
+                            help='Comma-separated column counts per synthetic CSV (default: 5,40)')
+        parser.add_argument('--tags', type=int, default=3,
+                            help='Output tags per row; the last is conditional on the first (default: 3)')
+        parser.add_argument('--cell-chars', type=int, default=60,
+                            help='Approximate characters per synthetic text cell (default: 60)')
+        parser.add_argument('--latency', default='fixed:20',
+                            help='Mock response latency in ms: fixed:MS, uniform:LO:HI, normal:MEAN:SD '
+                                 'or lognormal:MEDIAN:SIGMA (default: fixed:20)')
+        parser.add_argument('--ms-per-prompt-token', type=float, default=0.0,
+                            help='Extra simulated prefill time per prompt token, in ms (default: 0)')
+        parser.add_argument('--slots', type=int, default=1,
+                            help='Parallel request slots on the mock server, like OLLAMA_NUM_PARALLEL (default: 1)')
+        parser.add_argument('--error-rate', type=float, default=0.0,
+                            help='Fraction of mock requests that fail with HTTP 500 (default: 0)')
+        parser.add_argument('--retrieval', action='store_true',
+                            help='Ground the first tag on a synthetic reference index (exercises /api/embed)')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--in-process', action='store_true',
+                            help='Serve the mock from a thread instead of a child process '
+                                 '(its CPU/RSS then count against the measurement)')
+        parser.add_argument('--output', default='',
+                            help='Results JSON path (default: bench_results/throughput_<timestamp>.json)')
+
+    def handle(self, *args, **options):
+        try:
+            parse_latency_spec(options['latency'])
+        except ValueError as e:
+            raise CommandError(str(e))
+        if not 0 <= options['error_rate'] <= 1:
+            raise CommandError('--error-rate must be between 0 and 1.')
+
+        server_opts = {
+            'latency':             options['latency'],
+            'slots':               options['slots'],
+            'error_rate':          options['error_rate'],
+            'ms_per_prompt_token': options['ms_per_prompt_token'],
+            'seed':                options['seed'],
+        }
+
+        def progress(r):
+            lat = r['row_latency_ms']
+            self.stdout.write(
+                f"  {r['rows']:>6} rows x {r['width']:>3} cols: {r['rows_per_sec']:>8.2f} rows/s  "
+                f"p50 {lat['p50']:.1f}ms  p95 {lat['p95']:.1f}ms  cpu {r['cpu_ms_per_row']:.2f}ms/row  "
+                f"rss {r['peak_rss_mb']:.0f}MB  errors {r['error_cells']}"
+            )
+
+        self.stdout.write(f"Mock server: {server_opts}")
+        results = run_throughput_benchmark(
+            _int_list(options['rows']), _int_list(options['widths']), server_opts,
+            n_tags=options['tags'], cell_chars=options['cell_chars'],
+            retrieval=options['retrieval'], in_process=options['in_process'], progress=progress,
+        )
+        output = options['output'] or os.path.join(
+            'bench_results', f"throughput_{time.strftime('%Y%m%d_%H%M%S')}.json")
+        write_results(results, output)
+        self.stdout.write(self.style.SUCCESS(f"Results written to {output}"))
@@ -0,0 +1,244 @@
+"""
+Process-wide metrics, served at /metrics in the Prometheus text exposition
+format (0.0.4) so a scraper can chart throughput and alert when it drops.
+
+Deliberately dependency-free — a counter, a gauge and a histogram are a
+few dozen lines each, and the app otherwise never needs prometheus_client.
+Every metric is safe to update from the tagging/background threads.
+Gauges can instead be backed by a function evaluated at scrape time, for
+values already held elsewhere (PROGRESS_STATUS run states, pending rows).
+
+Like the LocMemCache counters these are per-process; scrape each worker.
+"""
+import contextlib
+import math
+import threading
+import time
+
+# Seconds. Text calls land anywhere from tens of ms to minutes; the upper
+# buckets matter for image generation and cold model loads.
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300, 600)
+IO_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+
+REGISTRY = []
+
+
+def _escape(value, quotes=True):
+    value = str(value).replace('\\', '\\\\').replace('\n', '\\n')
+    return value.replace('"', '\\"') if quotes else value
+
+
+def _format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    if value == -math.inf:
+        return '-Inf'
+    if isinstance(value, float) and value.is_integer() and abs(value) < 1e15:
+        return str(int(value))
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{n}="{_escape(v)}"' for n, v in pairs) + '}'
+
+
+class _Metric:
+    kind = ''
+
+    def __init__(self, name, documentation, labelnames=(), registry=REGISTRY):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        if registry is not None:
+            registry.append(self)
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[n]) for n in self.labelnames)
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+    def _samples(self):
+        with self._lock:
+            return [(self.name, key, (), value) for key, value in sorted(self._values.items())]
+
+    def render(self):
+        lines = [f"# HELP {self.name} {_escape(self.documentation, quotes=False)}", f"# TYPE {self.name} {self.kind}"]
+        for name, key, extra, value in self._samples():
+            lines.append(f"{name}{_format_labels(self.labelnames, key, extra)} {_format_value(value)}")
+        return lines
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        if amount < 0:
+            raise ValueError('Counters can only increase.')
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def get(self, **labels):
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+
+class Gauge(_Metric):
+    kind = 'gauge'
+
+    def __init__(self, name, documentation, labelnames=(), registry=REGISTRY):
+        super().__init__(name, documentation, labelnames, registry)
+        self._function = None
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def set_function(self, fn):
+        """Compute the gauge at scrape time instead: fn() returns
+        {label-values tuple: value} (or a bare number when unlabelled)."""
+        self._function = fn
+
+    def _samples(self):
+        if self._function is None:
+            return super()._samples()
+        values = self._function()
+        if not isinstance(values, dict):
+            values = {(): values}
+        return [(self.name, tuple(str(v) for v in key), (), value) for key, value in sorted(values.items())]
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS, registry=REGISTRY):
+        super().__init__(name, documentation, labelnames, registry)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = {'counts': [0] * len(self.buckets), 'sum': 0.0}
+            for n, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state['counts'][n] += 1
+                    break
+            state['sum'] += value
+
+    @contextlib.contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def _samples(self):
+        out = []
+        with self._lock:
+            items = sorted((k, {'counts': list(s['counts']), 'sum': s['sum']}) for k, s in self._values.items())
+        for key, state in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, state['counts']):
+                cumulative += count
+                out.append((f"{self.name}_bucket", key, (('le', _format_value(float(bound))),), cumulative))
+            out.append((f"{self.name}_sum", key, (), state['sum']))
+            out.append((f"{self.name}_count", key, (), cumulative))
+        return out
+
+
+def render(registry=REGISTRY):
+    """The whole registry as one exposition-format document."""
+    lines = []
+    for metric in registry:
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
+
+
+# ─── Metrics ─────────────────────────────────────────────────────────────────
+# Backend latency is labelled by host ("host:port") and model so a slow or
+# overloaded Ollama/SD box stands out; outcome is ok|error.
+
+ROWS_PROCESSED = Counter(
+    'odt_rows_processed_total', 'Rows completed by tagging runs (rate() gives rows/sec).', ['mode'])
+ROWS_PER_SECOND = Gauge(
+    'odt_rows_per_second', 'Combined row throughput of the runs currently running, since each started.')
+ROWS_PENDING = Gauge(
+    'odt_rows_pending', 'Rows still queued in running or paused runs.')
+RUNS = Gauge(
+    'odt_runs', 'Tagging runs known to this process, by status.', ['status'])
+RUNS_COMPLETED = Counter(
+    'odt_runs_completed_total', 'Tagging runs that ended, by outcome.', ['mode', 'outcome'])
+INFLIGHT_REQUESTS = Gauge(
+    'odt_inflight_requests', 'Backend requests currently awaiting a response.', ['kind', 'host'])
+LLM_LATENCY = Histogram(
+    'odt_llm_request_duration_seconds', 'Chat-completion latency.', ['host', 'model', 'outcome'])
+IMAGE_LATENCY = Histogram(
+    'odt_image_request_duration_seconds', 'SD server /generate latency.', ['host', 'model', 'outcome'])
+EMBEDDING_LATENCY = Histogram(
+    'odt_embedding_request_duration_seconds', 'Ollama /api/embed latency.', ['host', 'model', 'outcome'])
+CACHE_LOOKUPS = Counter(
+    'odt_cache_lookups_total', 'In-process cache lookups, by cache and hit/miss.', ['cache', 'result'])
+CACHE_HIT_RATIO = Gauge(
+    'odt_cache_hit_ratio', 'Hits / lookups since process start, per cache.', ['cache'])
+CSV_WRITE = Histogram(
+    'odt_csv_write_duration_seconds', 'Time to write a CSV, by file kind.', ['kind'], buckets=IO_BUCKETS)
+
+_LATENCY_BY_KIND = {'llm': LLM_LATENCY, 'image': IMAGE_LATENCY, 'embedding': EMBEDDING_LATENCY}
+
+
+def _hit_ratios():
+    with CACHE_LOOKUPS._lock:
+        totals = dict(CACHE_LOOKUPS._values)
+    out = {}
+    for cache_name in {k[0] for k in totals}:
+        hits = totals.get((cache_name, 'hit'), 0)
+        lookups = hits + totals.get((cache_name, 'miss'), 0)
+        out[(cache_name,)] = hits / lookups if lookups else 0.0
+    return out
+
+
+CACHE_HIT_RATIO.set_function(_hit_ratios)
+
+
+def cache_lookup(cache_name, hit):
+    CACHE_LOOKUPS.inc(cache=cache_name, result='hit' if hit else 'miss')
+
+
+@contextlib.contextmanager
+def backend_request(kind, host, model):
+    """Count one llm|image|embedding call as in flight and time it into that
+    kind's latency histogram. The outcome is 'error' if the block raises or
+    sets state['outcome'] itself (for calls that report failure in-band)."""
+    state = {'outcome': 'ok'}
+    INFLIGHT_REQUESTS.inc(kind=kind, host=host)
+    start = time.perf_counter()
+    try:
+        yield state
+    except BaseException:
+        state['outcome'] = 'error'
+        raise
+    finally:
+        INFLIGHT_REQUESTS.dec(kind=kind, host=host)
+        _LATENCY_BY_KIND[kind].observe(time.perf_counter() - start,
+                                       host=host, model=model or '', outcome=state['outcome'])
@@ -0,0 +1,1058 @@
+"""
+Tests for the tagging pipeline's offline pieces — prompt building, run
+estimates, traces and results for text runs; image mode's store,
+derivatives, batching, job queue and write-behind saves; the gallery
+index and zip export; and the throughput bench and metrics.
+
+Everything here runs without a real Ollama/SD server: LLM and image calls
+are patched out with canned answers and usage, so this stays in the fast,
+always-on tier alongside test_retrieval's tier-1 tests:
+
+  python manage.py test tagger_app.test_tagging
+"""
+import io
+import json
+import os
+import shutil
+import tempfile
+from unittest import mock
+
+import pandas as pd
+from django.conf import settings
+from django.test import TestCase, override_settings
+
+from . import utils
+
+
+class _IsolatedMediaMixin:
+    """Same isolation as test_retrieval's _IsolatedRegistryMixin: registry
+    CSVs and MEDIA_ROOT point at a throwaway temp directory."""
+
+    def setUp(self):
+        super().setUp()
+        self.tmp_dir = tempfile.mkdtemp(prefix='odt_tagging_test_')
+        self._patches = [
+            mock.patch.object(utils, 'PROJECTS_CSV', os.path.join(self.tmp_dir, 'projects.csv')),
+            mock.patch.object(utils, 'CONNECTIONS_CSV', os.path.join(self.tmp_dir, 'connections.csv')),
+            mock.patch.object(utils, 'STATS_CSV', os.path.join(self.tmp_dir, 'stats.csv')),
+            mock.patch.object(utils, 'RAG_PROJECTS_JSON', os.path.join(self.tmp_dir, 'rag_projects.json')),
+            mock.patch.object(utils, 'GALLERY_INDEX_DB', os.path.join(self.tmp_dir, 'gallery_index.sqlite3')),
+        ]
+        for p in self._patches:
+            p.start()
+        self._settings_override = override_settings(MEDIA_ROOT=os.path.join(self.tmp_dir, 'media'))
+        self._settings_override.enable()
+        os.makedirs(settings.MEDIA_ROOT, exist_ok=True)
+
+    def tearDown(self):
+        self._settings_override.disable()
+        for p in self._patches:
+            p.stop()
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+        super().tearDown()
+
+    def write_csv(self, df, name='data.csv'):
+        path = os.path.join(settings.MEDIA_ROOT, name)
+        df.to_csv(path, index=False)
+        return path
+
+
+def _fake_llm(answer='YES', prompt_tokens=100, completion_tokens=10, elapsed=0.5):
+    def call(system_prompt, user_prompt):
+        return answer, 'because', {
+            'prompt_tokens': prompt_tokens, 'completion_tokens': completion_tokens,
+            'elapsed_sec': elapsed, 'host': 'h', 'port': '1', 'model': 'm',
+        }
+    return call
+
+
+def _png(width, height, image_format='PNG'):
+    """Noise image bytes, so encoders and resizes have real work to do."""
+    from PIL import Image
+    buf = io.BytesIO()
+    Image.effect_noise((width, height), 24).convert('RGB').save(buf, format=image_format)
+    return buf.getvalue()
+
+
+class _ImageRunMixin(_IsolatedMediaMixin):
+    """An image-mode run over a small CSV, with derivatives, stats and the
+    server's capability probe patched out; tests patch the generation calls
+    they exercise around run_image_tagger."""
+
+    definitions = [{'OutputColumn': 'img', 'PromptTemplate': 'Draw {name}', 'ImageParams': '{"model": "m"}'}]
+
+    def setUp(self):
+        super().setUp()
+        self.png = _png(8, 8)
+        self.usage = {'host': 'h', 'port': '1', 'model': 'm', 'prompt_tokens': 0,
+                      'completion_tokens': 0, 'elapsed_sec': 1.0}
+        for patcher in (mock.patch.object(utils, 'queue_image_derivatives'),
+                        mock.patch.object(utils, 'record_stat'),
+                        mock.patch.object(utils, 'get_image_capability', return_value={})):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def run_image_tagger(self, session_key, names=('a', 'b', 'c'), definitions=None):
+        """Returns the run's final status and its tagged CSV."""
+        csv_path = self.write_csv(pd.DataFrame({'name': list(names)}))
+        utils.row_by_row_tagger(session_key, csv_path, '', [], definitions or self.definitions, mode='image')
+        status = utils.PROGRESS_STATUS.pop(session_key)
+        return status, pd.read_csv(csv_path[:-len('.csv')] + '_tagged.csv', keep_default_na=False)
+
+
+class PromptBuildingTests(TestCase):
+    def test_user_prompt_includes_send_context_only_when_enabled(self):
+        detail = {'gate': {'prompt': 'P', 'best_answer': 'YES', 'explanation': 'E'}}
+        base = {'ConditionField': 'gate', 'SendContext': ''}
+        without = utils.build_user_prompt(base, 0, 3, {'a': 1}, 'Task?', [], detail)
+        with_ctx = utils.build_user_prompt({**base, 'SendContext': '1'}, 0, 3, {'a': 1}, 'Task?', [], detail)
+        self.assertNotIn("Context from 'gate'", without)
+        self.assertIn("Context from 'gate'", with_ctx)
+        self.assertTrue(without.startswith('Row 1/3:\n  a: 1'))
+
+    def test_user_prompt_lists_retrieved_chunks(self):
+        chunks = [{'source': 'ref.csv — row 2', 'text': 'Apple: 52'}]
+        prompt = utils.build_user_prompt({}, 4, 10, {}, 'Check', chunks)
+        self.assertIn('[1] (ref.csv — row 2) Apple: 52', prompt)
+
+
+class PromptTemplateTests(TestCase):
+    def setUp(self):
+        self.df = pd.DataFrame({'name': ['Ann', 'Bob', '{city}'], 'city': ['Oslo', None, 'Rome'],
+                                'n': [1, 2, 3], 'Out': ['', '', '']})
+
+    def test_frame_render_matches_row_by_row(self):
+        definitions = [
+            {'PromptTemplate': 'Is {name} from {city}? n={n} {missing}', 'InputColumns': ''},
+            {'PromptTemplate': '{{name}} only', 'InputColumns': 'name'},
+            {'PromptTemplate': 'no context {name}', 'InputColumns': utils.NO_CONTEXT_COLUMNS},
+            {'PromptTemplate': 'global fallback {city}', 'InputColumns': 'nonexistent'},
+        ]
+        full_cols = ['name', 'city']
+        for definition in definitions:
+            frame = utils.render_tag_prompts_frame(definition, self.df, full_cols, {'Out'})
+            for i in range(len(self.df)):
+                row = self.df.loc[i]
+                full = {c: row[c] for c in full_cols}
+                all_ctx = {c: row[c] for c in self.df.columns}
+                expected, _ = utils.render_tag_prompt(definition, full, all_ctx)
+                self.assertEqual(frame.at[i], expected, definition)
+
+    def test_substituted_values_are_not_expanded_again(self):
+        rendered, _ = utils.render_tag_prompt({'PromptTemplate': '{name} in {city}'},
+                                              {'name': '{city}', 'city': 'Rome'}, {})
+        self.assertEqual(rendered, '{city} in Rome')
+
+    def test_templates_reading_generated_columns_stay_row_by_row(self):
+        definition = {'PromptTemplate': 'Given {Out}, describe {name}', 'InputColumns': ''}
+        self.assertIsNone(utils.render_tag_prompts_frame(definition, self.df, ['name', 'Out'], {'Out'}))
+        # Not visible to the tag, so it can't depend on it.
+        self.assertIsNotNone(utils.render_tag_prompts_frame(definition, self.df, ['name'], {'Out'}))
+
+
+class TextEstimateTests(_IsolatedMediaMixin, TestCase):
+    def test_stratified_sample_spans_the_whole_file(self):
+        self.assertEqual(utils._stratified_sample_indices(100, 5), [0, 25, 50, 74, 99])
+        self.assertEqual(utils._stratified_sample_indices(3, 5), [0, 1, 2])
+        self.assertEqual(utils._stratified_sample_indices(0, 5), [])
+
+    def test_extrapolates_tokens_and_counts_input_condition_skips_exactly(self):
+        df = pd.DataFrame({'name': [f'item{i}' for i in range(20)],
+                           'kind': ['food' if i % 4 == 0 else 'other' for i in range(20)]})
+        csv_path = self.write_csv(df)
+        definitions = [
+            {'OutputColumn': 'veg', 'PromptTemplate': 'Is {name} vegetarian?'},
+            {'OutputColumn': 'gi', 'PromptTemplate': 'GI of {name}?',
+             'ConditionField': 'kind', 'ConditionOp': '==', 'ConditionValue': 'food'},
+        ]
+        with mock.patch.object(utils, 'call_llm_tagging', side_effect=_fake_llm()) as llm:
+            est = utils.estimate_text_run(csv_path, [], definitions, sample_size=5)
+
+        by_col = {t['column']: t for t in est['tags']}
+        self.assertEqual(est['row_count'], 20)
+        self.assertEqual(by_col['veg']['expected_calls'], 20)
+        self.assertEqual(by_col['veg']['total_prompt_tokens'], 2000)
+        # 5 of 20 rows are 'food' — an exact count, not the sample's ratio.
+        self.assertTrue(by_col['gi']['skip_count_exact'])
+        self.assertEqual(by_col['gi']['expected_skipped'], 15)
+        self.assertEqual(by_col['gi']['total_sec'], 2.5)
+        self.assertEqual(est['total_estimate_sec'], 12.5)
+        self.assertLessEqual(llm.call_count, 10)
+
+    def test_condition_on_generated_column_uses_sampled_skip_rate(self):
+        csv_path = self.write_csv(pd.DataFrame({'name': list('abcdefghij')}))
+        definitions = [
+            {'OutputColumn': 'gate', 'PromptTemplate': 'Gate {name}?'},
+            {'OutputColumn': 'detail', 'PromptTemplate': 'Detail {name}',
+             'ConditionField': 'gate', 'ConditionOp': '==', 'ConditionValue': 'YES'},
+        ]
+        with mock.patch.object(utils, 'call_llm_tagging', side_effect=_fake_llm(answer='NO')):
+            est = utils.estimate_text_run(csv_path, [], definitions, sample_size=4)
+        detail = next(t for t in est['tags'] if t['column'] == 'detail')
+        self.assertFalse(detail['skip_count_exact'])
+        self.assertEqual(detail['expected_skipped'], 10)
+        self.assertEqual(detail['expected_calls'], 0)
+
+    def test_empty_csv_raises_value_error(self):
+        csv_path = self.write_csv(pd.DataFrame({'name': []}))
+        with self.assertRaises(ValueError):
+            utils.estimate_text_run(csv_path, [], [{'OutputColumn': 'x', 'PromptTemplate': 'y'}])
+
+    def test_prompt_profile_flags_verbose_columns(self):
+        df = pd.DataFrame({'name': ['a', 'b', 'c'],
+                           'blob': ['<p>' + 'x' * 3000 + '</p>'] * 3,
+                           'notes': ['y' * 2000] * 3})
+        csv_path = self.write_csv(df)
+        definitions = [{'OutputColumn': 'veg', 'PromptTemplate': 'Is {name} veg? Notes: {notes}'}]
+        with mock.patch.object(utils, 'call_llm_tagging', side_effect=_fake_llm(prompt_tokens=1000)):
+            est = utils.estimate_text_run(csv_path, [], definitions, sample_size=3)
+
+        profile = est['prompt_profile']
+        self.assertEqual(profile['token_source'], 'ollama')
+        # Segment attributions for a call sum back to the tokens Ollama counted.
+        self.assertAlmostEqual(sum(s['avg_tokens'] for s in profile['tags'][0]['segments']), 1000, delta=1)
+        cols = {c['name']: c for c in profile['columns']}
+        self.assertEqual(cols['blob']['flag'], 'exclude')
+        self.assertEqual(cols['blob']['saved_tokens'], cols['blob']['projected_tokens'])
+        self.assertEqual(cols['notes']['flag'], 'trim')
+        self.assertLess(cols['notes']['saved_tokens'], cols['notes']['projected_tokens'])
+        self.assertEqual(cols['name']['flag'], '')
+
+
+class ContextBudgetTests(_IsolatedMediaMixin, TestCase):
+    def test_truncation_strips_markup_and_cuts_at_sentence(self):
+        text = '<p>' + 'First sentence here. ' * 20 + '</p>'
+        out = utils.truncate_to_budget(text, 25)
+        self.assertNotIn('<p>', out)
+        self.assertTrue(out.endswith('here. …[truncated]'))
+        self.assertLessEqual(len(out), 25 * utils.APPROX_CHARS_PER_TOKEN + len(' …[truncated]'))
+        self.assertEqual(utils.truncate_to_budget('short', 25), 'short')
+
+    def test_parse_drops_unbudgeted_columns_and_bad_json(self):
+        parsed = utils.parse_context_budgets(
+            '{"columns": {"desc": {"max_tokens": "50", "summarize": true}, "name": {"max_tokens": ""}}}')
+        self.assertEqual(parsed['columns'], {'desc': {'max_tokens': 50, 'summarize': True}})
+        self.assertEqual(utils.parse_context_budgets('not json')['columns'], {})
+
+    def test_summarizes_each_distinct_value_once_and_persists_it(self):
+        long_a, long_b = 'alpha ' * 200, 'beta ' * 200
+        df = pd.DataFrame({'name': ['x', 'y', 'z', 'w'], 'desc': [long_a, long_b, long_a, long_a]})
+        csv_path = self.write_csv(df)
+        budgets = {'columns': {'desc': {'max_tokens': 20, 'summarize': True}}}
+        definitions = [{'OutputColumn': 'tag', 'PromptTemplate': 'Tag {name}: {desc}',
+                        'ConditionField': 'desc', 'ConditionOp': 'contains', 'ConditionValue': 'alpha'}]
+
+        client = mock.MagicMock()
+        client.chat.completions.create.return_value.choices = [
+            mock.MagicMock(message=mock.MagicMock(content='SUMMARY'))]
+        prompts = []
+
+        def fake_llm(system_prompt, user_prompt):
+            prompts.append(user_prompt)
+            return _fake_llm()(system_prompt, user_prompt)
+
+        with mock.patch.object(utils.openai, 'OpenAI', return_value=client), \
+                mock.patch.object(utils, 'call_llm_tagging', side_effect=fake_llm):
+            est = utils.estimate_text_run(csv_path, [], definitions, sample_size=4,
+                                          context_budgets=budgets)
+
+        # Two distinct long values -> two summary calls across four rows.
+        self.assertEqual(client.chat.completions.create.call_count, 2)
+        self.assertEqual(est['pending_summaries'], 0)
+        # The condition still tests the raw value ('alpha' rows only)...
+        self.assertEqual(len(prompts), 3)
+        # ...while the prompt carries the summary, not the 1200-char cell.
+        self.assertTrue(all('desc: SUMMARY' in p and 'alpha alpha' not in p for p in prompts))
+        self.assertEqual(len(utils.load_summary_cache(csv_path)), 2)
+
+    def test_summary_log_survives_a_torn_write_and_reads_the_old_sidecar(self):
+        csv_path = self.write_csv(pd.DataFrame({'desc': ['x']}))
+        with open(csv_path[:-len('.csv')] + '_summaries.json', 'w') as f:
+            json.dump({'old': 'kept'}, f)
+        utils._append_summary(csv_path, 'k1', 'first')
+        with open(utils._summaries_path_for_csv(csv_path), 'a') as f:
+            f.write('{"key": "k2", "summ')  # crashed mid-append
+        self.assertEqual(utils.load_summary_cache(csv_path), {'old': 'kept', 'k1': 'first'})
+        utils._append_summary(csv_path, 'k3', 'after')
+        self.assertEqual(utils.load_summary_cache(csv_path)['k3'], 'after')
+        with open(utils._summaries_path_for_csv(csv_path)) as f:
+            self.assertEqual(f.read().count('\n'), 3)
+
+
+class ConditionPrefillTests(_IsolatedMediaMixin, TestCase):
+    def test_frame_evaluation_matches_per_row(self):
+        df = pd.DataFrame({'kind': ['Apple', ' apple ', 'pear', None, ''], 'n': [1, 2, 3, 4, 5]})
+        for op, value in [('==', 'APPLE'), ('!=', 'apple'), ('contains', 'pp'), ('not_contains', 'pp'),
+                          ('is_empty', ''), ('is_not_empty', ''), ('bogus', 'x')]:
+            for field in ('kind', 'n', 'absent'):
+                definition = {'ConditionField': field, 'ConditionOp': op, 'ConditionValue': value}
+                frame = utils.evaluate_condition_frame(definition, df)
+                expected = [utils.evaluate_condition(definition, {c: df.loc[i, c] for c in df.columns})
+                            for i in range(len(df))]
+                self.assertEqual(frame.tolist(), expected, (field, op))
+        self.assertIsNone(utils.evaluate_condition_frame({'ConditionField': 'Out'}, df, ['Out']))
+
+    def test_rows_ruled_out_by_input_conditions_never_reach_the_llm(self):
+        csv_path = self.write_csv(pd.DataFrame({'name': ['a', 'b', 'c', 'd'], 'kind': ['x', 'y', 'x', 'y']}))
+        definitions = [
+            {'OutputColumn': 'first', 'PromptTemplate': 'Q {name}', 'ConditionField': 'kind',
+             'ConditionOp': '==', 'ConditionValue': 'x', 'DefaultValue': 'SKIP'},
+            {'OutputColumn': 'second', 'PromptTemplate': 'R {name}', 'ConditionField': 'first',
+             'ConditionOp': '==', 'ConditionValue': 'YES'},
+        ]
+        llm = mock.Mock(side_effect=_fake_llm())
+        with mock.patch.object(utils, 'call_llm_tagging', llm), mock.patch.object(utils, 'record_stat'):
+            utils.row_by_row_tagger('prefill-test', csv_path, '', [], definitions)
+        status = utils.PROGRESS_STATUS.pop('prefill-test')
+
+        self.assertEqual(status['status'], 'finished')
+        self.assertEqual((status['work_total'], status['work_done'], status['prefilled_rows']), (2, 2, 2))
+        self.assertEqual(llm.call_count, 4)  # rows a and c, both tags
+        out = pd.read_csv(csv_path[:-len('.csv')] + '_tagged.csv', keep_default_na=False)
+        self.assertEqual(out['first'].tolist(), ['YES', 'SKIP', 'YES', 'SKIP'])
+        self.assertEqual(out['second'].tolist(), ['YES', 'N/A', 'YES', 'N/A'])
+        self.assertTrue(out.loc[1, 'first_exp'].startswith('Condition not met'))
+        self.assertEqual(status['column_stats']['first'], {'YES': 2, 'SKIP': 2})
+
+
+class RunTraceTests(_IsolatedMediaMixin, TestCase):
+    def test_run_writes_chrome_trace_with_stage_spans(self):
+        csv_path = self.write_csv(pd.DataFrame({'name': ['a', 'b']}))
+        definitions = [{'OutputColumn': 'veg', 'PromptTemplate': 'Is {name} veg?'}]
+        with mock.patch.object(utils, 'call_llm_tagging', side_effect=_fake_llm()), \
+                mock.patch.object(utils, 'record_stat'):
+            utils.row_by_row_tagger('trace-test', csv_path, '', [], definitions)
+        utils.PROGRESS_STATUS.pop('trace-test', None)
+
+        trace_path = utils.get_run_trace_path(csv_path[:-len('.csv')] + '_tagged.csv')
+        with open(trace_path) as f:
+            events = json.load(f)
+        spans = [e for e in events if e.get('ph') == 'X']
+        names = {e['name'] for e in spans}
+        self.assertTrue({'read_csv', 'render_prompt', 'llm_call', 'record_stat',
+                         'to_csv', 'tag', 'row'} <= names)
+        self.assertEqual(sum(1 for e in spans if e['name'] == 'row'), 2)
+        llm = next(e for e in spans if e['name'] == 'llm_call')
+        self.assertEqual(llm['args']['prompt_tokens'], 100)
+        self.assertTrue(all(e['dur'] >= 0 for e in spans))
+
+    def test_failure_opening_the_trace_ends_the_run_with_an_error(self):
+        csv_path = self.write_csv(pd.DataFrame({'name': ['a']}))
+        definitions = [{'OutputColumn': 'veg', 'PromptTemplate': 'Is {name} veg?'}]
+        with mock.patch.object(utils, 'open_run_trace', side_effect=OSError('read-only file system')), \
+                mock.patch.object(utils, 'update_project') as update_project:
+            utils.row_by_row_tagger('trace-fail-test', csv_path, '', [], definitions, project_id='p1')
+        status = utils.PROGRESS_STATUS.pop('trace-fail-test')
+        self.assertEqual(status['status'], 'error: read-only file system')
+        update_project.assert_called_once_with('p1', status='error')
+
+    def test_no_trace_is_a_noop(self):
+        with utils.trace_span(None, 'x') as span:
+            span['k'] = 1
+        utils.close_run_trace(None)
+
+
+class LiveEventLogTests(_IsolatedMediaMixin, TestCase):
+    def test_pages_by_sequence_number_and_resumes(self):
+        tagged = os.path.join(settings.MEDIA_ROOT, 'data_tagged.csv')
+        log = utils.open_live_event_log(tagged)
+        for n in range(150):
+            utils.append_live_event(log, {'row_index': n})
+        path = log['path']
+        events, total = utils.read_live_events(path, before=150, limit=20)
+        self.assertEqual(total, 150)
+        self.assertEqual([e['seq'] for e in events], list(range(130, 150)))
+        events, _ = utils.read_live_events(path, after=63, limit=3)
+        self.assertEqual([e['row_index'] for e in events], [63, 64, 65])
+
+        # The index extends as the file grows; a half-written line is ignored.
+        utils.append_live_event(log, {'row_index': 150})
+        log['fh'].write('{"seq": 151, "row')
+        log['fh'].flush()
+        self.assertEqual(utils.read_live_events(path, after=149)[1], 151)
+        utils.close_live_event_log(log)
+
+        with open(path, 'rb+') as f:  # drop the torn tail, as a crash would leave it
+            f.truncate(f.seek(0, 2) - len('{"seq": 151, "row'))
+        resumed = utils.open_live_event_log(tagged, resume=True)
+        self.assertEqual(utils.append_live_event(resumed, {'row_index': 151})['seq'], 151)
+        utils.close_live_event_log(resumed)
+        fresh = utils.open_live_event_log(tagged)
+        self.assertEqual(fresh['next_seq'], 0)
+        utils.close_live_event_log(fresh)
+
+    def test_run_keeps_only_a_tail_in_memory(self):
+        csv_path = self.write_csv(pd.DataFrame({'name': [f'n{i}' for i in range(5)]}))
+        definitions = [{'OutputColumn': 'veg', 'PromptTemplate': 'Is {name} veg?'}]
+        with mock.patch.object(utils, 'LIVE_TAIL_SIZE', 2), \
+                mock.patch.object(utils, 'call_llm_tagging', side_effect=_fake_llm()), \
+                mock.patch.object(utils, 'record_stat'):
+            utils.row_by_row_tagger('events-test', csv_path, '', [], definitions)
+        status = utils.PROGRESS_STATUS.pop('events-test')
+        self.assertEqual(status['event_total'], 5)
+        self.assertEqual([e['seq'] for e in status['live_logs']], [3, 4])
+        events, total = utils.read_live_events(status['events_path'], after=0)
+        self.assertEqual(total, 5)
+        self.assertEqual([e['row_index'] for e in events], [0, 1, 2, 3, 4])
+
+
+class ResultsAnalyticsTests(_IsolatedMediaMixin, TestCase):
+    def test_incremental_updates_match_a_full_rebuild(self):
+        tagged = self.write_csv(pd.DataFrame({
+            'name':  ['a', 'b', 'c', 'd'],
+            'veg':   ['YES', 'NO', 'N/A', 'ERROR'],
+            'score': [1.5, 9, 3, None],
+        }), 'data_tagged.csv')
+        analytics = utils.load_results_analytics(tagged)
+        self.assertEqual(analytics['columns']['veg']['counts'], {'YES': 1, 'NO': 1, 'N/A': 1, 'ERROR': 1})
+        self.assertEqual(analytics['columns']['veg']['errors'], 1)
+        self.assertEqual(analytics['columns']['score']['numeric'],
+                         {'count': 3, 'sum': 13.5, 'min': 1.5, 'max': 9.0})
+
+        df = utils._read_tagged_frame(tagged)
+        before = df.copy()
+        df.at[3, 'veg'] = 'YES'
+        df.at[1, 'score'] = 2
+        changes = [(c, before.at[i, c], df.at[i, c]) for i, c in ((3, 'veg'), (1, 'score'))]
+        with mock.patch.object(utils, 'build_results_analytics', wraps=utils.build_results_analytics) as build:
+            updated = utils.write_tagged_csv(df, tagged, changes)
+            build.assert_not_called()
+        rebuilt = utils.build_results_analytics(utils._read_tagged_frame(tagged))
+        self.assertEqual(updated['columns'], rebuilt['columns'])
+        self.assertEqual(updated['columns']['score']['numeric']['max'], 3.0)  # old max was removed
+        self.assertIs(utils.load_results_analytics(tagged, rebuild=False)['columns']['veg']['errors'], 0)
+
+    def test_sidecar_is_rebuilt_once_the_csv_changes_behind_it(self):
+        tagged = self.write_csv(pd.DataFrame({'veg': ['YES', 'NO']}), 'data_tagged.csv')
+        utils.load_results_analytics(tagged)
+        self.write_csv(pd.DataFrame({'veg': ['YES', 'YES', 'NO']}), 'data_tagged.csv')
+        self.assertIsNone(utils.load_results_analytics(tagged, rebuild=False))
+        self.assertEqual(utils.load_results_analytics(tagged)['columns']['veg']['counts'], {'YES': 2, 'NO': 1})
+
+        # A delta against a stale sidecar falls back to rebuilding from df.
+        self.write_csv(pd.DataFrame({'veg': ['NO', 'NO', 'NO']}), 'data_tagged.csv')
+        df = utils._read_tagged_frame(tagged)
+        df.at[0, 'veg'] = 'YES'
+        updated = utils.write_tagged_csv(df, tagged, [('veg', 'NO', 'YES')])
+        self.assertEqual(updated['columns']['veg']['counts'], {'YES': 1, 'NO': 2})
+
+    def test_free_text_columns_stop_tracking_counts(self):
+        tagged = self.write_csv(pd.DataFrame({'note': [f'n{i}' for i in range(5)]}), 'data_tagged.csv')
+        with mock.patch.object(utils, 'ANALYTICS_MAX_CATEGORIES', 3):
+            stats = utils.load_results_analytics(tagged)['columns']['note']
+        self.assertIsNone(stats['counts'])
+        self.assertEqual(stats['non_empty'], 5)
+
+    def test_tagging_run_keeps_the_sidecar_current(self):
+        csv_path = self.write_csv(pd.DataFrame({'name': ['a', 'b', 'c']}))
+        definitions = [{'OutputColumn': 'veg', 'PromptTemplate': 'Is {name} veg?'}]
+        with mock.patch.object(utils, 'call_llm_tagging', side_effect=_fake_llm()), \
+                mock.patch.object(utils, 'record_stat'):
+            utils.row_by_row_tagger('analytics-test', csv_path, '', [], definitions)
+        utils.PROGRESS_STATUS.pop('analytics-test', None)
+
+        tagged = csv_path[:-len('.csv')] + '_tagged.csv'
+        analytics = utils.load_results_analytics(tagged, rebuild=False)
+        self.assertEqual(analytics['rows'], 3)
+        self.assertEqual(analytics['columns']['veg']['counts'], {'YES': 3})
+        self.assertEqual(analytics['columns']['veg_exp']['counts'], {'because': 3})
+
+
+class ResultsQueryTests(_IsolatedMediaMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.tagged = self.write_csv(pd.DataFrame({
+            'name':  ['pear', 'apple', 'fig', 'kiwi', 'plum'],
+            'score': [3, 10, 2, None, 7],
+            'img':   ['a.png', 'ERROR: timeout', 'c.png', 'd.png', 'N/A'],
+        }), 'data_tagged.csv')
+
+    def test_filters_sort_and_cursor_pagination(self):
+        page = utils.query_results(self.tagged, sort='score', descending=True, limit=2)
+        self.assertEqual([r['row_index'] for r in page['rows']], [1, 4])
+        self.assertEqual((page['total'], page['next_cursor']), (5, 2))
+        page = utils.query_results(self.tagged, sort='score', descending=True, cursor=4, limit=2)
+        self.assertEqual([r['row_index'] for r in page['rows']], [3])  # NaN sorts last
+        self.assertIsNone(page['next_cursor'])
+
+        page = utils.query_results(self.tagged, columns=['name'], search='P')
+        self.assertEqual(page['columns'], ['name'])
+        self.assertEqual([r['values'] for r in page['rows']], [['pear'], ['apple'], ['plum']])
+        self.assertEqual(utils.query_results(self.tagged, match_column='img', match_value=' n/a ')['total'], 1)
+        self.assertEqual([r['row_index'] for r in utils.query_results(self.tagged, errors_only=True)['rows']], [1])
+        with self.assertRaises(ValueError):
+            utils.query_results(self.tagged, sort='missing')
+
+    def test_review_filters_and_cached_frame(self):
+        utils.set_review_state(self.tagged, 0, 'img', 'approved')
+        utils.set_review_state(self.tagged, 2, 'img', 'rejected')
+        with mock.patch.object(utils, '_read_tagged_base', wraps=utils._read_tagged_base) as read:
+            approved = utils.query_results(self.tagged, review='approved')
+            unreviewed = utils.query_results(self.tagged, review='unreviewed')
+        self.assertEqual([r['row_index'] for r in approved['rows']], [0])
+        self.assertEqual([r['row_index'] for r in unreviewed['rows']], [3])
+        self.assertLessEqual(read.call_count, 1)
+
+        df = utils._read_tagged_frame(self.tagged)
+        df.at[1, 'img'] = 'b.png'
+        utils.write_tagged_csv(df, self.tagged)
+        self.assertEqual(utils.query_results(self.tagged, review='unreviewed')['total'], 2)
+
+    def test_results_data_view_pages_image_rows_with_candidates(self):
+        session = self.client.session
+        session['csv_filepath'] = self.tagged[:-len('_tagged.csv')] + '.csv'
+        session['project_mode'] = 'image'
+        session.save()
+        response = self.client.get('/ODT/results/data/', {'limit': 2, 'filter': 'error'})
+        data = response.json()
+        self.assertTrue(data['success'])
+        self.assertEqual(data['total'], 1)
+        self.assertEqual(data['rows'][0]['candidates'], {'img': []})
+        self.assertEqual(self.client.get('/ODT/results/data/', {'sort': 'nope'}).status_code, 400)
+
+
+class ImageStoreTests(_IsolatedMediaMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.tagged = os.path.join(settings.MEDIA_ROOT, 'data_tagged.csv')
+        self.images_dir, self.images_rel = utils.images_dir_for_tagged_path(self.tagged)
+        os.makedirs(self.images_dir)
+
+    def test_candidates_attempts_reviews_and_seeds(self):
+        self.assertEqual(utils._next_attempt_index(self.tagged, 0, 'img'), 0)
+        self.assertEqual(utils.load_review_state(self.tagged), {})
+        self.assertFalse(os.path.exists(utils._image_store_path_for_tagged(self.tagged)))  # reads don't create it
+
+        png = _png(8, 8)
+        first = utils._save_generated_images(self.images_dir, self.images_rel, self.tagged, 0, 'img',
+                                             0, [png, png], 'a', 'png')
+        retry = utils._save_generated_images(self.images_dir, self.images_rel, self.tagged, 0, 'img',
+                                             1, [png], 'a', 'png')
+        self.assertEqual(utils._next_attempt_index(self.tagged, 0, 'img'), 2)
+        found = utils.list_image_candidates_for_cells(self.tagged, [(0, 'img'), (5, 'img')])
+        self.assertEqual([c['rel_path'] for c in found[(0, 'img')]], retry + first)
+        self.assertEqual(found[(5, 'img')], [])
+
+        utils.record_seeds(self.tagged, first, 42)
+        self.assertEqual(utils.get_seed_for_path(self.tagged, first[1]), 42)
+        self.assertIsNone(utils.get_seed_for_path(self.tagged, retry[0]))
+        self.assertEqual(utils.set_review_state(self.tagged, 0, 'img', 'approved'), {'0:img': 'approved'})
+        self.assertEqual(utils.set_review_state(self.tagged, 0, 'img', ''), {})
+
+    def test_legacy_json_sidecars_are_imported_once(self):
+        base = self.tagged[:-len('_tagged.csv')]
+        with open(base + '_image_manifest.json', 'w') as f:
+            json.dump({'3:img': [{'rel_path': 'x/a.png', 'attempt': 0, 'n': 0},
+                                 {'rel_path': 'x/a_a1.png', 'attempt': 1, 'n': 0}]}, f)
+        with open(base + '_review.json', 'w') as f:
+            json.dump({'3:img': 'rejected'}, f)
+        with open(base + '_seeds.json', 'w') as f:
+            json.dump({'x/a.png': 7}, f)
+
+        self.assertEqual([c['rel_path'] for c in utils.list_image_candidates(self.tagged, 3, 'img')],
+                         ['x/a_a1.png', 'x/a.png'])
+        self.assertEqual(utils.load_review_state(self.tagged), {'3:img': 'rejected'})
+        self.assertEqual(utils.get_seed_for_path(self.tagged, 'x/a.png'), 7)
+        self.assertTrue(os.path.exists(base + '_seeds.json.migrated'))
+        self.assertFalse(os.path.exists(base + '_image_manifest.json'))
+
+
+class ImageDerivativeTests(_IsolatedMediaMixin, TestCase):
+    def test_derivatives_are_rendered_recorded_and_preferred(self):
+        from PIL import Image
+        tagged = os.path.join(settings.MEDIA_ROOT, 'data_tagged.csv')
+        images_dir, images_rel = utils.images_dir_for_tagged_path(tagged)
+        os.makedirs(images_dir)
+        with mock.patch.object(utils, 'queue_image_derivatives') as queue:
+            saved = utils._save_generated_images(images_dir, images_rel, tagged, 0, 'img', 0,
+                                                 [_png(800, 400)], 'a', 'png')
+        queue.assert_called_once_with(tagged, saved)
+        full = settings.MEDIA_URL + saved[0]
+        self.assertEqual(utils.image_display_urls(tagged, saved, 'preview'), {saved[0]: full})
+        self.assertEqual(utils.missing_image_derivatives(tagged), saved)
+
+        self.assertEqual(utils.render_image_derivatives(tagged, saved[0]), ['thumb', 'preview'])
+        thumb_rel = utils.derivative_rel_path(saved[0], 'thumb')
+        self.assertFalse(thumb_rel.startswith(images_rel + '/'))  # zips of the images folder stay originals-only
+        with Image.open(os.path.join(settings.MEDIA_ROOT, thumb_rel)) as img:
+            self.assertEqual(img.size, (256, 128))
+        self.assertEqual(utils.list_image_candidates(tagged, 0, 'img')[0]['thumb_url'], settings.MEDIA_URL + thumb_rel)
+        self.assertEqual(utils.image_display_urls(tagged, saved, 'preview'),
+                         {saved[0]: settings.MEDIA_URL + utils.derivative_rel_path(saved[0], 'preview')})
+        self.assertEqual(utils.missing_image_derivatives(tagged), [])
+
+
+class ImageWriteBehindTests(_ImageRunMixin, TestCase):
+    def test_saves_are_deferred_and_bounded(self):
+        import threading
+        tagged = os.path.join(settings.MEDIA_ROOT, 'data_tagged.csv')
+        images_dir, images_rel = utils.images_dir_for_tagged_path(tagged)
+        os.makedirs(images_dir)
+        release = threading.Event()
+        convert = utils._convert_image_bytes
+
+        def slow_convert(data, ext):
+            release.wait(5)
+            return convert(data, ext)
+
+        writer = utils.ImageWriteBehind(queue_max=1)
+        with mock.patch.object(utils, '_convert_image_bytes', side_effect=slow_convert):
+            first = utils._save_generated_images(images_dir, images_rel, tagged, 0, 'img', 0,
+                                                 [self.png], 'same', 'png', seed=3, writer=writer)
+            self.assertFalse(os.path.exists(os.path.join(settings.MEDIA_ROOT, first[0])))
+            blocked = threading.Thread(target=utils._save_generated_images, args=(
+                images_dir, images_rel, tagged, 1, 'img', 0, [self.png], 'same', 'png'),
+                kwargs={'writer': writer})
+            blocked.start()
+            blocked.join(0.2)
+            self.assertTrue(blocked.is_alive())  # queue full: the second save waits
+            release.set()
+            blocked.join(5)
+            self.assertEqual(writer.drain(), [])
+        self.assertEqual(first, [f'{images_rel}/same.png'])
+        self.assertEqual(sorted(os.listdir(images_dir)), ['same.png', 'same_row1.png'])
+        self.assertEqual(utils.get_seed_for_path(tagged, first[0]), 3)
+
+    def test_failed_save_becomes_an_error_cell(self):
+        convert = mock.Mock(side_effect=[self.png, OSError('disk full')])
+        with mock.patch.object(utils, 'call_image_generation',
+                               return_value=([self.png], {'seed_used': 1}, self.usage)), \
+                mock.patch.object(utils, '_convert_image_bytes', convert), \
+                mock.patch.object(utils, 'IMAGE_WRITE_QUEUE_MAX', 1):  # one in flight keeps the failure on row b
+            status, out = self.run_image_tagger('write-behind-test', names=('a', 'b'))
+
+        self.assertEqual(status['status'], 'finished')
+        self.assertTrue(out.loc[0, 'img'].endswith('.png'))
+        self.assertEqual(out.loc[1, 'img'], 'ERROR: saving image failed: disk full')
+
+    def _run_with_failed_first_save(self, session_key, on_generate=None, **patches):
+        """A three-row image run whose first save fails; on_generate(n) runs
+        as the nth generation starts."""
+        calls = []
+
+        def generate(*args, **kwargs):
+            calls.append(1)
+            if on_generate is not None:
+                on_generate(len(calls))
+            return [self.png], {'seed_used': 1}, dict(self.usage)
+
+        convert = mock.Mock(side_effect=[OSError('disk full'), self.png, self.png])
+        with mock.patch.object(utils, 'call_image_generation', side_effect=generate), \
+                mock.patch.multiple(utils, _convert_image_bytes=convert, **patches):
+            return self.run_image_tagger(session_key)
+
+    def test_failed_save_is_marked_when_the_run_is_stopped(self):
+        def stop_on_row_b(n):
+            if n == 2:
+                utils.CANCEL_FLAGS['write-behind-stop'] = True
+
+        status, out = self._run_with_failed_first_save('write-behind-stop', stop_on_row_b)
+        self.assertEqual(status['status'], 'cancelled')
+        self.assertEqual(out.loc[0, 'img'], 'ERROR: saving image failed: disk full')
+
+    def test_failed_save_is_marked_when_the_run_errors(self):
+        status, out = self._run_with_failed_first_save(
+            'write-behind-error', flush_run_trace=mock.Mock(side_effect=[None, RuntimeError('trace disk gone')]))
+        self.assertEqual(status['status'], 'error: trace disk gone')
+        self.assertEqual(out.loc[0, 'img'], 'ERROR: saving image failed: disk full')
+
+
+class ImageTransportTests(_IsolatedMediaMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.png = _png(16, 8)
+        self.jpg = _png(16, 8, 'JPEG')
+
+    def test_binary_response_is_split_by_header_sizes(self):
+        import struct
+        head = json.dumps({'seed_used': 7, 'elapsed_sec': 0.5, 'format': 'png',
+                           'sizes': [len(self.png), len(self.jpg)]}).encode('utf-8')
+        body = struct.pack('>I', len(head)) + head + self.png + self.jpg
+        images, header = utils._decode_generate_response(utils.SD_BINARY_MEDIA_TYPE, body)
+        self.assertEqual(images, [self.png, self.jpg])
+        self.assertEqual(header['seed_used'], 7)
+        with self.assertRaises(ValueError):
+            utils._decode_generate_response(utils.SD_BINARY_MEDIA_TYPE, body[:-1])
+
+    def test_shared_directory_handoff_reads_and_removes_files(self):
+        shared = os.path.join(self.tmp_dir, 'shared')
+        os.makedirs(shared)
+        with open(os.path.join(shared, 'abc.jpg'), 'wb') as fh:
+            fh.write(self.jpg)
+        body = json.dumps({'files': ['abc.jpg'], 'seed_used': 1, 'format': 'jpg'}).encode('utf-8')
+        with override_settings(SD_SHARED_OUTPUT_DIR=shared):
+            images, _ = utils._decode_generate_response('application/json', body)
+        self.assertEqual(images, [self.jpg])
+        self.assertEqual(os.listdir(shared), [])
+
+    def test_server_encoded_bytes_are_not_re_encoded(self):
+        self.assertIs(utils._convert_image_bytes(self.jpg, 'jpg'), self.jpg)
+        self.assertIs(utils._convert_image_bytes(self.png, 'png'), self.png)
+        # An older server's PNG still ends up as a JPEG file.
+        self.assertTrue(utils._convert_image_bytes(self.png, 'jpg').startswith(b'\xff\xd8'))
+
+
+class ImageBatchTests(_ImageRunMixin, TestCase):
+    def run_tagger(self, batch_results):
+        batch = mock.Mock(side_effect=lambda prompts, params, fmt: (batch_results(prompts), dict(self.usage)))
+        single = mock.Mock(return_value=([self.png], {'seed_used': 9}, dict(self.usage)))
+        # 1700 MB free fits two 512x512 images.
+        with mock.patch.object(utils, 'get_image_capability', return_value={'backend': 'cuda', 'vram_free_mb': 1700}), \
+                mock.patch.object(utils, 'call_image_generation_batch', batch), \
+                mock.patch.object(utils, 'call_image_generation', single):
+            status, out = self.run_image_tagger('batch-test')
+        self.assertEqual(status['status'], 'finished')
+        return batch, single, out
+
+    def test_rows_of_a_tag_are_generated_in_vram_sized_batches(self):
+        self.assertEqual(utils.image_batch_size({'width': 512, 'height': 512}, 1700), 2)
+        self.assertEqual(utils.image_batch_size({'width': 512, 'height': 512}, 0), 1)
+        batch, single, out = self.run_tagger(
+            lambda prompts: [([self.png], {'seed_used': n}) for n in range(len(prompts))])
+        self.assertEqual([c.args[0] for c in batch.call_args_list], [['Draw a', 'Draw b']])
+        self.assertEqual([c.args[0] for c in single.call_args_list], ['Draw c'])
+        self.assertTrue(all(v.endswith('.png') for v in out['img']))
+
+    def test_server_without_batch_endpoint_falls_back_to_single_calls(self):
+        batch, single, out = self.run_tagger(
+            lambda prompts: [([], {'error': 'Not Found', 'unsupported': True}) for _ in prompts])
+        self.assertEqual(batch.call_count, 1)
+        self.assertEqual(single.call_count, 3)
+        self.assertTrue(all(v.endswith('.png') for v in out['img']))
+
+    def test_batch_response_is_split_per_prompt(self):
+        header = {'results': [{'seed_used': 1, 'count': 2}, {'seed_used': 5, 'count': 1}], 'elapsed_sec': 3.0}
+        with mock.patch.object(utils, '_post_image_request',
+                               return_value=([b'a', b'b', b'c'], header, None, dict(self.usage))) as post:
+            results, _ = utils.call_image_generation_batch(['x', 'y'], {'model': 'm', 'seed': 4, 'num_images': 2})
+        self.assertEqual(post.call_args.args[1]['items'], [{'prompt': 'x', 'seed': 4}, {'prompt': 'y', 'seed': 4}])
+        self.assertEqual(results, [([b'a', b'b'], {'seed_used': 1, 'server_elapsed': 1.5}),
+                                   ([b'c'], {'seed_used': 5, 'server_elapsed': 1.5})])
+
+
+class ImageJobPlannerTests(_ImageRunMixin, TestCase):
+    def test_jobs_run_grouped_by_model_and_land_in_row_order(self):
+        definitions = [
+            {'OutputColumn': 'photo', 'PromptTemplate': 'Photo of {name}', 'ImageParams': '{"model": "m1"}'},
+            {'OutputColumn': 'sketch', 'PromptTemplate': 'Sketch of {name}', 'ImageParams': '{"model": "m2"}'},
+        ]
+        calls = []
+
+        def generate(prompt, params, image_format='png'):
+            calls.append((params['model'], prompt))
+            return [self.png], {'seed_used': 1}, dict(self.usage, model=params['model'])
+
+        with mock.patch.object(utils, 'call_image_generation', side_effect=generate), \
+                mock.patch.object(utils, 'preload_image_model') as preload:
+            status, out = self.run_image_tagger('planner-test', names=('a', 'b', 'c', 'd'), definitions=definitions)
+
+        self.assertEqual(status['status'], 'finished')
+        self.assertEqual([m for m, _ in calls], ['m1'] * 4 + ['m2'] * 4)
+        self.assertEqual(preload.call_args.args[0], 'm2')
+        self.assertEqual(status['image_switches'], {'planned': 1, 'row_major': 7, 'avoided': 6})
+        self.assertEqual(out['photo_exp'].tolist(), ['Generated with m1 (seed 1)'] * 4)
+        self.assertTrue(out.loc[3, 'sketch'].startswith(out.loc[3, 'photo'].rsplit('/', 1)[0]))
+
+    def test_switch_counting(self):
+        a, b = ('m1', (), 'default'), ('m2', (), 'default')
+        self.assertEqual(utils.count_pipeline_switches([a, b, a, b]), 3)
+        self.assertEqual(utils.count_pipeline_switches([a, a, b], current=b), 2)
+        self.assertEqual(utils.image_affinity_key({'lora': 'x', 'scheduler': ''}, 'base'), ('base', ('x',), 'default'))
+
+
+class ImageJobQueueTests(_ImageRunMixin, TestCase):
+    def run_tagger(self, submit):
+        wait = mock.Mock(return_value=([self.png], {'seed_used': 2}, dict(self.usage)))
+        single = mock.Mock(return_value=([self.png], {'seed_used': 9}, dict(self.usage)))
+        with mock.patch.object(utils, 'submit_image_job', submit), mock.patch.object(utils, 'wait_image_job', wait), \
+                mock.patch.object(utils, 'call_image_generation', single):
+            status, out = self.run_image_tagger('job-queue-test')
+        self.assertEqual(status['status'], 'finished')
+        self.assertTrue(all(v.endswith('.png') for v in out['img']))
+        return wait, single
+
+    def test_upcoming_rows_are_submitted_ahead(self):
+        submit = mock.Mock(side_effect=lambda prompt, *args: ({'id': prompt}, {}))
+        wait, single = self.run_tagger(submit)
+        self.assertEqual([c.args[0] for c in submit.call_args_list], ['Draw a', 'Draw b', 'Draw c'])
+        self.assertEqual([c.args[0] for c in wait.call_args_list], [{'id': 'Draw a'}, {'id': 'Draw b'}, {'id': 'Draw c'}])
+        self.assertEqual(single.call_count, 0)
+
+    def test_server_without_job_queue_falls_back_to_generate(self):
+        submit = mock.Mock(return_value=(None, {'error': 'Not Found', 'unsupported': True}))
+        wait, single = self.run_tagger(submit)
+        self.assertEqual(submit.call_count, 1)
+        self.assertEqual(wait.call_count, 0)
+        self.assertEqual(single.call_count, 3)
+
+    def test_failed_submit_only_skips_that_row(self):
+        answers = iter([(None, {'error': 'timed out', 'unsupported': False})])
+        submit = mock.Mock(side_effect=lambda prompt, *args: next(answers, ({'id': prompt}, {})))
+        wait, single = self.run_tagger(submit)
+        self.assertEqual([c.args[0] for c in submit.call_args_list], ['Draw a', 'Draw b', 'Draw c'])
+        self.assertEqual([c.args[0] for c in wait.call_args_list], [{'id': 'Draw b'}, {'id': 'Draw c'}])
+        self.assertEqual(single.call_count, 1)
+
+    def test_waiting_polls_then_fetches_and_frees_the_result(self):
+        import struct
+        head = json.dumps({'seed_used': 3, 'elapsed_sec': 2.0, 'sizes': [len(self.png)]}).encode('utf-8')
+        body = struct.pack('>I', len(head)) + head + self.png
+        states = iter([{'state': 'queued', 'queue_position': 2, 'eta_sec': 8.0},
+                       {'state': 'running', 'queue_position': 0}, {'state': 'done'}])
+        requests = []
+
+        def sd_request(path, payload=None, method='GET', timeout=10):
+            requests.append((method, path))
+            return {} if method == 'DELETE' else next(states)
+
+        seen = []
+        with mock.patch.object(utils, '_sd_request', side_effect=sd_request), \
+                mock.patch.object(utils, '_sd_get_raw', return_value=(utils.SD_BINARY_MEDIA_TYPE, body)), \
+                mock.patch.object(utils, 'IMAGE_JOB_POLL_SEC', 0):
+            images, meta, _ = utils.wait_image_job({'id': 'j1', 'conn': {'host': 'h', 'port': '1'}, 'model': 'm'},
+                                                   on_status=lambda s: seen.append(utils.image_queue_position(s)))
+        self.assertEqual(images, [self.png])
+        self.assertEqual(meta, {'seed_used': 3, 'server_elapsed': 2.0})
+        self.assertEqual(seen, [{'position': 2, 'eta_sec': 8.0}, {'position': 0, 'eta_sec': None}, None])
+        self.assertEqual(requests[-1], ('DELETE', '/jobs/j1'))
+
+    def test_bulk_retry_queues_ahead_at_retry_priority(self):
+        tagged = self.write_csv(pd.DataFrame({'name': ['a', 'b'], 'img': ['ERROR: x', 'ERROR: x'],
+                                              'img2': ['ERROR: x', 'ok.png']}), 'data_tagged.csv')
+        config = [{'OutputColumn': 'img', 'PromptTemplate': 'Draw {name}', 'ImageParams': '{"model": "m"}'},
+                  {'OutputColumn': 'img2', 'PromptTemplate': 'Sketch {img}', 'ImageParams': '{"model": "m"}'}]
+        images_dir, images_rel = utils.images_dir_for_tagged_path(tagged)
+        os.makedirs(images_dir)
+        submit = mock.Mock(side_effect=lambda prompt, *args: ({'id': prompt}, {}))
+        wait = mock.Mock(return_value=([self.png], {'seed_used': 2}, dict(self.usage)))
+        with mock.patch.object(utils, 'submit_image_job', submit), mock.patch.object(utils, 'wait_image_job', wait):
+            utils._run_bulk_retry('retry-test', [{
+                'tagged_path': tagged, 'config_data': config, 'images_dir': images_dir, 'images_rel': images_rel,
+                'targets': [(0, 'img'), (0, 'img2'), (1, 'img')],
+            }])
+        status = utils.BULK_RETRY_STATUS.pop('retry-test')
+        self.assertEqual((status['fixed'], status['failed']), (3, 0))
+        # Row 0's img2 is only queued once row 0's img is in, since its prompt reads it.
+        self.assertEqual([c.args[0] for c in submit.call_args_list],
+                         ['Draw a', 'Draw b', f'Sketch {images_rel}/row0.png'])
+        self.assertEqual({c.args[3] for c in submit.call_args_list}, {utils.IMAGE_JOB_PRIORITY_RETRY})
+
+
+class CellEditOverlayTests(_IsolatedMediaMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.tagged = self.write_csv(pd.DataFrame({
+            'sku': ['007', '008', '009'],
+            'img': ['a.png', 'ERROR: timeout', 'c.png'],
+        }), 'data_tagged.csv')
+        utils.load_results_analytics(self.tagged)
+        patcher = mock.patch.object(utils, 'EDIT_COMPACT_IDLE_SEC', 3600)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_edits_are_appended_merged_on_read_and_compacted(self):
+        with open(self.tagged) as f:
+            original = f.read()
+        utils.select_image_candidate(self.tagged, 1, 'img', 'b_a1.png')
+        utils.record_cell_edit(self.tagged, 2, 'img', 'c.png', 'c_a2.png')
+        with open(self.tagged) as f:
+            self.assertEqual(f.read(), original)  # the CSV itself is untouched
+
+        self.assertEqual(utils._read_tagged_frame(self.tagged)['img'].tolist(), ['a.png', 'b_a1.png', 'c_a2.png'])
+        self.assertEqual(utils.query_results(self.tagged, errors_only=True)['total'], 0)
+        analytics = utils.load_results_analytics(self.tagged, rebuild=False)
+        self.assertEqual(analytics['columns']['img']['errors'], 0)
+        self.assertEqual(analytics['columns']['img']['counts'], {'a.png': 1, 'b_a1.png': 1, 'c_a2.png': 1})
+
+        self.assertTrue(utils.compact_cell_edits(self.tagged))
+        self.assertFalse(os.path.exists(utils._edits_path_for_tagged(self.tagged)))
+        out = pd.read_csv(self.tagged, dtype=str)
+        self.assertEqual(out['sku'].tolist(), ['007', '008', '009'])
+        self.assertEqual(out['img'].tolist(), ['a.png', 'b_a1.png', 'c_a2.png'])
+        self.assertIsNotNone(utils.load_results_analytics(self.tagged, rebuild=False))  # still current
+
+    def test_compaction_waits_for_a_run_writing_the_same_file(self):
+        utils.record_cell_edit(self.tagged, 0, 'img', 'a.png', 'a_a1.png')
+        utils.PROGRESS_STATUS['overlay-test'] = {'status': 'running', 'tagged_file': self.tagged}
+        try:
+            self.assertFalse(utils.compact_cell_edits_when_idle(self.tagged))
+        finally:
+            utils.PROGRESS_STATUS.pop('overlay-test')
+        self.assertTrue(utils.compact_cell_edits_when_idle(self.tagged))
+
+        utils.record_cell_edit(self.tagged, 0, 'img', 'a_a1.png', 'stale.png')
+        utils.discard_cell_edits(self.tagged)
+        self.assertEqual(utils._read_tagged_frame(self.tagged).at[0, 'img'], 'a_a1.png')
+
+
+class GalleryIndexTests(_IsolatedMediaMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.csv_path = self.write_csv(pd.DataFrame({'sku': ['A1', '', 'C3']}), 'data.csv')
+        self.tagged = self.write_csv(pd.DataFrame({
+            'sku': ['A1', '', 'C3'],
+            'img': ['a.png', 'ERROR: timeout', 'c.png'],
+            'note': ['x', 'y', 'z'],
+        }), 'data_tagged.csv')
+        config_path = os.path.join(settings.MEDIA_ROOT, 'config.csv')
+        utils.save_config_file(config_path, [
+            {'OutputColumn': 'img', 'PromptTemplate': 'p', 'ImageParams': '{"steps": 4}'},
+            {'OutputColumn': 'note', 'PromptTemplate': 'p', 'ImageParams': ''},
+        ])
+        self.project = {'project_id': 'p1', 'name': 'One', 'csv_path': self.csv_path,
+                        'config_path': config_path, 'image_naming_column': 'sku'}
+        patcher = mock.patch.object(utils, 'EDIT_COMPACT_IDLE_SEC', 3600)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_index_pages_filters_and_counts(self):
+        page = utils.query_gallery([self.project], cursor=0, limit=2)
+        self.assertEqual((page['total'], page['all_items'], page['error_count'], page['next_cursor']), (3, 3, 1, 2))
+        self.assertEqual([(i['row_index'], i['label'], i['is_error']) for i in page['items']],
+                         [(0, 'A1', False), (1, 'row1', True)])
+        self.assertEqual(page['items'][0]['url'], settings.MEDIA_URL + 'a.png')
+        self.assertEqual(len(utils.query_gallery([self.project], cursor=2, limit=2)['items']), 1)
+        self.assertEqual([i['row_index'] for i in utils.query_gallery([self.project], 'error')['items']], [1])
+
+        utils.set_review_state(self.tagged, 2, 'img', 'approved')
+        with mock.patch.object(utils, '_reindex_gallery_project') as reindex:
+            approved = utils.query_gallery([self.project], 'approved')
+            unreviewed = utils.query_gallery([self.project], 'unreviewed')
+        reindex.assert_not_called()
+        self.assertEqual([i['row_index'] for i in approved['items']], [2])
+        self.assertEqual([i['row_index'] for i in unreviewed['items']], [0])
+
+    def test_single_cell_edits_patch_the_index_and_rewrites_reindex(self):
+        utils.query_gallery([self.project])
+        utils.record_cell_edit(self.tagged, 1, 'img', 'ERROR: timeout', 'b.png')
+        utils.compact_cell_edits(self.tagged)
+        with mock.patch.object(utils, '_reindex_gallery_project') as reindex:
+            page = utils.query_gallery([self.project])
+        reindex.assert_not_called()
+        self.assertEqual((page['error_count'], page['items'][1]['value']), (0, 'b.png'))
+
+        self.write_csv(pd.DataFrame({'sku': ['A1'], 'img': ['ERROR: boom'], 'note': ['x']}), 'data_tagged.csv')
+        page = utils.query_gallery([self.project])
+        self.assertEqual((page['all_items'], page['error_count']), (1, 1))
+
+        utils.drop_gallery_project('p1')
+        self.assertEqual(utils.query_gallery([])['all_items'], 0)
+
+
+class GalleryZipTests(_IsolatedMediaMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.csv_path = self.write_csv(pd.DataFrame({'sku': ['A1']}), 'data.csv')
+        self.tagged = self.write_csv(pd.DataFrame({'sku': ['A1'], 'img': ['x.png']}), 'data_tagged.csv')
+        images_dir, _ = utils.images_dir_for_tagged_path(self.tagged)
+        os.makedirs(images_dir)
+        for name in ('a.png', 'b.png'):
+            with open(os.path.join(images_dir, name), 'wb') as f:
+                f.write(_png(64, 64))
+        self.project = {'project_id': 'p1', 'name': 'One', 'csv_path': self.csv_path}
+
+    def _read_zip(self, data):
+        import io
+        import zipfile
+        return zipfile.ZipFile(io.BytesIO(data))
+
+    def test_stream_stores_images_and_merges_pending_edits(self):
+        utils.record_cell_edit(self.tagged, 0, 'img', 'x.png', 'y.png')
+        plan = utils.gallery_zip_plan([(self.project, None)])
+        with mock.patch.object(utils, 'GALLERY_ZIP_CHUNK', 1024):
+            chunks = list(utils.iter_gallery_zip(plan))
+        self.assertGreater(len(chunks), 3)
+        zf = self._read_zip(b''.join(chunks))
+        self.assertIsNone(zf.testzip())
+        infos = {i.filename: i for i in zf.infolist()}
+        self.assertEqual(sorted(infos), ['images/a.png', 'images/b.png', 'tagged.csv'])
+        self.assertEqual(infos['images/a.png'].compress_type, 0)  # ZIP_STORED
+        self.assertIn('y.png', zf.read('tagged.csv').decode())
+
+    def test_background_export_reports_progress_and_writes_file(self):
+        plan = utils.gallery_zip_plan([(self.project, ['data_images/a.png', '../outside.png'])])
+        utils.export_gallery_zip('job1', plan, 'out.zip')
+        status = utils.GALLERY_EXPORT_STATUS.pop('job1')
+        self.assertEqual((status['status'], status['done'], status['total']), ('finished', 2, 2))
+        with open(utils.gallery_export_path('job1'), 'rb') as f:
+            self.assertEqual(self._read_zip(f.read()).namelist(), ['images/a.png', 'tagged.csv'])
+
+
+class ThroughputBenchTests(TestCase):
+    def test_mock_server_speaks_openai_and_ollama_shapes(self):
+        import urllib.request
+        from . import bench
+
+        def post(port, path, payload):
+            req = urllib.request.Request(f"http://127.0.0.1:{port}{path}", data=json.dumps(payload).encode(),
+                                         headers={'Content-Type': 'application/json'}, method='POST')
+            with urllib.request.urlopen(req, timeout=5) as resp:
+                return json.loads(resp.read())
+
+        with bench.running_mock_server({'latency': 'fixed:0'}, in_process=True) as (_, port):
+            chat = post(port, '/v1/chat/completions', {'messages': [{'role': 'user', 'content': 'hi'}]})
+            self.assertIn('Best Answer:', chat['choices'][0]['message']['content'])
+            self.assertGreater(chat['usage']['prompt_tokens'], 0)
+            native = post(port, '/api/chat', {'messages': [{'role': 'user', 'content': 'hi'}]})
+            self.assertTrue(native['done'])
+            emb = post(port, '/api/embed', {'input': ['a', 'b', 'a']})['embeddings']
+            self.assertEqual(len(emb), 3)
+            self.assertEqual(emb[0], emb[2])
+
+    def test_bad_latency_spec_is_rejected(self):
+        from . import bench
+        with self.assertRaises(ValueError):
+            bench.parse_latency_spec('gaussian:10')
+
+    def test_small_benchmark_reports_throughput_and_latency(self):
+        from . import bench
+        results = bench.run_throughput_benchmark([6], [3], {'latency': 'fixed:0'}, n_tags=2, in_process=True)
+        (scenario,) = results['scenarios']
+        self.assertEqual(scenario['status'], 'finished')
+        self.assertGreater(scenario['rows_per_sec'], 0)
+        self.assertGreater(scenario['row_latency_ms']['p95'], 0)
+        self.assertEqual(scenario['error_cells'], 0)
+
+    def test_image_path_benchmark_saves_and_times_each_image(self):
+        from . import bench
+        results = bench.run_image_path_benchmark([(64, 48)], ['png', 'jpg'], rows=3)
+        self.assertEqual([s['format'] for s in results['scenarios']], ['png', 'jpg'])
+        for scenario in results['scenarios']:
+            self.assertEqual(scenario['errors'], 0)
+            self.assertGreater(scenario['images_per_sec'], 0)
+            self.assertGreater(scenario['mean_file_kb'], 0)
+
+
+class MetricsTests(TestCase):
+    def test_histogram_exposition_is_cumulative_and_escaped(self):
+        from . import metrics
+        registry = []
+        hist = metrics.Histogram('t_latency_seconds', 'Test.', ['host'], buckets=(0.1, 1), registry=registry)
+        for v in (0.05, 0.5, 0.7, 5):
+            hist.observe(v, host='a"b')
+        text = metrics.render(registry)
+        self.assertIn('# TYPE t_latency_seconds histogram', text)
+        self.assertIn('t_latency_seconds_bucket{host="a\\"b",le="0.1"} 1', text)
+        self.assertIn('t_latency_seconds_bucket{host="a\\"b",le="1"} 3', text)
+        self.assertIn('t_latency_seconds_bucket{host="a\\"b",le="+Inf"} 4', text)
+        self.assertIn('t_latency_seconds_count{host="a\\"b"} 4', text)
+        with self.assertRaises(ValueError):
+            hist.observe(1, model='x')
+
+    def test_tagging_run_is_visible_at_metrics_endpoint(self):
+        from django.test import Client
+        from django.urls import reverse
+        from . import bench, metrics
+        before = metrics.ROWS_PROCESSED.get(mode='text')
+        bench.run_throughput_benchmark([4], [2], {'latency': 'fixed:0'}, n_tags=1, in_process=True)
+        self.assertEqual(metrics.ROWS_PROCESSED.get(mode='text'), before + 4)
+
+        resp = Client().get(reverse('metrics'))
+        self.assertEqual(resp.status_code, 200)
+        self.assertTrue(resp['Content-Type'].startswith('text/plain'))
+        text = resp.content.decode()
+        self.assertRegex(text, r'odt_llm_request_duration_seconds_count\{host="127\.0\.0\.1:\d+",'
+                               r'model="mock-chat",outcome="ok"\} \d+')
+        self.assertIn('odt_csv_write_duration_seconds_count{kind="tagged"}', text)
+        self.assertIn('odt_runs{status="finished"}', text)
+        self.assertIn('odt_inflight_requests{kind="llm"', text)
@@ -15,7 +15,10 @@ urlpatterns = [
     path(f'{BASE_URL}/tagging/image-status/',      views.tagging_image_status_view, name='tagging_image_status'),
     path(f'{BASE_URL}/tagging/llm-status/',        views.tagging_llm_status_view, name='tagging_llm_status'),
     path(f'{BASE_URL}/tagging/stop/',              views.stop_tagging_view,       name='stop_tagging'),
+    path(f'{BASE_URL}/tagging/trace/',             views.tagging_trace_view,      name='tagging_trace'),
+    path(f'{BASE_URL}/tagging/events/',            views.tagging_events_view,     name='tagging_events'),
     path(f'{BASE_URL}/llm_status/',                views.llm_status_view,         name='llm_status'),
+    path(f'{BASE_URL}/metrics/',                   views.metrics_view,            name='metrics'),
     path(f'{BASE_URL}/config-guide/',              views.download_config_guide_view, name='download_config_guide'),
     path(f'{BASE_URL}/results/',                   views.results_view,            name='results'),
     path(f'{BASE_URL}/connection/',                views.connection_editor_view,  name='connection_editor'),
@@ -34,10 +37,12 @@ urlpatterns = [
     path(f'{BASE_URL}/image-backend/compare/',     views.compare_models_view,         name='compare_models'),
     path(f'{BASE_URL}/image_status/',              views.image_status_view,           name='image_status'),
     path(f'{BASE_URL}/define-columns/estimate/',   views.estimate_image_view,         name='estimate_image'),
+    path(f'{BASE_URL}/define-columns/estimate-text/', views.estimate_text_view,       name='estimate_text'),
     path(f'{BASE_URL}/define-columns/build-reference-index/', views.build_reference_index_view,  name='build_reference_index'),
     path(f'{BASE_URL}/define-columns/reference-index-status/', views.reference_index_status_view, name='reference_index_status'),
     path(f'{BASE_URL}/define-columns/add-reference-files/', views.add_reference_files_view,  name='add_reference_files'),
     path(f'{BASE_URL}/define-columns/remove-reference-file/', views.remove_reference_file_view, name='remove_reference_file'),
+    path(f'{BASE_URL}/results/data/',              views.results_data_view,           name='results_data'),
     path(f'{BASE_URL}/results/regenerate/',        views.regenerate_image_view,       name='regenerate_image'),
     path(f'{BASE_URL}/results/select-image/',      views.select_image_view,           name='select_image'),
     path(f'{BASE_URL}/results/review/',            views.set_review_view,             name='set_review'),
@@ -47,6 +52,8 @@ urlpatterns = [
     path(f'{BASE_URL}/gallery/retry/',                    views.gallery_retry_view,         name='gallery_retry'),
     path(f'{BASE_URL}/gallery/retry/status/',             views.gallery_retry_status_view,  name='gallery_retry_status'),
     path(f'{BASE_URL}/gallery/zip/',                      views.gallery_zip_view,           name='gallery_zip'),
+    path(f'{BASE_URL}/gallery/zip/status/',               views.gallery_zip_status_view,    name='gallery_zip_status'),
+    path(f'{BASE_URL}/gallery/zip/download/',             views.gallery_zip_download_view,  name='gallery_zip_download'),
     path(f'{BASE_URL}/project/<str:project_id>/gallery/', views.gallery_view,               name='project_gallery'),
     path(f'{BASE_URL}/project/<str:project_id>/open/',   views.project_open_view,   name='project_open'),
     path(f'{BASE_URL}/project/<str:project_id>/delete/', views.delete_project_view, name='project_delete'),
@@ -6,18 +6,29 @@ import os
 import platform
 import re
 import shutil
+import sqlite3
+import struct
 import subprocess
 import time
 import json
 import base64
+import contextlib
+import functools
+import hashlib
+import html
+import itertools
+import math
 import uuid
 import urllib.request
 import urllib.error
 import urllib.parse
+from collections import OrderedDict, deque
 from datetime import datetime
 from django.core.cache import cache
 from django.conf import settings
 
+from . import metrics
+
 LLM_CACHE_KEYS = {
     "requests": "llm_request_count",
     "total_time": "llm_total_inference_time",
@@ -33,6 +44,7 @@ IMAGE_CONNECTIONS_CSV = os.path.join(_base, '..', 'image_connections.csv')
 PROJECTS_CSV          = os.path.join(_base, '..', 'projects.csv')
 STATS_CSV             = os.path.join(_base, '..', 'stats.csv')
 RAG_PROJECTS_JSON     = os.path.join(_base, '..', 'rag_projects.json')
+GALLERY_INDEX_DB      = os.path.join(_base, '..', 'gallery_index.sqlite3')
 
 PAUSE_FLAGS = {}     # session_key -> bool  (True = paused)
 PROGRESS_STATUS = {} # session_key -> dict
@@ -63,6 +75,13 @@ _DEFAULT_IMAGE_CONNECTION = {
 # Image generation can take a while (large models / many steps).
 SD_TIMEOUT = 600
 
+# /generate asks the SD server to encode images in the project's output
+# format and send them as raw bytes (length-prefixed, see sd_server/app.py)
+# rather than base64 PNG inside JSON, so nothing is re-encoded on this side.
+# Servers that predate this ignore the extra fields and answer in JSON.
+SD_BINARY_MEDIA_TYPE = 'application/x-odt-images'
+IMAGE_JPEG_QUALITY = 92
+
 # Auto-retry budget for a single tag's image generation during a tagging run.
 # One extra attempt or two is cheap insurance against transient failures (a
 # dropped connection, the SD server momentarily busy, or the known
@@ -237,7 +256,8 @@ def embed_texts(texts, embedding_model, conn=None, timeout=60):
     data = json.dumps(payload).encode('utf-8')
     req = urllib.request.Request(url, data=data, headers={'Content-Type': 'application/json'}, method='POST')
     try:
-        with urllib.request.urlopen(req, timeout=timeout) as resp:
+        with metrics.backend_request('embedding', f"{conn['host']}:{conn['port']}", embedding_model), \
+                urllib.request.urlopen(req, timeout=timeout) as resp:
             result = json.loads(resp.read().decode('utf-8'))
     except urllib.error.HTTPError as e:
         # Ollama puts the actually useful message in the response body (e.g.
@@ -654,6 +674,56 @@ def _sd_request(path, payload=None, method='GET', timeout=10):
         return json.loads(resp.read().decode('utf-8'))
 
 
+def _sd_post_raw(path, payload, timeout=10):
+    """JSON POST to the SD server, returning (content_type, body bytes)
+    for endpoints that may answer in something other than JSON."""
+    req = urllib.request.Request(_sd_base_url() + path, data=json.dumps(payload).encode('utf-8'),
+                                 headers={'Content-Type': 'application/json'}, method='POST')
+    with urllib.request.urlopen(req, timeout=timeout) as resp:
+        return resp.headers.get('Content-Type', ''), resp.read()
+
+
+def _sd_get_raw(path, timeout=10):
+    """GET counterpart of _sd_post_raw."""
+    with urllib.request.urlopen(_sd_base_url() + path, timeout=timeout) as resp:
+        return resp.headers.get('Content-Type', ''), resp.read()
+
+
+def _http_error_detail(e):
+    """FastAPI's {"detail": ...} from an HTTPError, else the error itself."""
+    try:
+        return json.loads(e.read().decode('utf-8')).get('detail', str(e))
+    except Exception:
+        return str(e)
+
+
+def _decode_generate_response(content_type, body):
+    """Split a /generate reply into (image_bytes_list, header dict) whichever
+    way the server sent it: the binary length-prefixed body, a list of files
+    in the shared output directory (read and removed here), or base64 JSON."""
+    if content_type.split(';')[0].strip() == SD_BINARY_MEDIA_TYPE:
+        (head_len,) = struct.unpack('>I', body[:4])
+        header = json.loads(body[4:4 + head_len].decode('utf-8'))
+        images, offset = [], 4 + head_len
+        for size in header.get('sizes', []):
+            images.append(body[offset:offset + size])
+            offset += size
+        if offset != len(body):
+            raise ValueError(f"Truncated image response ({len(body)} bytes, expected {offset})")
+        return images, header
+    header = json.loads(body.decode('utf-8'))
+    if 'files' in header:
+        shared_dir = getattr(settings, 'SD_SHARED_OUTPUT_DIR', '')
+        images = []
+        for name in header['files']:
+            path = os.path.join(shared_dir, os.path.basename(name))
+            with open(path, 'rb') as fh:
+                images.append(fh.read())
+            os.remove(path)
+        return images, header
+    return [base64.b64decode(b) for b in header.get('images', [])], header
+
+
 def get_image_capability(timeout=6):
     return _sd_request('/capability', timeout=timeout)
 
@@ -667,6 +737,19 @@ def start_image_download(model_id, hf_token=None, timeout=10):
                        method='POST', timeout=timeout)
 
 
+def preload_image_model(model_id, hf_token=None, timeout=5):
+    """Ask the SD server to start loading a model in the background (see
+    sd_server's /preload). Best-effort: False if the server couldn't be
+    asked, e.g. one that predates the endpoint."""
+    try:
+        _sd_request('/preload', {'model_id': model_id, 'hf_token': hf_token or None},
+                    method='POST', timeout=timeout)
+        return True
+    except Exception as e:
+        print(f"Image model preload skipped: {e}")
+        return False
+
+
 def image_download_status(job_id, timeout=6):
     return _sd_request(f'/download/status?job_id={urllib.parse.quote(job_id)}', timeout=timeout)
 
@@ -876,66 +959,322 @@ def _normalize_loras(params):
     return []
 
 
-def call_image_generation(prompt, params):
-    """Generate image(s) via the SD server for one rendered prompt.
-
-    params keys (all optional except model): model, negative_prompt, width,
-    height, steps, guidance, seed, num_images, hf_token, loras (list of
-    {id, scale}), scheduler.
-
-    Returns (image_bytes_list, meta, usage_dict). usage keys mirror the LLM
-    path (prompt_tokens/completion_tokens are 0 for images) so record_stat is
-    reused unchanged. On failure image_bytes_list is empty and meta['error']
-    is set.
-    """
-    conn  = get_active_image_connection()
-    model = (params.get('model') or conn.get('model') or '').strip()
-
-    request_count = cache.get(IMAGE_CACHE_KEYS["requests"], 0) + 1
-    cache.set(IMAGE_CACHE_KEYS["requests"], request_count, None)
-
-    payload = {
+def _image_request_payload(model, params, image_format):
+    """The /generate and /generate_batch fields shared by every prompt."""
+    return {
         'model_id':        model,
-        'prompt':          prompt,
         'negative_prompt': params.get('negative_prompt', '') or '',
         'width':           _coerce_int(params.get('width'), 512),
         'height':          _coerce_int(params.get('height'), 512),
         'steps':           _coerce_int(params.get('steps'), 30),
         'guidance_scale':  _coerce_float(params.get('guidance'), 7.5),
-        'seed':            _coerce_int(params.get('seed'), -1),
         'num_images':      max(1, _coerce_int(params.get('num_images'), 1)),
         'hf_token':        params.get('hf_token') or None,
         'loras':           _normalize_loras(params),
         'scheduler':       (params.get('scheduler') or 'default').strip() or 'default',
+        'image_format':    'jpeg' if image_format in ('jpg', 'jpeg') else image_format,
+        'quality':         IMAGE_JPEG_QUALITY,
+        'response_format': 'file' if getattr(settings, 'SD_SHARED_OUTPUT_DIR', '') else 'binary',
     }
 
+
+def _post_image_request(path, payload, conn):
+    """POST one generation request to the active SD server, keeping the
+    request/timing counters. Returns (images, header, error, usage): error is
+    None on success, else the server's detail (or the transport error) and
+    images/header are empty; usage['http_status'] is set for HTTP errors."""
+    model = payload['model_id']
+
+    request_count = cache.get(IMAGE_CACHE_KEYS["requests"], 0) + 1
+    cache.set(IMAGE_CACHE_KEYS["requests"], request_count, None)
+
     start = time.time()
     usage = {
         'prompt_tokens': 0, 'completion_tokens': 0, 'elapsed_sec': 0,
         'host': conn['host'], 'port': conn['port'], 'model': model,
     }
     try:
-        data = _sd_request('/generate', payload, method='POST', timeout=SD_TIMEOUT)
+        with metrics.backend_request('image', f"{conn['host']}:{conn['port']}", model):
+            content_type, body = _sd_post_raw(path, payload, timeout=SD_TIMEOUT)
         elapsed = time.time() - start
         usage['elapsed_sec'] = elapsed
         cache.set(IMAGE_CACHE_KEYS["total_time"],
                   cache.get(IMAGE_CACHE_KEYS["total_time"], 0.0) + elapsed, None)
-        images = [base64.b64decode(b) for b in data.get('images', [])]
-        meta = {'seed_used': data.get('seed_used'),
-                'server_elapsed': data.get('elapsed_sec')}
-        return images, meta, usage
+        images, header = _decode_generate_response(content_type, body)
+        return images, header, None, usage
     except urllib.error.HTTPError as e:
-        try:
-            detail = json.loads(e.read().decode('utf-8')).get('detail', str(e))
-        except Exception:
-            detail = str(e)
+        detail = _http_error_detail(e)
         usage['elapsed_sec'] = time.time() - start
+        usage['http_status'] = e.code
         print(f"Image generation HTTP error: {detail}")
-        return [], {'error': detail}, usage
+        return [], {}, detail, usage
     except Exception as e:
         usage['elapsed_sec'] = time.time() - start
         print(f"Image generation error: {e}")
-        return [], {'error': str(e)}, usage
+        return [], {}, str(e), usage
+
+
+def call_image_generation(prompt, params, image_format='png'):
+    """Generate image(s) via the SD server for one rendered prompt.
+
+    params keys (all optional except model): model, negative_prompt, width,
+    height, steps, guidance, seed, num_images, hf_token, loras (list of
+    {id, scale}), scheduler. image_format is the extension the bytes are
+    wanted in (png|jpg); the server encodes them that way.
+
+    Returns (image_bytes_list, meta, usage_dict). usage keys mirror the LLM
+    path (prompt_tokens/completion_tokens are 0 for images) so record_stat is
+    reused unchanged. On failure image_bytes_list is empty and meta['error']
+    is set.
+    """
+    conn  = get_active_image_connection()
+    model = (params.get('model') or conn.get('model') or '').strip()
+    payload = {**_image_request_payload(model, params, image_format),
+               'prompt': prompt, 'seed': _coerce_int(params.get('seed'), -1)}
+    images, data, error, usage = _post_image_request('/generate', payload, conn)
+    if error is not None:
+        return [], {'error': error}, usage
+    meta = {'seed_used': data.get('seed_used'),
+            'server_elapsed': data.get('elapsed_sec')}
+    return images, meta, usage
+
+
+def call_image_generation_batch(prompts, params, image_format='png'):
+    """Generate images for several rendered prompts that share one tag's
+    params in a single /generate_batch call (every prompt gets params'
+    seed; -1 lets the server pick a distinct one per prompt).
+
+    Returns (results, usage_dict): results[i] is (image_bytes_list, meta) for
+    prompts[i], as call_image_generation would return them, with the batch's
+    time split evenly into each meta's 'server_elapsed'. On failure every
+    result carries the same meta['error'] (and meta['unsupported'] when the
+    server has no batch endpoint)."""
+    conn  = get_active_image_connection()
+    model = (params.get('model') or conn.get('model') or '').strip()
+    seed  = _coerce_int(params.get('seed'), -1)
+    payload = {**_image_request_payload(model, params, image_format),
+               'items': [{'prompt': p, 'seed': seed} for p in prompts]}
+    images, data, error, usage = _post_image_request('/generate_batch', payload, conn)
+    if error is not None:
+        meta = {'error': error, 'unsupported': usage.get('http_status') in (404, 405)}
+        return [([], dict(meta)) for _ in prompts], usage
+    share = (data.get('elapsed_sec') or 0) / max(1, len(prompts))
+    results, offset = [], 0
+    for item in data.get('results', []):
+        count = int(item.get('count', 0))
+        results.append((images[offset:offset + count],
+                        {'seed_used': item.get('seed_used'), 'server_elapsed': share}))
+        offset += count
+    return results, usage
+
+
+# ─── Image work ahead of the row loop ───────────────────────────────────────
+# ImageJobQueue, ImageBatcher and ImageJobPlanner each start some of an
+# image-mode run's (row, tag) jobs before the row loop reaches them. That
+# only works for a job whose prompt was pre-rendered and whose condition
+# was decided up front, so all three share that test, the run's row order
+# and each tag's parsed ImageParams through _AheadOfRowLoop.
+
+def _image_params(definition):
+    """A tag definition's ImageParams as a dict ({} if unset or malformed)."""
+    try:
+        params = json.loads(definition.get('ImageParams') or '{}')
+    except (ValueError, TypeError):
+        params = {}
+    return params if isinstance(params, dict) else {}
+
+
+class _AheadOfRowLoop:
+
+    def __init__(self, output_definitions, prerendered, condition_masks, work_rows):
+        self._params = {d['OutputColumn']: _image_params(d) for d in output_definitions}
+        self._prerendered = prerendered
+        self._masks = condition_masks
+        self._work_rows = list(work_rows)
+        self._position = {row: n for n, row in enumerate(self._work_rows)}
+
+    def _ahead_ok(self, row, out_col):
+        """Whether this job can run before the row loop gets to it."""
+        decided = self._masks[out_col].iat[row]
+        return self._prerendered.get(out_col) is not None and decided is not None and bool(decided)
+
+    def _rows_from(self, row):
+        """Work rows from `row` on, in run order, without copying the list."""
+        return (self._work_rows[n] for n in range(self._position[row], len(self._work_rows)))
+
+
+# ─── Queued image jobs ───────────────────────────────────────────────────────
+# /generate holds one HTTP connection open for the whole generation (up to
+# SD_TIMEOUT) and the server only ever shows one caller's work. A server
+# with a /jobs queue lets ODT submit generations ahead and pick each result
+# up when it gets to it, so the server starts the next image the moment the
+# last one finishes instead of waiting for ODT to save it and send another
+# request. Image runs keep the next IMAGE_JOB_LOOKAHEAD jobs of a tag
+# queued (ImageJobQueue); bulk retry does the same with its targets at a
+# higher priority, so a retry someone is waiting on overtakes a long run.
+# Jobs still outstanding when a run stops are cancelled. A server without
+# /jobs is noticed on the first submit and the caller goes back to
+# /generate; so is a job the server has forgotten (restart, or its result
+# outlived the server's TTL while the run was paused).
+
+IMAGE_JOB_LOOKAHEAD = 4
+IMAGE_JOB_POLL_SEC = 0.5
+IMAGE_JOB_PRIORITY_RUN = 0
+IMAGE_JOB_PRIORITY_RETRY = 1
+
+
+def submit_image_job(prompt, params, image_format='png', priority=IMAGE_JOB_PRIORITY_RUN):
+    """Queue one generation (params as for call_image_generation) on the SD
+    server and return at once. Returns (job, error_meta): job is the handle
+    wait_image_job and cancel_image_job take, or None with error_meta
+    {'error', 'unsupported'} — unsupported when the server has no /jobs."""
+    conn  = get_active_image_connection()
+    model = (params.get('model') or conn.get('model') or '').strip()
+    payload = {**_image_request_payload(model, params, image_format),
+               'prompt': prompt, 'seed': _coerce_int(params.get('seed'), -1), 'priority': priority}
+    try:
+        state = _sd_request('/jobs', payload, timeout=10)
+    except urllib.error.HTTPError as e:
+        return None, {'error': _http_error_detail(e), 'unsupported': e.code in (404, 405)}
+    except Exception as e:
+        return None, {'error': str(e), 'unsupported': False}
+    return {'id': state['id'], 'conn': conn, 'model': model}, {}
+
+
+def get_image_job_status(job, timeout=6):
+    """The server's view of a job: state, queue_position and eta_sec while
+    it is pending. {} if unreachable or unknown."""
+    try:
+        return _sd_request(f"/jobs/{job['id']}", timeout=timeout)
+    except Exception:
+        return {}
+
+
+def cancel_image_job(job, timeout=4):
+    """Best-effort: drop a submitted job (or a finished one's result)."""
+    try:
+        _sd_request(f"/jobs/{job['id']}", method='DELETE', timeout=timeout)
+    except Exception:
+        pass
+
+
+def image_queue_position(state):
+    """{'position', 'eta_sec'} for a pending job's status, else None — what
+    progress polling shows while a run or retry waits on the server."""
+    if state.get('state') not in ('queued', 'running'):
+        return None
+    return {'position': state.get('queue_position'), 'eta_sec': state.get('eta_sec')}
+
+
+def wait_image_job(job, should_stop=None, on_status=None):
+    """Wait for a submitted job and return (images, meta, usage) exactly as
+    call_image_generation would, timed from when the wait started. On
+    failure meta['error'] is set, plus meta['expired'] when the server no
+    longer knows the job. should_stop() cancels the job and gives up;
+    on_status(state) sees every status polled, the last one included."""
+    conn, model = job['conn'], job['model']
+    path = f"/jobs/{job['id']}"
+
+    request_count = cache.get(IMAGE_CACHE_KEYS["requests"], 0) + 1
+    cache.set(IMAGE_CACHE_KEYS["requests"], request_count, None)
+
+    start = time.time()
+    usage = {
+        'prompt_tokens': 0, 'completion_tokens': 0, 'elapsed_sec': 0,
+        'host': conn['host'], 'port': conn['port'], 'model': model,
+    }
+    images, meta = [], {}
+    with metrics.backend_request('image', f"{conn['host']}:{conn['port']}", model) as request:
+        try:
+            pending = ('queued', 'running')
+            state = _sd_request(path, timeout=10)
+            while state.get('state') in pending and not (should_stop is not None and should_stop()):
+                if on_status is not None:
+                    on_status(state)
+                time.sleep(IMAGE_JOB_POLL_SEC)
+                state = _sd_request(path, timeout=10)
+            if on_status is not None:
+                on_status(state)
+            if state.get('state') in pending:
+                cancel_image_job(job)
+                meta = {'error': 'cancelled'}
+            elif state.get('state') == 'done':
+                content_type, body = _sd_get_raw(path + '/result', timeout=SD_TIMEOUT)
+                images, header = _decode_generate_response(content_type, body)
+                meta = {'seed_used': header.get('seed_used'), 'server_elapsed': header.get('elapsed_sec')}
+                cancel_image_job(job)  # frees the result on the server
+            else:
+                meta = {'error': state.get('error') or f"job {state.get('state')}"}
+        except urllib.error.HTTPError as e:
+            meta = {'error': _http_error_detail(e), 'expired': e.code == 404}
+        except Exception as e:
+            meta = {'error': str(e)}
+        if not images:
+            request['outcome'] = 'error'
+    usage['elapsed_sec'] = time.time() - start
+    if images:
+        cache.set(IMAGE_CACHE_KEYS["total_time"],
+                  cache.get(IMAGE_CACHE_KEYS["total_time"], 0.0) + usage['elapsed_sec'], None)
+    else:
+        print(f"Image job error: {meta['error']}")
+    return images, meta, usage
+
+
+class ImageJobQueue(_AheadOfRowLoop):
+    """One image-mode run's generations, submitted ahead to the SD server's
+    job queue."""
+
+    def __init__(self, output_definitions, prerendered, condition_masks, work_rows,
+                 image_format='png', should_stop=lambda: False, on_status=None, lookahead=None):
+        super().__init__(output_definitions, prerendered, condition_masks, work_rows)
+        self._image_format = image_format
+        self._should_stop = should_stop
+        self._on_status = on_status
+        self._lookahead = lookahead or IMAGE_JOB_LOOKAHEAD
+        self._submitted = {}
+        self._taken = set()
+        self._supported = True
+
+    def _top_up(self, row, out_col):
+        """Make sure this job and the tag's next few are on the server."""
+        # Lazily, so each take() only walks as far as the lookahead reaches.
+        upcoming = itertools.islice((r for r in self._rows_from(row) if (r, out_col) not in self._taken
+                                     and self._ahead_ok(r, out_col)), self._lookahead)
+        for r in upcoming:
+            if (r, out_col) in self._submitted:
+                continue
+            job, meta = submit_image_job(self._prerendered[out_col].at[r], self._params[out_col],
+                                         self._image_format, IMAGE_JOB_PRIORITY_RUN)
+            if job is None:
+                # No /jobs on this server: stop queueing for the run. Any
+                # other failure (a timeout, a restart) only skips this
+                # round; the next take() tries again.
+                if meta.get('unsupported'):
+                    self._supported = False
+                return
+            self._submitted[(r, out_col)] = job
+
+    def take(self, row, out_col):
+        """(images, meta, usage) for this row/tag from the job queue, or
+        None when it should go through call_image_generation instead."""
+        key = (row, out_col)
+        if key not in self._submitted and (not self._supported or row not in self._position
+                                           or not self._ahead_ok(row, out_col)):
+            return None
+        if self._supported:
+            self._top_up(row, out_col)
+        job = self._submitted.pop(key, None)
+        if job is None:
+            return None
+        self._taken.add(key)
+        images, meta, usage = wait_image_job(job, self._should_stop, self._on_status)
+        return None if meta.get('expired') else (images, meta, usage)
+
+    def close(self):
+        """Cancel whatever is still queued (a stopped or failed run)."""
+        for job in self._submitted.values():
+            cancel_image_job(job)
+        self._submitted.clear()
 
 
 def estimate_image_generation(prompt, params):
@@ -975,15 +1314,24 @@ def _safe_filename_value(value, fallback):
     return s[:80] or fallback
 
 
-def _convert_image_bytes(png_bytes, ext):
-    """The SD server always returns PNG bytes; convert to JPEG here if the
-    project's chosen output format asks for it. JPEG has no alpha channel,
-    so transparency is flattened onto white first."""
-    if ext not in ('jpg', 'jpeg'):
-        return png_bytes
+_IMAGE_MAGIC = {'png': b'\x89PNG', 'jpg': b'\xff\xd8', 'jpeg': b'\xff\xd8'}
+
+
+def _convert_image_bytes(img_bytes, ext):
+    """Make image bytes match the project's output format. The SD server
+    normally encodes in that format already, so this is a pass-through;
+    older servers send PNG, which is converted here. JPEG has no alpha
+    channel, so transparency is flattened onto white first."""
+    magic = _IMAGE_MAGIC.get(ext)
+    if magic is None or img_bytes.startswith(magic):
+        return img_bytes
     import io
     from PIL import Image
-    img = Image.open(io.BytesIO(png_bytes))
+    img = Image.open(io.BytesIO(img_bytes))
+    if ext == 'png':
+        buf = io.BytesIO()
+        img.save(buf, format='PNG')
+        return buf.getvalue()
     if img.mode in ('RGBA', 'LA', 'P'):
         img = img.convert('RGBA')
         bg = Image.new('RGB', img.size, (255, 255, 255))
@@ -992,7 +1340,7 @@ def _convert_image_bytes(png_bytes, ext):
     else:
         img = img.convert('RGB')
     buf = io.BytesIO()
-    img.save(buf, format='JPEG', quality=92)
+    img.save(buf, format='JPEG', quality=IMAGE_JPEG_QUALITY)
     return buf.getvalue()
 
 
@@ -1013,28 +1361,133 @@ def images_dir_for_tagged_path(tagged_path):
     return images_dir, images_rel
 
 
-# ─── Image manifest (attempt tracking + candidate lookup) ───────────────────
-# A JSON sidecar next to the tagged CSV recording every image ever generated
-# for a given (row, output column), independent of what the file is actually
-# named on disk. This lets filenames stay clean (e.g. "SKU123.jpg" instead of
-# "row0_image_a0_0.png") while still supporting retries/candidates: the
-# manifest — not filename parsing — is the source of truth for attempt
-# numbers and the Results-page grid picker.
+# ─── Image store (candidates, review marks, seed history) ───────────────────
+# One SQLite file per project next to the tagged CSV, holding:
+#
+#   candidates  every image ever generated for a (row, output column) —
+#               initial run and each retry — independent of what the file is
+#               named on disk. Filenames stay clean ("SKU123.jpg" instead of
+#               "row0_image_a0_0.png") while attempt numbers and the grid
+#               picker still work: this table, not filename parsing, is the
+#               source of truth for both.
+#   reviews     the approve/reject mark per image cell, kept out of the CSV
+#               itself so it doesn't interfere with downstream consumers of
+#               the tagged data.
+#   seeds       the seed behind each generated file, so "retry with the same
+#               seed" can reuse whichever candidate is currently shown
+#               (including one picked via the grid, not just the latest) and
+#               show a prompt/LoRA tweak on the same composition.
+#   derivatives which downscaled copies (see "Image derivatives") have been
+#               rendered for each generated file.
+#
+# All three used to be whole-file JSON sidecars, re-read and re-parsed on
+# every lookup — once per image cell when rendering Results or the Gallery.
+# Here lookups are indexed by (row, column) or rel_path, appends don't
+# rewrite anything, and a whole page of cells costs one query. Sidecars left
+# by older versions are imported the first time the store is opened and
+# renamed to *.migrated.
 
 _manifest_lock = threading.Lock()
-
-
-def _manifest_path_for_tagged(tagged_path):
-    base = tagged_path[:-len('_tagged.csv')] if tagged_path.endswith('_tagged.csv') else os.path.splitext(tagged_path)[0]
-    return base + '_image_manifest.json'
-
-
-def _load_manifest(tagged_path):
+_reserved_image_paths = set()  # image files named but not yet written (write-behind)
+_image_store_ready = set()  # store paths whose schema/migration is done this process
+
+_IMAGE_STORE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS candidates (
+    row_index INTEGER NOT NULL,
+    out_col   TEXT    NOT NULL,
+    attempt   INTEGER NOT NULL,
+    n         INTEGER NOT NULL,
+    rel_path  TEXT    NOT NULL,
+    PRIMARY KEY (row_index, out_col, attempt, n)
+);
+CREATE INDEX IF NOT EXISTS candidates_rel_path ON candidates (rel_path);
+CREATE TABLE IF NOT EXISTS reviews (
+    row_index INTEGER NOT NULL,
+    out_col   TEXT    NOT NULL,
+    status    TEXT    NOT NULL,
+    PRIMARY KEY (row_index, out_col)
+);
+CREATE TABLE IF NOT EXISTS seeds (
+    rel_path TEXT PRIMARY KEY,
+    seed     INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS derivatives (
+    rel_path TEXT NOT NULL,
+    kind     TEXT NOT NULL,
+    PRIMARY KEY (rel_path, kind)
+);
+"""
+
+
+def _sidecar_base(tagged_path):
+    return tagged_path[:-len('_tagged.csv')] if tagged_path.endswith('_tagged.csv') else os.path.splitext(tagged_path)[0]
+
+
+def _image_store_path_for_tagged(tagged_path):
+    return _sidecar_base(tagged_path) + '_image_store.sqlite3'
+
+
+def _legacy_sidecar_paths(tagged_path):
+    base = _sidecar_base(tagged_path)
+    return {'manifest': base + '_image_manifest.json',
+            'review':   base + '_review.json',
+            'seeds':    base + '_seeds.json'}
+
+
+def _split_cell_key(key):
+    row, _, col = str(key).partition(':')
+    return (int(row), col) if row.isdigit() and col else None
+
+
+def _migrate_legacy_sidecars(conn, tagged_path):
+    for kind, path in _legacy_sidecar_paths(tagged_path).items():
+        if not os.path.exists(path):
+            continue
+        try:
+            with open(path) as f:
+                data = json.load(f)
+        except Exception:
+            continue
+        if kind == 'manifest':
+            conn.executemany(
+                "INSERT OR IGNORE INTO candidates VALUES (?, ?, ?, ?, ?)",
+                [(*cell, e['attempt'], e.get('n', 0), e['rel_path'])
+                 for key, entries in data.items() if (cell := _split_cell_key(key))
+                 for e in entries])
+        elif kind == 'review':
+            conn.executemany(
+                "INSERT OR REPLACE INTO reviews VALUES (?, ?, ?)",
+                [(*cell, status) for key, status in data.items() if (cell := _split_cell_key(key)) and status])
+        else:
+            conn.executemany("INSERT OR REPLACE INTO seeds VALUES (?, ?)",
+                             [(rel, int(seed)) for rel, seed in data.items() if seed is not None])
+        conn.commit()
+        os.replace(path, path + '.migrated')
+
+
+@contextlib.contextmanager
+def _image_store(tagged_path, create=True):
+    """A connection to the project's image store, committed on clean exit.
+    With create=False, yields None instead of creating an empty store for a
+    project that has never generated (or reviewed) anything."""
+    path = _image_store_path_for_tagged(tagged_path)
+    if not create and not os.path.exists(path) and not any(
+            os.path.exists(p) for p in _legacy_sidecar_paths(tagged_path).values()):
+        yield None
+        return
+    if not os.path.exists(path):
+        _image_store_ready.discard(path)  # deleted (e.g. with its project) since it was set up
+    conn = sqlite3.connect(path, timeout=30)
     try:
-        with open(_manifest_path_for_tagged(tagged_path)) as f:
-            return json.load(f)
-    except Exception:
-        return {}
+        if path not in _image_store_ready:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(_IMAGE_STORE_SCHEMA)
+            _migrate_legacy_sidecars(conn, tagged_path)
+            _image_store_ready.add(path)
+        with conn:
+            yield conn
+    finally:
+        conn.close()
 
 
 def _next_attempt_index(tagged_path, row_index, out_col):
@@ -1042,36 +1495,67 @@ def _next_attempt_index(tagged_path, row_index, out_col):
     'attempt' number so retries add new candidate images instead of
     overwriting earlier ones — that's what makes the grid picker and
     regenerate-history work."""
-    entries = _load_manifest(tagged_path).get(f"{row_index}:{out_col}", [])
-    return (max((e['attempt'] for e in entries), default=-1) + 1)
+    with _image_store(tagged_path, create=False) as conn:
+        if conn is None:
+            return 0
+        row = conn.execute("SELECT MAX(attempt) FROM candidates WHERE row_index = ? AND out_col = ?",
+                           (int(row_index), out_col)).fetchone()
+    return 0 if row[0] is None else row[0] + 1
 
 
 def _save_generated_images(images_dir, images_rel, tagged_path, row_index, out_col,
-                           attempt, images, base_name, ext):
+                           attempt, images, base_name, ext, seed=None, writer=None):
     """Write generated image bytes to disk with a human-readable filename and
-    record each one in the manifest. `base_name` should already be sanitized
-    (see _image_base_name); a per-file existence check disambiguates the rare
-    case where two rows sanitize to the same base name, so nothing on disk is
-    ever silently overwritten."""
-    saved_rel = []
+    record each one (and the seed behind it) in the image store. `base_name`
+    should already be sanitized (see _image_base_name); a per-file existence
+    check disambiguates the rare case where two rows sanitize to the same
+    base name, so nothing on disk is ever silently overwritten.
+
+    With `writer` (an ImageWriteBehind) only the filenames are settled here;
+    conversion, the file writes and the store inserts run on the write-behind
+    pool and the MEDIA_ROOT-relative paths are returned straight away."""
     with _manifest_lock:
-        manifest = _load_manifest(tagged_path)
-        key = f"{row_index}:{out_col}"
-        entries = manifest.setdefault(key, [])
-        for n, img_bytes in enumerate(images):
-            suffix = (f"_a{attempt}" if attempt > 0 else "") + (f"_{n}" if n > 0 else "")
-            fname = f"{base_name}{suffix}.{ext}"
+        fnames = _reserve_image_filenames(images_dir, row_index, attempt, len(images), base_name, ext)
+    args = (images_dir, images_rel, tagged_path, row_index, out_col, attempt, images, fnames, ext, seed)
+    if writer is None:
+        return _write_generated_images(*args)
+    writer.submit(row_index, out_col, _write_generated_images, *args)
+    return [f"{images_rel}/{fname}" for fname in fnames]
+
+
+def _reserve_image_filenames(images_dir, row_index, attempt, count, base_name, ext):
+    # Caller holds _manifest_lock. Reserved names cover files still queued
+    # for write-behind, which don't exist on disk yet.
+    fnames = []
+    for n in range(count):
+        suffix = (f"_a{attempt}" if attempt > 0 else "") + (f"_{n}" if n > 0 else "")
+        fname = f"{base_name}{suffix}.{ext}"
+        path = os.path.join(images_dir, fname)
+        if os.path.exists(path) or path in _reserved_image_paths:
+            fname = f"{base_name}_row{row_index}{suffix}.{ext}"
             path = os.path.join(images_dir, fname)
-            if os.path.exists(path):
-                fname = f"{base_name}_row{row_index}{suffix}.{ext}"
-                path = os.path.join(images_dir, fname)
+        _reserved_image_paths.add(path)
+        fnames.append(fname)
+    return fnames
+
+
+def _write_generated_images(images_dir, images_rel, tagged_path, row_index, out_col,
+                            attempt, images, fnames, ext, seed=None):
+    paths = [os.path.join(images_dir, fname) for fname in fnames]
+    try:
+        for path, img_bytes in zip(paths, images):
+            data = _convert_image_bytes(img_bytes, ext)
             with open(path, 'wb') as fh:
-                fh.write(_convert_image_bytes(img_bytes, ext))
-            rel = f"{images_rel}/{fname}"
-            saved_rel.append(rel)
-            entries.append({'rel_path': rel, 'attempt': attempt, 'n': n})
-        with open(_manifest_path_for_tagged(tagged_path), 'w') as f:
-            json.dump(manifest, f)
+                fh.write(data)
+    finally:
+        with _manifest_lock:
+            _reserved_image_paths.difference_update(paths)
+    saved_rel = [f"{images_rel}/{fname}" for fname in fnames]
+    with _image_store(tagged_path) as conn:
+        conn.executemany("INSERT OR REPLACE INTO candidates VALUES (?, ?, ?, ?, ?)",
+                         [(int(row_index), out_col, attempt, n, rel) for n, rel in enumerate(saved_rel)])
+    record_seeds(tagged_path, saved_rel, seed)
+    queue_image_derivatives(tagged_path, saved_rel)
     return saved_rel
 
 
@@ -1079,101 +1563,967 @@ def list_image_candidates(tagged_path, row_index, out_col):
     """Every previously generated candidate image for one row/tag — the
     initial generation plus any retries — for the Results-page grid picker.
     Newest attempt first."""
-    entries = _load_manifest(tagged_path).get(f"{row_index}:{out_col}", [])
-    candidates = [{
-        'rel_path': e['rel_path'],
-        'url':      settings.MEDIA_URL + e['rel_path'],
-        'attempt':  e['attempt'],
-        'n':        e.get('n', 0),
-    } for e in entries]
-    candidates.sort(key=lambda c: (-c['attempt'], c['n']))
-    return candidates
+    return list_image_candidates_for_cells(tagged_path, [(row_index, out_col)])[(row_index, out_col)]
+
+
+def list_image_candidates_for_cells(tagged_path, cells):
+    """list_image_candidates for many (row_index, out_col) cells at once — a
+    single query for a whole page of Results/Gallery cells."""
+    cells = [(int(r), c) for r, c in cells]
+    found = {cell: [] for cell in cells}
+    rows = sorted({r for r, _ in cells})
+    with _image_store(tagged_path, create=False) as conn:
+        for start in range(0, len(rows) if conn is not None else 0, 500):
+            chunk = rows[start:start + 500]
+            for row_index, out_col, attempt, n, rel, thumb in conn.execute(
+                    f"SELECT c.row_index, c.out_col, c.attempt, c.n, c.rel_path, d.kind FROM candidates c "
+                    f"LEFT JOIN derivatives d ON d.rel_path = c.rel_path AND d.kind = 'thumb' "
+                    f"WHERE c.row_index IN ({','.join('?' * len(chunk))}) ORDER BY c.attempt DESC, c.n",
+                    chunk):
+                if (row_index, out_col) in found:
+                    found[(row_index, out_col)].append({
+                        'rel_path':  rel,
+                        'url':       settings.MEDIA_URL + rel,
+                        'thumb_url': settings.MEDIA_URL + (derivative_rel_path(rel, 'thumb') if thumb else rel),
+                        'attempt':   attempt,
+                        'n':         n,
+                    })
+    return found
 
 
 def select_image_candidate(tagged_path, row_index, out_col, rel_path):
     """Point a tagged-CSV image cell at a different already-generated candidate."""
-    df = pd.read_csv(tagged_path)
+    df = _cached_tagged_frame(tagged_path)['typed']
     if row_index < 0 or row_index >= len(df) or out_col not in df.columns:
         raise ValueError("Invalid row index or column.")
-    df.at[row_index, out_col] = rel_path
-    df.to_csv(tagged_path, index=False)
-
-
-# ─── Review state (approve/reject) ──────────────────────────────────────────
-# A lightweight sidecar JSON next to the tagged CSV — keeps the approve/reject
-# mark out of the CSV itself so it doesn't interfere with downstream consumers
-# of the tagged data.
-
-_review_lock = threading.Lock()
-
-
-def _review_path_for_tagged(tagged_path):
-    base = tagged_path[:-len('_tagged.csv')] if tagged_path.endswith('_tagged.csv') else os.path.splitext(tagged_path)[0]
-    return base + '_review.json'
+    record_cell_edit(tagged_path, row_index, out_col, df.at[row_index, out_col], rel_path)
 
 
 def load_review_state(tagged_path):
     """{'<row_index>:<column>': 'approved'|'rejected'}"""
-    try:
-        with open(_review_path_for_tagged(tagged_path)) as f:
-            return json.load(f)
-    except Exception:
-        return {}
+    with _image_store(tagged_path, create=False) as conn:
+        if conn is None:
+            return {}
+        return {f"{r}:{c}": status for r, c, status in conn.execute("SELECT row_index, out_col, status FROM reviews")}
 
 
 def set_review_state(tagged_path, row_index, column, status):
     """status: 'approved' | 'rejected' | '' (clears the mark)."""
-    key = f"{row_index}:{column}"
-    with _review_lock:
-        state = load_review_state(tagged_path)
+    with _image_store(tagged_path) as conn:
         if status:
-            state[key] = status
+            conn.execute("INSERT OR REPLACE INTO reviews VALUES (?, ?, ?)", (int(row_index), column, status))
         else:
-            state.pop(key, None)
-        with open(_review_path_for_tagged(tagged_path), 'w') as f:
-            json.dump(state, f)
-    return state
+            conn.execute("DELETE FROM reviews WHERE row_index = ? AND out_col = ?", (int(row_index), column))
+    _gallery_review_changed(tagged_path, row_index, column, status)
+    return load_review_state(tagged_path)
+
+
+def record_seeds(tagged_path, rel_paths, seed):
+    if seed is None or not rel_paths:
+        return
+    with _image_store(tagged_path) as conn:
+        conn.executemany("INSERT OR REPLACE INTO seeds VALUES (?, ?)", [(rel, int(seed)) for rel in rel_paths])
+
+
+def get_seed_for_path(tagged_path, rel_path):
+    if not rel_path:
+        return None
+    with _image_store(tagged_path, create=False) as conn:
+        if conn is None:
+            return None
+        row = conn.execute("SELECT seed FROM seeds WHERE rel_path = ?", (str(rel_path),)).fetchone()
+    return row[0] if row else None
+
+
+# ─── Image write-behind ─────────────────────────────────────────────────────
+# In image mode the tagging thread hands each generation's post-processing —
+# JPEG conversion, the file writes, candidate/seed inserts — to a small pool
+# and moves straight on to the next /generate call, so the SD server isn't
+# left idle while the previous result is encoded and saved. The run's
+# ImageWriteBehind caps how many saves may be in flight
+# (IMAGE_WRITE_QUEUE_MAX); past that, submit() blocks the tagger until one
+# finishes, so a slow disk throttles generation instead of piling decoded
+# images up in memory. Filenames are settled up front, which is what lets
+# the tagged CSV record a path before its file exists; the run drains its
+# writer before reporting itself finished and marks any save that failed as
+# an ERROR cell.
+
+IMAGE_WRITE_WORKERS = 2
+IMAGE_WRITE_QUEUE_MAX = 8
+
+_image_write_executor = None
+_image_write_executor_lock = threading.Lock()
+
+
+def _image_write_pool():
+    global _image_write_executor
+    from concurrent.futures import ThreadPoolExecutor
+    with _image_write_executor_lock:
+        if _image_write_executor is None:
+            _image_write_executor = ThreadPoolExecutor(max_workers=IMAGE_WRITE_WORKERS,
+                                                       thread_name_prefix='odt-image-write')
+        return _image_write_executor
+
+
+class ImageWriteBehind:
+    """One run's in-flight image saves."""
+
+    def __init__(self, queue_max=None):
+        self._slots = threading.BoundedSemaphore(queue_max or IMAGE_WRITE_QUEUE_MAX)
+        self._pending = []
+
+    def submit(self, row_index, out_col, fn, *args):
+        self._slots.acquire()
+        try:
+            future = _image_write_pool().submit(fn, *args)
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _f: self._slots.release())
+        self._pending.append((row_index, out_col, future))
+
+    def drain(self):
+        """Wait for every pending save. Returns [(row_index, out_col, error), ...]
+        for the ones that failed."""
+        failures = []
+        for row_index, out_col, future in self._pending:
+            try:
+                future.result()
+            except Exception as e:
+                failures.append((row_index, out_col, str(e)))
+        self._pending = []
+        return failures
+
+
+# ─── Batched image generation ───────────────────────────────────────────────
+# On a GPU with memory to spare, one denoising pass over several prompts is
+# much faster than the same prompts one after another. A tag's ImageParams
+# are the same on every row, so upcoming rows of one tag always share model,
+# size, steps, scheduler and LoRA stack: the run's ImageBatcher generates
+# them together through /generate_batch the first time the row loop reaches
+# one of them, then hands each row its own result when the loop gets there.
+# Only rows whose prompt was pre-rendered and whose condition was decided up
+# front can be fetched ahead; everything else, and every retry, still goes
+# through /generate one at a time.
+#
+# Batch size comes from the SD server's free VRAM (vram_free_mb on
+# /capability) over a rough per-megapixel cost of each image in the batch,
+# capped at IMAGE_BATCH_MAX. Only CUDA servers batch: CPU reports no VRAM,
+# and on Apple Silicon vram_free_mb is just system RAM, which the server
+# already streams weights through. Anything else runs batches of one, i.e.
+# the plain sequential path. A server without /generate_batch is noticed on
+# the first attempt and the run carries on without batching.
+
+IMAGE_BATCH_MAX = 8
+IMAGE_BATCH_MB_PER_MEGAPIXEL = 2500  # activations per image, fp16 UNet + VAE decode
+IMAGE_BATCH_VRAM_HEADROOM = 0.8
+
+
+def image_batch_size(params, vram_free_mb):
+    """How many prompts with these ImageParams fit in one batch."""
+    if not vram_free_mb:
+        return 1
+    megapixels = _coerce_int(params.get('width'), 512) * _coerce_int(params.get('height'), 512) / 1e6
+    per_prompt = max(1, _coerce_int(params.get('num_images'), 1)) * megapixels * IMAGE_BATCH_MB_PER_MEGAPIXEL
+    return max(1, min(IMAGE_BATCH_MAX, int(vram_free_mb * IMAGE_BATCH_VRAM_HEADROOM // max(per_prompt, 1))))
+
+
+class ImageBatcher(_AheadOfRowLoop):
+    """One image-mode run's generations, fetched ahead in batches."""
+
+    def __init__(self, output_definitions, prerendered, condition_masks, work_rows,
+                 image_format='png', vram_free_mb=None):
+        super().__init__(output_definitions, prerendered, condition_masks, work_rows)
+        self._image_format = image_format
+        self._vram_free_mb = vram_free_mb
+        self._sizes = {}
+        self._ready = {}
+        self._supported = True
+
+    def _batch_size(self, out_col):
+        if out_col not in self._sizes:
+            if self._vram_free_mb is None:
+                try:
+                    cap = get_image_capability()
+                    self._vram_free_mb = (cap.get('vram_free_mb') or 0) if cap.get('backend') == 'cuda' else 0
+                except Exception:
+                    self._vram_free_mb = 0
+            self._sizes[out_col] = image_batch_size(self._params[out_col], self._vram_free_mb)
+        return self._sizes[out_col]
+
+    def take(self, row, out_col):
+        """(images, meta, usage) for this row/tag from a batch — generating
+        the batch now if needed — or None when it should go through
+        call_image_generation on its own."""
+        key = (row, out_col)
+        if key in self._ready:
+            return self._ready.pop(key)
+        if not self._supported or row not in self._position or not self._ahead_ok(row, out_col):
+            return None
+        rows = list(itertools.islice((r for r in self._rows_from(row) if self._ahead_ok(r, out_col)),
+                                     self._batch_size(out_col)))
+        if len(rows) == 1:
+            return None
+
+        prompts = [self._prerendered[out_col].at[r] for r in rows]
+        results, usage = call_image_generation_batch(prompts, self._params[out_col], self._image_format)
+        if results and results[0][1].get('unsupported'):
+            self._supported = False
+            return None
+        share = {**usage, 'elapsed_sec': usage['elapsed_sec'] / len(rows)}
+        for r, (images, meta) in zip(rows, results):
+            self._ready[(r, out_col)] = (images, meta, dict(share))
+        return self._ready.pop(key, None)
+
+
+# ─── Image job planning (model affinity) ─────────────────────────────────────
+# The row loop is row-major, so a project whose image tags use different
+# models (or LoRA stacks, or schedulers) makes the SD server swap pipelines
+# on nearly every call. When a (row, tag) job doesn't depend on anything
+# else in its row — its prompt was pre-rendered and its condition decided
+# up front — its order doesn't matter, so the run's ImageJobPlanner takes
+# IMAGE_AFFINITY_WINDOW rows at a time and generates their jobs grouped by
+# (model, LoRA ids, scheduler), starting with whatever the server has
+# loaded. The row loop then picks each result up in its usual order, so the
+# tagged CSV, live log and progress are unchanged apart from arriving a
+# window at a time. While one group runs, the next group's model is
+# preloaded on the server. Switches made versus what row-major order would
+# have made are reported in the run's progress (image_switches).
+
+IMAGE_AFFINITY_WINDOW = 16
+
+
+def image_affinity_key(params, default_model=''):
+    """What the SD server has to switch to run a tag: (model, LoRA ids, scheduler)."""
+    return ((params.get('model') or default_model or '').strip(),
+            tuple(l['id'] for l in _normalize_loras(params)),
+            (params.get('scheduler') or 'default').strip() or 'default')
+
+
+def count_pipeline_switches(keys, current=None):
+    """Pipeline switches needed to run jobs with these affinity keys in
+    order, starting from `current` (None: nothing loaded yet)."""
+    switches = 0
+    for key in keys:
+        if key != current:
+            switches += current is not None
+            current = key
+    return switches
+
+
+class ImageJobPlanner(_AheadOfRowLoop):
+    """One image-mode run's jobs, generated ahead in model-affinity order.
+    run_job(row, definition) does one job and returns what
+    _generate_image_for_tag returns; should_stop() ends a window early
+    (pause/cancel); preload(params) warms the next group's model."""
+
+    def __init__(self, output_definitions, prerendered, condition_masks, work_rows,
+                 run_job, should_stop=lambda: False, preload=None, default_model='', window=None):
+        super().__init__(output_definitions, prerendered, condition_masks, work_rows)
+        self._definitions = list(output_definitions)
+        self._column_order = {d['OutputColumn']: n for n, d in enumerate(self._definitions)}
+        self._keys = {col: image_affinity_key(params, default_model) for col, params in self._params.items()}
+        self._run_job = run_job
+        self._should_stop = should_stop
+        self._preload = preload
+        self._window = window or IMAGE_AFFINITY_WINDOW
+        self._ready = {}
+        self._current = None      # key the server last ran, in planned order
+        self._row_major = None    # same, had the jobs run row-major
+        self.stats = {'planned': 0, 'row_major': 0, 'avoided': 0}
+        plannable = {self._keys[d['OutputColumn']] for d in self._definitions
+                     if prerendered.get(d['OutputColumn']) is not None}
+        self.enabled = len(plannable) > 1
+
+    def take(self, row, out_col):
+        """This job's result if it was planned (planning its window now if
+        needed), or None when the row loop should run it itself."""
+        key = (row, out_col)
+        if key in self._ready:
+            return self._ready.pop(key)
+        if not self.enabled or row not in self._position or not self._ahead_ok(row, out_col):
+            return None
+        start = self._position[row]
+        rows = self._work_rows[start:start + self._window]
+        # The loop has already been through this row's earlier tags.
+        first_col = self._column_order[out_col]
+        jobs = [(r, d) for r in rows for d in self._definitions
+                if (r != row or self._column_order[d['OutputColumn']] >= first_col)
+                and (r, d['OutputColumn']) not in self._ready and self._ahead_ok(r, d['OutputColumn'])]
+
+        # Groups in first-seen order, except the one already loaded goes first.
+        order = list(dict.fromkeys(self._keys[d['OutputColumn']] for _, d in jobs))
+        if self._current in order:
+            order.remove(self._current)
+            order.insert(0, self._current)
+        planned = sorted(jobs, key=lambda job: order.index(self._keys[job[1]['OutputColumn']]))
+
+        for n, (r, definition) in enumerate(planned):
+            if self._should_stop():
+                break
+            job_key = self._keys[definition['OutputColumn']]
+            if job_key != self._current:
+                self.stats['planned'] += self._current is not None
+                self._current = job_key
+                upcoming = next((d for _, d in planned[n:] if self._keys[d['OutputColumn']] != job_key), None)
+                if upcoming is not None and self._preload is not None \
+                        and self._keys[upcoming['OutputColumn']][0] != job_key[0]:
+                    self._preload(self._params[upcoming['OutputColumn']])
+            self._ready[(r, definition['OutputColumn'])] = self._run_job(r, definition)
+
+        # Baseline: the same jobs (those that ran) in row-major order.
+        row_major_keys = [self._keys[d['OutputColumn']] for r, d in jobs
+                          if (r, d['OutputColumn']) in self._ready]
+        self.stats['row_major'] += count_pipeline_switches(row_major_keys, self._row_major)
+        self._row_major = row_major_keys[-1] if row_major_keys else self._row_major
+        self.stats['avoided'] = max(0, self.stats['row_major'] - self.stats['planned'])
+        return self._ready.pop(key, None)
+
+
+# ─── Image derivatives (thumbnails / previews) ──────────────────────────────
+# Pages that show generated images in bulk — the Results grid, Gallery cards,
+# the live log, the candidate picker — load small WebP copies instead of the
+# full-resolution files: a "thumb" for the small tiles and a "preview" for
+# Gallery cards. They are rendered by a small worker pool right after each
+# save (_save_generated_images), so generation never waits on them, and
+# recorded in the image store's `derivatives` table once written. Until then
+# (or if one is ever missing) pages fall back to the full image. Projects
+# generated before derivatives existed are backfilled the first time their
+# Results or Gallery page is opened in a process.
+#
+# A derivative of `<x>_images/<file>` lives at
+# `<x>_images_derivatives/<kind>/<file>.webp` — outside the images folder, so
+# downloads and zips of that folder still contain only the originals.
+
+DERIVATIVE_SIZES = {'thumb': 256, 'preview': 640}  # longest side, px; never upscaled
+DERIVATIVE_WORKERS = 2
+
+_derivative_executor = None
+_derivative_lock = threading.Lock()
+_derivatives_pending = set()     # rel paths queued or rendering
+_derivatives_backfilled = set()  # abs tagged paths already backfilled this process
+
+
+@functools.lru_cache(maxsize=1)
+def _derivative_format():
+    """(extension, PIL format) — WebP where this Pillow build supports it."""
+    from PIL import features
+    return ('webp', 'WEBP') if features.check('webp') else ('jpg', 'JPEG')
+
+
+def derivative_rel_path(rel_path, kind):
+    head, _, fname = str(rel_path).rpartition('/')
+    return f"{head}_derivatives/{kind}/{fname}.{_derivative_format()[0]}"
+
+
+def render_image_derivatives(tagged_path, rel_path):
+    """Write every DERIVATIVE_SIZES copy of one generated image and record
+    them in the image store. Returns the kinds written."""
+    from PIL import Image
+    ext, fmt = _derivative_format()
+    source = os.path.join(settings.MEDIA_ROOT, rel_path)
+    if not os.path.isfile(source):
+        return []
+    written = []
+    with Image.open(source) as img:
+        img.load()
+        for kind, size in DERIVATIVE_SIZES.items():
+            out = img.copy()
+            out.thumbnail((size, size))
+            out = out.convert('RGBA' if fmt == 'WEBP' and 'A' in out.getbands() else 'RGB')
+            path = os.path.join(settings.MEDIA_ROOT, derivative_rel_path(rel_path, kind))
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp = f"{path}.{uuid.uuid4().hex}.tmp"
+            out.save(tmp, format=fmt, quality=80)
+            os.replace(tmp, path)
+            written.append(kind)
+    with _image_store(tagged_path) as conn:
+        conn.executemany("INSERT OR REPLACE INTO derivatives VALUES (?, ?)", [(rel_path, k) for k in written])
+    return written
+
+
+def _render_queued_derivatives(tagged_path, rel_path):
+    try:
+        render_image_derivatives(tagged_path, rel_path)
+    except Exception as e:
+        print(f"WARNING: Rendering derivatives for {rel_path} failed: {e}")
+    finally:
+        with _derivative_lock:
+            _derivatives_pending.discard(rel_path)
+
+
+def queue_image_derivatives(tagged_path, rel_paths):
+    global _derivative_executor
+    from concurrent.futures import ThreadPoolExecutor
+    with _derivative_lock:
+        if _derivative_executor is None:
+            _derivative_executor = ThreadPoolExecutor(max_workers=DERIVATIVE_WORKERS,
+                                                      thread_name_prefix='odt-derivatives')
+        for rel in rel_paths:
+            if rel not in _derivatives_pending:
+                _derivatives_pending.add(rel)
+                _derivative_executor.submit(_render_queued_derivatives, tagged_path, rel)
+
+
+def missing_image_derivatives(tagged_path):
+    """Generated images in the store that lack one or more derivatives."""
+    with _image_store(tagged_path, create=False) as conn:
+        if conn is None:
+            return []
+        return [rel for (rel,) in conn.execute(
+            "SELECT DISTINCT rel_path FROM candidates WHERE rel_path NOT IN "
+            "(SELECT rel_path FROM derivatives GROUP BY rel_path HAVING COUNT(*) >= ?)",
+            (len(DERIVATIVE_SIZES),))]
 
 
-# ─── Seed history (locked-seed retry) ───────────────────────────────────────
-# {'<rel_path>': seed} sidecar next to the tagged CSV. Every generated image
-# is recorded here, so a later "retry with the same seed" can look up the
-# seed behind whichever candidate is currently shown in a cell (including one
-# picked via the grid, not just the latest attempt) and reuse it — letting
-# you tweak the prompt/negative-prompt/LoRA and see the effect on the same
-# composition instead of a fresh random one.
+def backfill_image_derivatives(tagged_path):
+    """Queue derivatives for every generated image missing any. Returns how
+    many images were queued."""
+    missing = missing_image_derivatives(tagged_path)
+    queue_image_derivatives(tagged_path, missing)
+    return len(missing)
+
+
+def backfill_image_derivatives_once(tagged_path):
+    key = os.path.abspath(tagged_path)
+    with _derivative_lock:
+        if key in _derivatives_backfilled:
+            return
+        _derivatives_backfilled.add(key)
+    backfill_image_derivatives(tagged_path)
+
+
+def image_display_urls(tagged_path, rel_paths, kind='thumb'):
+    """{rel_path: URL of its `kind` derivative, or of the full image while
+    that derivative isn't recorded yet}."""
+    rel_paths = list(dict.fromkeys(rel_paths))
+    ready = set()
+    with _image_store(tagged_path, create=False) as conn:
+        for start in range(0, len(rel_paths) if conn is not None else 0, 500):
+            chunk = rel_paths[start:start + 500]
+            ready.update(rel for (rel,) in conn.execute(
+                f"SELECT rel_path FROM derivatives WHERE kind = ? AND rel_path IN ({','.join('?' * len(chunk))})",
+                (kind, *chunk)))
+    return {rel: settings.MEDIA_URL + (derivative_rel_path(rel, kind) if rel in ready else rel)
+            for rel in rel_paths}
+
+
+# ─── Results analytics sidecar ──────────────────────────────────────────────
+# Per-column value counts, numeric summaries and error counts for a tagged
+# CSV, kept in a `<base>_analytics.json` sidecar so Results and Home read a
+# few KB instead of re-scanning the whole file on every page load. Built in
+# one vectorized pass when a run starts (or when no trustworthy sidecar
+# exists), then patched cell by cell as writers change values — the tagger's
+# per-row save, candidate selection, retries.
+#
+# Every such write goes through write_tagged_csv (whole file) or
+# record_cell_edit (one cell, see the overlay below), which update the
+# sidecar in step and stamp it with the CSV's (size, mtime) plus the size of
+# its pending edit log. A sidecar whose stamp no longer matches (a crash
+# between the two writes, a CSV edited outside the app) is simply rebuilt on
+# next read, so a missed update costs one full scan, never a wrong number.
+#
+# Counts are keyed by the stripped cell text; columns that pass
+# ANALYTICS_MAX_CATEGORIES distinct values (free text, file paths) stop
+# tracking counts but keep their error/numeric totals.
+
+ANALYTICS_MAX_CATEGORIES = 50
 
-_seeds_lock = threading.Lock()
+_tagged_file_locks = {}
+_tagged_file_locks_guard = threading.Lock()
 
 
-def _seeds_path_for_tagged(tagged_path):
+def _analytics_path_for_tagged(tagged_path):
     base = tagged_path[:-len('_tagged.csv')] if tagged_path.endswith('_tagged.csv') else os.path.splitext(tagged_path)[0]
-    return base + '_seeds.json'
+    return base + '_analytics.json'
 
 
-def load_seed_state(tagged_path):
+def get_results_analytics_path(tagged_path):
+    path = _analytics_path_for_tagged(tagged_path)
+    return path if os.path.exists(path) else None
+
+
+def _tagged_file_lock(tagged_path):
+    """Serializes everything that changes one tagged CSV or its sidecars:
+    full writes, overlay appends, compaction."""
+    with _tagged_file_locks_guard:
+        return _tagged_file_locks.setdefault(os.path.abspath(tagged_path), threading.Lock())
+
+
+def _file_signature(path):
     try:
-        with open(_seeds_path_for_tagged(tagged_path)) as f:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return [st.st_size, st.st_mtime_ns]
+
+
+def _tagged_signature(tagged_path):
+    signature = _file_signature(tagged_path)
+    if signature is None:
+        return None
+    edits = _file_signature(_edits_path_for_tagged(tagged_path))
+    return signature + [edits[0] if edits else 0]
+
+
+def _read_tagged_base(tagged_path, raw=False):
+    """The tagged CSV as written, without pending cell edits — only blank
+    cells read back as NaN, so literal "N/A"/"NA" answers survive a
+    read-modify-write round trip. raw=True keeps every cell as text, for
+    rewriting the file byte-for-byte (leading zeros and all)."""
+    if raw:
+        return pd.read_csv(tagged_path, dtype=str, keep_default_na=False)
+    return pd.read_csv(tagged_path, keep_default_na=False, na_values=[''])
+
+
+def _read_tagged_frame(tagged_path):
+    """The tagged CSV as readers should see it: the file plus its pending
+    cell edits."""
+    return _apply_cell_edits(_read_tagged_base(tagged_path), read_cell_edits(tagged_path)[0])
+
+
+def _analytics_key(value):
+    if value is None or (isinstance(value, float) and math.isnan(value)):
+        return None
+    key = str(value).strip()
+    return key or None
+
+
+def _analytics_number(key):
+    try:
+        number = float(key)
+    except (TypeError, ValueError):
+        return None
+    return number if math.isfinite(number) else None
+
+
+def _is_error_value(key):
+    return key == 'ERROR' or key.startswith('ERROR:')
+
+
+def _column_numeric_summary(keys):
+    numbers = pd.to_numeric(keys, errors='coerce')
+    numbers = numbers[np.isfinite(numbers)]
+    if numbers.empty:
+        return {'count': 0, 'sum': 0.0, 'min': None, 'max': None}
+    return {'count': int(len(numbers)), 'sum': float(numbers.sum()),
+            'min': float(numbers.min()), 'max': float(numbers.max())}
+
+
+def _column_analytics(series):
+    keys = series.dropna().map(str).str.strip()
+    keys = keys[keys != '']
+    counts = keys.value_counts(sort=False)
+    return {
+        'non_empty': int(len(keys)),
+        'errors':    int((keys.eq('ERROR') | keys.str.startswith('ERROR:')).sum()),
+        'counts':    ({str(k): int(v) for k, v in counts.items()}
+                      if len(counts) <= ANALYTICS_MAX_CATEGORIES else None),
+        'numeric':   _column_numeric_summary(keys),
+    }
+
+
+def build_results_analytics(df):
+    """Full-scan analytics for a tagged DataFrame (the sidecar's payload)."""
+    return {
+        'version': 1,
+        'rows':    int(len(df)),
+        'columns': {str(col): _column_analytics(df[col]) for col in df.columns},
+    }
+
+
+def _apply_analytics_change(analytics, column_values, column, old, new):
+    """Patch analytics for one cell going old -> new. column_values(col)
+    returns the column's current values, for the rare case that needs a
+    rescan."""
+    old_key, new_key = _analytics_key(old), _analytics_key(new)
+    if old_key == new_key:
+        return
+    stats = analytics['columns'].get(column)
+    if stats is None:
+        analytics['columns'][column] = _column_analytics(column_values(column))
+        return
+    numeric = stats['numeric']
+    bounds_lost = False
+    for key, sign in ((old_key, -1), (new_key, 1)):
+        if key is None:
+            continue
+        stats['non_empty'] += sign
+        if _is_error_value(key):
+            stats['errors'] += sign
+        counts = stats['counts']
+        if counts is not None:
+            n = counts.get(key, 0) + sign
+            if n > 0:
+                counts[key] = n
+            else:
+                counts.pop(key, None)
+            if len(counts) > ANALYTICS_MAX_CATEGORIES:
+                stats['counts'] = None
+        number = _analytics_number(key)
+        if number is None:
+            continue
+        numeric['count'] += sign
+        numeric['sum'] += sign * number
+        if sign > 0:
+            numeric['min'] = number if numeric['min'] is None else min(numeric['min'], number)
+            numeric['max'] = number if numeric['max'] is None else max(numeric['max'], number)
+        elif number in (numeric['min'], numeric['max']):
+            bounds_lost = True
+    if bounds_lost:
+        # Removing the current min/max leaves no way to know the next one
+        # from the totals alone — rescan just this column.
+        keys = column_values(column).dropna().map(str).str.strip()
+        stats['numeric'] = _column_numeric_summary(keys[keys != ''])
+
+
+def _read_analytics_sidecar(tagged_path):
+    try:
+        with open(_analytics_path_for_tagged(tagged_path)) as f:
             return json.load(f)
     except Exception:
-        return {}
+        return None
 
 
-def record_seeds(tagged_path, rel_paths, seed):
-    if seed is None or not rel_paths:
-        return
-    with _seeds_lock:
-        state = load_seed_state(tagged_path)
-        for rel in rel_paths:
-            state[rel] = seed
-        with open(_seeds_path_for_tagged(tagged_path), 'w') as f:
-            json.dump(state, f)
+def _save_analytics_sidecar(tagged_path, analytics):
+    analytics['source'] = _tagged_signature(tagged_path)
+    path = _analytics_path_for_tagged(tagged_path)
+    tmp = path + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(analytics, f)
+    os.replace(tmp, path)
 
 
-def get_seed_for_path(tagged_path, rel_path):
-    if not rel_path:
-        return None
-    return load_seed_state(tagged_path).get(str(rel_path))
+def write_tagged_csv(df, tagged_path, changes=None, analytics=None):
+    """Save the tagged CSV and bring its analytics sidecar along.
+
+    changes: [(column, old_value, new_value), ...] — every cell that differs
+    from what is currently on disk — or None when unknown, which rebuilds
+    the sidecar from df. analytics: the caller's in-memory copy (the tagger
+    keeps one for the whole run); otherwise the sidecar is loaded, and only
+    trusted if it still matches the file about to be replaced. Cell edits
+    still pending in the overlay stay pending (they apply on top of df);
+    while there are any, the sidecar is rebuilt rather than patched.
+    Returns the updated analytics.
+    """
+    with _tagged_file_lock(tagged_path):
+        if analytics is None and changes is not None:
+            analytics = _read_analytics_sidecar(tagged_path)
+            if analytics is None or analytics.get('source') != _tagged_signature(tagged_path):
+                changes = None
+        df.to_csv(tagged_path, index=False)
+        pending = read_cell_edits(tagged_path)[0]
+        if pending:
+            analytics = build_results_analytics(_apply_cell_edits(df.copy(), pending))
+        elif changes is None:
+            analytics = build_results_analytics(df)
+        else:
+            for column, old, new in changes:
+                _apply_analytics_change(analytics, df.__getitem__, column, old, new)
+            analytics['rows'] = int(len(df))
+        _save_analytics_sidecar(tagged_path, analytics)
+    return analytics
+
+
+def load_results_analytics(tagged_path, rebuild=True):
+    """The tagged CSV's analytics, from the sidecar when it is current.
+    A missing or stale sidecar is rebuilt from the CSV (one full scan), or
+    with rebuild=False reported as None — for pages that must stay cheap."""
+    with _tagged_file_lock(tagged_path):
+        analytics = _read_analytics_sidecar(tagged_path)
+        signature = _tagged_signature(tagged_path)
+        if analytics is not None and signature is not None and analytics.get('source') == signature:
+            return analytics
+        if not rebuild or signature is None:
+            return None
+        analytics = build_results_analytics(_read_tagged_frame(tagged_path))
+        _save_analytics_sidecar(tagged_path, analytics)
+        return analytics
+
+
+# ─── Cell-edit overlay ──────────────────────────────────────────────────────
+# Single-cell changes made after a run — picking a grid candidate, a retry,
+# each cell of a bulk retry — are appended to `<base>_edits.jsonl` instead of
+# rewriting the whole tagged CSV: one small append per cell however large the
+# file. Readers merge the log on the fly (_read_tagged_frame, the cached
+# frame behind the Results table), and compaction folds it back into the CSV
+# once edits go quiet for EDIT_COMPACT_IDLE_SEC, the log passes
+# EDIT_COMPACT_MAX_BYTES, a bulk retry finishes, or before the file is handed
+# out for download. Compaction never runs under an active tagging run for the
+# same file — that run's next save would overwrite the folded edits; until it
+# ends they stay in the log and keep applying on top.
+#
+# One JSON object per line: {"row": 12, "column": "image", "value": "..."};
+# later lines win. A torn last line (crash mid-append) is ignored.
+
+EDIT_COMPACT_IDLE_SEC = 30
+EDIT_COMPACT_MAX_BYTES = 256 * 1024
+
+_compaction_timers = {}  # abs tagged path -> threading.Timer
+_compaction_lock = threading.Lock()
+
+
+def _edits_path_for_tagged(tagged_path):
+    return _sidecar_base(tagged_path) + '_edits.jsonl'
+
+
+def read_cell_edits(tagged_path, offset=0):
+    """Pending edits from byte `offset` on: ([(row, column, value), ...], end_offset)."""
+    try:
+        with open(_edits_path_for_tagged(tagged_path), 'rb') as f:
+            f.seek(offset)
+            data = f.read()
+    except OSError:
+        return [], offset
+    complete = data[:data.rfind(b'\n') + 1]
+    edits = []
+    for line in complete.splitlines():
+        try:
+            entry = json.loads(line)
+            edits.append((int(entry['row']), entry['column'], entry['value']))
+        except (ValueError, KeyError, TypeError):
+            continue
+    return edits, offset + len(complete)
+
+
+def _apply_cell_edits(df, edits):
+    for row_index, column, value in edits:
+        if column not in df.columns or not 0 <= row_index < len(df):
+            continue
+        if value is not None and df[column].dtype != object:
+            df[column] = df[column].astype(object)
+        df.at[row_index, column] = value
+    return df
+
+
+def record_cell_edit(tagged_path, row_index, column, old_value, new_value):
+    """Set one cell of the tagged CSV (old_value: what it currently shows)
+    by appending to the overlay log; the analytics sidecar is patched in the
+    same step."""
+    with _tagged_file_lock(tagged_path):
+        analytics = _read_analytics_sidecar(tagged_path)
+        signature = _tagged_signature(tagged_path)
+        if analytics is not None and analytics.get('source') != signature:
+            analytics = None  # already stale; the next load rebuilds it
+        path = _edits_path_for_tagged(tagged_path)
+        with open(path, 'a') as f:
+            f.write(json.dumps({'row': int(row_index), 'column': column, 'value': new_value}) + '\n')
+        _gallery_cell_changed(tagged_path, signature, row_index, column, new_value)
+        if analytics is not None:
+            _apply_analytics_change(analytics, lambda col: _cached_tagged_frame(tagged_path)['typed'][col],
+                                    column, old_value, new_value)
+            _save_analytics_sidecar(tagged_path, analytics)
+        log_size = os.path.getsize(path)
+    _schedule_compaction(tagged_path, 0 if log_size >= EDIT_COMPACT_MAX_BYTES else EDIT_COMPACT_IDLE_SEC)
+
+
+def compact_cell_edits(tagged_path):
+    """Fold pending edits into the tagged CSV and drop the log. Callers must
+    make sure no run is writing the file (see compact_cell_edits_when_idle).
+    Returns True if there was anything to fold."""
+    with _tagged_file_lock(tagged_path):
+        edits, _ = read_cell_edits(tagged_path)
+        if not edits or not os.path.exists(tagged_path):
+            return False
+        analytics = _read_analytics_sidecar(tagged_path)
+        signature = _tagged_signature(tagged_path)
+        fresh = analytics is not None and analytics.get('source') == signature
+        df = _apply_cell_edits(_read_tagged_base(tagged_path, raw=True), edits)
+        df.to_csv(tagged_path, index=False)
+        os.remove(_edits_path_for_tagged(tagged_path))
+        _gallery_file_rewritten(tagged_path, signature)
+        if fresh:
+            _save_analytics_sidecar(tagged_path, analytics)  # its counts already include the edits
+    return True
+
+
+def discard_cell_edits(tagged_path):
+    """Drop pending edits unapplied — a fresh run is about to replace the file."""
+    with _tagged_file_lock(tagged_path):
+        try:
+            os.remove(_edits_path_for_tagged(tagged_path))
+        except OSError:
+            pass
+
+
+def _tagged_run_active(tagged_path):
+    target = os.path.abspath(tagged_path)
+    for status in list(PROGRESS_STATUS.values()):
+        state = str(status.get('status', ''))
+        if (status.get('tagged_file') and os.path.abspath(status['tagged_file']) == target
+                and state not in ('finished', 'cancelled') and not state.startswith('error')):
+            return True
+    return False
+
+
+def compact_cell_edits_when_idle(tagged_path):
+    """compact_cell_edits unless a run is writing the file, in which case
+    compaction is retried later. Returns True if edits were folded in."""
+    if _tagged_run_active(tagged_path):
+        _schedule_compaction(tagged_path, EDIT_COMPACT_IDLE_SEC)
+        return False
+    return compact_cell_edits(tagged_path)
+
+
+def _schedule_compaction(tagged_path, delay):
+    # Debounced: each edit pushes the pending compaction back.
+    key = os.path.abspath(tagged_path)
+
+    def fire():
+        with _compaction_lock:
+            if _compaction_timers.get(key) is timer:
+                del _compaction_timers[key]
+        try:
+            compact_cell_edits_when_idle(tagged_path)
+        except Exception as e:
+            print(f"WARNING: Compacting cell edits for {tagged_path} failed: {e}")
+
+    timer = threading.Timer(delay, fire)
+    timer.daemon = True
+    with _compaction_lock:
+        previous = _compaction_timers.pop(key, None)
+        if previous is not None:
+            previous.cancel()
+        _compaction_timers[key] = timer
+    timer.start()
+
+
+# ─── Results table queries ──────────────────────────────────────────────────
+# Backs the Results page's scrolling table (results_data_view): one page of
+# rows at a time, with column projection, sort and filters. The tagged CSV is
+# parsed once into a cached frame — typed values for sorting, their display
+# strings, and precomputed ERROR / image-cell masks — keyed by the file's
+# (size, mtime), so paging and re-filtering a large project never re-reads
+# it and every filter is a vectorized mask rather than a walk over rows.
+# Overlay edits are applied to the cached frame as they appear in the log,
+# a cell at a time. The cache holds the few most recently browsed files; the
+# single-cell writers (candidate picking, retries) read through it too.
+
+RESULTS_FRAME_CACHE_SIZE = 4
+RESULTS_PAGE_MAX = 500
+RESULTS_REVIEW_FILTERS = ('approved', 'rejected', 'unreviewed')
+_IMAGE_CELL_EXTS = ('.png', '.jpg', '.jpeg', '.webp')
+
+_results_frame_cache = OrderedDict()  # abs tagged path -> (signature, frame dict)
+_results_frame_lock = threading.Lock()
+
+
+def _build_tagged_frame(typed):
+    text = pd.DataFrame({c: typed[c].map(str).where(typed[c].notna(), '') for c in typed.columns},
+                        index=typed.index)
+    lower = pd.DataFrame({c: text[c].str.lower() for c in text.columns}, index=text.index)
+    return {
+        'typed':  typed,
+        'text':   text,
+        'lower':  lower,
+        'errors': pd.DataFrame({c: text[c].eq('ERROR') | text[c].str.startswith('ERROR:')
+                                for c in text.columns}, index=text.index),
+        'images': pd.DataFrame({c: lower[c].str.endswith(_IMAGE_CELL_EXTS) for c in text.columns},
+                               index=text.index),
+        'edits_offset': 0,
+    }
+
+
+def _apply_frame_edits(frame, tagged_path):
+    edits, frame['edits_offset'] = read_cell_edits(tagged_path, frame['edits_offset'])
+    _apply_cell_edits(frame['typed'], edits)
+    for row_index, column, value in edits:
+        if column not in frame['text'].columns or not 0 <= row_index < len(frame['text']):
+            continue
+        text = '' if value is None else str(value)
+        frame['text'].at[row_index, column] = text
+        frame['lower'].at[row_index, column] = text.lower()
+        frame['errors'].at[row_index, column] = _is_error_value(text)
+        frame['images'].at[row_index, column] = text.lower().endswith(_IMAGE_CELL_EXTS)
+
+
+def _cached_tagged_frame(tagged_path):
+    """The tagged CSV plus pending edits, as the cached frame dict above."""
+    key = os.path.abspath(tagged_path)
+    signature = _file_signature(tagged_path)
+    with _results_frame_lock:
+        cached = _results_frame_cache.get(key)
+        if cached and cached[0] == signature:
+            _results_frame_cache.move_to_end(key)
+            _apply_frame_edits(cached[1], tagged_path)
+            return cached[1]
+    frame = _build_tagged_frame(_read_tagged_base(tagged_path))
+    with _results_frame_lock:
+        _apply_frame_edits(frame, tagged_path)
+        _results_frame_cache[key] = (signature, frame)
+        _results_frame_cache.move_to_end(key)
+        while len(_results_frame_cache) > RESULTS_FRAME_CACHE_SIZE:
+            _results_frame_cache.popitem(last=False)
+    return frame
+
+
+def _review_status_frame(frame, review_state):
+    status = pd.DataFrame('', index=frame['text'].index, columns=frame['text'].columns)
+    for key, value in review_state.items():
+        row, _, col = key.partition(':')
+        if col in status.columns and row.isdigit() and int(row) < len(status):
+            status.iat[int(row), status.columns.get_loc(col)] = value
+    return status
+
+
+def query_results(tagged_path, columns=None, sort='', descending=False, search='',
+                  match_column='', match_value='', errors_only=False, review='',
+                  cursor=0, limit=100):
+    """One page of the tagged CSV for the Results table.
+
+    columns limits both what is returned and what `search` (case-insensitive
+    substring) looks at; match_column/match_value is an exact, case- and
+    whitespace-insensitive match on one column; errors_only keeps rows with
+    an ERROR cell; review keeps rows with an image cell in that review state
+    (RESULTS_REVIEW_FILTERS). cursor is the position in the filtered, sorted
+    result to start at. Raises ValueError for unknown columns/filters.
+
+    Returns {'columns', 'rows': [{'row_index', 'values'}], 'total', 'next_cursor'}
+    — next_cursor is None on the last page.
+    """
+    frame = _cached_tagged_frame(tagged_path)
+    all_columns = frame['text'].columns.tolist()
+    columns = list(columns) if columns else all_columns
+    unknown = [c for c in columns + [c for c in (sort, match_column) if c] if c not in all_columns]
+    if unknown:
+        raise ValueError(f"Unknown column(s): {', '.join(unknown)}")
+    if review and review not in RESULTS_REVIEW_FILTERS:
+        raise ValueError(f"Unknown review filter: {review}")
+
+    mask = pd.Series(True, index=frame['text'].index)
+    if search:
+        needle = search.strip().lower()
+        mask &= frame['lower'][columns].apply(lambda c: c.str.contains(needle, regex=False)).any(axis=1)
+    if match_column:
+        mask &= frame['text'][match_column].str.strip().str.upper().eq(match_value.strip().upper())
+    if errors_only:
+        mask &= frame['errors'][columns].any(axis=1)
+    if review:
+        status = _review_status_frame(frame, load_review_state(tagged_path))
+        if review == 'unreviewed':
+            mask &= (frame['images'] & status.eq('')).any(axis=1)
+        else:
+            mask &= (frame['images'] & status.eq(review)).any(axis=1)
+
+    index = frame['text'].index[mask.to_numpy()]
+    if sort:
+        values = frame['typed'].loc[index, sort]
+        try:
+            index = values.sort_values(ascending=not descending, kind='stable', na_position='last').index
+        except TypeError:  # mixed types in one column — fall back to text order
+            index = frame['text'].loc[index, sort].sort_values(ascending=not descending, kind='stable').index
+
+    limit = max(1, min(int(limit), RESULTS_PAGE_MAX))
+    cursor = max(0, int(cursor))
+    page = index[cursor:cursor + limit]
+    texts = frame['text'].loc[page, columns]
+    return {
+        'columns':     columns,
+        'rows':        [{'row_index': int(i), 'values': values}
+                        for i, values in zip(page, texts.values.tolist())],
+        'total':       int(len(index)),
+        'next_cursor': cursor + limit if cursor + limit < len(index) else None,
+    }
 
 
 # ─── Bulk retry ──────────────────────────────────────────────────────────────
@@ -1188,9 +2538,12 @@ _bulk_retry_lock = threading.Lock()
 def _run_bulk_retry(job_key, groups, lock_seed=False):
     """Shared retry loop for both 'retry all failed' (one project, error
     cells only) and the gallery's 'retry selected' (any cells, possibly
-    spanning several projects) — one at a time, since the SD server
-    serializes generation on its end anyway so there's no benefit to
-    parallelizing here.
+    spanning several projects). Cells finish one at a time, in order, but
+    the next IMAGE_JOB_LOOKAHEAD are kept queued on the SD server (at
+    IMAGE_JOB_PRIORITY_RETRY) so it never sits idle between them; a cell
+    waits to be queued while an earlier cell in its row is still pending,
+    since its prompt may read that cell. Without a job queue on the server
+    each cell is a plain regenerate_image_cell.
 
     groups: [{'tagged_path', 'config_data', 'images_dir', 'images_rel',
     'session_key', 'project_id', 'targets': [(row_index, col), ...]}, ...]
@@ -1202,23 +2555,59 @@ def _run_bulk_retry(job_key, groups, lock_seed=False):
             'fixed': 0, 'failed': 0, 'message': '',
         }
 
+    use_jobs = True
     for g in groups:
-        for row_index, col in g['targets']:
-            try:
-                regenerate_image_cell(
-                    g['tagged_path'], g['config_data'], row_index, col,
-                    g['images_dir'], g['images_rel'],
-                    session_key=g.get('session_key'), project_id=g.get('project_id'),
-                    lock_seed=lock_seed,
-                )
-                with _bulk_retry_lock:
-                    BULK_RETRY_STATUS[job_key]['fixed'] += 1
-            except Exception as e:
+        targets = list(g['targets'])
+        naming_column, image_format = _project_image_settings(g.get('project_id'))
+        queued = {}  # target index -> (job, row_context)
+        try:
+            for n, (row_index, col) in enumerate(targets):
+                for ahead in range(n, min(len(targets), n + IMAGE_JOB_LOOKAHEAD)):
+                    if not use_jobs:
+                        break
+                    ahead_row, ahead_col = targets[ahead]
+                    if ahead in queued or any(r == ahead_row for r, _ in targets[n:ahead]):
+                        continue
+                    try:
+                        prompt, params, row_context = _prepare_image_regeneration(
+                            g['tagged_path'], g['config_data'], ahead_row, ahead_col, lock_seed=lock_seed)
+                    except Exception:
+                        continue  # regenerate_image_cell reports it when its turn comes
+                    job, meta = submit_image_job(prompt, params, image_format, IMAGE_JOB_PRIORITY_RETRY)
+                    if job is None:
+                        use_jobs = not meta.get('unsupported')  # else retried for the next target
+                        break
+                    queued[ahead] = (job, row_context)
+
+                try:
+                    job, row_context = queued.pop(n, (None, None))
+                    generated = wait_image_job(job, on_status=lambda state: BULK_RETRY_STATUS[job_key].update(
+                        image_queue=image_queue_position(state))) if job is not None else None
+                    if generated is None or generated[1].get('expired'):
+                        regenerate_image_cell(
+                            g['tagged_path'], g['config_data'], row_index, col,
+                            g['images_dir'], g['images_rel'],
+                            session_key=g.get('session_key'), project_id=g.get('project_id'),
+                            lock_seed=lock_seed,
+                        )
+                    else:
+                        _save_image_regeneration(
+                            generated, g['tagged_path'], row_index, col, row_context,
+                            g['images_dir'], g['images_rel'], naming_column, image_format,
+                            session_key=g.get('session_key'), project_id=g.get('project_id'),
+                        )
+                    with _bulk_retry_lock:
+                        BULK_RETRY_STATUS[job_key]['fixed'] += 1
+                except Exception as e:
+                    with _bulk_retry_lock:
+                        BULK_RETRY_STATUS[job_key]['failed'] += 1
+                        BULK_RETRY_STATUS[job_key]['message'] = str(e)
                 with _bulk_retry_lock:
-                    BULK_RETRY_STATUS[job_key]['failed'] += 1
-                    BULK_RETRY_STATUS[job_key]['message'] = str(e)
-            with _bulk_retry_lock:
-                BULK_RETRY_STATUS[job_key]['done'] += 1
+                    BULK_RETRY_STATUS[job_key]['done'] += 1
+        finally:
+            for job, _ in queued.values():
+                cancel_image_job(job)
+        compact_cell_edits_when_idle(g['tagged_path'])
 
     with _bulk_retry_lock:
         BULK_RETRY_STATUS[job_key]['status'] = 'finished'
@@ -1229,13 +2618,12 @@ def bulk_retry_errors(job_key, tagged_path, config_data, images_dir, images_rel,
     """Find every image cell currently holding an 'ERROR: ...' value and
     retry it (fresh seed, same settings)."""
     image_cols = {d['OutputColumn'] for d in config_data if (d.get('ImageParams') or '').strip()}
-    df = pd.read_csv(tagged_path)
-    targets = [
+    text = _cached_tagged_frame(tagged_path)['text']
+    targets = sorted(
         (int(row_index), col)
-        for row_index, row in df.iterrows()
-        for col in image_cols
-        if col in df.columns and str(row[col]).startswith('ERROR:')
-    ]
+        for col in image_cols if col in text.columns
+        for row_index in np.flatnonzero(text[col].str.startswith('ERROR:').to_numpy())
+    )
     _run_bulk_retry(job_key, [{
         'tagged_path': tagged_path, 'config_data': config_data,
         'images_dir': images_dir, 'images_rel': images_rel,
@@ -1266,104 +2654,450 @@ def tagged_path_for_project(project):
     return base + '_tagged.csv'
 
 
-def build_gallery_items(project):
-    """Every generated-image cell for one project, flattened into gallery
-    cards. Returns (items, tagged_path, images_dir, images_rel); the latter
-    three are '' / None / '' when the project has no tagged output yet."""
-    tagged_path = tagged_path_for_project(project)
-    if not tagged_path or not os.path.exists(tagged_path):
-        return [], '', None, ''
+# ─── Gallery index ──────────────────────────────────────────────────────────
+# The Gallery pages through one SQLite index (GALLERY_INDEX_DB) of every
+# image/error cell across image-mode projects instead of re-reading each
+# project's tagged CSV, config and review marks on every visit. Each project
+# row carries a stamp — the tagged CSV's signature, the config file's and the
+# naming column — taken when it was indexed; a project whose stamp no longer
+# matches is re-indexed (one vectorized read of just its image and naming
+# columns) before the next query, so anything that rewrites the CSV (a
+# tagging run's saves, compaction, a fresh run) is picked up lazily.
+# Single-cell changes — a retry, a picked grid candidate, an approve/reject
+# mark — patch their item in place and carry the stamp forward, so browsing
+# never pays for a re-index after them.
+
+GALLERY_PAGE_SIZE = 200
+GALLERY_REVIEW_FILTERS = ('all', 'error', 'unreviewed', 'approved', 'rejected')
+
+_gallery_index_ready = set()
+
+_GALLERY_INDEX_SCHEMA = """
+CREATE TABLE IF NOT EXISTS projects (
+    project_id  TEXT PRIMARY KEY,
+    tagged_path TEXT NOT NULL,
+    stamp       TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS projects_tagged_path ON projects (tagged_path);
+CREATE TABLE IF NOT EXISTS items (
+    project_id      TEXT    NOT NULL,
+    row_index       INTEGER NOT NULL,
+    out_col         TEXT    NOT NULL,
+    col_order       INTEGER NOT NULL,
+    value           TEXT    NOT NULL,
+    label           TEXT    NOT NULL,
+    is_image        INTEGER NOT NULL,
+    is_error        INTEGER NOT NULL,
+    review          TEXT    NOT NULL DEFAULT '',
+    candidate_count INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (project_id, row_index, out_col)
+);
+CREATE INDEX IF NOT EXISTS items_order ON items (project_id, row_index, col_order);
+"""
+
+
+@contextlib.contextmanager
+def _gallery_index(create=True):
+    path = os.path.normpath(GALLERY_INDEX_DB)
+    if not create and not os.path.exists(path):
+        yield None
+        return
+    if not os.path.exists(path):
+        _gallery_index_ready.discard(path)
+    conn = sqlite3.connect(path, timeout=30)
+    try:
+        if path not in _gallery_index_ready:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(_GALLERY_INDEX_SCHEMA)
+            _gallery_index_ready.add(path)
+        with conn:
+            yield conn
+    finally:
+        conn.close()
+
+
+def _gallery_image_columns(project):
+    config_data = load_config_file(project.get('config_path', ''))
+    return [d['OutputColumn'] for d in config_data if (d.get('ImageParams') or '').strip()]
+
+
+def _gallery_stamp(project, tagged_path):
+    return json.dumps({
+        'tagged': _tagged_signature(tagged_path) if tagged_path else None,
+        'config': _file_signature(project.get('config_path', '') or ''),
+        'naming': project.get('image_naming_column', '') or '',
+    })
+
+
+def _gallery_cell_flags(text):
+    return text.lower().endswith(_IMAGE_CELL_EXTS), _is_error_value(text)
+
+
+def _reindex_gallery_project(conn, project, tagged_path, stamp):
+    project_id = str(project['project_id'])
+    conn.execute("DELETE FROM items WHERE project_id = ?", (project_id,))
+    conn.execute("INSERT OR REPLACE INTO projects VALUES (?, ?, ?)",
+                 (project_id, os.path.abspath(tagged_path) if tagged_path else '', stamp))
+    image_cols = _gallery_image_columns(project) if tagged_path else []
+    if not image_cols or not os.path.exists(tagged_path):
+        return
+    naming_column = project.get('image_naming_column', '') or ''
+    wanted = set(image_cols) | {naming_column}
+    df = pd.read_csv(tagged_path, dtype=str, keep_default_na=False, usecols=lambda c: c in wanted)
+    df = _apply_cell_edits(df, read_cell_edits(tagged_path)[0]).fillna('')
+    labels = pd.Series('row' + df.index.astype(str), index=df.index)
+    if naming_column in df.columns:
+        labels = df[naming_column].map(str).where(df[naming_column] != '', labels)
+
+    counts, reviews = {}, {}
+    with _image_store(tagged_path, create=False) as store:
+        if store is not None:
+            counts = {(r, c): n for r, c, n in store.execute(
+                "SELECT row_index, out_col, COUNT(*) FROM candidates GROUP BY row_index, out_col")}
+            reviews = {(r, c): status for r, c, status in store.execute(
+                "SELECT row_index, out_col, status FROM reviews")}
+
+    rows = []
+    for col_order, col in enumerate(image_cols):
+        if col not in df.columns:
+            continue
+        text = df[col].map(str)
+        is_image = text.str.lower().str.endswith(_IMAGE_CELL_EXTS)
+        is_error = text.eq('ERROR') | text.str.startswith('ERROR:')
+        for row_index in text.index[is_image | is_error]:
+            cell = (int(row_index), col)
+            rows.append((project_id, *cell, col_order, text[row_index], labels[row_index],
+                         int(is_image[row_index]), int(is_error[row_index]),
+                         reviews.get(cell, ''), counts.get(cell, 0)))
+    conn.executemany("INSERT INTO items VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+
+
+def sync_gallery_index(projects):
+    """Re-index any of `projects` (projects.csv rows) whose tagged CSV,
+    config or naming column changed since they were last indexed."""
+    with _gallery_index() as conn:
+        stamps = dict(conn.execute("SELECT project_id, stamp FROM projects"))
+        for project in projects:
+            tagged_path = tagged_path_for_project(project)
+            stamp = _gallery_stamp(project, tagged_path)
+            if stamps.get(str(project['project_id'])) != stamp:
+                _reindex_gallery_project(conn, project, tagged_path, stamp)
+
+
+def drop_gallery_project(project_id):
+    with _gallery_index(create=False) as conn:
+        if conn is not None:
+            conn.execute("DELETE FROM items WHERE project_id = ?", (str(project_id),))
+            conn.execute("DELETE FROM projects WHERE project_id = ?", (str(project_id),))
+
+
+def _gallery_projects_for(conn, tagged_path):
+    return conn.execute("SELECT project_id, stamp FROM projects WHERE tagged_path = ?",
+                        (os.path.abspath(tagged_path),)).fetchall()
+
+
+def _gallery_cell_changed(tagged_path, signature_before, row_index, column, value):
+    """Patch one item after a single-cell edit and carry its projects' stamps
+    forward. A project that was already stale, or a cell that only now
+    becomes an image/error (label and column order unknown here), is left
+    for the next query to re-index."""
+    with _gallery_index(create=False) as conn:
+        if conn is None:
+            return
+        text = '' if value is None else str(value)
+        is_image, is_error = _gallery_cell_flags(text)
+        with _image_store(tagged_path, create=False) as store:
+            count = 0 if store is None else store.execute(
+                "SELECT COUNT(*) FROM candidates WHERE row_index = ? AND out_col = ?",
+                (int(row_index), column)).fetchone()[0]
+        for project_id, stamp in _gallery_projects_for(conn, tagged_path):
+            stamp = json.loads(stamp)
+            if stamp['tagged'] != signature_before:
+                continue
+            key = (project_id, int(row_index), column)
+            if is_image or is_error:
+                patched = conn.execute(
+                    "UPDATE items SET value = ?, is_image = ?, is_error = ?, candidate_count = ? "
+                    "WHERE project_id = ? AND row_index = ? AND out_col = ?",
+                    (text, int(is_image), int(is_error), count, *key)).rowcount
+                if not patched:
+                    continue
+            else:
+                conn.execute("DELETE FROM items WHERE project_id = ? AND row_index = ? AND out_col = ?", key)
+            stamp['tagged'] = _tagged_signature(tagged_path)
+            conn.execute("UPDATE projects SET stamp = ? WHERE project_id = ?", (json.dumps(stamp), project_id))
+
+
+def _gallery_file_rewritten(tagged_path, signature_before):
+    """The tagged CSV was rewritten without changing what it shows
+    (compaction): carry current stamps forward."""
+    with _gallery_index(create=False) as conn:
+        if conn is None:
+            return
+        for project_id, stamp in _gallery_projects_for(conn, tagged_path):
+            stamp = json.loads(stamp)
+            if stamp['tagged'] == signature_before:
+                stamp['tagged'] = _tagged_signature(tagged_path)
+                conn.execute("UPDATE projects SET stamp = ? WHERE project_id = ?", (json.dumps(stamp), project_id))
+
+
+def _gallery_review_changed(tagged_path, row_index, column, status):
+    with _gallery_index(create=False) as conn:
+        if conn is None:
+            return
+        conn.executemany(
+            "UPDATE items SET review = ? WHERE project_id = ? AND row_index = ? AND out_col = ?",
+            [(status or '', project_id, int(row_index), column)
+             for project_id, _stamp in _gallery_projects_for(conn, tagged_path)])
+
+
+def query_gallery(projects, review_filter='all', cursor=0, limit=GALLERY_PAGE_SIZE):
+    """One page of gallery cards across `projects` (projects.csv rows, in
+    display order), re-indexing any that went stale first. review_filter is
+    one of GALLERY_REVIEW_FILTERS. Returns {'items', 'total' (matching the
+    filter), 'all_items', 'error_count', 'next_cursor'} — next_cursor is None
+    on the last page."""
+    if review_filter not in GALLERY_REVIEW_FILTERS:
+        raise ValueError(f"Unknown gallery filter: {review_filter}")
+    sync_gallery_index(projects)
+    by_id = {str(p['project_id']): p for p in projects}
+    where, params = {
+        'all':        ("", ()),
+        'error':      ("AND i.is_error = 1", ()),
+        'unreviewed': ("AND i.is_image = 1 AND i.review = ''", ()),
+        'approved':   ("AND i.is_image = 1 AND i.review = ?", ('approved',)),
+        'rejected':   ("AND i.is_image = 1 AND i.review = ?", ('rejected',)),
+    }[review_filter]
+    cursor, limit = max(0, int(cursor)), max(1, int(limit))
+    with _gallery_index() as conn:
+        conn.execute("CREATE TEMP TABLE IF NOT EXISTS targets (project_id TEXT PRIMARY KEY, position INTEGER)")
+        conn.execute("DELETE FROM temp.targets")
+        conn.executemany("INSERT OR IGNORE INTO temp.targets VALUES (?, ?)",
+                         [(pid, position) for position, pid in enumerate(by_id)])
+        all_items, error_count = conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(i.is_error), 0) FROM items i JOIN temp.targets t USING (project_id)"
+        ).fetchone()
+        total = all_items if review_filter == 'all' else conn.execute(
+            f"SELECT COUNT(*) FROM items i JOIN temp.targets t USING (project_id) WHERE 1 {where}", params
+        ).fetchone()[0]
+        page = conn.execute(
+            f"SELECT i.project_id, i.row_index, i.out_col, i.value, i.label, i.is_image, i.is_error, "
+            f"i.review, i.candidate_count, p.tagged_path "
+            f"FROM items i JOIN temp.targets t USING (project_id) JOIN projects p USING (project_id) "
+            f"WHERE 1 {where} ORDER BY t.position, i.row_index, i.col_order LIMIT ? OFFSET ?",
+            (*params, limit, cursor)).fetchall()
+
+    cells_by_path = {}
+    for project_id, row_index, column, *_rest, tagged_path in page:
+        cells_by_path.setdefault(tagged_path, []).append((row_index, column))
+    candidates = {path: list_image_candidates_for_cells(path, cells) for path, cells in cells_by_path.items()}
+    previews = {}
+    for path in cells_by_path:
+        backfill_image_derivatives_once(path)
+        previews.update(image_display_urls(path, [row[3] for row in page if row[9] == path and row[5]], 'preview'))
+
+    items = []
+    for project_id, row_index, column, value, label, is_image, is_error, review, _count, tagged_path in page:
+        items.append({
+            'project_id':      project_id,
+            'project_name':    by_id[project_id].get('name', ''),
+            'row_index':       row_index,
+            'column':          column,
+            'value':           value,
+            'is_image':        bool(is_image),
+            'is_error':        bool(is_error),
+            'url':             (settings.MEDIA_URL + value) if is_image else '',
+            'preview_url':     previews.get(value, '') if is_image else '',
+            'candidates_json': json.dumps(candidates[tagged_path][(row_index, column)]),
+            'review':          review if is_image else '',
+            'label':           label,
+        })
+    return {
+        'items':       items,
+        'total':       total,
+        'all_items':   all_items,
+        'error_count': error_count,
+        'next_cursor': cursor + limit if cursor + limit < total else None,
+    }
+
+
+# ─── Gallery zip export ─────────────────────────────────────────────────────
+# Zips are streamed: iter_gallery_zip yields the archive a chunk at a time as
+# each file is read, so the response starts immediately and memory stays at
+# about GALLERY_ZIP_CHUNK however large the export. Images are stored, not
+# deflated — PNG/JPEG/WebP are already compressed, so deflate only burns CPU.
+# Exports too big to sit through a single request (GALLERY_ZIP_BACKGROUND_MIN_FILES
+# and up, as the Gallery decides) are instead written to media/_exports/ by a
+# background thread reporting progress in GALLERY_EXPORT_STATUS, then
+# downloaded once finished; finished exports are pruned after
+# GALLERY_EXPORT_TTL_SEC.
+
+GALLERY_ZIP_CHUNK = 1024 * 1024
+GALLERY_ZIP_BACKGROUND_MIN_FILES = 2000
+GALLERY_EXPORT_TTL_SEC = 6 * 3600
+
+GALLERY_EXPORT_STATUS = {}  # job_key -> dict(status, done, total, bytes, message)
+_gallery_export_lock = threading.Lock()
+
+
+def gallery_zip_plan(entries, include_csv=True):
+    """entries: [(project, rel_paths_or_None), ...] — rel_paths_or_None is a
+    list of MEDIA_ROOT-relative image paths to zip, or None for every file
+    under that project's `<name>_images/` folder. Images are namespaced per
+    project when more than one project is included. Returns
+    [(arcname, source), ...] for iter_gallery_zip: source is a file path, or
+    a callable returning bytes (a tagged CSV with pending edits merged in)."""
+    plan = []
+    multi = len(entries) > 1
+    for project, rel_paths in entries:
+        tagged_path = tagged_path_for_project(project)
+        if not tagged_path:
+            continue
+        images_dir, images_rel = images_dir_for_tagged_path(tagged_path)
+        prefix = f"{_safe_col_name(project.get('name') or project['project_id'])}/" if multi else ''
+
+        if rel_paths is None:
+            if os.path.isdir(images_dir):
+                for fname in sorted(os.listdir(images_dir)):
+                    fpath = os.path.join(images_dir, fname)
+                    if os.path.isfile(fpath):
+                        plan.append((f"{prefix}images/{fname}", fpath))
+        else:
+            media_root = os.path.normpath(settings.MEDIA_ROOT)
+            for rel in rel_paths:
+                rel = str(rel).replace('\\', '/').lstrip('/')
+                # Only ever pull files out of *this* project's own images
+                # folder — rel paths arrive from the client (POST body),
+                # so this stops a crafted path from reaching outside it.
+                if not (rel == images_rel or rel.startswith(images_rel + '/')):
+                    continue
+                fpath = os.path.normpath(os.path.join(settings.MEDIA_ROOT, rel))
+                if not fpath.startswith(media_root) or not os.path.isfile(fpath):
+                    continue
+                plan.append((f"{prefix}images/{os.path.basename(rel)}", fpath))
+
+        if include_csv and os.path.isfile(tagged_path):
+            if read_cell_edits(tagged_path)[0]:
+                plan.append((f"{prefix}tagged.csv", functools.partial(_merged_tagged_csv_bytes, tagged_path)))
+            else:
+                plan.append((f"{prefix}tagged.csv", tagged_path))
+    return plan
+
 
-    config_data = load_config_file(project.get('config_path', ''))
-    image_cols = [d['OutputColumn'] for d in config_data if (d.get('ImageParams') or '').strip()]
-    if not image_cols:
-        return [], tagged_path, None, ''
+def _merged_tagged_csv_bytes(tagged_path):
+    edits, _ = read_cell_edits(tagged_path)
+    return _apply_cell_edits(_read_tagged_base(tagged_path, raw=True), edits).to_csv(index=False).encode()
 
-    images_dir, images_rel = images_dir_for_tagged_path(tagged_path)
-    df = read_csv_safe(tagged_path)
-    review_state = load_review_state(tagged_path)
-    naming_column = project.get('image_naming_column', '') or ''
-    image_exts = ('.png', '.jpg', '.jpeg', '.webp')
 
-    items = []
-    for row_index, row in df.iterrows():
-        for col in image_cols:
-            if col not in df.columns:
-                continue
-            cell = row[col]
-            sval = '' if (isinstance(cell, float) and pd.isna(cell)) else str(cell)
-            if not sval:
-                continue
-            is_err = sval.startswith('ERROR:')
-            is_img = sval.lower().endswith(image_exts)
-            if not (is_err or is_img):
-                continue
+class _ZipChunkSink:
+    """Write-only, unseekable file object for zipfile: collects what it
+    writes so a generator can hand the archive out in chunks."""
 
-            label = ''
-            if naming_column and naming_column in df.columns:
-                nv = row[naming_column]
-                label = '' if (isinstance(nv, float) and pd.isna(nv)) else str(nv)
-            if not label:
-                label = f"row{row_index}"
-
-            items.append({
-                'project_id':      project['project_id'],
-                'project_name':    project.get('name', ''),
-                'row_index':       int(row_index),
-                'column':          col,
-                'value':           sval,
-                'is_image':        is_img,
-                'is_error':        is_err,
-                'url':             (settings.MEDIA_URL + sval) if is_img else '',
-                'candidates_json': json.dumps(list_image_candidates(tagged_path, row_index, col)),
-                'review':          review_state.get(f"{row_index}:{col}", '') if is_img else '',
-                'label':           label,
-            })
-    return items, tagged_path, images_dir, images_rel
+    def __init__(self):
+        self._chunks = []
+        self.pending = 0
+        self._offset = 0
 
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self.pending += len(data)
+        self._offset += len(data)
+        return len(data)
 
-def build_gallery_zip(entries, include_csv=True):
-    """entries: [(project, rel_paths_or_None), ...] — rel_paths_or_None is a
-    list of MEDIA_ROOT-relative image paths to zip, or None for every file
-    under that project's `<name>_images/` folder. Images are namespaced per
-    project when more than one project is included. Returns raw zip bytes."""
-    import io
+    def tell(self):
+        return self._offset
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks, self.pending = [], 0
+        return data
+
+
+def iter_gallery_zip(plan, progress=None):
+    """Yield a zip of `plan` (see gallery_zip_plan) chunk by chunk.
+    progress(files_done, bytes_so_far) is called after each entry."""
     import zipfile
 
-    buf = io.BytesIO()
-    multi = len(entries) > 1
-    with zipfile.ZipFile(buf, 'w', zipfile.ZIP_DEFLATED) as zf:
-        for project, rel_paths in entries:
-            tagged_path = tagged_path_for_project(project)
-            if not tagged_path:
-                continue
-            images_dir, images_rel = images_dir_for_tagged_path(tagged_path)
-            prefix = f"{_safe_col_name(project.get('name') or project['project_id'])}/" if multi else ''
-
-            if rel_paths is None:
-                if os.path.isdir(images_dir):
-                    for fname in sorted(os.listdir(images_dir)):
-                        fpath = os.path.join(images_dir, fname)
-                        if os.path.isfile(fpath):
-                            zf.write(fpath, f"{prefix}images/{fname}")
+    sink = _ZipChunkSink()
+    with zipfile.ZipFile(sink, 'w') as zf:
+        for n, (arcname, source) in enumerate(plan, 1):
+            compress = zipfile.ZIP_STORED if arcname.lower().endswith(_IMAGE_CELL_EXTS) else zipfile.ZIP_DEFLATED
+            if callable(source):
+                zf.writestr(arcname, source(), compress_type=compress)
             else:
-                media_root = os.path.normpath(settings.MEDIA_ROOT)
-                for rel in rel_paths:
-                    rel = str(rel).replace('\\', '/').lstrip('/')
-                    # Only ever pull files out of *this* project's own images
-                    # folder — rel paths arrive from the client (POST body),
-                    # so this stops a crafted path from reaching outside it.
-                    if not (rel == images_rel or rel.startswith(images_rel + '/')):
-                        continue
-                    fpath = os.path.normpath(os.path.join(settings.MEDIA_ROOT, rel))
-                    if not fpath.startswith(media_root) or not os.path.isfile(fpath):
-                        continue
-                    zf.write(fpath, f"{prefix}images/{os.path.basename(rel)}")
+                try:
+                    zinfo = zipfile.ZipInfo.from_file(source, arcname)
+                    src = open(source, 'rb')
+                except OSError:
+                    continue  # removed since the plan was made
+                zinfo.compress_type = compress
+                with src, zf.open(zinfo, 'w') as dest:
+                    while chunk := src.read(GALLERY_ZIP_CHUNK):
+                        dest.write(chunk)
+                        if sink.pending >= GALLERY_ZIP_CHUNK:
+                            yield sink.drain()
+            if progress:
+                progress(n, sink.tell())
+            if sink.pending:
+                yield sink.drain()
+    yield sink.drain()
+
+
+def _gallery_exports_dir():
+    return os.path.join(settings.MEDIA_ROOT, '_exports')
+
+
+def gallery_export_path(job_key):
+    return os.path.join(_gallery_exports_dir(), f"{job_key}.zip")
+
+
+def _prune_gallery_exports():
+    cutoff = time.time() - GALLERY_EXPORT_TTL_SEC
+    with _gallery_export_lock:
+        expired = [k for k, st in GALLERY_EXPORT_STATUS.items()
+                   if st['status'] != 'running' and st.get('finished_at', cutoff + 1) < cutoff]
+        for job_key in expired:
+            del GALLERY_EXPORT_STATUS[job_key]
+    exports_dir = _gallery_exports_dir()
+    for fname in os.listdir(exports_dir) if os.path.isdir(exports_dir) else []:
+        path = os.path.join(exports_dir, fname)
+        if fname[:-len('.zip')] not in GALLERY_EXPORT_STATUS and os.path.getmtime(path) < cutoff:
+            with contextlib.suppress(OSError):
+                os.remove(path)
+
+
+def export_gallery_zip(job_key, plan, filename):
+    """Background counterpart of streaming iter_gallery_zip straight to the
+    client: write the zip under media/_exports/, tracking progress in
+    GALLERY_EXPORT_STATUS[job_key]. Meant to run in its own thread."""
+    _prune_gallery_exports()
+    with _gallery_export_lock:
+        GALLERY_EXPORT_STATUS[job_key] = {
+            'status': 'running', 'done': 0, 'total': len(plan), 'bytes': 0,
+            'filename': filename, 'message': '',
+        }
 
-            if include_csv and os.path.isfile(tagged_path):
-                zf.write(tagged_path, f"{prefix}tagged.csv")
+    def progress(done, size):
+        with _gallery_export_lock:
+            GALLERY_EXPORT_STATUS[job_key].update(done=done, bytes=size)
 
-    return buf.getvalue()
+    path = gallery_export_path(job_key)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    try:
+        with open(path + '.part', 'wb') as f:
+            for chunk in iter_gallery_zip(plan, progress):
+                f.write(chunk)
+        os.replace(path + '.part', path)
+        status, message = 'finished', ''
+    except Exception as e:
+        with contextlib.suppress(OSError):
+            os.remove(path + '.part')
+        status, message = 'error', str(e)
+    with _gallery_export_lock:
+        GALLERY_EXPORT_STATUS[job_key].update(status=status, message=message, finished_at=time.time())
 
 
 # ─── Compare models ──────────────────────────────────────────────────────────
@@ -1398,53 +3132,110 @@ def compare_models_generate(prompt, params, model_ids):
     return results
 
 
-def render_tag_prompt(definition, full_context, all_context):
-    """Render one tag's PromptTemplate given the row's context.
+# ─── Prompt templates ────────────────────────────────────────────────────────
+# A PromptTemplate is parsed once into (literal, column) segments and cached,
+# so rendering is a single join instead of one str.replace per context
+# column per row. Substitution is single-pass: a value that itself contains
+# "{Other}" is inserted verbatim rather than expanded again. Placeholders
+# naming a column outside the tag's context are left as written.
 
-    full_context: globally-selected columns (+ generated so far).
-    all_context: every column (+ generated so far) — per-tag InputColumns can
-    reach any of these even if not globally selected.
+_PLACEHOLDER_RE = re.compile(r'\{([^{}]*)\}')
 
-    Shared by the main tagging loop, single-row retry, and the cost/time
-    estimator so all three render a prompt identically.
-    """
-    prompt_template = definition['PromptTemplate']
+
+@functools.lru_cache(maxsize=512)
+def compile_prompt_template(template):
+    """Template text -> tuple of (literal, column) segments; the last
+    segment's column is None."""
+    segments, pos = [], 0
+    for m in _PLACEHOLDER_RE.finditer(template):
+        segments.append((template[pos:m.start()], m.group(1)))
+        pos = m.end()
+    segments.append((template[pos:], None))
+    return tuple(segments)
+
+
+def render_compiled_template(segments, context):
+    out = []
+    for literal, col in segments:
+        out.append(literal)
+        if col is not None:
+            out.append(str(context[col]) if col in context else f'{{{col}}}')
+    return ''.join(out)
+
+
+@functools.lru_cache(maxsize=512)
+def _parse_tag_input_columns(tag_input_str):
+    return frozenset(c.strip() for c in tag_input_str.split(',') if c.strip())
+
+
+def select_display_context(definition, full_context, all_context):
+    """The {column: value} context one tag is rendered and prompted with:
+    its own InputColumns (drawn from every column), none at all, or — when
+    unset or matching nothing — the globally selected columns."""
     tag_input_str = definition.get('InputColumns', '').strip()
     if tag_input_str == NO_CONTEXT_COLUMNS:
         # Explicitly "None" via the UI's chip picker — distinct from '' (unset,
         # falls through to full_context below): the user deliberately chose
         # zero context columns, so give the LLM none rather than everything.
-        display_context = {}
-    elif tag_input_str:
-        tag_cols = {c.strip() for c in tag_input_str.split(',') if c.strip()}
-        display_context = {k: v for k, v in all_context.items() if k in tag_cols}
-        if not display_context:
-            display_context = full_context
-    else:
-        display_context = full_context
+        return {}
+    if tag_input_str:
+        tag_cols = _parse_tag_input_columns(tag_input_str)
+        picked = {k: v for k, v in all_context.items() if k in tag_cols}
+        if picked:
+            return picked
+    return full_context
 
-    rendered_prompt = prompt_template
-    for col, val in display_context.items():
-        rendered_prompt = rendered_prompt.replace(f'{{{col}}}', str(val))
-    return rendered_prompt, display_context
 
+def render_tag_prompt(definition, full_context, all_context):
+    """Render one tag's PromptTemplate given the row's context.
 
-def regenerate_image_cell(tagged_path, config_data, row_index, out_col, images_dir, images_rel,
-                          session_key=None, project_id=None, param_overrides=None, lock_seed=False):
-    """Re-run image generation for one row/tag ('Retry') using the row's
-    current (already-tagged) values as context.
+    full_context: globally-selected columns (+ generated so far).
+    all_context: every column (+ generated so far) — per-tag InputColumns can
+    reach any of these even if not globally selected.
 
-    By default uses a fresh random seed. If lock_seed=True (and no explicit
-    seed override), reuses the seed recorded for whichever candidate is
-    currently shown in this cell — so you can tweak the prompt/negative
-    prompt/LoRA/etc. in Define Columns and see the effect on the same
-    composition instead of a new random one. Returns (new_relative_paths, seed_used).
+    Shared by the main tagging loop, single-row retry, and the cost/time
+    estimator so all three render a prompt identically.
     """
+    display_context = select_display_context(definition, full_context, all_context)
+    segments = compile_prompt_template(definition['PromptTemplate'])
+    return render_compiled_template(segments, display_context), display_context
+
+
+def render_tag_prompts_frame(definition, df, full_columns, dynamic_columns=()):
+    """Every row's rendered PromptTemplate for one tag in one vectorized pass
+    over df — what render_tag_prompt would give row by row when each row's
+    context is read straight from df. Returns None instead when a placeholder
+    the tag can see is in dynamic_columns (values only known mid-row, like
+    outputs generated earlier in the same row or budget-shortened columns);
+    those tags keep rendering per row."""
+    segments = compile_prompt_template(definition['PromptTemplate'])
+    visible = set(select_display_context(definition, dict.fromkeys(full_columns), dict.fromkeys(df.columns)))
+    used = {col for _, col in segments if col is not None and col in visible}
+    if used & set(dynamic_columns):
+        return None
+    rendered = pd.Series('', index=df.index, dtype=object)
+    pending = ''
+    for literal, col in segments:
+        pending += literal
+        if col is None:
+            continue
+        if col in used:
+            rendered = rendered + pending + df[col].map(str)
+            pending = ''
+        else:
+            pending += f'{{{col}}}'
+    return rendered + pending if pending else rendered
+
+
+def _prepare_image_regeneration(tagged_path, config_data, row_index, out_col,
+                                param_overrides=None, lock_seed=False):
+    """(rendered_prompt, params, row_context) for retrying one row/tag —
+    see regenerate_image_cell."""
     definition = next((d for d in config_data if d['OutputColumn'] == out_col), None)
     if not definition:
         raise ValueError(f"No such output column: {out_col}")
 
-    df = pd.read_csv(tagged_path)
+    df = _cached_tagged_frame(tagged_path)['typed']
     if row_index < 0 or row_index >= len(df):
         raise ValueError(f"Row {row_index} out of range.")
     row_context = {c: df.loc[row_index, c] for c in df.columns}  # already holds final generated state
@@ -1464,8 +3255,14 @@ def regenerate_image_cell(tagged_path, config_data, row_index, out_col, images_d
         params['seed'] = locked_seed if locked_seed is not None else -1
     else:
         params['seed'] = -1  # fresh randomness on a plain retry
+    return rendered_prompt, params, row_context
 
-    images, meta, usage = call_image_generation(rendered_prompt, params)
+
+def _save_image_regeneration(generated, tagged_path, row_index, out_col, row_context, images_dir, images_rel,
+                             naming_column='', image_format='png', session_key=None, project_id=None):
+    """Record and save a retry's (images, meta, usage); the new first image
+    replaces the cell. Returns (new_relative_paths, seed_used)."""
+    images, meta, usage = generated
     record_stat(
         usage['host'], usage['port'], usage['model'],
         session_key, project_id,
@@ -1474,22 +3271,44 @@ def regenerate_image_cell(tagged_path, config_data, row_index, out_col, images_d
     if not images:
         raise RuntimeError(meta.get('error', 'unknown error'))
 
-    naming_column, image_format = _project_image_settings(project_id)
     base_name = _image_base_name(row_context, naming_column, row_index)
     attempt   = _next_attempt_index(tagged_path, row_index, out_col)
     saved_rel = _save_generated_images(images_dir, images_rel, tagged_path, row_index, out_col,
-                                       attempt, images, base_name, image_format)
-    record_seeds(tagged_path, saved_rel, meta.get('seed_used'))
+                                       attempt, images, base_name, image_format, seed=meta.get('seed_used'))
 
-    df.at[row_index, out_col] = saved_rel[0]
-    df.to_csv(tagged_path, index=False)
+    record_cell_edit(tagged_path, row_index, out_col, row_context.get(out_col), saved_rel[0])
     return saved_rel, meta.get('seed_used')
 
 
+def regenerate_image_cell(tagged_path, config_data, row_index, out_col, images_dir, images_rel,
+                          session_key=None, project_id=None, param_overrides=None, lock_seed=False):
+    """Re-run image generation for one row/tag ('Retry') using the row's
+    current (already-tagged) values as context.
+
+    By default uses a fresh random seed. If lock_seed=True (and no explicit
+    seed override), reuses the seed recorded for whichever candidate is
+    currently shown in this cell — so you can tweak the prompt/negative
+    prompt/LoRA/etc. in Define Columns and see the effect on the same
+    composition instead of a new random one. Returns (new_relative_paths, seed_used).
+    """
+    rendered_prompt, params, row_context = _prepare_image_regeneration(
+        tagged_path, config_data, row_index, out_col, param_overrides, lock_seed)
+    naming_column, image_format = _project_image_settings(project_id)
+    generated = call_image_generation(rendered_prompt, params, image_format)
+    return _save_image_regeneration(generated, tagged_path, row_index, out_col, row_context,
+                                    images_dir, images_rel, naming_column, image_format,
+                                    session_key=session_key, project_id=project_id)
+
+
 def _generate_image_for_tag(definition, rendered_prompt, images_dir, images_rel,
                             row_index, out_col, session_key, project_id, tagged_path,
-                            row_data=None, naming_column='', image_format='png'):
+                            row_data=None, naming_column='', image_format='png', trace=None,
+                            writer=None, batcher=None, job_queue=None):
     """Run one image generation for a tag, save the image(s), record a stat.
+    With `writer` (an ImageWriteBehind) the save itself happens in the
+    background; the returned paths are final either way. With `batcher` (an
+    ImageBatcher) the first attempt may come from a batched generation, and
+    failing that with `job_queue` (an ImageJobQueue) from a queued job.
 
     Returns (cell_value, explanation, image_url, all_relative_paths, gen_meta):
     cell_value is the MEDIA_ROOT-relative path of the first image written
@@ -1509,12 +3328,25 @@ def _generate_image_for_tag(definition, rendered_prompt, images_dir, images_rel,
 
     attempt_params = params
     for attempt in range(1, IMAGE_GEN_MAX_ATTEMPTS + 1):
-        images, meta, usage = call_image_generation(rendered_prompt, attempt_params)
-        record_stat(
-            usage['host'], usage['port'], usage['model'],
-            session_key, project_id,
-            usage['prompt_tokens'], usage['completion_tokens'], usage['elapsed_sec'],
-        )
+        with trace_span(trace, 'image_generation', 'image', attempt=attempt) as span:
+            batched = batcher.take(row_index, out_col) if batcher is not None and attempt == 1 else None
+            queued = (job_queue.take(row_index, out_col)
+                      if batched is None and job_queue is not None and attempt == 1 else None)
+            if batched is not None:
+                images, meta, usage = batched
+            elif queued is not None:
+                images, meta, usage = queued
+            else:
+                images, meta, usage = call_image_generation(rendered_prompt, attempt_params, image_format)
+            span['ok'] = bool(images)
+            span['batched'] = batched is not None
+            span['queued'] = queued is not None
+        with trace_span(trace, 'record_stat', 'io'):
+            record_stat(
+                usage['host'], usage['port'], usage['model'],
+                session_key, project_id,
+                usage['prompt_tokens'], usage['completion_tokens'], usage['elapsed_sec'],
+            )
         if images:
             break
         err = meta.get('error', 'unknown error')
@@ -1536,10 +3368,11 @@ def _generate_image_for_tag(definition, rendered_prompt, images_dir, images_rel,
         return f"ERROR: {err}", f"Image generation failed: {err}", '', [], gen_meta
 
     base_name = _image_base_name(row_data, naming_column, row_index)
-    attempt   = _next_attempt_index(tagged_path, row_index, out_col)
-    saved_rel = _save_generated_images(images_dir, images_rel, tagged_path, row_index, out_col,
-                                       attempt, images, base_name, image_format)
-    record_seeds(tagged_path, saved_rel, meta.get('seed_used'))
+    with trace_span(trace, 'save_images', 'io', count=len(images)):
+        attempt   = _next_attempt_index(tagged_path, row_index, out_col)
+        saved_rel = _save_generated_images(images_dir, images_rel, tagged_path, row_index, out_col,
+                                           attempt, images, base_name, image_format,
+                                           seed=meta.get('seed_used'), writer=writer)
 
     cell_value = saved_rel[0]
     image_url  = settings.MEDIA_URL + saved_rel[0]
@@ -1592,6 +3425,11 @@ def load_projects():
             df['image_format'] = df['image_format'].fillna('png').replace('', 'png').astype(str)
         else:
             df['image_format'] = 'png'
+        # Per-column context budgets (JSON, see parse_context_budgets).
+        if 'context_budgets' in df.columns:
+            df['context_budgets'] = df['context_budgets'].fillna('').astype(str)
+        else:
+            df['context_budgets'] = ''
         return df.sort_values('last_updated', ascending=False).to_dict('records')
     except Exception as e:
         print(f"Error loading projects: {e}")
@@ -1623,6 +3461,7 @@ def save_project(project_id, name, csv_path, config_path='', mode='text'):
                 'mode': mode or 'text',
                 'image_naming_column': '',
                 'image_format': 'png',
+                'context_budgets': '',
             })
         else:
             existing['last_updated'] = now
@@ -1640,7 +3479,8 @@ def update_project(project_id, **kwargs):
                 p.update(kwargs)
                 p['last_updated'] = datetime.now().isoformat()
                 break
-        pd.DataFrame(projects).to_csv(path, index=False)
+        with metrics.CSV_WRITE.time(kind='projects'):
+            pd.DataFrame(projects).to_csv(path, index=False)
 
 
 def delete_project(project_id):
@@ -1671,6 +3511,7 @@ def delete_project(project_id):
             shutil.rmtree(project_dir, ignore_errors=True)
 
     remove_rag_project(project_id)
+    drop_gallery_project(project_id)
 
 
 def create_image_test_run_project(csv_path, config_path, base_name,
@@ -1747,7 +3588,7 @@ def record_stat(host, port, model, session_key, project_id,
         'completion_tokens': int(completion_tokens),
         'elapsed_sec':      round(float(elapsed_sec), 3),
     }])
-    with _stats_lock:
+    with _stats_lock, metrics.CSV_WRITE.time(kind='stats'):
         write_header = not os.path.exists(path)
         row.to_csv(path, mode='a', header=write_header, index=False)
 
@@ -1788,13 +3629,14 @@ def call_llm_tagging(system_prompt, user_prompt):
 
         start_time = time.time()
         client, model_name = get_llm_client()
-        response = client.chat.completions.create(
-            model=model_name,
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user",   "content": user_prompt},
-            ]
-        )
+        with metrics.backend_request('llm', f"{conn['host']}:{conn['port']}", model_name):
+            response = client.chat.completions.create(
+                model=model_name,
+                messages=[
+                    {"role": "system", "content": system_prompt},
+                    {"role": "user",   "content": user_prompt},
+                ]
+            )
         elapsed_time = time.time() - start_time
 
         total_time = cache.get(LLM_CACHE_KEYS["total_time"], 0.0) + elapsed_time
@@ -2269,6 +4111,7 @@ def load_reference_index(project_id):
 
     mtime  = os.path.getmtime(vectors_path)
     cached = _reference_index_cache.get(project_id)
+    metrics.cache_lookup('reference_index', bool(cached and cached[0] == mtime))
     if cached and cached[0] == mtime:
         return cached[1], cached[2]
 
@@ -2336,6 +4179,44 @@ def evaluate_condition(definition, full_context):
     return True
 
 
+def evaluate_condition_frame(definition, df, dynamic_columns=()):
+    """evaluate_condition for every row of df at once, as a boolean Series
+    (True = the tag runs). Returns None when the ConditionField is in
+    dynamic_columns — an output generated earlier in the same row, only
+    known mid-run — so the caller falls back to evaluate_condition per row."""
+    field = definition.get('ConditionField', '').strip()
+    if not field:
+        return pd.Series(True, index=df.index)
+    if field in dynamic_columns:
+        return None
+    if field in df.columns:
+        actual = df[field].map(str).str.strip()
+    else:
+        actual = pd.Series('', index=df.index, dtype=object)
+    op      = definition.get('ConditionOp', '==').strip()
+    cval    = definition.get('ConditionValue', '').strip().lower()
+    lowered = actual.str.lower()
+    if op == '==':           return lowered == cval
+    if op == '!=':           return lowered != cval
+    if op == 'contains':     return lowered.str.contains(cval, regex=False)
+    if op == 'not_contains': return ~lowered.str.contains(cval, regex=False)
+    if op == 'is_empty':     return actual == ''
+    if op == 'is_not_empty': return actual != ''
+    return pd.Series(True, index=df.index)
+
+
+def condition_default(definition):
+    """(answer, explanation) written to a cell whose tag condition was false."""
+    return (
+        definition.get('DefaultValue', '').strip() or 'N/A',
+        f"Condition not met — "
+        f"{definition.get('ConditionField','')} "
+        f"{definition.get('ConditionOp','')} "
+        f"'{definition.get('ConditionValue','')}' was false. "
+        f"Default value used.",
+    )
+
+
 # Weak/small local models often don't follow the "Best Answer: X" format
 # call_llm_tagging expects, so the raw text it falls back to can carry
 # formatting noise a stronger model wouldn't ("EVEN" vs "Even" vs "<EVEN>" vs
@@ -2355,8 +4236,509 @@ def _normalize_categorical_key(value):
     return key.upper()
 
 
+# ─── Context budgets (per-column truncation / summarize-once) ───────────────
+# A long free-text cell (product descriptions, scraped HTML) is otherwise
+# pasted verbatim into every tag's prompt for its row — paying its prompt-eval
+# time once per tag, and on small-context models sometimes overflowing
+# num_ctx outright so Ollama silently drops the start of the prompt. A
+# project can give any column a token budget: over-budget values are either
+# cut at a sentence/word boundary, or (summarize mode) condensed once by a
+# cheap model and the summary reused for every tag and every row holding the
+# same value. Budgets only shape what the LLM sees — conditions still test
+# the raw cell, so "contains" on a long column keeps working.
+#
+# Stored per project as a JSON cell in projects.csv (context_budgets), same
+# precedent as ImageParams/RetrievalConfig:
+#   {"columns": {"<col>": {"max_tokens": 200, "summarize": false}},
+#    "summary_model": ""}   # '' = the active tagging model
+
+APPROX_CHARS_PER_TOKEN = 4
+SUMMARY_TIMEOUT = 120
+_summaries_lock = threading.Lock()
+_HTML_TAG_RE = re.compile(r'<[^>]+>')
+
+
+def parse_context_budgets(raw):
+    """Normalize a context_budgets JSON string (or already-parsed dict) to
+    {'columns': {col: {'max_tokens': int, 'summarize': bool}}, 'summary_model': str},
+    dropping columns with no positive budget. Malformed input means no budgets."""
+    try:
+        cfg = json.loads(raw) if isinstance(raw, str) else (raw or {})
+        if not isinstance(cfg, dict):
+            cfg = {}
+    except (ValueError, TypeError):
+        cfg = {}
+    columns = {}
+    for col, spec in (cfg.get('columns') or {}).items():
+        if not isinstance(spec, dict):
+            continue
+        max_tokens = _coerce_int(spec.get('max_tokens'), 0)
+        if max_tokens > 0:
+            columns[str(col)] = {'max_tokens': max_tokens, 'summarize': bool(spec.get('summarize'))}
+    return {'columns': columns, 'summary_model': str(cfg.get('summary_model') or '').strip()}
+
+
+def get_project_context_budgets(project_id):
+    proj = get_project(project_id) if project_id else None
+    return parse_context_budgets((proj or {}).get('context_budgets', ''))
+
+
+def truncate_to_budget(text, max_tokens):
+    """Cut `text` to roughly max_tokens (at APPROX_CHARS_PER_TOKEN). Markup is
+    stripped and whitespace collapsed first — often enough on its own for
+    HTML blobs — then the cut backs off to the last sentence end, or failing
+    that the last word, within the final 30% so the model never sees half a
+    word. Values already within budget come back unchanged."""
+    text = str(text)
+    max_chars = max_tokens * APPROX_CHARS_PER_TOKEN
+    if len(text) <= max_chars:
+        return text
+    if '<' in text and '>' in text:
+        text = html.unescape(_HTML_TAG_RE.sub(' ', text))
+    text = re.sub(r'\s+', ' ', text).strip()
+    if len(text) <= max_chars:
+        return text
+    cut = text[:max_chars]
+    floor = int(max_chars * 0.7)
+    sentence_end = max(cut.rfind('. '), cut.rfind('! '), cut.rfind('? '))
+    if sentence_end >= floor:
+        cut = cut[:sentence_end + 1]
+    elif cut.rfind(' ') >= floor:
+        cut = cut[:cut.rfind(' ')]
+    return cut.rstrip() + ' …[truncated]'
+
+
+def _summaries_path_for_csv(csv_path, legacy=False):
+    """The append-only summary log, or (legacy=True) the older single-JSON
+    sidecar that was rewritten on every new summary — still read if present."""
+    base = csv_path[:-len('_tagged.csv')] if csv_path.endswith('_tagged.csv') else os.path.splitext(csv_path)[0]
+    return base + ('_summaries.json' if legacy else '_summaries.jsonl')
+
+
+def load_summary_cache(csv_path):
+    """{content-hash: summary} sidecar next to the project's CSV, shared by
+    the estimator, the main run and any resumed run — a value summarized
+    while estimating is never paid for again. New summaries are appended one
+    line each, so a crash mid-write costs at most that line."""
+    cache = {}
+    try:
+        with open(_summaries_path_for_csv(csv_path, legacy=True)) as f:
+            legacy = json.load(f)
+        if isinstance(legacy, dict):
+            cache.update(legacy)
+    except Exception:
+        pass
+    try:
+        with open(_summaries_path_for_csv(csv_path), 'rb') as f:
+            data = f.read()
+    except OSError:
+        return cache
+    for line in data[:data.rfind(b'\n') + 1].splitlines():
+        try:
+            entry = json.loads(line)
+            cache[entry['key']] = entry['summary']
+        except (ValueError, KeyError, TypeError):
+            continue
+    return cache
+
+
+def _append_summary(csv_path, key, summary):
+    line = json.dumps({'key': key, 'summary': summary}) + '\n'
+    with _summaries_lock, open(_summaries_path_for_csv(csv_path), 'ab+') as f:
+        if f.tell():
+            f.seek(-1, os.SEEK_END)
+            if f.read(1) != b'\n':
+                line = '\n' + line  # don't fuse onto a line torn by a crash
+        f.write(line.encode('utf-8'))
+
+
+def _summary_key(text, max_tokens, model):
+    return hashlib.sha256(f"{model}\0{max_tokens}\0{text}".encode('utf-8')).hexdigest()
+
+
+def summarize_to_budget(text, max_tokens, model, summary_cache, csv_path=None):
+    """Condense `text` to about max_tokens with `model`, at most once per
+    distinct (value, budget, model): hits come from summary_cache, misses are
+    summarized, stored there and — when csv_path is given — persisted to the
+    sidecar. A failed summary falls back to truncate_to_budget and isn't
+    cached, so the next row holding the value tries again."""
+    text = str(text)
+    if len(text) <= max_tokens * APPROX_CHARS_PER_TOKEN:
+        return text
+    conn = get_active_connection()
+    model = model or conn['model']
+    key = _summary_key(text, max_tokens, model)
+    metrics.cache_lookup('summaries', key in summary_cache)
+    if key in summary_cache:
+        return summary_cache[key]
+    try:
+        client = openai.OpenAI(base_url=f"http://{conn['host']}:{conn['port']}/v1",
+                               api_key='ollama', timeout=SUMMARY_TIMEOUT)
+        with metrics.backend_request('llm', f"{conn['host']}:{conn['port']}", model):
+            response = client.chat.completions.create(
+                model=model,
+                max_tokens=max_tokens,
+                messages=[
+                    {"role": "system", "content": (
+                        f"Condense the user's text to at most {max_tokens} tokens. Keep every name, "
+                        f"number, date and concrete fact; drop markup, boilerplate and repetition. "
+                        f"Reply with the condensed text only."
+                    )},
+                    {"role": "user", "content": text},
+                ],
+            )
+        summary = (response.choices[0].message.content or '').strip()
+    except Exception as e:
+        print(f"Summary error ({model}): {e}")
+        summary = ''
+    if not summary:
+        return truncate_to_budget(text, max_tokens)
+    summary_cache[key] = summary
+    if csv_path:
+        _append_summary(csv_path, key, summary)
+    return summary
+
+
+def apply_context_budgets(values, budgets, summary_cache=None, csv_path=None):
+    """Copy of a row's {column: value} with every budgeted column brought
+    within its budget (see parse_context_budgets). Unbudgeted columns pass
+    through untouched; with no budgets the dict itself is returned."""
+    columns = budgets.get('columns') if budgets else None
+    if not columns:
+        return values
+    out = dict(values)
+    for col, spec in columns.items():
+        if col not in out:
+            continue
+        val = out[col]
+        if val is None or (isinstance(val, float) and pd.isna(val)):
+            continue
+        if spec['summarize'] and summary_cache is not None:
+            out[col] = summarize_to_budget(val, spec['max_tokens'], budgets.get('summary_model', ''),
+                                           summary_cache, csv_path)
+        else:
+            out[col] = truncate_to_budget(val, spec['max_tokens'])
+    return out
+
+
+# ─── Live event log (sequence-numbered, disk-backed) ────────────────────────
+# Every tag a run processes emits one live event (row, prompt, answer,
+# explanation, image info) for the tagging page. Events are appended to
+# <name>_events.jsonl next to the tagged CSV, each stamped with a
+# sequence number; PROGRESS_STATUS only keeps the last LIVE_TAIL_SIZE of
+# them for the progress poll. Older history is paged back off disk by
+# sequence number, so a 100k-row run's log never sits in memory.
+#
+# Readers find an event via a sparse offset index (one byte offset per
+# EVENT_INDEX_STRIDE events), built lazily and extended incrementally as
+# the file grows — the writer never has to maintain it.
+
+LIVE_TAIL_SIZE = 100
+EVENT_INDEX_STRIDE = 64
+_event_index_lock = threading.Lock()
+_event_index_cache = {}  # path -> {'size': bytes indexed, 'count': events, 'checkpoints': [offsets]}
+
+
+def _events_path_for_tagged(tagged_path):
+    base = tagged_path[:-len('_tagged.csv')] if tagged_path.endswith('_tagged.csv') else os.path.splitext(tagged_path)[0]
+    return base + '_events.jsonl'
+
+
+def get_live_events_path(tagged_path):
+    path = _events_path_for_tagged(tagged_path)
+    return path if os.path.exists(path) else None
+
+
+def _event_index(path):
+    """Sparse index over the complete lines of an events file, extended
+    from wherever the last call stopped. A trailing partial line (a write
+    still in flight) is left for next time."""
+    with _event_index_lock:
+        idx = _event_index_cache.get(path)
+        try:
+            size = os.path.getsize(path)
+        except OSError:
+            _event_index_cache.pop(path, None)
+            return {'size': 0, 'count': 0, 'checkpoints': []}
+        if idx is None or size < idx['size']:
+            idx = {'size': 0, 'count': 0, 'checkpoints': []}
+        if size > idx['size']:
+            with open(path, 'rb') as f:
+                f.seek(idx['size'])
+                offset = idx['size']
+                for line in f:
+                    if not line.endswith(b'\n'):
+                        break
+                    if idx['count'] % EVENT_INDEX_STRIDE == 0:
+                        idx['checkpoints'].append(offset)
+                    offset += len(line)
+                    idx['count'] += 1
+            idx['size'] = offset
+        _event_index_cache[path] = idx
+        return dict(idx, checkpoints=list(idx['checkpoints']))
+
+
+def open_live_event_log(tagged_path, resume=False):
+    """Start a run's event file — fresh, or (resume=True, continuing a
+    paused run) appending after its existing events so sequence numbers
+    carry on. Returns the handle append_live_event takes."""
+    path = _events_path_for_tagged(tagged_path)
+    if resume and os.path.exists(path):
+        next_seq = _event_index(path)['count']
+    else:
+        with _event_index_lock:
+            _event_index_cache.pop(path, None)
+        open(path, 'w').close()
+        next_seq = 0
+    # Line-buffered, so each event reaches the file whole as it's written.
+    return {'path': path, 'fh': open(path, 'a', encoding='utf-8', buffering=1), 'next_seq': next_seq}
+
+
+def append_live_event(log, event):
+    """Stamp `event` with the next sequence number, append it, and return
+    the stamped copy."""
+    event = {'seq': log['next_seq'], **event}
+    log['fh'].write(json.dumps(event, separators=(',', ':'), default=str) + '\n')
+    log['next_seq'] += 1
+    return event
+
+
+def close_live_event_log(log):
+    if log is not None:
+        log['fh'].close()
+
+
+def read_live_events(path, after=None, before=None, limit=LIVE_TAIL_SIZE):
+    """A page of events, oldest first, plus the total count. `after` gives
+    the events from that sequence number on; `before` the `limit` events
+    just before it (paging back through history)."""
+    idx = _event_index(path)
+    count = idx['count']
+    if before is not None:
+        stop = max(0, min(int(before), count))
+        start = max(0, stop - limit)
+    else:
+        start = max(0, int(after or 0))
+        stop = min(count, start + limit)
+    if start >= stop:
+        return [], count
+    events = []
+    with open(path, 'rb') as f:
+        f.seek(idx['checkpoints'][start // EVENT_INDEX_STRIDE])
+        for _ in range(start % EVENT_INDEX_STRIDE):
+            f.readline()
+        for _ in range(stop - start):
+            events.append(json.loads(f.readline()))
+    return events, count
+
+
+# ─── Metrics (scrape-time run gauges) ──────────────────────────────────────
+# Counters and latency histograms are updated inline (see metrics.py); the
+# run-level gauges are derived from PROGRESS_STATUS whenever /metrics is
+# scraped, so they can never drift from what the progress page shows.
+
+def _run_status_bucket(status):
+    """Collapse PROGRESS_STATUS's free-form status ("Processing row 3/10",
+    "error: ...") to a small fixed label set."""
+    status = str(status or '')
+    if status.startswith('error'):
+        return 'error'
+    if status in ('paused', 'finished', 'cancelled'):
+        return status
+    return 'running'
+
+
+def _metrics_runs_by_status():
+    counts = {(s,): 0 for s in ('running', 'paused', 'finished', 'cancelled', 'error')}
+    for ps in list(PROGRESS_STATUS.values()):
+        key = (_run_status_bucket(ps.get('status')),)
+        counts[key] = counts.get(key, 0) + 1
+    return counts
+
+
+def _metrics_rows_pending():
+    return sum(max(0, ps.get('work_total', 0) - ps.get('work_done', 0)) for ps in list(PROGRESS_STATUS.values())
+               if _run_status_bucket(ps.get('status')) in ('running', 'paused'))
+
+
+def _metrics_rows_per_second():
+    now, rate = time.time(), 0.0
+    for ps in list(PROGRESS_STATUS.values()):
+        if _run_status_bucket(ps.get('status')) != 'running':
+            continue
+        elapsed = now - ps.get('start_time', now)
+        if elapsed > 0:
+            rate += ps.get('work_done', 0) / elapsed
+    return rate
+
+
+metrics.RUNS.set_function(_metrics_runs_by_status)
+metrics.ROWS_PENDING.set_function(_metrics_rows_pending)
+metrics.ROWS_PER_SECOND.set_function(_metrics_rows_per_second)
+
+
+# ─── Run tracing (Chrome trace / Perfetto) ──────────────────────────────────
+# PROGRESS_STATUS only tallies llm_time_sec, which can't say whether a slow
+# run is waiting on the model or on its own bookkeeping (per-row to_csv,
+# record_stat, update_project, retrieval embeds). Each run writes its stage
+# timings as Chrome trace-event "complete" spans to <name>_trace.json next to
+# the tagged CSV — open it in ui.perfetto.dev or chrome://tracing.
+#
+# Events are streamed to disk as they happen rather than held in memory, so
+# a 100k-row run doesn't accumulate millions of dicts; the trace-event JSON
+# Array format explicitly tolerates a missing closing ']', so a file cut off
+# by a crash or server kill still loads.
+
+def _trace_path_for_tagged(tagged_path):
+    base = tagged_path[:-len('_tagged.csv')] if tagged_path.endswith('_tagged.csv') else os.path.splitext(tagged_path)[0]
+    return base + '_trace.json'
+
+
+def open_run_trace(tagged_path, run_name, **meta):
+    """Start a fresh trace file for a run (replacing the previous run's).
+    Returns the trace handle for trace_span/close_run_trace, or None if the
+    file can't be opened — tracing must never be the reason a run fails."""
+    try:
+        fh = open(_trace_path_for_tagged(tagged_path), 'w')
+    except OSError as e:
+        print(f"Trace disabled: {e}")
+        return None
+    fh.write('[\n')
+    trace = {'fh': fh, 't0': time.perf_counter(), 'first': True,
+             'pid': os.getpid(), 'tid': threading.get_ident()}
+    _trace_write(trace, {'name': 'process_name', 'ph': 'M', 'pid': trace['pid'],
+                         'args': {'name': run_name}})
+    _trace_write(trace, {'name': 'run_meta', 'ph': 'i', 's': 'g', 'ts': 0,
+                         'pid': trace['pid'], 'tid': trace['tid'], 'args': meta})
+    return trace
+
+
+def _trace_write(trace, event):
+    trace['fh'].write(('' if trace['first'] else ',\n') + json.dumps(event, default=str))
+    trace['first'] = False
+
+
+def trace_complete(trace, name, cat, start, **args):
+    """Emit a span from `start` (a time.perf_counter() reading) to now — for
+    stages too long to wrap in a `with` block, like a whole row."""
+    if trace is None:
+        return
+    end = time.perf_counter()
+    try:
+        _trace_write(trace, {
+            'name': name, 'cat': cat, 'ph': 'X', 'pid': trace['pid'], 'tid': trace['tid'],
+            'ts':   round((start - trace['t0']) * 1e6, 1),
+            'dur':  round((end - start) * 1e6, 1),
+            'args': args,
+        })
+    except (OSError, ValueError):
+        pass
+
+
+@contextlib.contextmanager
+def trace_span(trace, name, cat='tagger', **args):
+    """Time the enclosed block as one span. Yields the span's args dict so
+    the block can attach results (token counts…) before it closes. A no-op
+    when trace is None."""
+    start = time.perf_counter()
+    try:
+        yield args
+    finally:
+        trace_complete(trace, name, cat, start, **args)
+
+
+def flush_run_trace(trace):
+    if trace is not None:
+        try:
+            trace['fh'].flush()
+        except (OSError, ValueError):
+            pass
+
+
+def close_run_trace(trace):
+    if trace is None:
+        return
+    try:
+        trace['fh'].write('\n]\n')
+        trace['fh'].close()
+    except (OSError, ValueError):
+        pass
+
+
+def get_run_trace_path(tagged_path):
+    """Path of the latest run's trace file for a tagged CSV, or None."""
+    if not tagged_path:
+        return None
+    path = _trace_path_for_tagged(tagged_path)
+    return path if os.path.exists(path) else None
+
+
 # ─── Core tagger ─────────────────────────────────────────────────────────────
 
+def build_system_prompt(total_rows, context_cols, output_col_names):
+    """The fixed per-run system prompt. Shared by row_by_row_tagger and the
+    text-mode estimator so a sampled call costs exactly what the real one will."""
+    return (
+        f"You are an AI-powered CSV Tagger.\n"
+        f"You receive one row at a time from a dataset with {total_rows} rows.\n"
+        f"Input fields per row: {', '.join(context_cols)}.\n"
+        f"Output fields being generated in order: {', '.join(output_col_names)}.\n"
+        f"Some rows include previously generated fields — treat them as facts.\n"
+        f"Answer the user-defined task precisely.\n"
+        f"Always format your response as:\n"
+        f"Best Answer: <your answer>\n"
+        f"Explanation: <brief reason>"
+    )
+
+
+def build_user_prompt_parts(definition, row_index, total_rows, display_context, rendered_prompt,
+                           retrieved_chunks=None, generated_detail=None):
+    """One tag's user message for one row, as (segment, name, text) pieces
+    whose texts concatenate to the exact prompt sent: the row's context dump
+    (one 'column' piece per column), any retrieved reference chunks, the
+    rendered task, and — when the tag has SendContext set — the full
+    prompt/answer/explanation of its condition column from earlier in the
+    same row (generated_detail). Kept in pieces so the token profiler can
+    attribute a prompt's cost to the column or block that caused it."""
+    # The trailing newline on an empty context keeps the joined text
+    # byte-identical to what earlier runs sent.
+    parts = [('task', 'header', f"Row {row_index+1}/{total_rows}:" + ("" if display_context else "\n"))]
+    for k, v in display_context.items():
+        parts.append(('column', k, f"\n  {k}: {v}"))
+    if retrieved_chunks:
+        parts.append(('reference', 'reference', (
+            "\n\nReference Data (retrieved — ground your answer in this, not just the row above):\n"
+            + "\n".join(f"  [{n+1}] ({c['source']}) {c['text']}" for n, c in enumerate(retrieved_chunks))
+        )))
+    parts.append(('task', 'task', (
+        f"\n\nTask: {rendered_prompt}\n\n"
+        f"Best Answer: <your answer>\n"
+        f"Explanation: <brief reason>"
+    )))
+
+    send_context = definition.get('SendContext', '').strip() == '1'
+    cond_field   = definition.get('ConditionField', '').strip()
+    if send_context and cond_field and cond_field in (generated_detail or {}):
+        d = generated_detail[cond_field]
+        parts.append(('send_context', cond_field, (
+            f"\n\n--- Context from '{cond_field}' (condition column) ---"
+            f"\nPrompt used: {d['prompt']}"
+            f"\nAnswer: {d['best_answer']}"
+            f"\nExplanation: {d['explanation']}"
+            f"\n---"
+        )))
+    return parts
+
+
+def build_user_prompt(definition, row_index, total_rows, display_context, rendered_prompt,
+                      retrieved_chunks=None, generated_detail=None):
+    """build_user_prompt_parts joined into the message actually sent."""
+    return "".join(text for _, _, text in build_user_prompt_parts(
+        definition, row_index, total_rows, display_context, rendered_prompt,
+        retrieved_chunks, generated_detail,
+    ))
+
+
 def infer_resume_row(csv_path, output_definitions):
     """How many rows of an interrupted run are actually done, read straight
     off the _tagged.csv output rather than trusting done_rows/status in the
@@ -2389,11 +4771,40 @@ def infer_resume_row(csv_path, output_definitions):
     return int(incomplete.index[0]) if len(incomplete) else len(df)
 
 
+def _mark_image_save_failures(df, failures):
+    """Turn write-behind saves that failed (ImageWriteBehind.drain()) into
+    ERROR cells, so the tagged CSV doesn't point at images that were never
+    written and the cells can be retried. Returns the changes for
+    write_tagged_csv."""
+    changes = []
+    for row_index, out_col, err in failures:
+        old = df.at[row_index, out_col]
+        df.at[row_index, out_col] = f"ERROR: saving image failed: {err}"
+        changes.append((out_col, old, df.at[row_index, out_col]))
+    return changes
+
+
 def row_by_row_tagger(session_key, csv_path, config_path, input_columns,
                       output_definitions, project_id=None, mode='text', start_row=0):
+    trace = None
+    event_log = None
+    image_writer = ImageWriteBehind() if mode == 'image' else None
+    image_jobs = None
     try:
+        # Stands in until the CSV has been read (the full entry is set up
+        # below), so a failure in the setup steps still ends the run with an
+        # error status.
+        PROGRESS_STATUS[session_key] = {
+            "done": start_row, "total": 0, "status": "running", "tagged_file": "",
+            "start_time": time.time(), "last_update": time.time(),
+            "project_id": project_id, "mode": mode,
+        }
         base, ext = os.path.splitext(csv_path)
         tagged_path = base + "_tagged.csv"
+        trace = open_run_trace(tagged_path, f"tagging run {session_key[:8]}",
+                               session_key=session_key, project_id=project_id,
+                               mode=mode, start_row=start_row)
+        event_log = open_live_event_log(tagged_path, resume=start_row > 0)
 
         # start_row > 0 means we're continuing a run that was left paused
         # across a process restart — PROGRESS_STATUS/PAUSE_FLAGS are
@@ -2402,15 +4813,22 @@ def row_by_row_tagger(session_key, csv_path, config_path, input_columns,
         # real, previously-generated answers for every row before start_row,
         # so read from there instead of the original csv_path — reading
         # csv_path here would re-tag the whole file from row 0.
-        if start_row > 0 and os.path.exists(tagged_path):
-            df = read_csv_safe(tagged_path)
-            # Empty output cells round-tripped through CSV come back as NaN
-            # rather than the "" a fresh run would have — fill them so a
-            # same-row cross-column reference to a not-yet-generated output
-            # column doesn't literally see the string "nan".
-            df = df.fillna("")
+        # Cell edits made since the last save belong to that output: fold
+        # them in before resuming from it, or drop them when starting over.
+        if start_row > 0:
+            compact_cell_edits(tagged_path)
         else:
-            df = read_csv_safe(csv_path)
+            discard_cell_edits(tagged_path)
+        with trace_span(trace, 'read_csv', 'io'):
+            if start_row > 0 and os.path.exists(tagged_path):
+                df = read_csv_safe(tagged_path)
+                # Empty output cells round-tripped through CSV come back as NaN
+                # rather than the "" a fresh run would have — fill them so a
+                # same-row cross-column reference to a not-yet-generated output
+                # column doesn't literally see the string "nan".
+                df = df.fillna("")
+            else:
+                df = read_csv_safe(csv_path)
         total_rows = len(df)
         PROGRESS_STATUS[session_key] = {
             "done":        start_row,
@@ -2419,13 +4837,25 @@ def row_by_row_tagger(session_key, csv_path, config_path, input_columns,
             "tagged_file": "",
             "start_time":  time.time(),
             "last_update": time.time(),
-            "live_logs":   [],
+            # Newest LIVE_TAIL_SIZE live events; the full history is in
+            # events_path (see the live event log section).
+            "live_logs":   deque(maxlen=LIVE_TAIL_SIZE),
+            "events_path": event_log['path'],
+            "event_total": event_log['next_seq'],
             # Cumulative {out_col: {value: count}} across the whole run (not
             # capped like live_logs) — lets the progress endpoint report a
             # live categorical breakdown for low-cardinality output columns
             # (YES/NO, 0/1, A/B/C…) while a run is still in flight.
             "column_stats": {},
             "project_id":  project_id,
+            "mode":        mode,
+            "start_row":   start_row,
+            # Rows this run actually sends to the LLM/SD server — rows whose
+            # every tag was ruled out by an input-column condition are
+            # pre-filled up front and not counted (see condition_masks).
+            "work_total":     total_rows - start_row,
+            "work_done":      0,
+            "prefilled_rows": 0,
             "prompt_tokens":     0,
             "completion_tokens": 0,
             "llm_time_sec":      0.0,
@@ -2469,7 +4899,63 @@ def row_by_row_tagger(session_key, csv_path, config_path, input_columns,
                 ordered_output_cols.append(src_col)
         other_cols = [c for c in df.columns if c not in ordered_output_cols]
         df = df[other_cols + ordered_output_cols]
-        df.to_csv(tagged_path, index=False)
+
+        # A condition on a plain input column is decided before the run
+        # starts: evaluate it column-wise, bulk-fill the default into every
+        # cell it rules out, and leave only rows with at least one tag to
+        # actually run for the loop below. That carries down a chain — a tag
+        # gated on an earlier tag's output is decided too wherever that
+        # earlier tag was pre-filled. condition_masks[col] holds True/False
+        # per row, or None where it can only be checked mid-row.
+        with trace_span(trace, 'precompute_conditions', 'prompt') as span:
+            remaining_rows = df.index >= start_row
+            condition_masks = {}
+            prefilled = {}  # out_col -> default where pre-filled, None elsewhere
+            needs_work = pd.Series(False, index=df.index)
+            for definition in output_definitions:
+                out_col = definition['OutputColumn']
+                field = definition.get('ConditionField', '').strip()
+                mask = pd.Series(None, index=df.index, dtype=object)
+                if field in prefilled:
+                    known = prefilled[field].notna()
+                    if known.any():
+                        mask[known] = evaluate_condition_frame(
+                            definition, pd.DataFrame({field: prefilled[field][known]})).astype(object)
+                else:
+                    decided = evaluate_condition_frame(definition, df, ordered_output_cols)
+                    if decided is not None:
+                        mask = decided.astype(object)
+                condition_masks[out_col] = mask
+                ruled_out = mask.eq(False)  # None (undecided) is neither
+                skipped = remaining_rows & ruled_out.to_numpy()
+                needs_work |= ~ruled_out
+                prefilled[out_col] = pd.Series(None, index=df.index, dtype=object)
+                if skipped.any():
+                    default_answer, default_exp = condition_default(definition)
+                    df.loc[skipped, out_col] = default_answer
+                    df.loc[skipped, out_col + '_exp'] = default_exp
+                    prefilled[out_col][skipped] = default_answer
+            work_rows = [i for i in range(start_row, total_rows) if needs_work.iat[i]]
+            prefilled_rows = (total_rows - start_row) - len(work_rows)
+            span['work_rows'] = len(work_rows)
+            span['prefilled_rows'] = prefilled_rows
+        PROGRESS_STATUS[session_key]["work_total"]     = len(work_rows)
+        PROGRESS_STATUS[session_key]["prefilled_rows"] = prefilled_rows
+        # Fully pre-filled rows never reach the loop's tally, so count their
+        # defaults into the live analytics here.
+        if prefilled_rows:
+            for definition in output_definitions:
+                val_key = _normalize_categorical_key(condition_default(definition)[0])
+                if val_key:
+                    col_stats = PROGRESS_STATUS[session_key]["column_stats"].setdefault(definition['OutputColumn'], {})
+                    col_stats[val_key] = col_stats.get(val_key, 0) + prefilled_rows
+
+        # One full analytics build per run; each row's save below only
+        # patches the cells that row wrote.
+        analytics = write_tagged_csv(df, tagged_path)
+        written_cols = [c for d in output_definitions
+                        for c in (d['OutputColumn'], d['OutputColumn'] + '_exp', d['OutputColumn'] + '_sources')
+                        if c in df.columns]
 
         context_cols = [c for c in input_columns if c in df.columns] if input_columns else list(df.columns)
 
@@ -2478,32 +4964,78 @@ def row_by_row_tagger(session_key, csv_path, config_path, input_columns,
         row_key_col = other_cols[0] if other_cols else (df.columns[0] if len(df.columns) else None)
 
         output_col_names = [d['OutputColumn'] for d in output_definitions]
-        system_prompt = (
-            f"You are an AI-powered CSV Tagger.\n"
-            f"You receive one row at a time from a dataset with {total_rows} rows.\n"
-            f"Input fields per row: {', '.join(context_cols)}.\n"
-            f"Output fields being generated in order: {', '.join(output_col_names)}.\n"
-            f"Some rows include previously generated fields — treat them as facts.\n"
-            f"Answer the user-defined task precisely.\n"
-            f"Always format your response as:\n"
-            f"Best Answer: <your answer>\n"
-            f"Explanation: <brief reason>"
-        )
+        system_prompt = build_system_prompt(total_rows, context_cols, output_col_names)
 
         if project_id:
-            update_project(project_id, status='running', total_rows=total_rows, session_key=session_key)
+            with trace_span(trace, 'update_project', 'io'):
+                update_project(project_id, status='running', total_rows=total_rows, session_key=session_key)
+
+        # Per-column budgets only shape text-mode prompts; image prompts are
+        # short by construction and their naming column must stay verbatim.
+        budgets = get_project_context_budgets(project_id) if mode != 'image' else None
+        summary_cache = load_summary_cache(csv_path) if budgets and budgets['columns'] else None
+
+        # Tags whose template only reads columns that stay fixed for the whole
+        # run get every row's prompt rendered up front in one vectorized pass;
+        # the rest (templates reading an earlier tag's output, or a budgeted
+        # column) keep rendering row by row.
+        dynamic_cols = set(ordered_output_cols) | set(budgets['columns'] if budgets else ())
+        prerendered = {}
+        with trace_span(trace, 'prerender_prompts', 'prompt'):
+            for n, definition in enumerate(output_definitions):
+                full_cols = context_cols + [d['OutputColumn'] for d in output_definitions[:n]]
+                prerendered[definition['OutputColumn']] = render_tag_prompts_frame(
+                    definition, df, full_cols, dynamic_cols)
+        image_batcher = (ImageBatcher(output_definitions, prerendered, condition_masks, work_rows, image_format)
+                         if mode == 'image' else None)
+        if mode == 'image':
+            image_jobs = ImageJobQueue(
+                output_definitions, prerendered, condition_masks, work_rows, image_format,
+                should_stop=lambda: CANCEL_FLAGS.get(session_key, False),
+                on_status=lambda state: PROGRESS_STATUS[session_key].update(image_queue=image_queue_position(state)))
 
-        for i in range(start_row, total_rows):
+        def run_planned_image_job(r, definition):
+            out_col = definition['OutputColumn']
+            PROGRESS_STATUS[session_key]["status"] = \
+                f"Generating {out_col} for row {r + 1}/{total_rows} (grouped by model)"
+            return _generate_image_for_tag(
+                definition, prerendered[out_col].at[r], images_dir, images_rel,
+                r, out_col, session_key, project_id, tagged_path,
+                row_data={c: df.at[r, c] for c in df.columns}, naming_column=naming_column,
+                image_format=image_format, trace=trace, writer=image_writer, batcher=image_batcher,
+                job_queue=image_jobs,
+            )
+
+        image_planner = None
+        if mode == 'image' and naming_column not in output_col_names:
+            image_planner = ImageJobPlanner(
+                output_definitions, prerendered, condition_masks, work_rows, run_planned_image_job,
+                should_stop=lambda: PAUSE_FLAGS.get(session_key, False) or CANCEL_FLAGS.get(session_key, False),
+                preload=lambda params: preload_image_model(
+                    (params.get('model') or get_active_image_connection().get('model') or '').strip(),
+                    params.get('hf_token')),
+                default_model=get_active_image_connection().get('model') or '')
+            if image_planner.enabled:
+                PROGRESS_STATUS[session_key]["image_switches"] = image_planner.stats
+            else:
+                image_planner = None
+
+        for i in work_rows:
             if CANCEL_FLAGS.get(session_key, False):
                 break
+            row_start       = time.perf_counter()
             row             = df.loc[i]
-            row_context     = {c: row[c] for c in context_cols}
-            all_row_context = {c: row[c] for c in df.columns}  # every CSV column
+            row_before      = [row[c] for c in written_cols]
+            raw_row_context = {c: row[c] for c in df.columns}  # every CSV column, unbudgeted
+            with trace_span(trace, 'context_budgets', 'prompt', row=i):
+                all_row_context = apply_context_budgets(raw_row_context, budgets, summary_cache, csv_path)
+            row_context     = {c: all_row_context[c] for c in context_cols}
             generated       = {}
             generated_detail = {}
 
             for definition in output_definitions:
                 out_col = definition['OutputColumn']
+                tag_start = time.perf_counter()
 
                 # full_context: globally selected cols + AI-generated cols (for conditions + default prompt)
                 full_context = {**row_context, **generated}
@@ -2511,7 +5043,12 @@ def row_by_row_tagger(session_key, csv_path, config_path, input_columns,
                 all_context  = {**all_row_context, **generated}
 
                 # Per-tag column filter: draws from all_context so any CSV column is reachable
-                rendered_prompt, display_context = render_tag_prompt(definition, full_context, all_context)
+                with trace_span(trace, 'render_prompt', 'prompt', row=i, column=out_col):
+                    if prerendered[out_col] is not None:
+                        display_context = select_display_context(definition, full_context, all_context)
+                        rendered_prompt = prerendered[out_col].at[i]
+                    else:
+                        rendered_prompt, display_context = render_tag_prompt(definition, full_context, all_context)
 
                 # Retrieval-augmented grounding: query the project's reference
                 # index (if this tag has it enabled) with the same columns
@@ -2521,67 +5058,51 @@ def row_by_row_tagger(session_key, csv_path, config_path, input_columns,
                 retrieval_cfg = parse_retrieval_config(definition) if mode != 'image' else {'enabled': False, 'top_k': 3}
                 retrieved_chunks = []
                 if retrieval_cfg['enabled'] and project_id:
-                    query_text = " ".join(str(v) for v in display_context.values())
-                    retrieved_chunks = retrieve_reference_chunks(project_id, query_text, top_k=retrieval_cfg['top_k'])
-
-                user_prompt = (
-                    f"Row {i+1}/{total_rows}:\n"
-                    + "\n".join(f"  {k}: {v}" for k, v in display_context.items())
-                )
-                if retrieved_chunks:
-                    user_prompt += (
-                        "\n\nReference Data (retrieved — ground your answer in this, not just the row above):\n"
-                        + "\n".join(f"  [{n+1}] ({c['source']}) {c['text']}" for n, c in enumerate(retrieved_chunks))
-                    )
-                user_prompt += (
-                    f"\n\nTask: {rendered_prompt}\n\n"
-                    f"Best Answer: <your answer>\n"
-                    f"Explanation: <brief reason>"
+                    with trace_span(trace, 'retrieval', 'retrieval', row=i, column=out_col,
+                                    top_k=retrieval_cfg['top_k']):
+                        query_text = " ".join(str(v) for v in display_context.values())
+                        retrieved_chunks = retrieve_reference_chunks(project_id, query_text, top_k=retrieval_cfg['top_k'])
+
+                user_prompt = build_user_prompt(
+                    definition, i, total_rows, display_context, rendered_prompt,
+                    retrieved_chunks, generated_detail,
                 )
 
-                send_context = definition.get('SendContext', '').strip() == '1'
-                cond_field   = definition.get('ConditionField', '').strip()
-                if send_context and cond_field and cond_field in generated_detail:
-                    d = generated_detail[cond_field]
-                    user_prompt += (
-                        f"\n\n--- Context from '{cond_field}' (condition column) ---"
-                        f"\nPrompt used: {d['prompt']}"
-                        f"\nAnswer: {d['best_answer']}"
-                        f"\nExplanation: {d['explanation']}"
-                        f"\n---"
-                    )
-
                 image_url = ''
                 image_urls = []
+                thumb_urls = []
                 image_meta = None
-                if evaluate_condition(definition, all_context):
+                runs = condition_masks[out_col].iat[i]
+                if runs is None:
+                    runs = evaluate_condition(definition, {**raw_row_context, **generated})
+                if runs:
                     if mode == 'image':
-                        best_answer, explanation, image_url, all_paths, image_meta = _generate_image_for_tag(
+                        planned = image_planner.take(i, out_col) if image_planner is not None else None
+                        best_answer, explanation, image_url, all_paths, image_meta = planned or _generate_image_for_tag(
                             definition, rendered_prompt, images_dir, images_rel,
                             i, out_col, session_key, project_id, tagged_path,
                             row_data=all_context, naming_column=naming_column, image_format=image_format,
+                            trace=trace, writer=image_writer, batcher=image_batcher, job_queue=image_jobs,
                         )
                         image_urls = [settings.MEDIA_URL + p for p in all_paths]
+                        thumb_urls = [settings.MEDIA_URL + derivative_rel_path(p, 'thumb') for p in all_paths]
                     else:
-                        best_answer, explanation, usage = call_llm_tagging(system_prompt, user_prompt)
-                        record_stat(
-                            usage['host'], usage['port'], usage['model'],
-                            session_key, project_id,
-                            usage['prompt_tokens'], usage['completion_tokens'], usage['elapsed_sec'],
-                        )
+                        with trace_span(trace, 'llm_call', 'llm', row=i, column=out_col) as span:
+                            best_answer, explanation, usage = call_llm_tagging(system_prompt, user_prompt)
+                            span['prompt_tokens']     = usage['prompt_tokens']
+                            span['completion_tokens'] = usage['completion_tokens']
+                        with trace_span(trace, 'record_stat', 'io'):
+                            record_stat(
+                                usage['host'], usage['port'], usage['model'],
+                                session_key, project_id,
+                                usage['prompt_tokens'], usage['completion_tokens'], usage['elapsed_sec'],
+                            )
                         ps = PROGRESS_STATUS[session_key]
                         ps['prompt_tokens']     += usage['prompt_tokens']
                         ps['completion_tokens'] += usage['completion_tokens']
                         ps['llm_time_sec']      += usage['elapsed_sec']
                 else:
-                    best_answer = definition.get('DefaultValue', '').strip() or 'N/A'
-                    explanation = (
-                        f"Condition not met — "
-                        f"{definition.get('ConditionField','')} "
-                        f"{definition.get('ConditionOp','')} "
-                        f"'{definition.get('ConditionValue','')}' was false. "
-                        f"Default value used."
-                    )
+                    best_answer, explanation = condition_default(definition)
 
                 df.at[i, out_col] = best_answer
                 df.at[i, out_col + '_exp'] = explanation
@@ -2616,18 +5137,23 @@ def row_by_row_tagger(session_key, csv_path, config_path, input_columns,
 
                 # live_logs carry extra image_url/image_urls for the frontend
                 # (image_urls has every candidate when num_images > 1, for the
-                # grid thumbnail strip); log_entry above keeps its fixed base
+                # grid thumbnail strip; thumb_urls are their derivatives, which
+                # may still be rendering); log_entry above keeps its fixed base
                 # schema. retrieved_sources is similarly UI-only — the CSV's
                 # audit trail is the `_sources` column above.
                 live_entry = dict(log_entry)
                 live_entry["image_url"] = image_url
                 live_entry["image_urls"] = image_urls
+                live_entry["thumb_urls"] = thumb_urls
                 live_entry["image_meta"] = image_meta
                 live_entry["retrieved_sources"] = [c['source'] for c in retrieved_chunks]
-                live = PROGRESS_STATUS[session_key]["live_logs"]
-                live.append(live_entry)
-                if len(live) > 100:
-                    live.pop(0)
+                live_entry = append_live_event(event_log, live_entry)
+                PROGRESS_STATUS[session_key]["live_logs"].append(live_entry)
+                PROGRESS_STATUS[session_key]["event_total"] = event_log['next_seq']
+
+                # Enclosing span for the whole tag; the pause wait below is
+                # deliberately left out of it.
+                trace_complete(trace, 'tag', 'row', tag_start, row=i, column=out_col)
 
                 # Pause check (after each tag, not just each row). Also bails
                 # out immediately if the project was deleted out from under
@@ -2635,13 +5161,17 @@ def row_by_row_tagger(session_key, csv_path, config_path, input_columns,
                 # it up in that case, since PAUSE_FLAGS alone would leave it
                 # sleeping forever.
                 was_paused = False
+                pause_start = time.perf_counter()
                 while PAUSE_FLAGS.get(session_key, False) and not CANCEL_FLAGS.get(session_key, False):
                     if not was_paused:
                         PROGRESS_STATUS[session_key]['status'] = 'paused'
                         if project_id:
                             update_project(project_id, status='paused', done_rows=i)
+                        flush_run_trace(trace)
                         was_paused = True
                     time.sleep(0.5)
+                if was_paused:
+                    trace_complete(trace, 'paused', 'row', pause_start, row=i)
                 if was_paused and not CANCEL_FLAGS.get(session_key, False):
                     if project_id:
                         update_project(project_id, status='running')
@@ -2652,45 +5182,383 @@ def row_by_row_tagger(session_key, csv_path, config_path, input_columns,
             if CANCEL_FLAGS.get(session_key, False):
                 break
 
-            df.to_csv(tagged_path, index=False)
+            with trace_span(trace, 'to_csv', 'io', row=i), metrics.CSV_WRITE.time(kind='tagged'):
+                write_tagged_csv(df, tagged_path,
+                                 [(c, old, df.at[i, c]) for c, old in zip(written_cols, row_before)],
+                                 analytics)
+            trace_complete(trace, 'row', 'row', row_start, row=i)
+            flush_run_trace(trace)
+            metrics.ROWS_PROCESSED.inc(mode=mode)
             PROGRESS_STATUS[session_key]["done"]        = i + 1
+            PROGRESS_STATUS[session_key]["work_done"]  += 1
             PROGRESS_STATUS[session_key]["status"]      = f"Processing row {i + 1}/{total_rows}"
             PROGRESS_STATUS[session_key]["last_update"] = time.time()
 
+        # Saves still in flight belong to rows already written out: wait
+        # for them, and turn any that failed into ERROR cells (retryable
+        # like any failed generation).
+        save_failures = []
+        if image_writer is not None:
+            with trace_span(trace, 'drain_image_writes', 'io'):
+                save_failures = _mark_image_save_failures(df, image_writer.drain())
+
         if CANCEL_FLAGS.pop(session_key, False):
             # Either the project was deleted (its files are gone — don't
             # touch disk again) or the user hit Stop (project still exists,
-            # but every completed row up to here was already flushed to
-            # tagged_path by the per-row save above, so there's nothing left
-            # to write). Either way, just record where it stopped.
+            # and every completed row up to here was already flushed to
+            # tagged_path by the per-row save above — except for image
+            # saves that failed since, which still need their ERROR cells
+            # written). Either way, record where it stopped.
+            if save_failures and os.path.exists(tagged_path) and (not project_id or get_project(project_id)):
+                write_tagged_csv(df, tagged_path, save_failures, analytics)
             PAUSE_FLAGS.pop(session_key, None)
             PROGRESS_STATUS[session_key]["status"]      = "cancelled"
             PROGRESS_STATUS[session_key]["last_update"] = time.time()
+            metrics.RUNS_COMPLETED.inc(mode=mode, outcome='cancelled')
             if project_id:
                 update_project(project_id, status='cancelled', done_rows=PROGRESS_STATUS[session_key]["done"])
             return
 
-        df.to_csv(tagged_path, index=False)
+        with trace_span(trace, 'to_csv', 'io'), metrics.CSV_WRITE.time(kind='tagged'):
+            write_tagged_csv(df, tagged_path, save_failures, analytics)
         PROGRESS_STATUS[session_key]["status"]      = "finished"
         PROGRESS_STATUS[session_key]["done"]        = total_rows
         PROGRESS_STATUS[session_key]["last_update"] = time.time()
+        metrics.RUNS_COMPLETED.inc(mode=mode, outcome='finished')
 
         if project_id:
-            update_project(project_id, status='finished', done_rows=total_rows, total_rows=total_rows)
+            with trace_span(trace, 'update_project', 'io'):
+                update_project(project_id, status='finished', done_rows=total_rows, total_rows=total_rows)
 
         print(f"DEBUG: Tagging completed -> {tagged_path}")
 
     except Exception as e:
         PROGRESS_STATUS[session_key]["status"]      = f"error: {str(e)}"
         PROGRESS_STATUS[session_key]["last_update"] = time.time()
+        metrics.RUNS_COMPLETED.inc(mode=mode, outcome='error')
         print(f"Tagging Error: {e}")
         if project_id:
             update_project(project_id, status='error')
         try:
+            failures = image_writer.drain() if image_writer is not None else []
             if 'df' in locals() and 'tagged_path' in locals():
-                df.to_csv(tagged_path, index=False)
+                _mark_image_save_failures(df, failures)
+                write_tagged_csv(df, tagged_path)
         except Exception as save_error:
             print(f"ERROR: Failed to save partial progress: {save_error}")
+    finally:
+        if image_jobs is not None:
+            image_jobs.close()
+        close_run_trace(trace)
+        close_live_event_log(event_log)
+
+
+# ─── Text-mode run estimate ──────────────────────────────────────────────────
+# The text-mode counterpart to estimate_image_generation: rather than guess
+# from row counts, run the real prompts for a handful of rows against the
+# active Ollama host and extrapolate from what they actually cost. Rows are
+# sampled evenly across the file (first, last, and evenly spaced between) so
+# a CSV whose long-description rows all sit at the end isn't estimated off
+# its first five short ones.
+
+TEXT_ESTIMATE_SAMPLE_ROWS = 5
+
+
+def _stratified_sample_indices(n_rows, sample_size):
+    if n_rows <= 0 or sample_size <= 0:
+        return []
+    k = min(sample_size, n_rows)
+    return sorted({int(round(x)) for x in np.linspace(0, n_rows - 1, k)})
+
+
+# Prompt token profile. Ollama only reports one prompt_tokens figure per
+# call, so each sampled call's count is spread over its pieces (system prompt,
+# each context column, reference chunks, SendContext carry-over, task text)
+# in proportion to their length — calibrated per call, so a model whose
+# tokenizer is twice as dense as another's still sums to exactly what Ollama
+# counted. Servers that report no usage fall back to ~4 chars per token.
+PROFILE_FLAG_SHARE = 0.15      # flag a column costing >= 15% of all sampled prompt tokens
+PROFILE_TRIM_CHARS = 500       # "trim" projections assume values cut to this many characters
+
+
+def _profile_call(segments, system_prompt, parts, prompt_tokens):
+    """Add one sampled call's per-piece token attribution into segments,
+    keyed (segment, name) -> {'tokens', 'trimmable'}. 'trimmable' is the part
+    of a column value beyond PROFILE_TRIM_CHARS."""
+    total_chars = len(system_prompt) + sum(len(text) for _, _, text in parts)
+    if prompt_tokens and total_chars:
+        per_char = prompt_tokens / total_chars
+    else:
+        per_char = 1 / APPROX_CHARS_PER_TOKEN
+    pieces = [('system', 'system', system_prompt)] + parts
+    for seg, name, text in pieces:
+        entry = segments.setdefault((seg, name), {'tokens': 0.0, 'trimmable': 0.0, 'calls': 0})
+        entry['tokens'] += len(text) * per_char
+        entry['calls'] += 1
+        if seg == 'column':
+            value_len = len(text) - len(f"\n  {name}: ")
+            entry['trimmable'] += max(0, value_len - PROFILE_TRIM_CHARS) * per_char
+
+
+def _sec_per_prompt_token(fits):
+    """Prefill cost per prompt token, from a no-intercept least-squares fit of
+    call time against (prompt_tokens, completion_tokens) over the sample.
+    Returns 0.0 when the sample can't separate the two (too few calls, or no
+    variation) — the profile then reports token savings without a time."""
+    if len(fits) < 2:
+        return 0.0
+    a = np.array([[p, c] for p, c, _ in fits], dtype=float)
+    b = np.array([t for _, _, t in fits], dtype=float)
+    if np.linalg.matrix_rank(a) < 2:
+        return 0.0
+    coef = np.linalg.lstsq(a, b, rcond=None)[0]
+    return max(0.0, float(coef[0]))
+
+
+def _build_prompt_profile(output_definitions, per_tag, tags, csv_columns, fits):
+    """Turn the per-tag segment tallies from estimate_text_run into per-tag
+    breakdowns plus a per-column view that flags the expensive ones. A
+    flagged column nobody's PromptTemplate references by {name} can simply be
+    left out of InputColumns; one that is referenced is marked for trimming
+    instead, since excluding it would break the substitution."""
+    expected = {t['column']: t['expected_calls'] for t in tags}
+    referenced = set()
+    for d in output_definitions:
+        referenced.update(re.findall(r'\{([^{}]+)\}', d.get('PromptTemplate', '')))
+    sec_per_token = _sec_per_prompt_token(fits)
+
+    tag_profiles = []
+    columns = {}
+    grand_total = 0.0
+    for d in output_definitions:
+        out_col = d['OutputColumn']
+        stats = per_tag[out_col]
+        calls = stats['calls']
+        seg_total = sum(e['tokens'] for e in stats['segments'].values())
+        grand_total += seg_total
+        segments = []
+        for (seg, name), e in sorted(stats['segments'].items(), key=lambda kv: -kv[1]['tokens']):
+            segments.append({
+                'segment':    seg,
+                'name':       name,
+                'avg_tokens': round(e['tokens'] / calls, 1) if calls else 0,
+                'share':      round(e['tokens'] / seg_total, 3) if seg_total else 0,
+            })
+            if seg != 'column':
+                continue
+            col = columns.setdefault(name, {'sampled_tokens': 0.0, 'projected_tokens': 0.0,
+                                            'projected_trimmable': 0.0, 'tags': []})
+            col['sampled_tokens'] += e['tokens']
+            if calls:
+                col['projected_tokens']    += e['tokens'] / calls * expected[out_col]
+                col['projected_trimmable'] += e['trimmable'] / calls * expected[out_col]
+            col['tags'].append(out_col)
+        tag_profiles.append({
+            'column':            out_col,
+            'avg_prompt_tokens': round(seg_total / calls, 1) if calls else 0,
+            'segments':          segments,
+        })
+
+    column_rows = []
+    for name, col in sorted(columns.items(), key=lambda kv: -kv[1]['sampled_tokens']):
+        share = col['sampled_tokens'] / grand_total if grand_total else 0
+        is_referenced = name in referenced
+        flag = ''
+        saved = 0.0
+        if share >= PROFILE_FLAG_SHARE:
+            if not is_referenced:
+                flag, saved = 'exclude', col['projected_tokens']
+            elif col['projected_trimmable'] > 0:
+                flag, saved = 'trim', col['projected_trimmable']
+        column_rows.append({
+            'name':             name,
+            'kind':             'input' if name in csv_columns else 'generated',
+            'share':            round(share, 3),
+            'projected_tokens': int(round(col['projected_tokens'])),
+            'referenced':       is_referenced,
+            'tags':             col['tags'],
+            'flag':             flag,
+            'saved_tokens':     int(round(saved)),
+            'saved_sec':        round(saved * sec_per_token, 1),
+        })
+
+    return {
+        'token_source':         'ollama' if any(s['prompt_tokens'] for s in per_tag.values()) else 'estimated',
+        'sec_per_prompt_token': round(sec_per_token, 5),
+        'flag_share':           PROFILE_FLAG_SHARE,
+        'trim_chars':           PROFILE_TRIM_CHARS,
+        'tags':                 tag_profiles,
+        'columns':              column_rows,
+    }
+
+
+def estimate_text_run(csv_path, input_columns, output_definitions, project_id=None,
+                      sample_size=TEXT_ESTIMATE_SAMPLE_ROWS, context_budgets=None):
+    """Render and run every tag's real prompt (conditions, retrieval and
+    SendContext carry-over included) for a stratified sample of rows, then
+    extrapolate tokens, wall time and skipped cells to the whole file.
+
+    Skipped-cell counts are exact for tags whose ConditionField is an input
+    column (evaluated over every row, no LLM needed) and sampled for tags
+    conditioned on a generated column. Wall time assumes the sequential
+    row_by_row_tagger loop — one call in flight at a time.
+
+    The same sample calls feed 'prompt_profile' (see _build_prompt_profile):
+    where each tag's prompt tokens go, and which context columns are worth
+    trimming or dropping from InputColumns.
+
+    context_budgets (see parse_context_budgets; defaults to the project's
+    saved ones) are applied exactly as the real run applies them. Summaries
+    made for sampled rows land in the shared summary cache, and the one-off
+    cost of summarizing the rest of the file's distinct over-budget values
+    is added to the wall-time estimate.
+
+    Raises ValueError when there is nothing to estimate.
+    """
+    df = read_csv_safe(csv_path)
+    total_rows = len(df)
+    if total_rows == 0:
+        raise ValueError('CSV has no rows.')
+    if not output_definitions:
+        raise ValueError('Define at least one output tag first.')
+
+    context_cols = [c for c in input_columns if c in df.columns] if input_columns else list(df.columns)
+    output_col_names = [d['OutputColumn'] for d in output_definitions]
+    system_prompt = build_system_prompt(total_rows, context_cols, output_col_names)
+
+    per_tag = {
+        col: {'calls': 0, 'skipped': 0, 'errors': 0, 'prompt_tokens': 0,
+              'completion_tokens': 0, 'elapsed_sec': 0.0, 'retrieval_sec': 0.0,
+              'segments': {}}
+        for col in output_col_names
+    }
+    fits = []  # (prompt_tokens, completion_tokens, elapsed_sec) per successful sample call
+    sample_idx = _stratified_sample_indices(total_rows, sample_size)
+
+    budgets = (parse_context_budgets(context_budgets) if context_budgets is not None
+               else get_project_context_budgets(project_id))
+    summary_cache = load_summary_cache(csv_path) if budgets['columns'] else None
+    summarized, summary_sec = 0, 0.0
+
+    for i in sample_idx:
+        row = df.loc[i]
+        raw_row_context = {c: row[c] for c in df.columns}
+        cached_before = len(summary_cache) if summary_cache is not None else 0
+        t0 = time.time()
+        all_row_context = apply_context_budgets(raw_row_context, budgets, summary_cache, csv_path)
+        if summary_cache is not None and len(summary_cache) > cached_before:
+            summarized  += len(summary_cache) - cached_before
+            summary_sec += time.time() - t0
+        row_context = {c: all_row_context[c] for c in context_cols}
+        generated, generated_detail = {}, {}
+
+        for definition in output_definitions:
+            out_col = definition['OutputColumn']
+            stats = per_tag[out_col]
+            full_context = {**row_context, **generated}
+            all_context  = {**all_row_context, **generated}
+            rendered_prompt, display_context = render_tag_prompt(definition, full_context, all_context)
+
+            if evaluate_condition(definition, {**raw_row_context, **generated}):
+                retrieval_cfg = parse_retrieval_config(definition)
+                retrieved_chunks = []
+                if retrieval_cfg['enabled'] and project_id:
+                    t0 = time.time()
+                    query_text = " ".join(str(v) for v in display_context.values())
+                    retrieved_chunks = retrieve_reference_chunks(project_id, query_text, top_k=retrieval_cfg['top_k'])
+                    stats['retrieval_sec'] += time.time() - t0
+                parts = build_user_prompt_parts(
+                    definition, i, total_rows, display_context, rendered_prompt,
+                    retrieved_chunks, generated_detail,
+                )
+                user_prompt = "".join(text for _, _, text in parts)
+                best_answer, explanation, usage = call_llm_tagging(system_prompt, user_prompt)
+                stats['calls']             += 1
+                stats['prompt_tokens']     += usage['prompt_tokens']
+                stats['completion_tokens'] += usage['completion_tokens']
+                stats['elapsed_sec']       += usage['elapsed_sec']
+                if best_answer == 'ERROR':
+                    stats['errors'] += 1
+                else:
+                    fits.append((usage['prompt_tokens'], usage['completion_tokens'], usage['elapsed_sec']))
+                _profile_call(stats['segments'], system_prompt, parts, usage['prompt_tokens'])
+            else:
+                stats['skipped'] += 1
+                best_answer = definition.get('DefaultValue', '').strip() or 'N/A'
+                explanation = 'Condition not met — default value used.'
+
+            generated[out_col] = best_answer
+            generated_detail[out_col] = {
+                'prompt': rendered_prompt, 'best_answer': best_answer, 'explanation': explanation,
+            }
+
+    # Conditions on an input column don't depend on any LLM output, so their
+    # skip count over the whole file is known exactly — no need to trust a
+    # five-row sample for those.
+    tags = []
+    for definition in output_definitions:
+        out_col = definition['OutputColumn']
+        stats = per_tag[out_col]
+        cond_field = definition.get('ConditionField', '').strip()
+        sampled = stats['calls'] + stats['skipped']
+        if cond_field and cond_field not in output_col_names and cond_field in df.columns:
+            skipped_total = int((~evaluate_condition_frame(definition, df, output_col_names)).sum())
+            skip_exact = True
+        else:
+            skipped_total = round(stats['skipped'] / sampled * total_rows) if sampled else 0
+            skip_exact = not cond_field
+        expected_calls = total_rows - skipped_total
+
+        calls = stats['calls']
+        avg_prompt     = stats['prompt_tokens'] / calls if calls else 0
+        avg_completion = stats['completion_tokens'] / calls if calls else 0
+        avg_sec        = (stats['elapsed_sec'] + stats['retrieval_sec']) / calls if calls else 0
+        tags.append({
+            'column':                out_col,
+            'sampled_calls':         calls,
+            'sampled_errors':        stats['errors'],
+            'avg_prompt_tokens':     round(avg_prompt, 1),
+            'avg_completion_tokens': round(avg_completion, 1),
+            'avg_call_sec':          round(avg_sec, 3),
+            'expected_calls':        expected_calls,
+            'expected_skipped':      skipped_total,
+            'skip_count_exact':      skip_exact,
+            'total_prompt_tokens':     int(round(avg_prompt * expected_calls)),
+            'total_completion_tokens': int(round(avg_completion * expected_calls)),
+            'total_sec':             round(avg_sec * expected_calls, 1),
+        })
+
+    # Summaries are paid once per distinct over-budget value, not per row or
+    # per tag — count exactly how many the full run still has to make.
+    pending_summaries = 0
+    if summary_cache is not None:
+        model = budgets['summary_model'] or get_active_connection()['model']
+        for col, spec in budgets['columns'].items():
+            if not spec['summarize'] or col not in df.columns:
+                continue
+            max_chars = spec['max_tokens'] * APPROX_CHARS_PER_TOKEN
+            for val in df[col].dropna().astype(str).unique():
+                if len(val) > max_chars and _summary_key(val, spec['max_tokens'], model) not in summary_cache:
+                    pending_summaries += 1
+    summary_estimate_sec = pending_summaries * (summary_sec / summarized) if summarized else 0.0
+
+    conn = get_active_connection()
+    return {
+        'pending_summaries':       pending_summaries,
+        'summary_estimate_sec':    round(summary_estimate_sec, 1),
+        'prompt_profile':          _build_prompt_profile(output_definitions, per_tag, tags, df.columns, fits),
+        'model':                   conn.get('model', ''),
+        'host':                    f"{conn.get('host', '')}:{conn.get('port', '')}",
+        'row_count':               total_rows,
+        'sampled_rows':            [int(i) for i in sample_idx],
+        'sample_llm_sec':          round(sum(s['elapsed_sec'] + s['retrieval_sec'] for s in per_tag.values()), 2),
+        'tags':                    tags,
+        'total_prompt_tokens':     sum(t['total_prompt_tokens'] for t in tags),
+        'total_completion_tokens': sum(t['total_completion_tokens'] for t in tags),
+        'total_expected_calls':    sum(t['expected_calls'] for t in tags),
+        'total_expected_skipped':  sum(t['expected_skipped'] for t in tags),
+        'total_estimate_sec':      round(sum(t['total_sec'] for t in tags) + summary_estimate_sec, 1),
+    }
 
 
 # ─── Helpers ─────────────────────────────────────────────────────────────────
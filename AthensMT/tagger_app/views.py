@@ -10,10 +10,11 @@ from itertools import zip_longest
 from django.shortcuts import render, redirect
 from django.conf import settings
 from django.core.files.storage import FileSystemStorage
-from django.http import JsonResponse, HttpResponse
+from django.http import JsonResponse, HttpResponse, FileResponse, StreamingHttpResponse
 from django.core.cache import cache
 import pandas as pd
 
+from . import metrics
 from .forms import UploadForm
 from .utils import (
     PROGRESS_STATUS,
@@ -67,9 +68,19 @@ from .utils import (
     load_style_presets,
     render_tag_prompt,
     estimate_image_generation,
+    estimate_text_run,
+    parse_context_budgets,
+    APPROX_CHARS_PER_TOKEN,
     regenerate_image_cell,
-    list_image_candidates,
+    list_image_candidates_for_cells,
+    backfill_image_derivatives_once,
+    derivative_rel_path,
+    image_display_urls,
+    query_results,
+    RESULTS_REVIEW_FILTERS,
     select_image_candidate,
+    load_results_analytics,
+    compact_cell_edits_when_idle,
     load_review_state,
     set_review_state,
     BULK_RETRY_STATUS,
@@ -78,8 +89,19 @@ from .utils import (
     compare_models_generate,
     images_dir_for_tagged_path,
     tagged_path_for_project,
-    build_gallery_items,
-    build_gallery_zip,
+    GALLERY_PAGE_SIZE,
+    GALLERY_REVIEW_FILTERS,
+    query_gallery,
+    gallery_zip_plan,
+    iter_gallery_zip,
+    export_gallery_zip,
+    gallery_export_path,
+    GALLERY_EXPORT_STATUS,
+    GALLERY_ZIP_BACKGROUND_MIN_FILES,
+    get_run_trace_path,
+    get_live_events_path,
+    read_live_events,
+    LIVE_TAIL_SIZE,
     REFERENCE_INDEX_STATUS,
     build_reference_index,
     get_reference_manifest,
@@ -140,6 +162,11 @@ def llm_status_view(request):
     })
 
 
+def metrics_view(request):
+    """Prometheus scrape target — text exposition format, see metrics.py."""
+    return HttpResponse(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
 # ─── Home / Projects dashboard ───────────────────────────────────────────────
 
 def home_view(request):
@@ -157,6 +184,17 @@ def home_view(request):
             p['live_total']  = p.get('total_rows', 0)
             p['live_status'] = p.get('status', 'idle')
             p['is_live']     = False
+        # Sidecar only — a project without a current one just shows no
+        # summary rather than paying for a full scan on the dashboard.
+        tagged_file = tagged_path_for_project(p)
+        analytics = load_results_analytics(tagged_file, rebuild=False) if tagged_file else None
+        if analytics:
+            p['error_cells']    = sum(stats['errors'] for stats in analytics['columns'].values())
+            p['yes_no_summary'] = [
+                {'column': col['column'],
+                 'yes_pct': next((seg['pct'] for seg in col['segments'] if seg['label'] == 'YES'), 0)}
+                for col in _build_yes_no_analytics(analytics)[:2]
+            ]
 
     return render(request, 'home.html', {
         'projects':         projects,
@@ -302,6 +340,64 @@ def upload_file_view(request):
 
 # ─── Define columns ──────────────────────────────────────────────────────────
 
+def _tag_definitions_from_post(post):
+    """The Define Columns form's tag cards as config rows — shared by the
+    Save handler and the text-mode estimate, which runs whatever is on screen
+    right now rather than the last-saved config."""
+    output_cols      = post.getlist('output_column')
+    prompts          = post.getlist('prompt_template')
+    condition_fields = post.getlist('condition_field')
+    condition_ops    = post.getlist('condition_op')
+    condition_values = post.getlist('condition_value')
+    default_values   = post.getlist('default_value')
+    send_contexts    = post.getlist('send_context')
+    tag_input_cols   = post.getlist('tag_input_cols')
+    image_params     = post.getlist('image_params')
+    retrieval_configs = post.getlist('retrieval_config')
+    node_xs          = post.getlist('node_x')
+    node_ys          = post.getlist('node_y')
+
+    new_config = []
+    # zip_longest: image_params/node_x/node_y/retrieval_config are absent in some
+    # contexts (fills to ''); other arrays are always one-per-card thanks to the
+    # mirrored-hidden inputs.
+    for oc, pt, cf, cop, cv, dv, sc, tic, ip, rc, nx, ny in zip_longest(
+        output_cols, prompts,
+        condition_fields, condition_ops, condition_values, default_values,
+        send_contexts, tag_input_cols, image_params, retrieval_configs, node_xs, node_ys,
+        fillvalue='',
+    ):
+        if (oc or '').strip() and (pt or '').strip():
+            new_config.append({
+                "OutputColumn":   oc.strip(),
+                "PromptTemplate": pt.strip(),
+                "ConditionField": (cf or '').strip(),
+                "ConditionOp":    (cop or '').strip(),
+                "ConditionValue": (cv or '').strip(),
+                "DefaultValue":   (dv or '').strip(),
+                "SendContext":    (sc or '').strip(),
+                "InputColumns":   (tic or '').strip(),
+                "ImageParams":    (ip or '').strip(),
+                "RetrievalConfig": (rc or '').strip(),
+                "NodeX":          (nx or '').strip(),
+                "NodeY":          (ny or '').strip(),
+            })
+    return new_config
+
+
+def _context_budgets_from_post(post):
+    """The Context Budgets card as the JSON stored in the project's
+    context_budgets cell. A column with a blank/zero budget is left out
+    entirely rather than stored as 'unlimited'."""
+    columns = {}
+    for col, max_tokens in zip(post.getlist('budget_column'), post.getlist('budget_tokens')):
+        columns[col] = {'max_tokens': max_tokens,
+                        'summarize': col in post.getlist('budget_summarize')}
+    budgets = parse_context_budgets({'columns': columns,
+                                     'summary_model': post.get('summary_model', '')})
+    return json.dumps(budgets) if budgets['columns'] else ''
+
+
 def define_columns_view(request):
     csv_path    = request.session.get('csv_filepath')
     config_path = request.session.get('config_filepath')
@@ -316,46 +412,9 @@ def define_columns_view(request):
 
     if request.method == 'POST':
         input_cols       = request.POST.getlist('input_columns')
-        output_cols      = request.POST.getlist('output_column')
-        prompts          = request.POST.getlist('prompt_template')
-        condition_fields = request.POST.getlist('condition_field')
-        condition_ops    = request.POST.getlist('condition_op')
-        condition_values = request.POST.getlist('condition_value')
-        default_values   = request.POST.getlist('default_value')
-        send_contexts    = request.POST.getlist('send_context')
-        tag_input_cols   = request.POST.getlist('tag_input_cols')
-        image_params     = request.POST.getlist('image_params')
-        retrieval_configs = request.POST.getlist('retrieval_config')
-        node_xs          = request.POST.getlist('node_x')
-        node_ys          = request.POST.getlist('node_y')
         image_naming_col = request.POST.get('image_naming_column', '').strip()
         image_format     = (request.POST.get('image_format', '').strip() or 'png').lower()
-
-        new_config = []
-        # zip_longest: image_params/node_x/node_y/retrieval_config are absent in some
-        # contexts (fills to ''); other arrays are always one-per-card thanks to the
-        # mirrored-hidden inputs.
-        for oc, pt, cf, cop, cv, dv, sc, tic, ip, rc, nx, ny in zip_longest(
-            output_cols, prompts,
-            condition_fields, condition_ops, condition_values, default_values,
-            send_contexts, tag_input_cols, image_params, retrieval_configs, node_xs, node_ys,
-            fillvalue='',
-        ):
-            if (oc or '').strip() and (pt or '').strip():
-                new_config.append({
-                    "OutputColumn":   oc.strip(),
-                    "PromptTemplate": pt.strip(),
-                    "ConditionField": (cf or '').strip(),
-                    "ConditionOp":    (cop or '').strip(),
-                    "ConditionValue": (cv or '').strip(),
-                    "DefaultValue":   (dv or '').strip(),
-                    "SendContext":    (sc or '').strip(),
-                    "InputColumns":   (tic or '').strip(),
-                    "ImageParams":    (ip or '').strip(),
-                    "RetrievalConfig": (rc or '').strip(),
-                    "NodeX":          (nx or '').strip(),
-                    "NodeY":          (ny or '').strip(),
-                })
+        new_config       = _tag_definitions_from_post(request.POST)
 
         if not config_path:
             base, _ = os.path.splitext(csv_path)
@@ -372,6 +431,8 @@ def define_columns_view(request):
             if mode == 'image':
                 update_kwargs['image_naming_column'] = image_naming_col
                 update_kwargs['image_format'] = image_format
+            else:
+                update_kwargs['context_budgets'] = _context_budgets_from_post(request.POST)
             update_project(project_id, **update_kwargs)
 
         # "Test Run" — duplicate this project into a throwaway copy holding
@@ -450,6 +511,23 @@ def define_columns_view(request):
 
         context['image_naming_column'] = (proj.get('image_naming_column', '') if proj else '') or ''
         context['image_format'] = (proj.get('image_format', '') if proj else '') or 'png'
+    else:
+        # Context budgets card: one row per column with its saved budget and
+        # the column's longest value in approximate tokens, so it's obvious
+        # which columns are worth budgeting at all.
+        budgets = parse_context_budgets((proj or {}).get('context_budgets', ''))
+        max_lens = df.astype(str).apply(lambda c: c.str.len().max() if len(c) else 0)
+        context['budget_rows'] = [
+            {
+                'column':      col,
+                'max_tokens':  budgets['columns'].get(col, {}).get('max_tokens', ''),
+                'summarize':   budgets['columns'].get(col, {}).get('summarize', False),
+                'longest_tokens': int(max_lens.get(col, 0) or 0) // APPROX_CHARS_PER_TOKEN,
+            }
+            for col in all_columns
+        ]
+        context['summary_model'] = budgets['summary_model']
+        context['budgets_active'] = bool(budgets['columns'])
     return render(request, 'define_columns.html', context)
 
 
@@ -507,6 +585,35 @@ def estimate_image_view(request):
     })
 
 
+def estimate_text_view(request):
+    """Text-mode 'Estimate Run' — runs the on-screen tag config (unsaved
+    edits included) against a stratified sample of real rows on the active
+    host, then extrapolates tokens, time and skipped cells to the full file.
+    See utils.estimate_text_run."""
+    if request.method != 'POST':
+        return JsonResponse({'success': False, 'error': 'POST required.'}, status=400)
+
+    csv_path = request.session.get('csv_filepath')
+    if not csv_path or not os.path.exists(csv_path):
+        return JsonResponse({'success': False, 'error': 'No CSV loaded.'}, status=400)
+
+    definitions = _tag_definitions_from_post(request.POST)
+    if not definitions:
+        return JsonResponse({'success': False, 'error': 'Define at least one output tag first.'}, status=400)
+
+    try:
+        estimate = estimate_text_run(
+            csv_path, request.POST.getlist('input_columns'), definitions,
+            project_id=request.session.get('project_id'),
+            context_budgets=_context_budgets_from_post(request.POST) or {},
+        )
+    except ValueError as e:
+        return JsonResponse({'success': False, 'error': str(e)}, status=400)
+    except Exception as e:
+        return JsonResponse({'success': False, 'error': str(e)})
+    return JsonResponse({'success': True, **estimate})
+
+
 # ─── Reference data (retrieval) ──────────────────────────────────────────────
 
 def build_reference_index_view(request):
@@ -732,9 +839,16 @@ def tagging_progress_view(request):
         return JsonResponse({'error': 'No progress data found'}, status=400)
 
     progress_data = PROGRESS_STATUS[session_key]
+    # `since` is the next event sequence number the page hasn't shown. A
+    # fresh page (since=0) starts from the in-memory tail and pages back via
+    # tagging_events_view; a page that fell behind the tail mid-run catches
+    # up from the on-disk log a page at a time.
     since         = int(request.GET.get('since', 0))
-    live_logs     = progress_data.get("live_logs", [])
-    new_logs      = live_logs[since:]
+    tail          = list(progress_data.get("live_logs", []))
+    if since and tail and since < tail[0]['seq'] and progress_data.get("events_path"):
+        new_logs, _ = read_live_events(progress_data["events_path"], after=since)
+    else:
+        new_logs = [e for e in tail if e['seq'] >= since]
 
     tagged_file_path = cache.get(f"tagged_file_{session_key}")
     files_saved      = bool(tagged_file_path and os.path.exists(tagged_file_path))
@@ -742,7 +856,11 @@ def tagging_progress_view(request):
     done      = progress_data["done"]
     total     = progress_data["total"]
     elapsed   = time.time() - progress_data.get("start_time", time.time())
-    remaining = ((elapsed / done) * (total - done)) if done > 0 and total > done else None
+    # ETA from rows that actually hit the model — rows pre-filled by an
+    # input-column condition cost nothing and would skew a per-row average.
+    work_done  = progress_data.get("work_done", done)
+    work_total = progress_data.get("work_total", total)
+    remaining = ((elapsed / work_done) * (work_total - work_done)) if work_done > 0 and work_total > work_done else None
 
     return JsonResponse({
         "done":        done,
@@ -750,10 +868,16 @@ def tagging_progress_view(request):
         "status":      progress_data["status"],
         "paused":      PAUSE_FLAGS.get(session_key, False),
         "logs":        new_logs,
-        "log_total":   len(live_logs),
+        "log_total":   progress_data.get("event_total", 0),
+        "next_since":  new_logs[-1]['seq'] + 1 if new_logs else since,
         "files_saved": files_saved,
         "elapsed":     elapsed,
         "remaining":   remaining,
+        "work_done":      work_done,
+        "work_total":     work_total,
+        "prefilled_rows": progress_data.get("prefilled_rows", 0),
+        "image_switches": progress_data.get("image_switches"),
+        "image_queue":    progress_data.get("image_queue"),
         "prompt_tokens":     progress_data.get("prompt_tokens", 0),
         "completion_tokens": progress_data.get("completion_tokens", 0),
         "llm_time_sec":      progress_data.get("llm_time_sec", 0.0),
@@ -829,66 +953,17 @@ def results_view(request):
         else:
             return redirect('upload_file')
 
-    df            = pd.read_csv(tagged_file)
-    table_columns = df.columns.tolist()
+    # The download link serves the CSV file itself, so fold in any pending
+    # cell edits first (deferred if a run is still writing it).
+    compact_cell_edits_when_idle(tagged_file)
     mode          = _project_mode(request)
-    review_state  = load_review_state(tagged_file) if mode == 'image' else {}
+    analytics     = load_results_analytics(tagged_file)
+    # Rows themselves are paged in by the table from results_data_view; the
+    # page only needs the header and the sidecar's totals.
+    table_columns = pd.read_csv(tagged_file, nrows=0).columns.tolist()
     review_filter = (request.GET.get('filter', 'all') or 'all') if mode == 'image' else 'all'
-
-    # Build cells tagged with whether they point at a generated image, so the
-    # template can render a thumbnail (+ grid picker / regenerate) instead of
-    # a raw path.
-    image_exts = ('.png', '.jpg', '.jpeg', '.webp')
-
-    def build_row(row_index, row):
-        cells = []
-        row_matches = (review_filter == 'all')
-        for col in table_columns:
-            cell = row[col]
-            if isinstance(cell, float) and pd.isna(cell):
-                cells.append({'value': '', 'is_image': False, 'url': '', 'candidates_json': '[]',
-                              'column': col, 'row_index': int(row_index), 'review': ''})
-                continue
-            sval   = str(cell)
-            is_img = sval.lower().endswith(image_exts)
-            is_err = sval.startswith('ERROR:')
-            review = review_state.get(f"{row_index}:{col}", '') if (mode == 'image' and is_img) else ''
-            candidates = list_image_candidates(tagged_file, row_index, col) if (mode == 'image' and (is_img or is_err)) else []
-            if mode == 'image' and review_filter != 'all' and (is_img or is_err):
-                if review_filter == 'error' and is_err:
-                    row_matches = True
-                elif review_filter == 'unreviewed' and is_img and not review:
-                    row_matches = True
-                elif review_filter in ('approved', 'rejected') and review == review_filter:
-                    row_matches = True
-            cells.append({
-                'value':          sval,
-                'is_image':       is_img,
-                'is_image_error': is_err and mode == 'image',
-                'url':            (settings.MEDIA_URL + sval) if is_img else '',
-                'candidates_json': json.dumps(candidates),
-                'column':         col,
-                'row_index':      int(row_index),
-                'review':         review,
-            })
-        return cells, row_matches
-
-    table_rows = []
-    if mode == 'image':
-        MAX_ROWS = 50
-        for row_index, row in df.iterrows():
-            cells, matches = build_row(row_index, row)
-            if matches:
-                table_rows.append(cells)
-            if len(table_rows) >= MAX_ROWS:
-                break
-        err_mask = df[table_columns].astype(str).apply(lambda col: col.str.startswith('ERROR:'))
-        error_cell_count = int(err_mask.values.sum())
-    else:
-        for row_index, row in df.head(10).iterrows():
-            cells, _ = build_row(row_index, row)
-            table_rows.append(cells)
-        error_cell_count = 0
+    error_cell_count = (sum(stats['errors'] for stats in analytics['columns'].values())
+                        if mode == 'image' else 0)
 
     def _media_rel(p):
         return os.path.relpath(p, settings.MEDIA_ROOT).replace(os.sep, '/')
@@ -898,42 +973,45 @@ def results_view(request):
     return render(request, 'results.html', {
         "tagged_file_url":   tagged_file_url,
         "table_columns":     table_columns,
-        "table_rows":        table_rows,
+        "media_url":         settings.MEDIA_URL,
         "mode":              mode,
         "review_filter":     review_filter,
         "error_cell_count":  error_cell_count,
-        "total_rows":        len(df),
-        "shown_rows":        len(table_rows),
-        "analytics_columns": _build_yes_no_analytics(df, table_columns),
+        "total_rows":        analytics['rows'],
+        "analytics_columns": _build_yes_no_analytics(analytics),
+        "numeric_columns":   _build_numeric_analytics(analytics),
+        "error_columns":     [{'column': col, 'errors': stats['errors']}
+                              for col, stats in analytics['columns'].items() if stats['errors']],
     })
 
 
 # Categorical breakdown shown on the Results "Analytics" tab: any column
 # (over the FULL tagged dataset, not just the preview rows) whose non-empty
 # values are entirely YES/NO/N-A. Colors mirror the app's status palette so
-# YES/NO read as affirmative/negative at a glance.
+# YES/NO read as affirmative/negative at a glance. Built from the analytics
+# sidecar's per-column counts (see load_results_analytics), so the cost is
+# independent of the dataset's size.
 _ANALYTICS_CATEGORIES = ['YES', 'NO', 'N/A']
 _ANALYTICS_COLORS = {'YES': '#0ca30c', 'NO': '#d03b3b', 'N/A': '#898781'}
 
 
-def _build_yes_no_analytics(df, table_columns):
+def _build_yes_no_analytics(results_analytics):
     analytics = []
-    for col in table_columns:
-        if col.endswith('_exp'):
+    for col, stats in results_analytics['columns'].items():
+        if col.endswith('_exp') or not stats['counts']:
             continue
-        values = df[col].dropna().astype(str).str.strip().str.upper()
-        values = values[values != '']
-        values = values.replace({'NA': 'N/A'})
-        if values.empty:
-            continue
-        uniques = set(values.unique())
-        if not uniques <= set(_ANALYTICS_CATEGORIES) or not (uniques & {'YES', 'NO'}):
+        values = {}
+        for value, count in stats['counts'].items():
+            label = value.upper()
+            label = 'N/A' if label == 'NA' else label
+            values[label] = values.get(label, 0) + count
+        if not set(values) <= set(_ANALYTICS_CATEGORIES) or not (set(values) & {'YES', 'NO'}):
             continue
 
-        total = len(values)
+        total = sum(values.values())
         segments = []
         for cat in _ANALYTICS_CATEGORIES:
-            count = int((values == cat).sum())
+            count = values.get(cat, 0)
             if count:
                 segments.append({
                     'label': cat,
@@ -945,6 +1023,87 @@ def _build_yes_no_analytics(df, table_columns):
     return analytics
 
 
+def _build_numeric_analytics(results_analytics):
+    """Count/mean/min/max for every column whose non-empty cells are all numbers."""
+    summaries = []
+    for col, stats in results_analytics['columns'].items():
+        numeric = stats['numeric']
+        if col.endswith('_exp') or not numeric['count'] or numeric['count'] != stats['non_empty']:
+            continue
+        summaries.append({
+            'column': col,
+            'count':  numeric['count'],
+            'mean':   round(numeric['sum'] / numeric['count'], 4),
+            'min':    numeric['min'],
+            'max':    numeric['max'],
+        })
+    return summaries
+
+
+def results_data_view(request):
+    """One page of the Results table as JSON (GET).
+
+    Params: cursor (from the previous page's next_cursor), limit, columns
+    (comma-separated projection), sort (column name, '-' prefix for
+    descending), q (substring search), match_column + match_value, and
+    filter — 'error' or, in image mode, 'approved' | 'rejected' |
+    'unreviewed', the same vocabulary as the page's filter select. Image-mode
+    rows also carry each image/ERROR cell's review mark and candidates.
+    """
+    tagged_file, _config_path, _session_key, _project_id = _resolve_project_context(request)
+    if not tagged_file:
+        # Same fallback as results_view: the tagged file next to the upload.
+        csv_path = request.session.get('csv_filepath')
+        auto_tagged = os.path.splitext(csv_path)[0] + '_tagged.csv' if csv_path else ''
+        tagged_file = auto_tagged if auto_tagged and os.path.exists(auto_tagged) else None
+    if not tagged_file:
+        return JsonResponse({'success': False, 'error': 'No tagged file for this session.'}, status=400)
+
+    sort = request.GET.get('sort', '').strip()
+    row_filter = request.GET.get('filter', '').strip()
+    try:
+        page = query_results(
+            tagged_file,
+            columns=[c for c in request.GET.get('columns', '').split(',') if c],
+            sort=sort.lstrip('-'),
+            descending=sort.startswith('-'),
+            search=request.GET.get('q', ''),
+            match_column=request.GET.get('match_column', '').strip(),
+            match_value=request.GET.get('match_value', ''),
+            errors_only=row_filter == 'error',
+            review=row_filter if row_filter in RESULTS_REVIEW_FILTERS else '',
+            cursor=request.GET.get('cursor') or 0,
+            limit=request.GET.get('limit') or 100,
+        )
+    except ValueError as e:
+        return JsonResponse({'success': False, 'error': str(e)}, status=400)
+
+    if _project_mode(request) == 'image':
+        review_state = load_review_state(tagged_file)
+        image_cells = [(row['row_index'], col)
+                       for row in page['rows']
+                       for col, value in zip(page['columns'], row['values'])
+                       if value.lower().endswith(('.png', '.jpg', '.jpeg', '.webp')) or value.startswith('ERROR:')]
+        candidates = list_image_candidates_for_cells(tagged_file, image_cells)
+        backfill_image_derivatives_once(tagged_file)
+        values = {(row['row_index'], col): value
+                  for row in page['rows'] for col, value in zip(page['columns'], row['values'])}
+        thumbs = image_display_urls(tagged_file, [values[cell] for cell in image_cells
+                                                  if not values[cell].startswith('ERROR:')])
+        by_row = {}
+        for row_index, col in image_cells:
+            by_row.setdefault(row_index, []).append(col)
+        for row in page['rows']:
+            cols = by_row.get(row['row_index'], [])
+            row['review'] = {c: review_state[f"{row['row_index']}:{c}"]
+                             for c in cols if f"{row['row_index']}:{c}" in review_state}
+            row['candidates'] = {c: candidates[(row['row_index'], c)] for c in cols}
+            row['thumbs'] = {c: thumbs[values[(row['row_index'], c)]]
+                             for c in cols if values[(row['row_index'], c)] in thumbs}
+
+    return JsonResponse({'success': True, **page})
+
+
 def set_review_view(request):
     """Lightweight approve/reject — one click, no CSV write, sidecar JSON only."""
     if request.method != 'POST':
@@ -1042,6 +1201,7 @@ def regenerate_image_view(request):
         'success':    True,
         'image_url':  settings.MEDIA_URL + saved_rel[0],
         'image_urls': [settings.MEDIA_URL + p for p in saved_rel],
+        'thumb_urls': [settings.MEDIA_URL + derivative_rel_path(p, 'thumb') for p in saved_rel],
         'seed_used':  seed_used,
     })
 
@@ -1096,40 +1256,38 @@ def gallery_view(request, project_id=None):
             if project_filter else image_projects
         )
 
-    all_items = []
-    for proj in target_projects:
-        proj_items, _tagged, _dir, _rel = build_gallery_items(proj)
-        all_items.extend(proj_items)
-
-    error_count = sum(1 for it in all_items if it['is_error'])
     review_filter = request.GET.get('filter', 'all') or 'all'
+    if review_filter not in GALLERY_REVIEW_FILTERS:
+        review_filter = 'all'
+    try:
+        page = max(1, int(request.GET.get('page', 1)))
+    except ValueError:
+        page = 1
+    result = query_gallery(target_projects, review_filter,
+                           cursor=(page - 1) * GALLERY_PAGE_SIZE, limit=GALLERY_PAGE_SIZE)
 
-    if review_filter == 'all':
-        items = all_items
-    else:
-        def matches(it):
-            if review_filter == 'error':
-                return it['is_error']
-            if review_filter == 'unreviewed':
-                return it['is_image'] and not it['review']
-            return it['is_image'] and it['review'] == review_filter
-        items = [it for it in all_items if matches(it)]
-
-    MAX_ITEMS = 300
-    truncated = len(items) > MAX_ITEMS
-    items = items[:MAX_ITEMS]
+    def page_url(n):
+        params = request.GET.copy()
+        params['page'] = n
+        return '?' + params.urlencode()
 
     return render(request, 'gallery.html', {
-        'items':              items,
+        'items':              result['items'],
         'is_cross_project':   project_id is None,
         'project':            current_project,
         'projects_available': image_projects,
         'project_filter':     request.GET.get('project', ''),
         'review_filter':      review_filter,
-        'error_count':        error_count,
-        'total_items':        len(all_items),
-        'shown_items':        len(items),
-        'truncated':          truncated,
+        'error_count':        result['error_count'],
+        'total_items':        result['all_items'],
+        'matching_items':     result['total'],
+        'shown_items':        len(result['items']),
+        'first_shown':        (page - 1) * GALLERY_PAGE_SIZE + 1,
+        'last_shown':         (page - 1) * GALLERY_PAGE_SIZE + len(result['items']),
+        'page':               page,
+        'prev_url':           page_url(page - 1) if page > 1 else '',
+        'next_url':           page_url(page + 1) if result['next_cursor'] is not None else '',
+        'zip_in_background':  result['all_items'] >= GALLERY_ZIP_BACKGROUND_MIN_FILES,
     })
 
 
@@ -1201,6 +1359,41 @@ def gallery_retry_status_view(request):
     return JsonResponse({'success': True, **BULK_RETRY_STATUS[job_key]})
 
 
+def tagging_trace_view(request):
+    """Download the latest run's per-stage timing trace (Chrome trace-event
+    JSON — open in ui.perfetto.dev or chrome://tracing). Works mid-run too:
+    the file is streamed as the run goes, and the format tolerates the
+    closing bracket still being missing."""
+    tagged_file, _, _, project_id = _resolve_project_context(request)
+    trace_path = get_run_trace_path(tagged_file)
+    if not trace_path:
+        return JsonResponse({'success': False, 'error': 'No trace recorded for this run yet.'}, status=404)
+    name = os.path.splitext(os.path.basename(tagged_file))[0]
+    return FileResponse(open(trace_path, 'rb'), as_attachment=True,
+                        filename=f"{name}_trace.json", content_type='application/json')
+
+
+def tagging_events_view(request):
+    """Page back through a run's full live event history on disk.
+    ?before=SEQ returns the `limit` events just before SEQ; ?after=SEQ the
+    ones from SEQ on. Oldest first either way."""
+    tagged_file, _, _, _ = _resolve_project_context(request)
+    events_path = get_live_events_path(tagged_file) if tagged_file else None
+    if not events_path:
+        return JsonResponse({'success': False, 'error': 'No live events recorded for this run.'}, status=404)
+    try:
+        limit  = min(max(int(request.GET.get('limit', LIVE_TAIL_SIZE)), 1), 500)
+        before = request.GET.get('before')
+        after  = request.GET.get('after')
+        events, total = read_live_events(events_path,
+                                         after=int(after) if after not in (None, '') else None,
+                                         before=int(before) if before not in (None, '') else None,
+                                         limit=limit)
+    except ValueError:
+        return JsonResponse({'success': False, 'error': 'before/after/limit must be integers.'}, status=400)
+    return JsonResponse({'success': True, 'events': events, 'total': total})
+
+
 def download_config_guide_view(request):
     """Static Markdown doc explaining ODT and the config-file schema —
     meant to be handed to a large LLM alongside a few sample data rows so
@@ -1214,14 +1407,18 @@ def download_config_guide_view(request):
 def gallery_zip_view(request):
     """GET ?project_id=<id> -> whole-project zip; GET with no project_id ->
     every image-mode project zipped, one subfolder each; POST {items: [...]}
-    -> just the selected images, grouped by project."""
-    selected_items = None
+    -> just the selected images, grouped by project. Streamed as it is built.
+
+    POST {project_id?, items?, background: true} instead starts building the
+    zip in a background thread and returns {job_key, total}; poll
+    gallery_zip_status, then fetch gallery_zip_download."""
+    payload = {}
     if request.method == 'POST':
         try:
             payload = json.loads(request.body or '{}')
         except ValueError:
             payload = {}
-        selected_items = payload.get('items')
+    selected_items = payload.get('items')
 
     if selected_items:
         by_project = {}
@@ -1239,7 +1436,7 @@ def gallery_zip_view(request):
             return JsonResponse({'success': False, 'error': 'No valid items selected.'}, status=400)
         fname = f"gallery_selected_{int(time.time())}.zip"
     else:
-        project_id = request.GET.get('project_id', '').strip()
+        project_id = str(payload.get('project_id') or request.GET.get('project_id', '')).strip()
         if project_id:
             proj = get_project(project_id)
             if not proj:
@@ -1251,12 +1448,33 @@ def gallery_zip_view(request):
             entries = [(p, None) for p in projects]
             fname = f"gallery_all_{int(time.time())}.zip"
 
-    zip_bytes = build_gallery_zip(entries)
-    response = HttpResponse(zip_bytes, content_type='application/zip')
+    plan = gallery_zip_plan(entries)
+    if payload.get('background'):
+        job_key = str(uuid.uuid4())
+        threading.Thread(target=export_gallery_zip, args=(job_key, plan, fname), daemon=True).start()
+        return JsonResponse({'success': True, 'job_key': job_key, 'total': len(plan)})
+
+    response = StreamingHttpResponse(iter_gallery_zip(plan), content_type='application/zip')
     response['Content-Disposition'] = f'attachment; filename="{fname}"'
     return response
 
 
+def gallery_zip_status_view(request):
+    job_key = request.GET.get('job_key', '').strip()
+    if not job_key or job_key not in GALLERY_EXPORT_STATUS:
+        return JsonResponse({'success': False, 'error': 'No such job.'}, status=400)
+    return JsonResponse({'success': True, **GALLERY_EXPORT_STATUS[job_key]})
+
+
+def gallery_zip_download_view(request):
+    job_key = request.GET.get('job_key', '').strip()
+    status = GALLERY_EXPORT_STATUS.get(job_key)
+    if not status or status['status'] != 'finished' or not os.path.exists(gallery_export_path(job_key)):
+        return JsonResponse({'success': False, 'error': 'Export not ready.'}, status=404)
+    return FileResponse(open(gallery_export_path(job_key), 'rb'), as_attachment=True,
+                        filename=status['filename'], content_type='application/zip')
+
+
 # ─── Connection ──────────────────────────────────────────────────────────────
 
 def connection_editor_view(request):
@@ -13,10 +13,14 @@ import base64
 import io
 import json
 import os
+import struct
+import threading
+import uuid
 from typing import List, Optional
 
 from dotenv import load_dotenv
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Response
+from PIL import Image
 from pydantic import BaseModel
 
 _SERVER_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -26,7 +30,9 @@ _SERVER_DIR = os.path.dirname(os.path.abspath(__file__))
 load_dotenv(os.path.join(_SERVER_DIR, ".env"))
 
 import downloader
+import jobs
 import models as model_mgr
+import workers
 from capability import detect_capability, get_live_metrics
 
 app = FastAPI(title="ODT Stable Diffusion Server")
@@ -34,6 +40,41 @@ app = FastAPI(title="ODT Stable Diffusion Server")
 CATALOG_PATH = os.path.join(_SERVER_DIR, "catalog.json")
 LORA_CATALOG_PATH = os.path.join(_SERVER_DIR, "lora_catalog.json")
 
+# /generate response encodings. "json" is the original base64-in-JSON shape;
+# "binary" is a 4-byte big-endian header length, a JSON header
+# ({seed_used, elapsed_sec, format, sizes}) and then the raw image bytes back
+# to back; "file" writes the images into SD_SHARED_OUTPUT_DIR (a directory
+# ODT can also see, for co-located deployments) and returns their names.
+# Images are encoded once, here, in the format the caller asked for.
+BINARY_MEDIA_TYPE = "application/x-odt-images"
+IMAGE_FORMATS = {"png": "PNG", "jpeg": "JPEG", "jpg": "JPEG", "webp": "WEBP"}
+SHARED_OUTPUT_DIR = os.environ.get("SD_SHARED_OUTPUT_DIR", "").strip()
+
+# Upper bound on prompts per /generate_batch; callers size batches to the
+# free VRAM, this just stops one request from asking for an absurd batch.
+MAX_BATCH = int(os.environ.get("SD_MAX_BATCH", "8") or 8)
+
+# SD_WORKERS=N runs generation in N worker processes (see workers.py) rather
+# than in-process; `backend` is whichever of the two serves the endpoints.
+WORKER_COUNT = int(os.environ.get("SD_WORKERS", "0") or 0)
+WORKER_DEVICES = [d.strip() for d in os.environ.get("SD_WORKER_DEVICES", "").split(",") if d.strip()]
+pool = None
+backend = model_mgr
+
+
+@app.on_event("startup")
+def start_workers():
+    global pool, backend
+    if WORKER_COUNT > 0 and pool is None:
+        pool = backend = workers.WorkerPool(WORKER_COUNT, WORKER_DEVICES)
+        jobs.configure(workers=len(pool), cancel_running=lambda job_id: pool.request_cancel(tag=job_id))
+
+
+def _job_tag():
+    # Lets DELETE /jobs/{id} stop just that job: it is interrupted only once
+    # it is the one generating, never a /generate it is waiting behind.
+    return {"tag": jobs.current_job_id()}
+
 
 def load_catalog():
     try:
@@ -53,7 +94,8 @@ def load_lora_catalog():
 
 @app.get("/health")
 def health():
-    return {"status": "ok", "loaded_model": model_mgr.get_loaded_model()}
+    return {"status": "ok", "loaded_model": backend.get_loaded_model(),
+            "pipeline_cache": backend.get_cache_stats(), "workers": len(pool) if pool is not None else 0}
 
 
 @app.get("/status")
@@ -61,18 +103,44 @@ def status():
     """Live activity — what the server is doing right now (loading weights,
     loading a LoRA, generating step N/M, idle) plus a short recent-events
     log, so a caller polling this can show real progress instead of a
-    black box while /generate is in flight."""
-    return model_mgr.get_status()
+    black box while /generate is in flight. pipeline_cache has the loaded
+    pipelines and their hit/miss and load-time figures; lora_cache has the
+    resident LoRA adapters and recent LoRA load timings. In worker-pool mode
+    the top-level state is the busiest worker's, `workers` has each one's
+    status and cache, and `failed_workers` lists any that couldn't start or
+    are being restarted."""
+    if pool is not None:
+        return pool.get_status()
+    return {**model_mgr.get_status(), "pipeline_cache": model_mgr.get_cache_stats(),
+            "lora_cache": model_mgr.get_lora_stats()}
 
 
 @app.post("/cancel")
 def cancel():
     """Best-effort: interrupts an in-flight generation. See
-    models.request_cancel for what this can and can't stop."""
-    model_mgr.request_cancel()
+    models.request_cancel for what this can and can't stop. Interrupts
+    every worker in worker-pool mode."""
+    backend.request_cancel()
     return {"cancelled": True}
 
 
+class PreloadReq(BaseModel):
+    model_id: str
+    hf_token: Optional[str] = None
+
+
+@app.post("/preload")
+def preload(req: PreloadReq):
+    """Start loading a model into the pipeline cache in the background and
+    return at once — a caller about to switch models sends this ahead so
+    the weights load while the current model is still generating."""
+    if not req.model_id:
+        raise HTTPException(status_code=400, detail="model_id is required")
+    threading.Thread(target=backend.preload, daemon=True,
+                     args=(req.model_id, req.hf_token or os.environ.get("HF_TOKEN"))).start()
+    return {"queued": True}
+
+
 @app.get("/capability")
 def capability():
     return detect_capability()
@@ -81,8 +149,12 @@ def capability():
 @app.get("/metrics")
 def metrics():
     """Live CPU/RAM/GPU load for the tagging page's system-metrics panel —
-    separate from the static, one-time /capability report."""
-    return get_live_metrics()
+    separate from the static, one-time /capability report. In worker-pool
+    mode `workers` adds each worker's placement, load and own readings."""
+    live = get_live_metrics()
+    if pool is not None:
+        live["workers"] = pool.get_metrics()
+    return live
 
 
 @app.get("/models")
@@ -164,50 +236,243 @@ class LoraSpec(BaseModel):
     scale: float = 1.0
 
 
-class GenerateReq(BaseModel):
+class _GenerationSettings(BaseModel):
     model_id: str
-    prompt: str
     negative_prompt: Optional[str] = ""
     width: int = 512
     height: int = 512
     steps: int = 30
     guidance_scale: float = 7.5
-    seed: int = -1
     num_images: int = 1
     hf_token: Optional[str] = None
     loras: List[LoraSpec] = []
     scheduler: Optional[str] = "default"
+    response_format: Optional[str] = "json"  # "json", "binary" or "file"
+    image_format: Optional[str] = "png"      # "png", "jpeg" or "webp"
+    quality: int = 92                        # JPEG/WebP only
 
 
-@app.post("/generate")
-def generate(req: GenerateReq):
+class GenerateReq(_GenerationSettings):
+    prompt: str
+    seed: int = -1
+
+
+class BatchItem(BaseModel):
+    prompt: str
+    seed: int = -1
+
+
+class GenerateBatchReq(_GenerationSettings):
+    items: List[BatchItem]
+
+
+def encode_image(img, image_format="png", quality=92):
+    """One image as bytes in the requested format. JPEG has no alpha
+    channel, so transparency is flattened onto white first."""
+    fmt = IMAGE_FORMATS[image_format]
+    if fmt == "JPEG" and img.mode != "RGB":
+        rgba = img.convert("RGBA")
+        img = Image.new("RGB", rgba.size, (255, 255, 255))
+        img.paste(rgba, mask=rgba.split()[-1])
+    buf = io.BytesIO()
+    if fmt == "PNG":
+        img.save(buf, format=fmt)
+    else:
+        img.save(buf, format=fmt, quality=max(1, min(100, int(quality))))
+    return buf.getvalue()
+
+
+def pack_images(header, blobs):
+    """The "binary" response body: length-prefixed JSON header, then the
+    images concatenated in order (header["sizes"] splits them again)."""
+    head = json.dumps({**header, "sizes": [len(b) for b in blobs]}).encode("utf-8")
+    return struct.pack(">I", len(head)) + head + b"".join(blobs)
+
+
+def write_shared_images(blobs, ext):
+    """Drop each image into SHARED_OUTPUT_DIR under a unique name; the
+    rename makes a file appear only once it is complete."""
+    os.makedirs(SHARED_OUTPUT_DIR, exist_ok=True)
+    names = []
+    for blob in blobs:
+        name = f"{uuid.uuid4().hex}.{ext}"
+        tmp = os.path.join(SHARED_OUTPUT_DIR, f".{name}.part")
+        with open(tmp, "wb") as fh:
+            fh.write(blob)
+        os.replace(tmp, os.path.join(SHARED_OUTPUT_DIR, name))
+        names.append(name)
+    return names
+
+
+def _output_options(req):
+    """Validated (image_format, response_format) for a generation request."""
+    image_format = (req.image_format or "png").lower()
+    if image_format not in IMAGE_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Unsupported image_format '{req.image_format}'")
+    response_format = (req.response_format or "json").lower()
+    if response_format not in ("json", "binary", "file"):
+        raise HTTPException(status_code=400, detail=f"Unsupported response_format '{req.response_format}'")
+    if response_format == "file" and not SHARED_OUTPUT_DIR:
+        raise HTTPException(status_code=400, detail="response_format 'file' needs SD_SHARED_OUTPUT_DIR set on the server")
+    return image_format, response_format
+
+
+def _generation_kwargs(req):
+    return dict(
+        model_id=req.model_id,
+        negative_prompt=req.negative_prompt or "",
+        width=req.width,
+        height=req.height,
+        steps=req.steps,
+        guidance_scale=req.guidance_scale,
+        num_images=req.num_images,
+        token=req.hf_token or os.environ.get("HF_TOKEN"),
+        loras=[l.dict() for l in req.loras],
+        scheduler=req.scheduler,
+    )
+
+
+def _encode_images(images, req, image_format):
+    """Encode once, in the requested format: (blobs, file extension)."""
+    ext = "jpg" if image_format == "jpeg" else image_format
+    return [encode_image(img, image_format, req.quality) for img in images], ext
+
+
+def _respond(header, blobs, ext, response_format):
+    """Answer in the requested response_format."""
+    header = {**header, "format": ext}
+    if response_format == "binary":
+        return Response(content=pack_images(header, blobs), media_type=BINARY_MEDIA_TYPE)
+    if response_format == "file":
+        return {**header, "files": write_shared_images(blobs, ext)}
+    return {**header, "images": [base64.b64encode(b).decode("ascii") for b in blobs]}
+
+
+def _image_response(images, header, req, image_format, response_format):
+    blobs, ext = _encode_images(images, req, image_format)
+    return _respond(header, blobs, ext, response_format)
+
+
+def _run_generate(req):
+    images, seed_used, elapsed = backend.generate(
+        prompt=req.prompt, seed=req.seed, **_generation_kwargs(req), **_job_tag())
+    return images, {"seed_used": seed_used, "elapsed_sec": round(elapsed, 3)}
+
+
+def _run_generate_batch(req):
+    results, elapsed = backend.generate_batch(
+        prompts=[item.prompt for item in req.items], seeds=[item.seed for item in req.items],
+        **_generation_kwargs(req), **_job_tag())
+    header = {"results": [{"seed_used": seed, "count": len(images)} for images, seed in results],
+              "elapsed_sec": round(elapsed, 3)}
+    return [img for batch_images, _ in results for img in batch_images], header
+
+
+def _check_generate(req):
     if not req.model_id or not req.prompt:
         raise HTTPException(status_code=400, detail="model_id and prompt are required")
+
+
+def _check_batch(req):
+    if not req.model_id or not req.items or not all(item.prompt for item in req.items):
+        raise HTTPException(status_code=400, detail="model_id and a prompt for every item are required")
+    if len(req.items) > MAX_BATCH:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BATCH} items per batch (SD_MAX_BATCH)")
+
+
+@app.post("/generate")
+def generate(req: GenerateReq):
+    _check_generate(req)
+    image_format, response_format = _output_options(req)
     try:
-        images, seed_used, elapsed = model_mgr.generate(
-            model_id=req.model_id,
-            prompt=req.prompt,
-            negative_prompt=req.negative_prompt or "",
-            width=req.width,
-            height=req.height,
-            steps=req.steps,
-            guidance_scale=req.guidance_scale,
-            seed=req.seed,
-            num_images=req.num_images,
-            token=req.hf_token or os.environ.get("HF_TOKEN"),
-            loras=[l.dict() for l in req.loras],
-            scheduler=req.scheduler,
-        )
+        images, header = _run_generate(req)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    return _image_response(images, header, req, image_format, response_format)
 
-    encoded = []
-    for img in images:
-        buf = io.BytesIO()
-        img.save(buf, format="PNG")
-        encoded.append(base64.b64encode(buf.getvalue()).decode("ascii"))
 
-    return {"images": encoded, "seed_used": seed_used, "elapsed_sec": round(elapsed, 3)}
+@app.post("/generate_batch")
+def generate_batch(req: GenerateBatchReq):
+    """Several prompts sharing model, size, steps, scheduler and LoRA stack
+    in one denoising pass. Images come back flat, prompt by prompt, in the
+    same encodings as /generate; results[i] = {seed_used, count} says how
+    many of them belong to items[i]."""
+    _check_batch(req)
+    image_format, response_format = _output_options(req)
+    try:
+        images, header = _run_generate_batch(req)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    return _image_response(images, header, req, image_format, response_format)
+
+
+class JobReq(_GenerationSettings):
+    """A /generate body (prompt, seed) or a /generate_batch one (items),
+    plus a queue priority — higher runs first, ties run oldest first."""
+    prompt: Optional[str] = None
+    seed: int = -1
+    items: List[BatchItem] = []
+    priority: int = 0
+
+
+@app.post("/jobs")
+def submit_job(req: JobReq):
+    """Queue a generation and return its job id at once. Poll GET
+    /jobs/{id} for state, queue position and ETA; fetch the images from
+    GET /jobs/{id}/result once it is done."""
+    if req.items:
+        kind, run_images = "batch", _run_generate_batch
+        _check_batch(req)
+    else:
+        kind, run_images = "generate", _run_generate
+        _check_generate(req)
+    image_format, response_format = _output_options(req)
+
+    def run():
+        images, header = run_images(req)
+        return _encode_images(images, req, image_format) + (response_format,), header
+
+    job_id = jobs.submit(run, priority=req.priority, kind=kind)
+    return jobs.status(job_id)
+
+
+@app.get("/jobs")
+def list_jobs():
+    return jobs.queue_summary()
+
+
+@app.get("/jobs/{job_id}")
+def job_status(job_id: str):
+    state = jobs.status(job_id)
+    if state is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired job")
+    return state
+
+
+@app.get("/jobs/{job_id}/result")
+def job_result(job_id: str, response_format: Optional[str] = None):
+    """The finished job's images in the same encodings as /generate —
+    response_format defaults to the one it was submitted with. 409 while
+    the job is still queued or running, or if it failed or was cancelled."""
+    state = jobs.status(job_id)
+    if state is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired job")
+    if state["state"] != "done":
+        raise HTTPException(status_code=409, detail=state["error"] or f"Job is {state['state']}")
+    _, (blobs, ext, submitted_format) = jobs.result(job_id)
+    response_format = (response_format or submitted_format).lower()
+    if response_format not in ("json", "binary", "file") or (response_format == "file" and not SHARED_OUTPUT_DIR):
+        raise HTTPException(status_code=400, detail=f"Unsupported response_format '{response_format}'")
+    return _respond(state["header"], blobs, ext, response_format)
+
+
+@app.delete("/jobs/{job_id}")
+def cancel_job(job_id: str):
+    """Cancel a queued or running job, or discard a finished one's result."""
+    previous = jobs.cancel(job_id)
+    if previous is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired job")
+    return {"cancelled": previous in ("queued", "running"), "state": previous}
 
 
 if __name__ == "__main__":
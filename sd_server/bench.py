@@ -0,0 +1,290 @@
+"""Request-path benchmark for the SD server.
+
+Starts this server in-process on a free port with the fake pipeline
+(SD_FAKE_PIPELINE=1, see fake_pipeline.py — no torch/diffusers/weights
+needed) and measures what a /generate costs beyond the denoising itself:
+
+  encode      PNG encode, base64, JSON encode/decode per image size (no HTTP)
+  sequential  client latency vs the server-reported elapsed_sec, one at a time
+  concurrent  N clients at once — throughput, latency, time spent waiting on
+              models._lock — while a poller measures /status responsiveness
+  switching   latency when every request changes model / LoRA stack /
+              scheduler vs. when nothing changes
+
+Results go to a JSON file so runs can be compared over time. Point --url at
+an already-running server (e.g. a real GPU box) to skip the in-process fake
+and measure that instead.
+
+    python bench.py                              # fake pipeline, defaults
+    SD_FAKE_STEP_SEC=0.05 python bench.py --concurrency 4 --requests 32
+    python bench.py --url http://gpu-box:7860 --model stabilityai/sdxl-turbo
+"""
+import argparse
+import base64
+import io
+import json
+import os
+import platform
+import socket
+import statistics
+import threading
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+_SERVER_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def _percentiles(values):
+    if not values:
+        return {"p50": 0.0, "p95": 0.0, "max": 0.0, "mean": 0.0}
+    ordered = sorted(values)
+
+    def pct(q):
+        k = (len(ordered) - 1) * q / 100
+        lo, hi = int(k), min(int(k) + 1, len(ordered) - 1)
+        return ordered[lo] + (ordered[hi] - ordered[lo]) * (k - lo)
+
+    return {"p50": round(pct(50), 2), "p95": round(pct(95), 2),
+            "max": round(ordered[-1], 2), "mean": round(statistics.fmean(ordered), 2)}
+
+
+def _timed_ms(fn, repeat):
+    out = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        out.append((time.perf_counter() - t0) * 1000)
+    return out
+
+
+# ─── HTTP helpers ────────────────────────────────────────────────────────────
+
+def _post(base_url, path, payload, timeout=600):
+    req = urllib.request.Request(f"{base_url}{path}", data=json.dumps(payload).encode("utf-8"),
+                                 headers={"Content-Type": "application/json"}, method="POST")
+    with urllib.request.urlopen(req, timeout=timeout) as resp:
+        return json.loads(resp.read())
+
+
+def _get(base_url, path, timeout=30):
+    with urllib.request.urlopen(f"{base_url}{path}", timeout=timeout) as resp:
+        return json.loads(resp.read())
+
+
+def _generate(base_url, payload):
+    """One /generate; returns (client_ms, server_elapsed_ms, response_bytes)."""
+    body = json.dumps(payload).encode("utf-8")
+    req = urllib.request.Request(f"{base_url}/generate", data=body,
+                                 headers={"Content-Type": "application/json"}, method="POST")
+    t0 = time.perf_counter()
+    with urllib.request.urlopen(req, timeout=600) as resp:
+        raw = resp.read()
+    data = json.loads(raw)
+    client_ms = (time.perf_counter() - t0) * 1000
+    return client_ms, data["elapsed_sec"] * 1000, len(raw)
+
+
+def _start_local_server():
+    """Run app.app under uvicorn on a free local port in a daemon thread,
+    with the fake pipeline unless the caller already chose otherwise."""
+    os.environ.setdefault("SD_FAKE_PIPELINE", "1")
+    import uvicorn
+    import sys
+    sys.path.insert(0, _SERVER_DIR)
+    from app import app
+
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    deadline = time.time() + 30
+    while not server.started:
+        if time.time() > deadline:
+            raise RuntimeError("Local SD server did not start.")
+        time.sleep(0.05)
+    return f"http://127.0.0.1:{port}", server
+
+
+# ─── Scenarios ───────────────────────────────────────────────────────────────
+
+def bench_encode(sizes, repeat):
+    """Per-image serialisation cost on this machine, isolated from HTTP."""
+    import fake_pipeline
+    out = []
+    for w, h in sizes:
+        img = fake_pipeline._synthetic_image(w, h, seed=1)
+        png = io.BytesIO()
+        img.save(png, format="PNG")
+        png_bytes = png.getvalue()
+        b64 = base64.b64encode(png_bytes).decode("ascii")
+        doc = json.dumps({"images": [b64], "seed_used": 1, "elapsed_sec": 1.0})
+
+        def encode_png():
+            buf = io.BytesIO()
+            img.save(buf, format="PNG")
+
+        out.append({
+            "width": w, "height": h,
+            "png_bytes": len(png_bytes), "base64_bytes": len(b64),
+            "png_encode_ms":  _percentiles(_timed_ms(encode_png, repeat)),
+            "base64_ms":      _percentiles(_timed_ms(lambda: base64.b64encode(png_bytes).decode("ascii"), repeat)),
+            "json_dumps_ms":  _percentiles(_timed_ms(lambda: json.dumps({"images": [b64]}), repeat)),
+            "json_loads_ms":  _percentiles(_timed_ms(lambda: json.loads(doc), repeat)),
+            "b64decode_ms":   _percentiles(_timed_ms(lambda: base64.b64decode(b64), repeat)),
+        })
+    return out
+
+
+def bench_sequential(base_url, payload, n):
+    client, server, sizes = [], [], []
+    for _ in range(n):
+        c, s, b = _generate(base_url, payload)
+        client.append(c)
+        server.append(s)
+        sizes.append(b)
+    return {
+        "requests":     n,
+        "client_ms":    _percentiles(client),
+        "pipeline_ms":  _percentiles(server),
+        "overhead_ms":  _percentiles([c - s for c, s in zip(client, server)]),
+        "response_bytes": int(statistics.fmean(sizes)) if sizes else 0,
+    }
+
+
+def bench_concurrent(base_url, payload, concurrency, n, status_interval=0.02):
+    """n requests from `concurrency` clients at once. Everything beyond the
+    server-reported pipeline time is queueing on models._lock plus transport;
+    a background poller meanwhile times /status, which must stay responsive
+    because ODT's tagging page polls it throughout a run."""
+    status_ms, stop = [], threading.Event()
+
+    def poll_status():
+        while not stop.is_set():
+            t0 = time.perf_counter()
+            try:
+                _get(base_url, "/status", timeout=30)
+                status_ms.append((time.perf_counter() - t0) * 1000)
+            except Exception:
+                pass
+            stop.wait(status_interval)
+
+    poller = threading.Thread(target=poll_status, daemon=True)
+    poller.start()
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(lambda _: _generate(base_url, payload), range(n)))
+    wall = time.perf_counter() - t0
+    stop.set()
+    poller.join()
+
+    client = [c for c, _, _ in results]
+    server = [s for _, s, _ in results]
+    return {
+        "concurrency":      concurrency,
+        "requests":         n,
+        "wall_sec":         round(wall, 3),
+        "images_per_sec":   round(n * payload.get("num_images", 1) / wall, 3) if wall else 0.0,
+        "client_ms":        _percentiles(client),
+        "pipeline_ms":      _percentiles(server),
+        "wait_ms":          _percentiles([c - s for c, s in zip(client, server)]),
+        "lock_utilisation": round(sum(server) / 1000 / wall, 3) if wall else 0.0,
+        "status_ms":        _percentiles(status_ms),
+        "status_polls":     len(status_ms),
+    }
+
+
+def bench_switching(base_url, payload, n, alt_model, lora_ids, schedulers):
+    """Mean latency when every request flips one of model / LoRA stack /
+    scheduler, against a baseline where nothing changes; the difference is
+    the per-switch cost."""
+    def run(variants):
+        times = []
+        for i in range(n):
+            c, _, _ = _generate(base_url, {**payload, **variants[i % len(variants)]})
+            times.append(c)
+        return _percentiles(times[1:] or times)  # first call may include a cold load
+
+    baseline = run([{}])
+    out = {"baseline_ms": baseline}
+    cases = {
+        "model":     [{"model_id": payload["model_id"]}, {"model_id": alt_model}],
+        "lora":      [{"loras": []}, {"loras": [{"id": lora_ids[0], "scale": 0.8}]},
+                      {"loras": [{"id": l, "scale": 0.8} for l in lora_ids]}],
+        "lora_scale": [{"loras": [{"id": lora_ids[0], "scale": 0.5}]},
+                       {"loras": [{"id": lora_ids[0], "scale": 1.0}]}],
+        "scheduler": [{"scheduler": s} for s in schedulers],
+    }
+    for name, variants in cases.items():
+        res = run(variants)
+        out[f"{name}_ms"] = res
+        out[f"{name}_switch_cost_ms"] = round(res["mean"] - baseline["mean"], 2)
+    # Leave the server on the baseline config for whatever runs next.
+    _generate(base_url, payload)
+    return out
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the SD server's /generate request path")
+    parser.add_argument("--url", default="", help="Benchmark this running server instead of an in-process fake one")
+    parser.add_argument("--model", default="fake/sd-model")
+    parser.add_argument("--alt-model", default="fake/sd-model-alt", help="Second model for the switching scenario")
+    parser.add_argument("--loras", default="fake/lora-a,fake/lora-b", help="Comma-separated LoRA ids for the switching scenario")
+    parser.add_argument("--width", type=int, default=512)
+    parser.add_argument("--height", type=int, default=512)
+    parser.add_argument("--steps", type=int, default=10)
+    parser.add_argument("--num-images", type=int, default=1)
+    parser.add_argument("--requests", type=int, default=20, help="Requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--encode-sizes", default="512x512,768x768,1024x1024")
+    parser.add_argument("--skip-switching", action="store_true")
+    parser.add_argument("--output", default="", help="Results JSON path (default: bench_results/sd_server_<timestamp>.json)")
+    args = parser.parse_args()
+
+    base_url, server = (args.url.rstrip("/"), None) if args.url else _start_local_server()
+    payload = {"model_id": args.model, "prompt": "a lighthouse on a cliff at dusk", "width": args.width,
+               "height": args.height, "steps": args.steps, "num_images": args.num_images, "seed": 42}
+    sizes = [tuple(int(x) for x in s.split("x")) for s in args.encode_sizes.split(",") if s]
+    lora_ids = [l for l in args.loras.split(",") if l] or ["fake/lora-a"]
+
+    print(f"Benchmarking {base_url} ({'fake pipeline' if server else 'external server'})")
+    _generate(base_url, payload)  # warm-up: first model load isn't request overhead
+    results = {
+        "benchmark":  "sd_server",
+        "created_at": datetime.now().isoformat(),
+        "python":     platform.python_version(),
+        "platform":   platform.platform(),
+        "target":     "fake" if server else base_url,
+        "fake_timing": {k: os.environ.get(k) for k in ("SD_FAKE_STEP_SEC", "SD_FAKE_LOAD_SEC",
+                                                      "SD_FAKE_LORA_SEC", "SD_FAKE_SCHEDULER_SEC")},
+        "request":    payload,
+        "encode":     bench_encode(sizes, repeat=10),
+    }
+    print("  encode done")
+    results["sequential"] = bench_sequential(base_url, payload, args.requests)
+    print(f"  sequential: overhead p50 {results['sequential']['overhead_ms']['p50']}ms")
+    results["concurrent"] = bench_concurrent(base_url, payload, args.concurrency, args.requests)
+    c = results["concurrent"]
+    print(f"  concurrent x{args.concurrency}: {c['images_per_sec']} img/s, wait p95 {c['wait_ms']['p95']}ms, "
+          f"/status p95 {c['status_ms']['p95']}ms")
+    if not args.skip_switching:
+        schedulers = [s["key"] for s in _get(base_url, "/schedulers")["schedulers"]][:3]
+        results["switching"] = bench_switching(base_url, payload, max(4, args.requests // 2),
+                                               args.alt_model, lora_ids, schedulers)
+        sw = results["switching"]
+        print("  switching cost (ms): " + ", ".join(
+            f"{k[:-len('_switch_cost_ms')]} {v}" for k, v in sw.items() if k.endswith("_switch_cost_ms")))
+
+    output = args.output or os.path.join("bench_results", f"sd_server_{time.strftime('%Y%m%d_%H%M%S')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {output}")
+    if server:
+        server.should_exit = True
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,9 @@
+"""pytest setup for the server's tests: the fake pipeline, with its timing
+knobs near zero. fake_pipeline reads them once at import, so they're set
+here, before any test module imports models."""
+import os
+
+os.environ["SD_FAKE_PIPELINE"] = "1"
+for _name in ("SD_FAKE_STEP_SEC", "SD_FAKE_LOAD_SEC", "SD_FAKE_LORA_SEC",
+              "SD_FAKE_SCHEDULER_SEC", "SD_FAKE_MOVE_SEC"):
+    os.environ[_name] = "0"
@@ -0,0 +1,157 @@
+"""Deterministic stand-in for a diffusers text-to-image pipeline.
+
+Lets the server's request path — JSON parsing, the generate lock, model /
+LoRA / scheduler switching, image encoding and transport — be exercised and
+benchmarked on any machine, without torch, diffusers or multi-GB weights.
+Enable it by starting the server with SD_FAKE_PIPELINE=1; models.py then
+builds one of these instead of calling from_pretrained. Timing knobs (all
+seconds, read once at import):
+
+    SD_FAKE_STEP_SEC       per denoising step          (default 0.01)
+    SD_FAKE_LOAD_SEC       per model load              (default 0.5)
+    SD_FAKE_LORA_SEC       per LoRA weight load        (default 0.1)
+    SD_FAKE_SCHEDULER_SEC  per scheduler swap          (default 0.01)
+    SD_FAKE_MOVE_SEC       per CPU <-> device move     (default 0.05)
+
+SD_FAKE_SIZE_MB (default 2000) is the weight footprint each fake pipeline
+reports to the pipeline cache's memory budgets.
+
+Images are a smooth, seed-determined colour field plus mild grain — close
+enough to a real generation's PNG size/encode cost that overhead numbers
+mean something, and never flat, so models._looks_blank doesn't reject them.
+"""
+import os
+import time
+from types import SimpleNamespace
+
+import numpy as np
+from PIL import Image
+
+
+def _env_sec(name, default):
+    try:
+        return float(os.environ.get(name, default))
+    except ValueError:
+        return default
+
+
+STEP_SEC = _env_sec("SD_FAKE_STEP_SEC", 0.01)
+LOAD_SEC = _env_sec("SD_FAKE_LOAD_SEC", 0.5)
+LORA_SEC = _env_sec("SD_FAKE_LORA_SEC", 0.1)
+SCHEDULER_SEC = _env_sec("SD_FAKE_SCHEDULER_SEC", 0.01)
+MOVE_SEC = _env_sec("SD_FAKE_MOVE_SEC", 0.05)
+SIZE_MB = int(_env_sec("SD_FAKE_SIZE_MB", 2000))
+
+
+def enabled():
+    return os.environ.get("SD_FAKE_PIPELINE", "").strip().lower() in ("1", "true", "yes")
+
+
+class FakeGenerator:
+    """Just enough of torch.Generator for a seed to reach the pipeline."""
+
+    def __init__(self, seed):
+        self.seed = int(seed)
+
+
+class FakeScheduler:
+    def __init__(self, name="default", config=None):
+        self.name = name
+        self.config = dict(config or {"name": name})
+
+    @classmethod
+    def named(cls, name):
+        """A scheduler 'class' for SCHEDULERS[...]['cls'] — mirrors
+        getattr(diffusers, name) so models._ensure_scheduler stays one path."""
+        return SimpleNamespace(from_config=lambda config: cls._from_config(name, config))
+
+    @classmethod
+    def _from_config(cls, name, config):
+        time.sleep(SCHEDULER_SEC)
+        return cls(name, config)
+
+    @classmethod
+    def from_config(cls, config):
+        return cls._from_config(config.get("name", "default"), config)
+
+
+class FakePipeline:
+    def __init__(self, model_id):
+        time.sleep(LOAD_SEC)
+        self.model_id = model_id
+        self.size_mb = SIZE_MB
+        self.device = "cpu"
+        self.scheduler = FakeScheduler()
+        self.adapters = {}
+        self.active_adapters = []
+        self.lora_enabled = True
+        self._interrupt = False
+
+    # LoRA API surface used by models._ensure_loras.
+    def load_lora_weights(self, lora_id, adapter_name=None, token=None, **kwargs):
+        time.sleep(LORA_SEC)
+        self.adapters[adapter_name or lora_id] = lora_id
+
+    def unload_lora_weights(self):
+        self.adapters.clear()
+        self.active_adapters = []
+
+    def delete_adapters(self, adapter_names):
+        for name in [adapter_names] if isinstance(adapter_names, str) else adapter_names:
+            self.adapters.pop(name, None)
+        self.active_adapters = [a for a in self.active_adapters if a[0] in self.adapters]
+
+    def disable_lora(self):
+        self.lora_enabled = False
+
+    def enable_lora(self):
+        self.lora_enabled = True
+
+    def set_adapters(self, adapter_names, adapter_weights=None):
+        missing = [n for n in adapter_names if n not in self.adapters]
+        if missing:
+            raise ValueError(f"Adapter(s) not loaded: {missing}")
+        self.active_adapters = list(zip(adapter_names, adapter_weights or [1.0] * len(adapter_names)))
+
+    def to(self, device):
+        time.sleep(MOVE_SEC)
+        self.device = device
+        return self
+
+    def enable_attention_slicing(self):
+        pass
+
+    def enable_vae_slicing(self):
+        pass
+
+    def __call__(self, prompt, negative_prompt=None, width=512, height=512,
+                 num_inference_steps=30, guidance_scale=7.5, num_images_per_prompt=1,
+                 generator=None, callback_on_step_end=None):
+        # A list of prompts is one batch: the steps are paid once, and (like
+        # diffusers) the generators then run one per image, prompt-major.
+        prompts = prompt if isinstance(prompt, list) else [prompt]
+        per_prompt = int(num_images_per_prompt)
+        if isinstance(generator, list):
+            seeds = [g.seed for g in generator]
+        else:
+            seed = generator.seed if generator is not None else 0
+            seeds = [seed + n for n in range(per_prompt)] * len(prompts)
+        for step in range(int(num_inference_steps)):
+            if self._interrupt:
+                break
+            time.sleep(STEP_SEC)
+            if callback_on_step_end is not None:
+                callback_on_step_end(self, step, step, {})
+        images = [_synthetic_image(int(width), int(height), seeds[n], prompts[n // per_prompt])
+                  for n in range(len(prompts) * per_prompt)]
+        return SimpleNamespace(images=images)
+
+
+def _synthetic_image(width, height, seed, prompt=""):
+    rng = np.random.default_rng((seed, len(prompt or "")))
+    # Upsampled low-res colour field (smooth structure, like a real image)
+    # plus mild per-pixel grain (keeps PNG compression realistic).
+    coarse = rng.integers(0, 256, size=(max(1, height // 32), max(1, width // 32), 3), dtype=np.uint8)
+    field = np.asarray(Image.fromarray(coarse).resize((width, height), Image.BICUBIC), dtype=np.int16)
+    grain = rng.integers(-6, 7, size=(height, width, 3), dtype=np.int16)
+    return Image.fromarray(np.clip(field + grain, 0, 255).astype(np.uint8))
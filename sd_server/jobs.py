@@ -0,0 +1,183 @@
+"""Queued generation jobs: submit, poll, fetch, cancel.
+
+A caller POSTs a /generate or /generate_batch body to /jobs and gets a job
+id back at once, instead of holding one HTTP connection open for the whole
+generation. Worker threads take jobs off a priority queue (higher priority
+first, then oldest first) and run them — one thread in-process, where
+generation is serialised by models._lock anyway, or one per process in
+worker-pool mode (configure()). State lives in an in-memory dict keyed by
+job id, like downloader.py.
+
+A finished job keeps its encoded result until the caller deletes it, or
+for JOB_TTL_SEC after it finished, whichever comes first. Queue position and
+ETA come from the mean run time of the last few jobs.
+"""
+import collections
+import heapq
+import itertools
+import threading
+import time
+import uuid
+
+import models as model_mgr
+
+JOB_TTL_SEC = 15 * 60
+_RECENT_RUNS = 20
+
+_jobs = {}
+_queue = []  # heap of (-priority, seq, job_id)
+_seq = itertools.count()
+_cond = threading.Condition()
+_recent_sec = collections.deque(maxlen=_RECENT_RUNS)
+_threads = []
+_running = set()
+_worker_count = 1
+_cancel_running = lambda job_id: model_mgr.request_cancel(job_id)
+_local = threading.local()
+
+
+def configure(workers=1, cancel_running=None):
+    """How many jobs run at once, and how to interrupt a running one
+    (cancel_running(job_id)) when that isn't models.request_cancel."""
+    global _worker_count, _cancel_running
+    _worker_count = max(1, int(workers))
+    if cancel_running is not None:
+        _cancel_running = cancel_running
+
+
+def current_job_id():
+    """The job the calling worker thread is running, else None."""
+    return getattr(_local, "job_id", None)
+
+
+def _prune():
+    # Caller holds _cond.
+    cutoff = time.time() - JOB_TTL_SEC
+    for job_id in [j for j, job in _jobs.items() if job["finished"] and job["finished"] < cutoff]:
+        del _jobs[job_id]
+
+
+def _ensure_workers():
+    # Caller holds _cond.
+    _threads[:] = [t for t in _threads if t.is_alive()]
+    while len(_threads) < _worker_count:
+        thread = threading.Thread(target=_work, name=f"sd-jobs-{len(_threads)}", daemon=True)
+        thread.start()
+        _threads.append(thread)
+
+
+def submit(run, priority=0, kind="generate"):
+    """Queue run() — which returns (result, header) — and return the job id."""
+    job_id = uuid.uuid4().hex
+    with _cond:
+        _prune()
+        _jobs[job_id] = {
+            "id": job_id, "kind": kind, "priority": int(priority), "state": "queued",
+            "submitted": time.time(), "started": None, "finished": None,
+            "error": "", "header": None, "result": None, "run": run,
+        }
+        heapq.heappush(_queue, (-int(priority), next(_seq), job_id))
+        _ensure_workers()
+        _cond.notify()
+    return job_id
+
+
+def _work():
+    while True:
+        with _cond:
+            while not _queue:
+                _cond.wait()
+            _, _, job_id = heapq.heappop(_queue)
+            job = _jobs.get(job_id)
+            if job is None or job["state"] != "queued":
+                continue
+            job["state"], job["started"] = "running", time.time()
+            _running.add(job_id)
+            run = job.pop("run")
+        _local.job_id = job_id
+        try:
+            result, header = run()
+            error = ""
+        except Exception as e:
+            result, header, error = None, None, str(e)
+        _local.job_id = None
+        with _cond:
+            _running.discard(job_id)
+            job["finished"] = time.time()
+            _recent_sec.append(job["finished"] - job["started"])
+            if job["state"] == "cancelling":
+                job["state"] = "cancelled"
+            elif error:
+                job["state"], job["error"] = "error", error
+            else:
+                job["state"], job["result"], job["header"] = "done", result, header
+
+
+def _mean_run_sec():
+    return sum(_recent_sec) / len(_recent_sec) if _recent_sec else None
+
+
+def status(job_id):
+    """A job's public state, with queue position (jobs ahead of it, running
+    ones included) and ETA in seconds while it is still pending. None if
+    the id is unknown or expired."""
+    with _cond:
+        job = _jobs.get(job_id)
+        if job is None:
+            return None
+        out = {k: job[k] for k in ("id", "kind", "priority", "state", "submitted", "started", "finished", "error")}
+        if job["state"] == "done":
+            out["header"] = job["header"]
+        mean = _mean_run_sec()
+        if job["state"] == "queued":
+            ahead = sorted(e for e in _queue if _jobs.get(e[2], {}).get("state") == "queued")
+            position = next(n for n, e in enumerate(ahead) if e[2] == job_id)
+            out["queue_position"] = position + len(_running)
+            if mean is not None:
+                # Jobs ahead start as running ones finish, _worker_count at a time.
+                busy = sorted(max(0.0, mean - (time.time() - _jobs[j]["started"])) for j in _running)
+                free_at = busy[0] if len(busy) >= _worker_count else 0.0
+                out["eta_sec"] = round(free_at + (position // _worker_count + 1) * mean, 1)
+        elif job["state"] == "running":
+            out["queue_position"] = 0
+            if mean is not None:
+                out["eta_sec"] = round(max(0.0, mean - (time.time() - job["started"])), 1)
+        return out
+
+
+def result(job_id):
+    """(state, result) — result is whatever run() returned, once done."""
+    with _cond:
+        job = _jobs.get(job_id)
+        return (None, None) if job is None else (job["state"], job["result"])
+
+
+def cancel(job_id):
+    """Drop a job. A queued one never runs; a running one is interrupted
+    (see configure()) — or, if still waiting for the pipeline behind
+    another caller's generation, gives up once it gets it; a finished one
+    just has its result discarded.
+    Returns the state it was in, or None if unknown."""
+    with _cond:
+        job = _jobs.get(job_id)
+        if job is None:
+            return None
+        state = job["state"]
+        if state == "queued":
+            job.update(state="cancelled", finished=time.time())
+            job.pop("run", None)
+        elif state == "running":
+            job["state"] = "cancelling"
+        else:
+            del _jobs[job_id]
+    if state == "running":
+        _cancel_running(job_id)
+    return state
+
+
+def queue_summary():
+    with _cond:
+        queued = sum(1 for job in _jobs.values() if job["state"] == "queued")
+        mean = _mean_run_sec()
+        return {"queued": queued, "running": len(_running), "workers": _worker_count,
+                "mean_run_sec": round(mean, 2) if mean is not None else None}
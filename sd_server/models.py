@@ -1,26 +1,69 @@
 """Pipeline load/cache + generation for the SD server.
 
-One pipeline — and its attached LoRA stack + scheduler — is kept in memory at
-a time (single-GPU assumption). Switching any of them frees/reloads as
-needed. A module-level lock serialises generation so concurrent requests
-don't fight over the GPU — this matches ODT's row-by-row (sequential)
-tagging loop.
+Loaded pipelines — each with its own resident LoRA adapters + scheduler — are
+kept in an LRU cache bounded by a host-RAM budget (SD_PIPELINE_CACHE_MB), so
+switching back to a recently used model costs a device move at most, not a
+multi-GB reload. On CUDA a model that fits the device budget
+(SD_DEVICE_BUDGET_MB) lives fully on the GPU; others in the cache are parked
+on the CPU while it is in use and promoted back when asked for. Models too
+big for the device run with sequential CPU offload, as on MPS, and already
+live in host memory. A module-level lock serialises generation so
+concurrent requests don't fight over the GPU — this matches ODT's
+row-by-row (sequential) tagging loop.
 """
 import collections
 import inspect
+import os
 import threading
 import time
 
+import fake_pipeline
 from capability import detect_capability
 
 _lock = threading.Lock()
-_loaded = {
-    "model_id": None, "pipe": None, "device": "cpu",
-    "lora_ids": [],            # ids of the currently-loaded LoRA stack, in order
-    "scheduler_key": "default",
-    "default_scheduler_cls": None,
-    "default_scheduler_config": None,
-}
+
+
+def _new_entry(model_id=None, pipe=None, device="cpu"):
+    return {
+        "model_id": model_id, "pipe": pipe, "device": device,
+        "lora_ids": [],            # ids of the active LoRA stack, in order
+        # Resident adapters, lora id -> adapter name, least recently used first.
+        "adapters": collections.OrderedDict(),
+        "adapter_seq": 0,
+        "lora_enabled": True,
+        "scheduler_key": "default",
+        "default_scheduler_cls": None,
+        "default_scheduler_config": None,
+        # "device" (fully on the GPU, can be parked), "offload" (sequential
+        # CPU offload) or "cpu".
+        "placement": "cpu",
+        "on_device": False,
+        "size_mb": 0,
+        "load_sec": 0.0,
+        "last_used": None,
+        # ensure_loaded calls holding it between lookup and use; _evict_for
+        # leaves it alone while this is non-zero.
+        "in_use": 0,
+    }
+
+
+# The pipeline in use by the current/last generation; the cache below holds
+# every loaded one, least recently used first.
+_loaded = _new_entry()
+_pipelines = collections.OrderedDict()
+_cache_stats = {"hits": 0, "misses": 0, "loads": 0, "load_sec": 0.0,
+                "promotions": 0, "promote_sec": 0.0, "parks": 0, "evictions": 0}
+_cache_lock = threading.Lock()  # _pipelines/_cache_stats, for readers outside _lock
+_sizes_mb = {}      # model id -> footprint measured when it was last loaded
+_loading_mb = 0     # room set aside for loads still in progress
+
+# LoRA adapters stay loaded on their pipeline once used, up to
+# SD_LORA_CACHE_SIZE per pipeline (least recently used dropped first), and a
+# stack is switched by activating a subset with set_adapters — so going from
+# A to A+B loads only B, and back to A loads nothing. Timings for /status.
+LORA_CACHE_SIZE = int(os.environ.get("SD_LORA_CACHE_SIZE", "8") or 8)
+_lora_stats = {"hits": 0, "loads": 0, "load_sec": 0.0, "evictions": 0}
+_lora_loads = collections.deque(maxlen=20)  # recent {lora_id, model_id, sec, ts}
 
 # Live activity status + a short rolling history, so a slow/stuck weight load
 # or generation isn't a silent black box to whatever's polling /status (ODT's
@@ -31,6 +74,11 @@ _status_lock = threading.Lock()
 _status = {"state": "idle", "detail": "", "since": None}
 _log_buffer = collections.deque(maxlen=200)
 _cancel_requested = threading.Event()
+# Which request holds _lock, by the tag its caller gave it (a queued job's
+# id), and tagged requests cancelled while still waiting for it.
+_cancel_lock = threading.Lock()
+_running_tag = None
+_cancelled_tags = set()
 
 
 def _set_status(state, detail=""):
@@ -50,19 +98,27 @@ def get_status():
         return {**_status, "logs": list(_log_buffer)[-50:]}
 
 
-def request_cancel():
+def request_cancel(tag=None):
     """Best-effort cancellation. If a denoising loop is running, most
     diffusers pipelines check `_interrupt` every step and bail out almost
     immediately. If we're still inside from_pretrained() loading weights,
     there's no cooperative hook to interrupt that — this only guarantees
-    generate() won't proceed to the denoising loop once loading finishes."""
-    _cancel_requested.set()
-    pipe = _loaded.get("pipe")
-    if pipe is not None:
-        try:
-            pipe._interrupt = True
-        except Exception:
-            pass
+    generate() won't proceed to the denoising loop once loading finishes.
+
+    With a tag, only the request given that tag is stopped: interrupted if
+    it holds the generation lock, else marked so it gives up as soon as it
+    gets the lock — whatever is generating meanwhile is left alone."""
+    with _cancel_lock:
+        if tag is not None and tag != _running_tag:
+            _cancelled_tags.add(tag)
+            return
+        _cancel_requested.set()
+        pipe = _loaded.get("pipe")
+        if pipe is not None:
+            try:
+                pipe._interrupt = True
+            except Exception:
+                pass
 
 # A curated set of well-known schedulers/samplers — the single biggest lever
 # on output quality/speed after steps. "default" leaves whatever the pipeline
@@ -82,11 +138,78 @@ def get_loaded_model():
     return _loaded["model_id"]
 
 
+def _env_mb(name):
+    try:
+        return int(os.environ.get(name, "") or -1)
+    except ValueError:
+        return -1
+
+
+_budgets = None
+
+
+def _budgets_mb():
+    """(host_budget_mb, device_budget_mb), worked out once. Unset env vars
+    default to half the system RAM and 90% of total VRAM; a non-CUDA
+    backend keeps nothing fully on the device."""
+    global _budgets
+    if _budgets is not None:
+        return _budgets
+    cap = detect_capability()
+    host, device = _env_mb("SD_PIPELINE_CACHE_MB"), _env_mb("SD_DEVICE_BUDGET_MB")
+    if host < 0:
+        host = int((cap.get("ram_mb") or 0) * 0.5)
+    if device < 0:
+        device = int((cap.get("vram_total_mb") or 0) * 0.9) if cap.get("backend") == "cuda" else 0
+    _budgets = (host, device)
+    return _budgets
+
+
+def get_cache_stats():
+    """Pipeline cache hit/miss and load-time figures for /health and /status."""
+    host_budget, device_budget = _budgets_mb()
+    with _cache_lock:
+        stats = dict(_cache_stats)
+        entries = [{k: e[k] for k in ("model_id", "placement", "on_device", "size_mb", "load_sec", "last_used")}
+                   for e in _pipelines.values()]
+    lookups = stats["hits"] + stats["misses"]
+    return {
+        **stats,
+        "load_sec": round(stats["load_sec"], 3),
+        "promote_sec": round(stats["promote_sec"], 3),
+        "hit_ratio": round(stats["hits"] / lookups, 3) if lookups else 0.0,
+        "avg_load_sec": round(stats["load_sec"] / stats["loads"], 3) if stats["loads"] else 0.0,
+        "host_budget_mb": host_budget,
+        "device_budget_mb": device_budget,
+        "cached_mb": sum(e["size_mb"] for e in entries),
+        "loading_mb": _loading_mb,
+        "pipelines": entries,
+    }
+
+
 def get_loaded_loras():
     return list(_loaded["lora_ids"])
 
 
+def get_lora_stats():
+    """Adapter-cache hits/loads/evictions and recent LoRA load timings."""
+    with _cache_lock:
+        stats = dict(_lora_stats)
+        recent = list(_lora_loads)
+        resident = {e["model_id"]: list(e["adapters"]) for e in _pipelines.values() if e["adapters"]}
+    return {
+        **stats,
+        "load_sec": round(stats["load_sec"], 3),
+        "avg_load_sec": round(stats["load_sec"] / stats["loads"], 3) if stats["loads"] else 0.0,
+        "limit_per_pipeline": LORA_CACHE_SIZE,
+        "resident": resident,
+        "recent_loads": recent,
+    }
+
+
 def _select_device_dtype():
+    if fake_pipeline.enabled():
+        return "cpu", None
     import torch
     backend = detect_capability()["backend"]
     if backend == "cuda":
@@ -104,15 +227,35 @@ def _select_device_dtype():
     return "cpu", torch.float32
 
 
-def _load(model_id, token=None):
-    import torch
-    from diffusers import AutoPipelineForText2Image
+def _pipeline_size_mb(pipe):
+    """Weight footprint of a pipeline: the sum of its torch modules' parameters."""
+    if hasattr(pipe, "size_mb"):
+        return int(pipe.size_mb)
+    total = 0
+    for component in getattr(pipe, "components", {}).values():
+        params = getattr(component, "parameters", None)
+        if callable(params):
+            total += sum(p.numel() * p.element_size() for p in params())
+    return int(total / (1024 * 1024))
+
 
+def _load(model_id, token=None, announce=True):
+    """Return (pipe, device, placement, size_mb). announce=False leaves the
+    live status alone, for loads running alongside a generation."""
     device, dtype = _select_device_dtype()
-    _set_status("loading_model", f"Loading weights for {model_id} ({device})…")
+    if announce:
+        _set_status("loading_model", f"Loading weights for {model_id} ({device})…")
     _log(f"Loading weights for {model_id} ({device})…")
     t0 = time.time()
 
+    if fake_pipeline.enabled():
+        pipe = fake_pipeline.FakePipeline(model_id)
+        _log(f"Fake pipeline ready in {time.time() - t0:.1f}s: {model_id}")
+        placement = "device" if 0 < pipe.size_mb <= _budgets_mb()[1] else "cpu"
+        return pipe, device, placement, _pipeline_size_mb(pipe)
+
+    from diffusers import AutoPipelineForText2Image
+
     common = dict(torch_dtype=dtype, token=token or None)
     # The safety_checker weights aren't downloaded (see downloader.py), and
     # pipeline classes without one (SDXL/SD3/FLUX) don't accept the kwarg at
@@ -132,81 +275,288 @@ def _load(model_id, token=None):
             pipe = AutoPipelineForText2Image.from_pretrained(model_id, **common)
 
     _log(f"Weights loaded in {time.time() - t0:.1f}s")
+    size_mb = _pipeline_size_mb(pipe)
 
     if device == "cpu":
         pipe = pipe.to(device)
+        placement = "cpu"
+    elif device == "cuda" and size_mb <= _budgets_mb()[1]:
+        # Fits in VRAM: ensure_loaded moves it all there (making room first).
+        # It can be parked on the CPU later and moved back far faster than
+        # reloading from disk.
+        placement = "device"
     else:
         # Stream weights layer-by-layer instead of materializing the whole
         # pipeline on-device at once — Flux/SD3.5-sized models can exceed
         # physical RAM, and on Apple Silicon "device" memory is the same
         # unified pool as system RAM, so a plain .to(device) has no headroom
         # to fall back on and gets killed by the OS under memory pressure.
-        _set_status("loading_model", "Preparing sequential CPU offload…")
+        if announce:
+            _set_status("loading_model", "Preparing sequential CPU offload…")
         pipe.enable_sequential_cpu_offload(device=device)
+        placement = "offload"
     for opt in ("enable_attention_slicing", "enable_vae_slicing"):
         try:
             getattr(pipe, opt)()
         except Exception:
             pass
     _log(f"Model ready: {model_id}")
-    return pipe, device
-
+    return pipe, device, placement, size_mb
 
-def ensure_loaded(model_id, token=None):
-    if _loaded["model_id"] == model_id and _loaded["pipe"] is not None:
-        return _loaded["pipe"]
-
-    # Free the previously-loaded pipeline before loading a new one.
-    if _loaded["pipe"] is not None:
-        _log(f"Unloading {_loaded['model_id']} to switch models…")
-        _loaded["pipe"] = None
-        _loaded["model_id"] = None
-        _loaded["lora_ids"] = []  # a fresh pipe has no LoRA attached
-        _loaded["scheduler_key"] = "default"
-        try:
-            import torch
-            if torch.cuda.is_available():
-                torch.cuda.empty_cache()
-        except Exception:
-            pass
 
-    pipe, device = _load(model_id, token)
+def _free_device_memory():
+    try:
+        import torch
+        if torch.cuda.is_available():
+            torch.cuda.empty_cache()
+    except Exception:
+        pass
+
+
+def _park(entry):
+    """Move a fully-on-device pipeline's weights to the CPU."""
+    _log(f"Parking {entry['model_id']} on the CPU…")
+    entry["pipe"].to("cpu")
+    entry["on_device"] = False
+    with _cache_lock:
+        _cache_stats["parks"] += 1
+    _free_device_memory()
+
+
+def _promote(entry):
+    """Bring a parked pipeline back onto the device, parking least recently
+    used ones first until it fits the device budget."""
+    device_budget = _budgets_mb()[1]
+    on_device = [e for e in _pipelines.values() if e["on_device"] and e is not entry]
+    used = sum(e["size_mb"] for e in on_device)
+    for other in on_device:
+        if used + entry["size_mb"] <= device_budget:
+            break
+        _park(other)
+        used -= other["size_mb"]
+    _set_status("loading_model", f"Moving {entry['model_id']} to {entry['device']}…")
+    t0 = time.time()
+    entry["pipe"].to(entry["device"])
+    entry["on_device"] = True
+    with _cache_lock:
+        _cache_stats["promotions"] += 1
+        _cache_stats["promote_sec"] += time.time() - t0
+    _log(f"Moved {entry['model_id']} to {entry['device']} in {time.time() - t0:.1f}s")
+
+
+def _estimate_size_mb(model_id, token=None):
+    """What a model will take up once loaded, so room can be made before its
+    weights are read: its size at an earlier load, else its safetensors on
+    disk, else the largest pipeline cached now."""
+    if model_id in _sizes_mb:
+        return _sizes_mb[model_id]
+    if fake_pipeline.enabled():
+        return fake_pipeline.SIZE_MB
+    try:
+        from huggingface_hub import snapshot_download
+        root = snapshot_download(model_id, token=token or None, local_files_only=True)
+        total = sum(os.path.getsize(os.path.join(folder, name))
+                    for folder, _, names in os.walk(root) for name in names if name.endswith(".safetensors"))
+        if total:
+            return int(total / (1024 * 1024))
+    except Exception:
+        pass
+    with _cache_lock:
+        return max((e["size_mb"] for e in _pipelines.values()), default=0)
+
+
+def _evict_for(size_mb, keep_loaded=True):
+    """Drop least recently used pipelines until size_mb more (on top of any
+    loads in progress) fits the host budget. Pipelines pinned by
+    ensure_loaded are skipped, and so is the one in use unless keep_loaded
+    is False — ensure_loaded, under _lock, is about to replace it; preload
+    runs alongside a generation that may be using it. Whatever is skipped
+    is kept even if that leaves the cache over."""
+    global _loaded
+    host_budget = _budgets_mb()[0]
+    with _cache_lock:
+        evicted = []
+        for model_id, entry in list(_pipelines.items()):
+            if sum(e["size_mb"] for e in _pipelines.values()) + _loading_mb + size_mb <= host_budget:
+                break
+            if entry["in_use"] or (keep_loaded and entry is _loaded):
+                continue
+            del _pipelines[model_id]
+            _cache_stats["evictions"] += 1
+            evicted.append(entry)
+        if any(e is _loaded for e in evicted):
+            _loaded = _new_entry()
+    for entry in evicted:
+        _log(f"Unloading {entry['model_id']} (pipeline cache over budget)…")
+        entry["pipe"] = None
+    if evicted:
+        _free_device_memory()
+
+
+def _load_within_budget(model_id, token=None, keep_loaded=True, announce=True):
+    """_load, after evicting enough to fit the model's estimated size and
+    setting that much aside until it's loaded — so the host budget holds
+    while the weights come in, not just once they're cached."""
+    global _loading_mb
+    estimate = _estimate_size_mb(model_id, token)
+    _evict_for(estimate, keep_loaded)
+    with _cache_lock:
+        _loading_mb += estimate
+    try:
+        return _load(model_id, token, announce)
+    finally:
+        with _cache_lock:
+            _loading_mb -= estimate
+
+
+def _cache_pipeline(model_id, pipe, device, placement, size_mb, load_sec, pin=False, keep_loaded=True):
+    """Add a freshly loaded pipeline to the cache, evicting again if it came
+    out bigger than estimated. pin marks it in use before it can be seen,
+    for ensure_loaded to release."""
+    _evict_for(size_mb, keep_loaded)
+    entry = _new_entry(model_id, pipe, device)
+    entry.update(placement=placement, size_mb=size_mb, load_sec=round(load_sec, 3))
     # Cache the pipeline's original scheduler so "default" can be restored
     # after switching to something else.
-    _loaded["default_scheduler_cls"] = type(pipe.scheduler)
-    _loaded["default_scheduler_config"] = dict(pipe.scheduler.config)
-    _loaded.update(model_id=model_id, pipe=pipe, device=device)
-    return pipe
+    entry["default_scheduler_cls"] = type(pipe.scheduler)
+    entry["default_scheduler_config"] = dict(pipe.scheduler.config)
+    with _cache_lock:
+        _sizes_mb[model_id] = size_mb
+        _cache_stats["loads"] += 1
+        _cache_stats["load_sec"] += load_sec
+        if _pipelines.get(model_id) is not None:  # a concurrent load got there first
+            entry = _pipelines[model_id]
+        _pipelines[model_id] = entry
+        entry["in_use"] += pin
+    return entry
+
+
+# Models being loaded by preload(), each with an Event set once it's cached
+# (or has failed), so ensure_loaded waits for that load instead of starting
+# a second one.
+_preloading = {}
+_preload_lock = threading.Lock()
+
+
+def preload(model_id, token=None):
+    """Load a model into the cache without taking the generation lock, so
+    its weights come off disk while another model is still generating. It
+    is not put on the device; its first generate() does that."""
+    with _cache_lock:
+        if model_id in _pipelines or model_id in _preloading:
+            return
+        done = _preloading[model_id] = threading.Event()
+    try:
+        with _preload_lock:  # one background load at a time
+            _log(f"Preloading {model_id}…")
+            t0 = time.time()
+            pipe, device, placement, size_mb = _load_within_budget(model_id, token, announce=False)
+            _cache_pipeline(model_id, pipe, device, placement, size_mb, time.time() - t0)
+    except Exception as e:
+        _log(f"Preload of {model_id} failed: {e}")
+    finally:
+        with _cache_lock:
+            _preloading.pop(model_id, None)
+        done.set()
+
+
+def ensure_loaded(model_id, token=None):
+    global _loaded
+    with _cache_lock:
+        pending = _preloading.get(model_id)
+    if pending is not None:
+        _set_status("loading_model", f"Waiting for {model_id} to finish preloading…")
+        pending.wait()
+    # The entry is pinned (in_use) from the lookup until it is _loaded, so a
+    # preload making room in the meantime can't evict it.
+    with _cache_lock:
+        entry = _pipelines.get(model_id)
+        if entry is not None and entry["pipe"] is not None:
+            entry["in_use"] += 1
+            _cache_stats["hits"] += 1
+            _pipelines.move_to_end(model_id)
+        else:
+            entry = None
+            _cache_stats["misses"] += 1
+    try:
+        if entry is None:
+            t0 = time.time()
+            pipe, device, placement, size_mb = _load_within_budget(model_id, token, keep_loaded=False)
+            entry = _cache_pipeline(model_id, pipe, device, placement, size_mb, time.time() - t0,
+                                    pin=True, keep_loaded=False)
+        if entry["placement"] == "device" and not entry["on_device"]:
+            _promote(entry)
+        if entry["pipe"] is None:
+            raise RuntimeError(f"{model_id} was unloaded while it was being loaded — try again")
+        entry["last_used"] = time.time()
+        _loaded = entry
+    finally:
+        if entry is not None:
+            with _cache_lock:
+                entry["in_use"] -= 1
+    return entry["pipe"]
+
+
+def _drop_adapters(pipe, entry, lora_ids):
+    names = [entry["adapters"].pop(i) for i in lora_ids]
+    try:
+        pipe.delete_adapters(names)
+    except AttributeError:  # diffusers without delete_adapters: start over
+        pipe.unload_lora_weights()
+        entry["adapters"].clear()
+    with _cache_lock:
+        _lora_stats["evictions"] += len(names)
 
 
 def _ensure_loras(pipe, loras, token=None):
-    """Attach a stack of LoRAs (each {'id':..., 'scale':...}) on the loaded
-    pipeline. Strengths are applied via set_adapters — changing scale alone
-    doesn't require reloading weights, only a different *set* of LoRA ids does."""
+    """Activate a stack of LoRAs (each {'id':..., 'scale':...}) on the loaded
+    pipeline. Adapters already resident on it are reused; only missing ones
+    are loaded, evicting the least recently used inactive ones past
+    LORA_CACHE_SIZE. Strengths and the active subset are applied via
+    set_adapters; an empty stack just disables LoRA."""
     loras = [
         {"id": (l.get("id") or "").strip(), "scale": float(l.get("scale", 1.0))}
         for l in (loras or []) if (l.get("id") or "").strip()
     ]
     ids = [l["id"] for l in loras]
-
-    if ids != _loaded.get("lora_ids"):
-        if ids:
-            _set_status("loading_lora", f"Loading LoRA(s): {', '.join(ids)}…")
-            _log(f"Loading LoRA(s): {', '.join(ids)}…")
-        if _loaded.get("lora_ids"):
-            try:
-                pipe.unload_lora_weights()
-            except Exception:
-                pass
-        for i, l in enumerate(loras):
-            pipe.load_lora_weights(l["id"], adapter_name=f"lora{i}", token=token or None)
-        _loaded["lora_ids"] = ids
-        if ids:
-            _log(f"LoRA(s) ready: {', '.join(ids)}")
+    entry, adapters = _loaded, _loaded["adapters"]
+
+    missing = [i for i in ids if i not in adapters]
+    spare = [i for i in adapters if i not in ids]
+    overflow = len(adapters) + len(missing) - LORA_CACHE_SIZE
+    if overflow > 0 and spare:
+        _drop_adapters(pipe, entry, spare[:overflow])
+        missing = [i for i in ids if i not in adapters]
+    with _cache_lock:
+        _lora_stats["hits"] += len(ids) - len(missing)
+    if missing:
+        _set_status("loading_lora", f"Loading LoRA(s): {', '.join(missing)}…")
+        _log(f"Loading LoRA(s): {', '.join(missing)}…")
+        for lora_id in missing:
+            name = f"lora{entry['adapter_seq']}"
+            entry["adapter_seq"] += 1
+            t0 = time.time()
+            pipe.load_lora_weights(lora_id, adapter_name=name, token=token or None)
+            sec = time.time() - t0
+            adapters[lora_id] = name
+            with _cache_lock:
+                _lora_stats["loads"] += 1
+                _lora_stats["load_sec"] += sec
+                _lora_loads.append({"lora_id": lora_id, "model_id": entry["model_id"],
+                                    "sec": round(sec, 3), "ts": time.time()})
+            _log(f"LoRA {lora_id} loaded in {sec:.1f}s")
+    for lora_id in ids:
+        adapters.move_to_end(lora_id)
 
     if loras:
-        adapter_names = [f"lora{i}" for i in range(len(loras))]
-        pipe.set_adapters(adapter_names, adapter_weights=[l["scale"] for l in loras])
+        if not entry["lora_enabled"]:
+            pipe.enable_lora()
+            entry["lora_enabled"] = True
+        pipe.set_adapters([adapters[i] for i in ids], adapter_weights=[l["scale"] for l in loras])
+    elif adapters and entry["lora_enabled"]:
+        pipe.disable_lora()
+        entry["lora_enabled"] = False
+    entry["lora_ids"] = ids
 
 
 def _ensure_scheduler(pipe, scheduler_key):
@@ -218,14 +568,29 @@ def _ensure_scheduler(pipe, scheduler_key):
         cls = _loaded["default_scheduler_cls"]
         config = _loaded["default_scheduler_config"]
     else:
-        import diffusers
-        cls = getattr(diffusers, spec["cls"])
+        cls = _scheduler_class(spec["cls"])
         config = dict(pipe.scheduler.config)
         config.update(spec.get("kwargs", {}))
     pipe.scheduler = cls.from_config(config)
     _loaded["scheduler_key"] = scheduler_key
 
 
+def _scheduler_class(name):
+    if fake_pipeline.enabled():
+        return fake_pipeline.FakeScheduler.named(name)
+    import diffusers
+    return getattr(diffusers, name)
+
+
+def _make_generator(device, seed):
+    if fake_pipeline.enabled():
+        return fake_pipeline.FakeGenerator(seed)
+    import torch
+    # MPS does not support generator device="mps" for manual_seed reliably.
+    gen_device = "cpu" if device == "mps" else device
+    return torch.Generator(device=gen_device).manual_seed(seed)
+
+
 def _looks_blank(img, tolerance=3):
     """True when an image is essentially a single flat color across its
     whole RGB range — the signature of a corrupted (NaN/Inf) decode, which
@@ -242,13 +607,34 @@ def _looks_blank(img, tolerance=3):
 
 def generate(model_id, prompt, negative_prompt="", width=512, height=512,
              steps=30, guidance_scale=7.5, seed=-1, num_images=1, token=None,
-             loras=None, scheduler=None):
+             loras=None, scheduler=None, tag=None):
     """Return (list_of_PIL_images, seed_used, elapsed_sec)."""
-    import torch
-
+    results, elapsed = generate_batch(
+        model_id, [prompt], [seed], negative_prompt=negative_prompt, width=width,
+        height=height, steps=steps, guidance_scale=guidance_scale, num_images=num_images,
+        token=token, loras=loras, scheduler=scheduler, tag=tag)
+    images, seed_used = results[0]
+    return images, seed_used, elapsed
+
+
+def generate_batch(model_id, prompts, seeds, negative_prompt="", width=512, height=512,
+                   steps=30, guidance_scale=7.5, num_images=1, token=None,
+                   loras=None, scheduler=None, tag=None):
+    """Run several prompts that share every other setting through one
+    denoising pass. seeds[i] (-1 = random) seeds prompts[i]; each prompt gets
+    its own generator(s), so a prompt's image matches what a single /generate
+    with that seed gives. tag names the request for request_cancel(tag).
+    Return ([(images, seed_used) per prompt], elapsed_sec)."""
+    global _running_tag
     with _lock:
-        _cancel_requested.clear()
+        with _cancel_lock:
+            _cancel_requested.clear()
+            _running_tag = tag
+            cancelled = tag is not None and tag in _cancelled_tags
+            _cancelled_tags.discard(tag)
         try:
+            if cancelled:
+                raise RuntimeError("Cancelled before generation started")
             pipe = ensure_loaded(model_id, token)
             if _cancel_requested.is_set():
                 raise RuntimeError("Cancelled before generation started")
@@ -257,22 +643,29 @@ def generate(model_id, prompt, negative_prompt="", width=512, height=512,
             if _cancel_requested.is_set():
                 raise RuntimeError("Cancelled before generation started")
             device = _loaded["device"]
-
-            if seed is None or int(seed) < 0:
-                seed = int(time.time() * 1000) % (2 ** 32)
-            seed = int(seed)
-            # MPS does not support generator device="mps" for manual_seed reliably.
-            gen_device = "cpu" if device == "mps" else device
-            generator = torch.Generator(device=gen_device).manual_seed(seed)
+            num_images = int(num_images)
+
+            base_seed = int(time.time() * 1000) % (2 ** 32)
+            seeds = [int(s) if s is not None and int(s) >= 0 else (base_seed + n) % (2 ** 32)
+                     for n, s in enumerate(seeds)]
+            if len(prompts) == 1:
+                # The original single-prompt call: one generator for all images.
+                prompt, negative = prompts[0], negative_prompt or None
+                generator = _make_generator(device, seeds[0])
+            else:
+                # Batched: diffusers orders the batch prompt-major, one
+                # generator per image.
+                prompt, negative = list(prompts), [negative_prompt or ""] * len(prompts)
+                generator = [_make_generator(device, s + k) for s in seeds for k in range(num_images)]
 
             kwargs = {
                 "prompt":                prompt,
-                "negative_prompt":       negative_prompt or None,
+                "negative_prompt":       negative,
                 "width":                 int(width),
                 "height":                int(height),
                 "num_inference_steps":   int(steps),
                 "guidance_scale":        float(guidance_scale),
-                "num_images_per_prompt": int(num_images),
+                "num_images_per_prompt": num_images,
                 "generator":             generator,
             }
             # Drop kwargs the specific pipeline doesn't accept (e.g. FLUX has
@@ -291,7 +684,11 @@ def generate(model_id, prompt, negative_prompt="", width=512, height=512,
                 pipe._interrupt = False  # reset — a prior cancel may have left this set
 
             _set_status("generating", f"Step 0/{total_steps}")
-            _log(f"Generating {num_images} image(s): {width}x{height}, {total_steps} steps, seed {seed}")
+            if len(prompts) == 1:
+                _log(f"Generating {num_images} image(s): {width}x{height}, {total_steps} steps, seed {seeds[0]}")
+            else:
+                _log(f"Generating a batch of {len(prompts)} prompt(s) x {num_images} image(s): "
+                     f"{width}x{height}, {total_steps} steps")
             start = time.time()
             result = pipe(**kwargs)
             elapsed = time.time() - start
@@ -308,8 +705,13 @@ def generate(model_id, prompt, negative_prompt="", width=512, height=512,
 
             _log(f"Done in {elapsed:.1f}s")
             _set_status("idle", "")
-            return result.images, seed, elapsed
+            images = list(result.images)
+            return [(images[n * num_images:(n + 1) * num_images], seed)
+                    for n, seed in enumerate(seeds)], elapsed
         except Exception as e:
             _log(f"Error: {e}")
             _set_status("idle", "")
             raise
+        finally:
+            with _cancel_lock:
+                _running_tag = None
@@ -0,0 +1,130 @@
+"""
+Tests for jobs.py's queue: priority order, cancel, expiry and the queue
+position / ETA that /jobs/{id} reports. Jobs here are plain callables, so
+no pipeline runs:
+
+  cd sd_server && python -m pytest -q
+"""
+import threading
+import time
+import unittest
+from unittest import mock
+
+import jobs
+
+
+def _wait_for(job_id, *states, timeout=5):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        status = jobs.status(job_id)
+        if status is not None and status["state"] in states:
+            return status
+        time.sleep(0.01)
+    raise AssertionError(f"job {job_id} never reached {states}: {jobs.status(job_id)}")
+
+
+class JobQueueTests(unittest.TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self._cancel_running = jobs._cancel_running
+        with jobs._cond:
+            jobs._jobs.clear()
+            jobs._queue.clear()
+            jobs._recent_sec.clear()
+        jobs.configure(workers=1)
+        self.release = threading.Event()
+        self.addCleanup(self.release.set)
+
+    def tearDown(self):
+        self.release.set()
+        deadline = time.time() + 5
+        while jobs._running and time.time() < deadline:  # let the next test start idle
+            time.sleep(0.01)
+        jobs._cancel_running = self._cancel_running
+        super().tearDown()
+
+    def _blocker(self):
+        """A running job that holds the only worker until self.release."""
+        job_id = jobs.submit(lambda: (self.release.wait(5), {}), priority=100)
+        _wait_for(job_id, "running")
+        return job_id
+
+    def test_higher_priority_first_then_oldest_first(self):
+        blocker = self._blocker()
+        ran = []
+
+        def job(name):
+            return lambda: (ran.append(name), {})
+
+        ids = [jobs.submit(job(name), priority=p) for name, p in (("a", 0), ("b", 5), ("c", 0), ("d", 5))]
+        self.release.set()
+        for job_id in ids:
+            _wait_for(job_id, "done")
+        self.assertEqual(ran, ["b", "d", "a", "c"])
+        self.assertEqual(jobs.result(blocker)[0], "done")
+
+    def test_result_and_error(self):
+        ok = jobs.submit(lambda: ("payload", {"seed_used": 1}))
+        bad = jobs.submit(lambda: 1 / 0)
+        self.assertEqual(_wait_for(ok, "done")["header"], {"seed_used": 1})
+        self.assertEqual(jobs.result(ok), ("done", "payload"))
+        self.assertIn("division", _wait_for(bad, "error")["error"])
+        self.assertEqual(jobs.result("nope"), (None, None))
+
+    def test_cancel_a_queued_job_never_runs_it(self):
+        self._blocker()
+        run = mock.Mock(return_value=(None, {}))
+        job_id = jobs.submit(run)
+        self.assertEqual(jobs.cancel(job_id), "queued")
+        self.release.set()
+        later = jobs.submit(lambda: (None, {}))
+        _wait_for(later, "done")
+        self.assertEqual(jobs.status(job_id)["state"], "cancelled")
+        run.assert_not_called()
+
+    def test_cancel_a_running_job_interrupts_it(self):
+        interrupt = mock.Mock(side_effect=lambda job_id: self.release.set())
+        jobs.configure(cancel_running=interrupt)
+        job_id = self._blocker()
+        self.assertEqual(jobs.cancel(job_id), "running")
+        interrupt.assert_called_once_with(job_id)
+        self.assertEqual(_wait_for(job_id, "cancelled")["state"], "cancelled")
+        self.assertEqual(jobs.result(job_id), ("cancelled", None))
+
+    def test_cancel_a_finished_job_discards_it(self):
+        job_id = jobs.submit(lambda: ("payload", {}))
+        _wait_for(job_id, "done")
+        self.assertEqual(jobs.cancel(job_id), "done")
+        self.assertIsNone(jobs.status(job_id))
+        self.assertIsNone(jobs.cancel(job_id))
+
+    def test_finished_jobs_expire_after_the_ttl(self):
+        old = jobs.submit(lambda: ("payload", {}))
+        _wait_for(old, "done")
+        with jobs._cond:
+            jobs._jobs[old]["finished"] -= jobs.JOB_TTL_SEC + 1
+        fresh = jobs.submit(lambda: ("payload", {}))
+        self.assertIsNone(jobs.status(old))
+        self.assertIsNotNone(jobs.status(fresh))
+
+    def test_queue_position_and_eta(self):
+        jobs._recent_sec.append(2.0)
+        running = self._blocker()
+        first = jobs.submit(lambda: (None, {}))
+        second = jobs.submit(lambda: (None, {}))
+        status = jobs.status(running)
+        self.assertEqual(status["queue_position"], 0)
+        self.assertAlmostEqual(status["eta_sec"], 2.0, delta=0.3)
+        status = jobs.status(first)
+        self.assertEqual(status["queue_position"], 1)
+        self.assertAlmostEqual(status["eta_sec"], 4.0, delta=0.3)
+        status = jobs.status(second)
+        self.assertEqual(status["queue_position"], 2)
+        self.assertAlmostEqual(status["eta_sec"], 6.0, delta=0.3)
+        self.assertEqual(jobs.queue_summary(),
+                         {"queued": 2, "running": 1, "workers": 1, "mean_run_sec": 2.0})
+
+
+if __name__ == "__main__":
+    unittest.main()
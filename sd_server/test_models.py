@@ -0,0 +1,274 @@
+"""
+Tests for models.generate / generate_batch, the pipeline cache and the
+per-pipeline LoRA adapter cache, run on the fake pipeline (see
+conftest.py) so no torch, diffusers or weights are needed:
+
+  cd sd_server && python -m pytest -q
+"""
+import threading
+import time
+import unittest
+from unittest import mock
+
+import numpy as np
+
+import models
+
+
+def _reset(host_mb=10000, device_mb=0):
+    """Empty every cache and counter, with fixed memory budgets."""
+    models._pipelines.clear()
+    models._loaded = models._new_entry()
+    for stats in (models._cache_stats, models._lora_stats):
+        for k in stats:
+            stats[k] = 0
+    models._lora_loads.clear()
+    models._budgets = (host_mb, device_mb)
+
+
+class _FreshModelsMixin:
+
+    def setUp(self):
+        super().setUp()
+        _reset()
+
+    def tearDown(self):
+        _reset()
+        models._budgets = None
+        super().tearDown()
+
+
+class GenerateTests(_FreshModelsMixin, unittest.TestCase):
+
+    def test_generate_returns_images_at_the_requested_size(self):
+        images, seed, elapsed = models.generate("fake/a", "a cat", width=64, height=48, steps=2,
+                                                seed=7, num_images=2)
+        self.assertEqual(seed, 7)
+        self.assertEqual(len(images), 2)
+        self.assertEqual(images[0].size, (64, 48))
+        self.assertGreaterEqual(elapsed, 0)
+        self.assertEqual(models.get_status()["state"], "idle")
+
+    def test_same_seed_gives_the_same_image(self):
+        first, _, _ = models.generate("fake/a", "a cat", width=64, height=64, steps=1, seed=3)
+        second, _, _ = models.generate("fake/a", "a cat", width=64, height=64, steps=1, seed=3)
+        other, _, _ = models.generate("fake/a", "a cat", width=64, height=64, steps=1, seed=4)
+        self.assertTrue(np.array_equal(np.asarray(first[0]), np.asarray(second[0])))
+        self.assertFalse(np.array_equal(np.asarray(first[0]), np.asarray(other[0])))
+
+    def test_random_seed_is_reported(self):
+        _, seed, _ = models.generate("fake/a", "a cat", width=32, height=32, steps=1, seed=-1)
+        self.assertGreaterEqual(seed, 0)
+
+    def test_batch_matches_single_generations(self):
+        prompts, seeds = ["a cat", "a dog", "a lighthouse"], [11, 12, 13]
+        results, _ = models.generate_batch("fake/a", prompts, seeds, width=64, height=64, steps=1)
+        self.assertEqual([seed for _, seed in results], seeds)
+        for (images, seed), prompt in zip(results, prompts):
+            single, _, _ = models.generate("fake/a", prompt, width=64, height=64, steps=1, seed=seed)
+            self.assertEqual(len(images), 1)
+            self.assertTrue(np.array_equal(np.asarray(images[0]), np.asarray(single[0])))
+
+    def test_batch_with_several_images_per_prompt(self):
+        results, _ = models.generate_batch("fake/a", ["a", "b"], [1, -1], width=32, height=32,
+                                           steps=1, num_images=3)
+        self.assertEqual([len(images) for images, _ in results], [3, 3])
+        self.assertEqual(results[0][1], 1)
+        self.assertGreaterEqual(results[1][1], 0)
+
+    def test_scheduler_switch_and_back(self):
+        models.generate("fake/a", "x", width=32, height=32, steps=1, seed=1, scheduler="euler_a")
+        self.assertEqual(models._loaded["scheduler_key"], "euler_a")
+        models.generate("fake/a", "x", width=32, height=32, steps=1, seed=1)
+        pipe = models._loaded["pipe"]
+        self.assertEqual(models._loaded["scheduler_key"], "default")
+        self.assertEqual(type(pipe.scheduler), models._loaded["default_scheduler_cls"])
+
+
+class TaggedCancelTests(_FreshModelsMixin, unittest.TestCase):
+
+    def _start(self, tag=None, steps=1):
+        outcome = {}
+
+        def run():
+            try:
+                outcome["result"] = models.generate("fake/a", "x", width=32, height=32, steps=steps,
+                                                    seed=1, tag=tag)
+            except RuntimeError as e:
+                outcome["error"] = str(e)
+
+        thread = threading.Thread(target=run, daemon=True)
+        thread.start()
+        return thread, outcome
+
+    def _wait_generating(self):
+        deadline = time.time() + 5
+        while models.get_status()["state"] != "generating":
+            self.assertLess(time.time(), deadline)
+            time.sleep(0.005)
+
+    def test_cancelling_a_waiting_job_leaves_the_running_generation_alone(self):
+        with mock.patch.object(models.fake_pipeline, "STEP_SEC", 0.02):
+            running, running_out = self._start(steps=25)
+            self._wait_generating()
+            waiting, waiting_out = self._start(tag="job-1")
+            time.sleep(0.05)  # queued on _lock behind the first
+            models.request_cancel("job-1")
+            running.join(5)
+            waiting.join(5)
+        self.assertIn("result", running_out)
+        self.assertEqual(waiting_out, {"error": "Cancelled before generation started"})
+        self.assertEqual(models._cancelled_tags, set())
+
+    def test_cancelling_the_generating_job_interrupts_it(self):
+        with mock.patch.object(models.fake_pipeline, "STEP_SEC", 0.02):
+            thread, outcome = self._start(tag="job-2", steps=100)
+            self._wait_generating()
+            models.request_cancel("job-2")
+            thread.join(5)
+        self.assertEqual(outcome, {"error": "Cancelled"})
+        self.assertIsNone(models._running_tag)
+
+
+class PipelineCacheTests(_FreshModelsMixin, unittest.TestCase):
+
+    def _run(self, model_id):
+        models.generate(model_id, "x", width=32, height=32, steps=1, seed=1)
+
+    def test_second_request_for_a_model_is_a_hit(self):
+        self._run("fake/a")
+        self._run("fake/a")
+        stats = models.get_cache_stats()
+        self.assertEqual((stats["hits"], stats["misses"], stats["loads"]), (1, 1, 1))
+
+    def test_switching_back_reuses_the_cached_pipeline(self):
+        self._run("fake/a")
+        pipe_a = models._loaded["pipe"]
+        self._run("fake/b")
+        self._run("fake/a")
+        self.assertIs(models._loaded["pipe"], pipe_a)
+        self.assertEqual(models.get_cache_stats()["loads"], 2)
+
+    def test_least_recently_used_pipeline_is_evicted_past_the_budget(self):
+        models._budgets = (2 * models.fake_pipeline.SIZE_MB, 0)
+        self._run("fake/a")
+        self._run("fake/b")
+        self._run("fake/a")
+        self._run("fake/c")
+        stats = models.get_cache_stats()
+        self.assertEqual([p["model_id"] for p in stats["pipelines"]], ["fake/a", "fake/c"])
+        self.assertEqual(stats["evictions"], 1)
+        self.assertEqual(models.get_loaded_model(), "fake/c")
+
+    def test_outgoing_pipeline_is_evicted_before_the_next_one_loads(self):
+        models._budgets = (models.fake_pipeline.SIZE_MB, 0)
+        self._run("fake/a")
+        cached_during_load = []
+        load = models._load
+
+        def watch_load(model_id, *args, **kwargs):
+            cached_during_load.append(sorted(models._pipelines))
+            return load(model_id, *args, **kwargs)
+
+        with mock.patch.object(models, "_load", side_effect=watch_load):
+            self._run("fake/b")
+        self.assertEqual(cached_during_load, [[]])
+        self.assertEqual([p["model_id"] for p in models.get_cache_stats()["pipelines"]], ["fake/b"])
+        self.assertEqual(models.get_loaded_model(), "fake/b")
+        self.assertEqual(models.get_cache_stats()["loading_mb"], 0)
+
+    def test_preload_keeps_the_pipeline_in_use(self):
+        models._budgets = (models.fake_pipeline.SIZE_MB, 0)
+        self._run("fake/a")
+        models.preload("fake/b")
+        self.assertEqual([p["model_id"] for p in models.get_cache_stats()["pipelines"]], ["fake/a", "fake/b"])
+        self.assertIsNotNone(models._loaded["pipe"])
+
+    def test_preload_cannot_evict_the_pipeline_being_fetched(self):
+        # fake/a is cached and parked; while ensure_loaded moves it back to
+        # the device, a preload of fake/c needs room and fake/b (in use) is
+        # off limits — fake/a must not be the one to go.
+        models._budgets = (2 * models.fake_pipeline.SIZE_MB, 0)
+        self._run("fake/a")
+        self._run("fake/b")
+        models._pipelines["fake/a"].update(placement="device", on_device=False)
+        promote = models._promote
+
+        def preload_then_promote(entry):
+            models.preload("fake/c")
+            promote(entry)
+
+        with mock.patch.object(models, "_promote", side_effect=preload_then_promote):
+            pipe = models.ensure_loaded("fake/a")
+        self.assertIsNotNone(pipe)
+        self.assertIs(models._loaded["pipe"], pipe)
+        self.assertEqual(models._loaded["in_use"], 0)
+        self.assertEqual(sorted(models._pipelines), ["fake/a", "fake/b", "fake/c"])
+        # Nothing is left pinned: the next load evicts as usual.
+        self._run("fake/d")
+        self.assertEqual([p["model_id"] for p in models.get_cache_stats()["pipelines"]], ["fake/c", "fake/d"])
+
+
+class LoraStackTests(_FreshModelsMixin, unittest.TestCase):
+
+    def _run(self, *lora_ids, scale=1.0):
+        models.generate("fake/a", "x", width=32, height=32, steps=1, seed=1,
+                        loras=[{"id": i, "scale": scale} for i in lora_ids])
+        return models._loaded["pipe"]
+
+    def test_switching_a_to_b_and_back_loads_each_once(self):
+        self._run("lora/a")
+        self._run("lora/b")
+        pipe = self._run("lora/a")
+        stats = models.get_lora_stats()
+        self.assertEqual((stats["loads"], stats["hits"], stats["evictions"]), (2, 1, 0))
+        self.assertEqual(stats["resident"], {"fake/a": ["lora/b", "lora/a"]})
+        self.assertEqual(pipe.active_adapters, [(models._loaded["adapters"]["lora/a"], 1.0)])
+        self.assertEqual(models.get_loaded_loras(), ["lora/a"])
+
+    def test_stack_and_scale_change_reuse_resident_adapters(self):
+        self._run("lora/a")
+        self._run("lora/a", "lora/b")
+        pipe = self._run("lora/a", "lora/b", scale=0.5)
+        self.assertEqual(models.get_lora_stats()["loads"], 2)
+        self.assertEqual([w for _, w in pipe.active_adapters], [0.5, 0.5])
+
+    def test_least_recently_used_adapter_is_evicted_past_the_limit(self):
+        with mock.patch.object(models, "LORA_CACHE_SIZE", 2):
+            self._run("lora/a")
+            self._run("lora/b")
+            self._run("lora/c")
+            self.assertEqual(models.get_lora_stats()["resident"], {"fake/a": ["lora/b", "lora/c"]})
+            pipe = self._run("lora/a")
+            stats = models.get_lora_stats()
+        self.assertEqual(stats["resident"], {"fake/a": ["lora/c", "lora/a"]})
+        self.assertEqual((stats["loads"], stats["evictions"]), (4, 2))
+        self.assertEqual(sorted(pipe.adapters.values()), ["lora/a", "lora/c"])
+
+    def test_active_stack_is_kept_even_past_the_limit(self):
+        with mock.patch.object(models, "LORA_CACHE_SIZE", 1):
+            pipe = self._run("lora/a", "lora/b")
+        self.assertEqual(len(pipe.active_adapters), 2)
+        self.assertEqual(models.get_lora_stats()["evictions"], 0)
+
+    def test_empty_stack_disables_lora_without_unloading(self):
+        self._run("lora/a")
+        pipe = self._run()
+        self.assertFalse(pipe.lora_enabled)
+        self.assertEqual(models.get_loaded_loras(), [])
+        self.assertEqual(list(pipe.adapters.values()), ["lora/a"])
+        pipe = self._run("lora/a")
+        self.assertTrue(pipe.lora_enabled)
+        self.assertEqual(models.get_lora_stats()["loads"], 1)
+
+    def test_each_pipeline_keeps_its_own_adapters(self):
+        self._run("lora/a")
+        models.generate("fake/b", "x", width=32, height=32, steps=1, seed=1, loras=[{"id": "lora/b"}])
+        self._run("lora/a")
+        stats = models.get_lora_stats()
+        self.assertEqual(stats["resident"], {"fake/a": ["lora/a"], "fake/b": ["lora/b"]})
+        self.assertEqual(stats["loads"], 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
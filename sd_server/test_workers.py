@@ -0,0 +1,87 @@
+"""
+Tests for workers.WorkerPool's failure handling: a worker whose placement
+can't be applied, one that dies between requests, and a pool with none
+left. These start real worker processes (on the fake pipeline, see
+conftest.py), so they take a few seconds:
+
+  cd sd_server && python -m pytest -q
+"""
+import time
+import unittest
+
+import workers
+
+
+def _generate(pool, model_id="fake/a"):
+    return pool.generate(model_id, "a cat", seed=1, width=32, height=32, steps=1)
+
+
+class WorkerPoolTests(unittest.TestCase):
+
+    def _pool(self, placements):
+        pool = workers.WorkerPool(len(placements), placements)
+        self.addCleanup(lambda: [w["proc"].kill() for w in pool._workers])
+        return pool
+
+    def test_worker_with_a_bad_placement_is_reported_and_skipped(self):
+        pool = self._pool(["cpu:0", "cpu:99999"])
+        status = pool.get_status()
+        self.assertEqual([w["index"] for w in status["failed_workers"]], [1])
+        self.assertIn("failed to start", status["failed_workers"][0]["reason"])
+        self.assertEqual(status["workers"][1]["state"], "failed")
+        self.assertEqual(status["state"], "idle")
+
+        for model_id in ("fake/a", "fake/b"):  # the idle broken worker never gets a job
+            images, seed, _ = _generate(pool, model_id)
+            self.assertEqual((len(images), seed), (1, 1))
+        status = pool.get_status()
+        self.assertEqual([w["completed"] for w in status["workers"]], [2, 0])
+        self.assertEqual(status["pipeline_cache"]["loads"], 2)
+        self.assertEqual(status["pipeline_cache"]["pipelines"][0]["worker"], 0)
+
+    def test_dead_worker_is_restarted_and_the_request_still_runs(self):
+        pool = self._pool(["cpu:0"])
+        _generate(pool)
+        worker = pool._workers[0]
+        old_pid = worker["proc"].pid
+        worker["proc"].kill()
+        worker["proc"].join(5)
+
+        images, _, _ = _generate(pool)
+        self.assertEqual(len(images), 1)
+        self.assertNotEqual(worker["proc"].pid, old_pid)
+        status = pool.get_status()["workers"][0]
+        self.assertEqual((status["restarts"], status["failed"]), (1, None))
+        self.assertIn("exit code", status["last_exit"])
+
+    def test_request_running_when_its_worker_dies_is_sent_again(self):
+        pool = self._pool(["cpu:0"])
+        _generate(pool)
+        worker = pool._workers[0]
+        conn = worker["conn"]
+
+        class DyingConn:
+            """The pipe as seen when the worker is killed mid-request."""
+            def send(self, message):
+                worker["proc"].kill()
+                worker["proc"].join(5)
+                raise BrokenPipeError(32, "Broken pipe")
+
+            def __getattr__(self, name):
+                return getattr(conn, name)
+
+        worker["conn"] = DyingConn()
+        images, _, _ = _generate(pool)
+        self.assertEqual(len(images), 1)
+        self.assertEqual(pool.get_status()["workers"][0]["restarts"], 1)
+
+    def test_no_usable_worker_raises(self):
+        pool = self._pool(["cpu:99999"])
+        start = time.time()
+        with self.assertRaisesRegex(RuntimeError, "No SD worker is available"):
+            _generate(pool)
+        self.assertLess(time.time() - start, 5)
+
+
+if __name__ == "__main__":
+    unittest.main()
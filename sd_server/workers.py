@@ -0,0 +1,406 @@
+"""Worker-process pool: several pipelines generating at once.
+
+By default the server runs generation in-process, one request at a time
+behind models._lock — right for a single GPU. With SD_WORKERS=N it instead
+starts N worker processes, each with its own copy of models.py (its own
+pipeline cache, LoRA stack and lock) pinned to one placement from
+SD_WORKER_DEVICES:
+
+    SD_WORKER_DEVICES=cuda:0,cuda:1          one worker per GPU
+    SD_WORKER_DEVICES=cpu:0-15,cpu:16-31     CPU workers on disjoint core sets
+    SD_WORKER_DEVICES=cpu:0-3+8-11,...       ("+" joins ranges within one worker)
+
+Unset, workers are spread round-robin over the visible GPUs, or given equal
+slices of the CPU cores when there are none. A GPU worker only sees its own
+device (CUDA_VISIBLE_DEVICES); a CPU worker is bound to its cores and sizes
+its thread pools to match.
+
+The dispatcher sends each request to the worker with the lowest load,
+counting one extra job against a worker that would first have to switch
+models — so a model's requests stay on the worker that has it loaded unless
+another worker is idle. Each worker runs one request at a time; requests for
+a busy worker wait their turn in this process. Status, cache figures and
+live load are collected from every worker through a second, control pipe
+that stays responsive while the worker generates.
+
+A worker that can't start (a placement naming a core or GPU that doesn't
+exist) is reported on /status and never sent work. One that dies later —
+a crash, the OOM killer — is restarted, and the request it was running is
+sent once more, to another worker or the restarted one.
+"""
+import multiprocessing
+import os
+import threading
+import time
+
+WORKER_START_TIMEOUT_SEC = 120
+
+
+class _WorkerLost(RuntimeError):
+    """A worker's pipe broke: the process exited under a request."""
+
+
+def _parse_cores(spec):
+    """"0-3+8" -> [0, 1, 2, 3, 8]"""
+    cores = []
+    for part in spec.split("+"):
+        part = part.strip()
+        if not part:
+            continue
+        if "-" in part:
+            lo, hi = part.split("-", 1)
+            cores.extend(range(int(lo), int(hi) + 1))
+        else:
+            cores.append(int(part))
+    return cores
+
+
+def default_placements(count):
+    """One placement per worker when SD_WORKER_DEVICES isn't given."""
+    gpus = 0
+    try:
+        import torch
+        if torch.cuda.is_available():
+            gpus = torch.cuda.device_count()
+    except Exception:
+        pass
+    if gpus:
+        return [f"cuda:{n % gpus}" for n in range(count)]
+    cores = sorted(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else list(range(os.cpu_count() or 1))
+    share = max(1, len(cores) // count)
+    return ["cpu:" + "+".join(str(c) for c in (cores[n * share:(n + 1) * share] or cores[-1:]))
+            for n in range(count)]
+
+
+def _pin(placement):
+    """Apply a placement to this (fresh) process before torch is imported."""
+    kind, _, where = placement.partition(":")
+    if kind == "cuda":
+        os.environ["CUDA_VISIBLE_DEVICES"] = where or "0"
+        return
+    os.environ["CUDA_VISIBLE_DEVICES"] = ""
+    cores = _parse_cores(where) if where else []
+    if cores:
+        if hasattr(os, "sched_setaffinity"):
+            os.sched_setaffinity(0, cores)
+        for var in ("OMP_NUM_THREADS", "MKL_NUM_THREADS"):
+            os.environ[var] = str(len(cores))
+        try:
+            import torch
+            torch.set_num_threads(len(cores))
+        except Exception:
+            pass
+
+
+def _process_load():
+    """This worker's own CPU and memory use (psutil's figures in
+    get_live_metrics are system-wide)."""
+    try:
+        import psutil
+        proc = psutil.Process()
+        return {"cpu_percent": proc.cpu_percent(interval=None),
+                "rss_mb": int(proc.memory_info().rss / (1024 * 1024))}
+    except Exception:
+        return {"cpu_percent": None, "rss_mb": None}
+
+
+def _control_loop(conn):
+    # Runs on its own thread in the worker, so status and cancel get an
+    # answer while the main thread is busy generating.
+    import capability
+    import models
+    while True:
+        try:
+            op, args = conn.recv()
+        except (EOFError, OSError):
+            return
+        try:
+            if op == "status":
+                reply = {**models.get_status(), "pipeline_cache": models.get_cache_stats(),
+                         "lora_cache": models.get_lora_stats(),
+                         "loaded_model": models.get_loaded_model(), "pid": os.getpid()}
+            elif op == "metrics":
+                reply = {**capability.get_live_metrics(), "pid": os.getpid(), "process": _process_load()}
+            elif op == "cancel":
+                models.request_cancel(*args)
+                reply = True
+            elif op == "preload":
+                threading.Thread(target=models.preload, args=args, daemon=True).start()
+                reply = True
+            else:
+                reply = None
+            conn.send(("ok", reply))
+        except Exception as e:
+            conn.send(("error", str(e)))
+
+
+def _worker_main(placement, conn, control):
+    try:
+        _pin(placement)
+        import models
+    except Exception as e:
+        # Told to the pool, which shows it on /status, rather than dying silently.
+        conn.send(("failed", f"{type(e).__name__}: {e}"))
+        return
+    threading.Thread(target=_control_loop, args=(control,), daemon=True).start()
+    conn.send(("ready", os.getpid()))
+    while True:
+        try:
+            op, kwargs = conn.recv()
+        except (EOFError, OSError):
+            return
+        try:
+            if op == "generate_batch":
+                results, elapsed = models.generate_batch(**kwargs)
+                cached = [p["model_id"] for p in models.get_cache_stats()["pipelines"]]
+                reply = ("ok", (results, elapsed, cached))
+            else:
+                reply = ("error", f"Unknown operation {op}")
+        except Exception as e:
+            reply = ("error", str(e))
+        conn.send(reply)
+
+
+class WorkerPool:
+    """The main process's handle on the workers. Exposes the slice of
+    models.py that app.py uses, so either can sit behind the endpoints."""
+
+    def __init__(self, count, placements=None):
+        placements = list(placements or [])
+        placements += default_placements(count)[len(placements):]
+        self._ctx = multiprocessing.get_context("spawn")  # never fork a process that may hold CUDA state
+        self._workers = []
+        self._lock = threading.Condition()  # notified when a restart finishes
+        for index, placement in enumerate(placements[:count]):
+            worker = {
+                "index": index, "placement": placement,
+                "conn_lock": threading.Lock(), "control_lock": threading.Lock(),
+                "inflight": 0, "models": set(), "tags": set(), "done": 0, "busy_sec": 0.0,
+                # Why it can't take work (None while it can), and its restart history.
+                "failed": None, "restarting": False, "restarts": 0, "last_exit": None,
+            }
+            self._spawn(worker)
+            self._workers.append(worker)
+        for worker in self._workers:
+            self._await_start(worker)
+
+    def __len__(self):
+        return len(self._workers)
+
+    def _spawn(self, worker):
+        conn, child_conn = self._ctx.Pipe()
+        control, child_control = self._ctx.Pipe()
+        proc = self._ctx.Process(target=_worker_main, args=(worker["placement"], child_conn, child_control),
+                                 name=f"sd-worker-{worker['index']}", daemon=True)
+        proc.start()
+        # Only the child may hold these ends, so its death reads as EOF here.
+        child_conn.close()
+        child_control.close()
+        worker.update(proc=proc, conn=conn, control=control, models=set())
+
+    def _await_start(self, worker):
+        """Wait for a (re)started worker to report in. A placement it can't
+        apply, or a crash on import, leaves it failed with the reason."""
+        failed = None
+        try:
+            if not worker["conn"].poll(WORKER_START_TIMEOUT_SEC):
+                failed = f"did not start within {WORKER_START_TIMEOUT_SEC}s"
+            else:
+                state, detail = worker["conn"].recv()
+                if state != "ready":
+                    failed = f"failed to start: {detail}"
+        except (EOFError, OSError):
+            worker["proc"].join(5)
+            failed = f"failed to start: exited with code {worker['proc'].exitcode}"
+        if failed and worker["proc"].is_alive():
+            worker["proc"].kill()
+        with self._lock:
+            worker["failed"] = failed
+            self._lock.notify_all()
+        return failed is None
+
+    def _lost(self, worker, reason):
+        """Take a worker that died out of rotation and restart it in the
+        background."""
+        with self._lock:
+            if worker["failed"] or worker["restarting"]:
+                return
+            worker["failed"], worker["restarting"] = reason, True
+        threading.Thread(target=self._restart, args=(worker, reason), daemon=True,
+                         name=f"sd-worker-{worker['index']}-restart").start()
+
+    def _restart(self, worker, reason):
+        with worker["conn_lock"], worker["control_lock"]:
+            old = worker["proc"]
+            if old.is_alive():
+                old.kill()
+            old.join(5)
+            worker["conn"].close()
+            worker["control"].close()
+            worker["last_exit"] = f"{reason} (exit code {old.exitcode})"
+            self._spawn(worker)
+            started = self._await_start(worker)
+        with self._lock:
+            worker["restarting"] = False
+            worker["restarts"] += started
+            self._lock.notify_all()
+
+    def _pick(self, model_id, reserve=True):
+        deadline = time.time() + WORKER_START_TIMEOUT_SEC
+        with self._lock:
+            while True:
+                for w in self._workers:
+                    if w["failed"] is None and not w["proc"].is_alive():
+                        self._lost(w, "exited while idle")
+                live = [w for w in self._workers if w["failed"] is None]
+                if live:
+                    break
+                if not any(w["restarting"] for w in self._workers) or time.time() >= deadline:
+                    raise RuntimeError("No SD worker is available — " + "; ".join(
+                        f"worker {w['index']} ({w['placement']}) {w['failed']}" for w in self._workers))
+                self._lock.wait(deadline - time.time())
+            worker = min(live, key=lambda w: (
+                w["inflight"] + (0 if model_id in w["models"] else 1), w["inflight"], w["index"]))
+            worker["inflight"] += reserve
+            worker["models"].add(model_id)
+        return worker
+
+    def _control(self, worker, op, args=(), timeout=5):
+        with worker["control_lock"]:
+            while worker["control"].poll():  # a late answer to a call that timed out
+                worker["control"].recv()
+            worker["control"].send((op, args))
+            if not worker["control"].poll(timeout):
+                raise TimeoutError(f"Worker {worker['index']} did not answer '{op}'")
+            state, reply = worker["control"].recv()
+        if state != "ok":
+            raise RuntimeError(reply)
+        return reply
+
+    def _call(self, worker, kwargs):
+        with worker["conn_lock"]:
+            if worker["failed"]:  # died while this request waited its turn
+                raise _WorkerLost(f"Worker {worker['index']} {worker['failed']}")
+            start = time.time()
+            try:
+                worker["conn"].send(("generate_batch", kwargs))
+                state, reply = worker["conn"].recv()
+            except (EOFError, OSError) as e:
+                self._lost(worker, f"exited mid-request ({type(e).__name__})")
+                raise _WorkerLost(f"Worker {worker['index']} exited")
+        return state, reply, time.time() - start
+
+    def generate_batch(self, model_id, prompts, seeds, tag=None, **kwargs):
+        """models.generate_batch on the best worker for model_id. tag
+        names the request for request_cancel(tag). If the worker dies
+        under it, the request is sent once more."""
+        kwargs = dict(model_id=model_id, prompts=prompts, seeds=seeds, tag=tag, **kwargs)
+        for attempt in (1, 2):
+            worker = self._pick(model_id)
+            if tag is not None:
+                worker["tags"].add(tag)
+            try:
+                state, reply, busy = self._call(worker, kwargs)
+                break
+            except _WorkerLost:
+                if attempt == 2:
+                    raise
+            finally:
+                with self._lock:
+                    worker["inflight"] -= 1
+                    worker["tags"].discard(tag)
+        if state != "ok":
+            raise RuntimeError(reply)
+        results, elapsed, cached = reply
+        with self._lock:
+            worker["models"] = set(cached)
+            worker["done"] += 1
+            worker["busy_sec"] += busy
+        return results, elapsed
+
+    def generate(self, model_id, prompt, seed=-1, tag=None, **kwargs):
+        [(images, seed_used)], elapsed = self.generate_batch(model_id, [prompt], [seed], tag=tag, **kwargs)
+        return images, seed_used, elapsed
+
+    def preload(self, model_id, token=None):
+        """Warm the model on the worker that would get its next request."""
+        self._control(self._pick(model_id, reserve=False), "preload", (model_id, token))
+
+    def request_cancel(self, tag=None):
+        """Cancel `tag` on the worker it went to (interrupted there only if
+        it is the request generating), or interrupt every worker."""
+        with self._lock:
+            targets = [w for w in self._workers if w["failed"] is None and (tag is None or tag in w["tags"])]
+        for worker in targets:
+            try:
+                self._control(worker, "cancel", (tag,))
+            except Exception:
+                pass
+
+    def _each(self, op):
+        out = []
+        for worker in self._workers:
+            with self._lock:
+                entry = {"index": worker["index"], "placement": worker["placement"],
+                         "alive": worker["proc"].is_alive(), "inflight": worker["inflight"],
+                         "completed": worker["done"], "busy_sec": round(worker["busy_sec"], 3),
+                         "failed": worker["failed"], "restarts": worker["restarts"],
+                         "last_exit": worker["last_exit"]}
+                failed = worker["failed"]
+            if failed:
+                entry.update(state="restarting" if worker["restarting"] else "failed", detail=failed)
+                out.append(entry)
+                continue
+            try:
+                entry.update(self._control(worker, op))
+            except Exception as e:
+                entry["error"] = str(e)
+            out.append(entry)
+        return out
+
+    def get_status(self):
+        """Every worker's status, with a pool-wide state (the busiest
+        worker's), detail, merged recent log and summed cache figures on
+        top — all from one round trip to each worker. Workers that failed
+        to start or are restarting are listed under failed_workers."""
+        workers = self._each("status")
+        rank = {"generating": 3, "loading_model": 2, "loading_lora": 2, "failed": 0, "restarting": 0}
+        busiest = max(workers, key=lambda w: (rank.get(w.get("state"), 1 if w.get("state") != "idle" else 0),
+                                              -w["index"]))
+        logs = sorted(({**line, "worker": w["index"]} for w in workers for line in w.get("logs", [])),
+                      key=lambda line: line["ts"])[-50:]
+        for w in workers:
+            w.pop("logs", None)
+        loras = [w.get("lora_cache") or {} for w in workers]
+        lora_cache = {k: sum(l.get(k, 0) for l in loras) for k in ("hits", "loads", "load_sec", "evictions")}
+        lora_cache["recent_loads"] = sorted(({**load, "worker": w["index"]} for w, l in zip(workers, loras)
+                                             for load in l.get("recent_loads", [])), key=lambda load: load["ts"])[-20:]
+        failed = [{"index": w["index"], "placement": w["placement"], "state": w["state"], "reason": w["failed"]}
+                  for w in workers if w["failed"]]
+        return {"state": busiest.get("state", "idle"),
+                "detail": f"worker {busiest['index']}: {busiest.get('detail', '')}" if busiest.get("detail") else "",
+                "since": busiest.get("since"), "logs": logs, "workers": workers, "failed_workers": failed,
+                "lora_cache": lora_cache, "pipeline_cache": self._cache_totals(workers)}
+
+    def get_cache_stats(self):
+        """Cache figures summed over the workers; per-worker detail is in
+        get_status()."""
+        return self._cache_totals(self._each("status"))
+
+    @staticmethod
+    def _cache_totals(workers):
+        stats = [w.get("pipeline_cache") or {} for w in workers]
+        total = {k: sum(s.get(k, 0) for s in stats)
+                 for k in ("hits", "misses", "loads", "load_sec", "promote_sec", "cached_mb")}
+        lookups = total["hits"] + total["misses"]
+        total["hit_ratio"] = round(total["hits"] / lookups, 3) if lookups else 0.0
+        total["pipelines"] = [{**p, "worker": w["index"]} for w, s in zip(workers, stats) for p in s.get("pipelines", [])]
+        return total
+
+    def get_loaded_model(self):
+        loaded = [w.get("loaded_model") for w in self._each("status")]
+        return next((m for m in loaded if m), None)
+
+    def get_metrics(self):
+        """Live load per worker (each one's own view of CPU/RAM/GPU)."""
+        return self._each("metrics")